@@ -1,14 +1,18 @@
 from pyteal import *
 
+from algorand.merkle import COUNT_OFFSET, HEADER_SIZE, LEAF_PREFIX, NODE_PREFIX, UNCLAIMED_OFFSET
+
 def approval_program():
     # Global state keys
     local_match_id = Bytes("match_id")
     local_admin = Bytes("admin")
+    local_committed = Bytes("committed")  # settled but not yet claimed, all matches
 
     # Initialization
     on_creation = Seq([
         App.globalPut(local_admin, Txn.sender()),
         App.globalPut(local_match_id, Int(0)),
+        App.globalPut(local_committed, Int(0)),
         Return(Int(1))
     ])
 
@@ -25,7 +29,8 @@ def approval_program():
         InnerTxnBuilder.SetFields({
             TxnField.type_enum: TxnType.Payment,
             TxnField.receiver: winner_addr,
-            TxnField.amount: Balance(Global.current_application_address()) - Global.min_txn_fee(),
+            TxnField.amount: Balance(Global.current_application_address()) - Global.min_txn_fee()
+                             - App.globalGet(local_committed),  # never pay out settled winnings
             TxnField.fee: Int(0) # Inner txn fee covered by outer? Or set to 0 and let pooled fees handle it if supported, 
                                  # For simplicity on Testnet, usually we might pay fee. 
                                  # Safer to just close out the account or send specific amount.
@@ -36,6 +41,86 @@ def approval_program():
         Return(Int(1))
     ])
 
+    # Settle a match for many winners (see algorand/merkle.py)
+    # Args[0] = "settle"
+    # Args[1] = Match ID (Int)
+    # Args[2] = Merkle root of the (index, address, amount) leaves
+    # Args[3] = Number of winners (Int)
+    # Args[4] = Total of the amounts (Int)
+    # Creates box Itob(match ID) = root | unclaimed | count | claim bitmap,
+    # so settling costs the same whatever the winner count. Needs a box
+    # reference per 1024 bytes of box (about 8000 winners).
+    settle_match = Txn.application_args[1]
+    settle_root = Txn.application_args[2]
+    settle_count = Btoi(Txn.application_args[3])
+    settle_total = Btoi(Txn.application_args[4])
+    app_addr = Global.current_application_address()
+    settle = Seq([
+        Assert(Txn.sender() == App.globalGet(local_admin)),
+        Assert(Len(settle_match) == Int(8)),
+        Assert(Len(settle_root) == Int(32)),
+        Assert(settle_count > Int(0)),
+        # Fails if the match was already settled
+        Assert(App.box_create(settle_match, Int(HEADER_SIZE) + (settle_count + Int(7)) / Int(8))),
+        App.box_replace(settle_match, Int(0), Concat(settle_root, Itob(settle_total), Itob(settle_count))),
+        App.globalPut(local_committed, App.globalGet(local_committed) + settle_total),
+        # The pot (after the new box's minimum balance) must cover every settled match
+        Assert(Balance(app_addr) - MinBalance(app_addr) >= App.globalGet(local_committed)),
+        Return(Int(1))
+    ])
+
+    # Claim winnings from a settled match; the sender is the winner
+    # Args[0] = "claim"
+    # Args[1] = Match ID (Int)
+    # Args[2] = Winner index (Int)
+    # Args[3] = Amount (Int)
+    # Args[4] = Proof: concatenated 32-byte sibling hashes, leaf level first
+    # Fee: 2 x min fee (covers the inner payment)
+    claim_match = Txn.application_args[1]
+    claim_index = Btoi(Txn.application_args[2])
+    claim_amount = Btoi(Txn.application_args[3])
+    claim_proof = Txn.application_args[4]
+    count = Btoi(App.box_extract(claim_match, Int(COUNT_OFFSET), Int(8)))
+    unclaimed = Btoi(App.box_extract(claim_match, Int(UNCLAIMED_OFFSET), Int(8)))
+    bitmap_byte = Int(HEADER_SIZE) + claim_index / Int(8)
+    flags = ScratchVar(TealType.bytes)
+    node = ScratchVar(TealType.bytes)
+    path = ScratchVar(TealType.uint64)      # index bits not yet consumed
+    offset = ScratchVar(TealType.uint64)
+    sibling = Extract(claim_proof, offset.load(), Int(32))
+    claim = Seq([
+        Assert(claim_index < count),
+        Assert(Len(claim_proof) == BitLen(count - Int(1)) * Int(32)),
+        flags.store(App.box_extract(claim_match, bitmap_byte, Int(1))),
+        Assert(GetBit(flags.load(), claim_index % Int(8)) == Int(0)),
+        node.store(Sha256(Concat(
+            Bytes("base16", LEAF_PREFIX.hex()), Itob(claim_index), Txn.sender(), Itob(claim_amount),
+        ))),
+        path.store(claim_index),
+        For(offset.store(Int(0)), offset.load() < Len(claim_proof), offset.store(offset.load() + Int(32))).Do(Seq([
+            # Bit k of the index set: the node at level k is a right child
+            node.store(Sha256(If(
+                path.load() & Int(1),
+                Concat(Bytes("base16", NODE_PREFIX.hex()), sibling, node.load()),
+                Concat(Bytes("base16", NODE_PREFIX.hex()), node.load(), sibling),
+            ))),
+            path.store(path.load() >> Int(1)),
+        ])),
+        Assert(node.load() == App.box_extract(claim_match, Int(0), Int(32))),
+        App.box_replace(claim_match, bitmap_byte, SetBit(flags.load(), claim_index % Int(8), Int(1))),
+        App.box_replace(claim_match, Int(UNCLAIMED_OFFSET), Itob(unclaimed - claim_amount)),
+        App.globalPut(local_committed, App.globalGet(local_committed) - claim_amount),
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields({
+            TxnField.type_enum: TxnType.Payment,
+            TxnField.receiver: Txn.sender(),
+            TxnField.amount: claim_amount,
+            TxnField.fee: Int(0)
+        }),
+        InnerTxnBuilder.Submit(),
+        Return(Int(1))
+    ])
+
     # Deposit logic (Opt-in or just NoOp call with payment?)
     # Usually users send Algo to the App Account.
     # We can accept payments in the OnCompletion.
@@ -51,7 +136,9 @@ def approval_program():
         [Txn.on_completion() == OnComplete.CloseOut, Return(Int(1))],
         [Txn.on_completion() == OnComplete.NoOp, Cond(
             [Txn.application_args[0] == Bytes("payout"), payout],
-            [Txn.application_args[0] == Bytes("deposit"), deposit]
+            [Txn.application_args[0] == Bytes("deposit"), deposit],
+            [Txn.application_args[0] == Bytes("settle"), settle],
+            [Txn.application_args[0] == Bytes("claim"), claim]
         )]
     )
 
@@ -59,12 +146,3 @@ def approval_program():
 
 def clear_state_program():
     return Return(Int(1))
-
-if __name__ == "__main__":
-    with open("contract.teal", "w") as f:
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=6)
-        f.write(compiled)
-    
-    with open("clear.teal", "w") as f:
-        compiled = compileTeal(clear_state_program(), mode=Mode.Application, version=6)
-        f.write(compiled)
@@ -0,0 +1,145 @@
+"""
+Merkle trees of (address, amount) winners for match_payout claims.
+
+    from algorand.merkle import WinnerTree
+
+    tree = WinnerTree([(alice, 3_000_000), (bob, 1_000_000), (carol, 500_000)])
+    tree.root                  # 32 bytes, committed once with "settle"
+    tree.total                 # sum of the amounts
+    tree.proof(1)              # sibling hashes for bob, passed to "claim"
+
+Leaves are hashed as sha256(0x00 || index || address || amount) and inner
+nodes as sha256(0x01 || left || right), with index and amount as 8-byte
+big-endian integers. The prefixes keep an inner node from passing as a
+leaf, and the index ties each leaf to one bit of the claim bitmap. The
+leaf level is padded with zero hashes up to a power of two, so every
+proof is depth(count) hashes long and the contract can derive the path
+from the index alone: at level k the node is a right child when bit k of
+the index is set.
+
+The settlement box for a match (named by the 8-byte match ID) holds
+
+    [root 32][unclaimed amount u64][winner count u64][claim bitmap]
+
+with bit i of the bitmap (most significant bit of each byte first, as
+getbit/setbit number them) set once winner i has claimed.
+"""
+import hashlib
+import struct
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+EMPTY = bytes(32)
+
+ROOT_OFFSET, UNCLAIMED_OFFSET, COUNT_OFFSET = 0, 32, 40
+HEADER_SIZE = 48
+
+# Opcode cost of "claim" is about CLAIM_BASE_COST + CLAIM_LEVEL_COST * depth,
+# so one call verifies up to 8 levels (256 winners); deeper proofs pool
+# budget from "deposit" calls (PADDING_COST each) in the same group.
+APP_CALL_BUDGET = 700
+CLAIM_BASE_COST = 170
+CLAIM_LEVEL_COST = 62
+PADDING_COST = 14
+
+
+def _sha256(data):
+    return hashlib.sha256(data).digest()
+
+
+def _address(value):
+    if isinstance(value, str):
+        from algosdk import encoding
+
+        return encoding.decode_address(value)
+    if len(value) != 32:
+        raise ValueError("address must be 32 bytes")
+    return bytes(value)
+
+
+def depth(count):
+    """Proof length (levels above the leaves) for `count` winners."""
+    return (count - 1).bit_length() if count > 1 else 0
+
+
+def leaf_hash(index, address, amount):
+    return _sha256(LEAF_PREFIX + struct.pack(">Q", index) + _address(address) + struct.pack(">Q", amount))
+
+
+def node_hash(left, right):
+    return _sha256(NODE_PREFIX + left + right)
+
+
+def padding_calls(count):
+    """Extra "deposit" calls a claim needs next to it for `count` winners."""
+    need = CLAIM_BASE_COST + CLAIM_LEVEL_COST * depth(count) - APP_CALL_BUDGET
+    return max(0, -(-need // (APP_CALL_BUDGET - PADDING_COST)))
+
+
+def box_size(count):
+    """Bytes in the settlement box for `count` winners."""
+    return HEADER_SIZE + (count + 7) // 8
+
+
+def verify(root, index, address, amount, proof):
+    """What the contract checks in "claim"."""
+    node = leaf_hash(index, address, amount)
+    for level, sibling in enumerate(proof):
+        node = node_hash(sibling, node) if index >> level & 1 else node_hash(node, sibling)
+    return node == root
+
+
+class WinnerTree:
+    """Merkle tree over [(address, amount), ...], in claim-index order."""
+
+    def __init__(self, winners):
+        if not winners:
+            raise ValueError("no winners")
+        self.winners = [(_address(a), int(amount)) for a, amount in winners]
+        for _, amount in self.winners:
+            if not 0 < amount < 2**64:
+                raise ValueError(f"amount {amount} out of range")
+        self.depth = depth(len(self.winners))
+        level = [leaf_hash(i, a, amount) for i, (a, amount) in enumerate(self.winners)]
+        level += [EMPTY] * ((1 << self.depth) - len(level))
+        self.levels = [level]
+        while len(level) > 1:
+            level = [node_hash(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+            self.levels.append(level)
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    @property
+    def total(self):
+        return sum(amount for _, amount in self.winners)
+
+    def __len__(self):
+        return len(self.winners)
+
+    def index(self, address):
+        """Claim index of `address` (its first leaf)."""
+        raw = _address(address)
+        for i, (a, _) in enumerate(self.winners):
+            if a == raw:
+                return i
+        raise KeyError(address)
+
+    def proof(self, index):
+        """Sibling hashes from leaf `index` up to the root."""
+        if not 0 <= index < len(self.winners):
+            raise IndexError(index)
+        return [self.levels[k][(index >> k) ^ 1] for k in range(self.depth)]
+
+    def claim_args(self, match_id, index):
+        """Application args for the winner's "claim" call.
+
+        Send it with padding_calls(len(tree)) b"deposit" calls in its group.
+        """
+        _, amount = self.winners[index]
+        return [b"claim", match_id, index, amount, b"".join(self.proof(index))]
+
+    def settle_args(self, match_id):
+        """Application args for the admin's "settle" call."""
+        return [b"settle", match_id, self.root, len(self.winners), self.total]
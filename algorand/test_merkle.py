@@ -0,0 +1,71 @@
+import pytest
+
+from algorand.merkle import EMPTY, WinnerTree, box_size, depth, padding_calls, verify
+from tools.avm import MIN_TXN_FEE, Ledger, Rejected, app_call, payment
+from tools.localnet import deploy
+
+ALGO = 1_000_000
+
+
+def _accounts(n):
+    return [bytes([i + 1]) * 32 for i in range(n)]
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 8, 9])
+def test_every_proof_verifies(count):
+    tree = WinnerTree([(a, 1000 + i) for i, a in enumerate(_accounts(count))])
+    assert len(tree.levels[0]) == 1 << depth(count)
+    for index, (address, amount) in enumerate(tree.winners):
+        proof = tree.proof(index)
+        assert len(proof) == tree.depth
+        assert verify(tree.root, index, address, amount, proof)
+
+
+def test_tampered_claims_fail():
+    tree = WinnerTree([(a, 1000) for a in _accounts(5)])
+    address, amount = tree.winners[2]
+    proof = tree.proof(2)
+    assert not verify(tree.root, 2, address, amount + 1, proof)
+    assert not verify(tree.root, 3, address, amount, proof)
+    assert not verify(tree.root, 2, address, amount, proof[:-1] + [EMPTY])
+    # the padding leaves past the last winner cannot be claimed as zero hashes
+    assert not verify(tree.root, 5, bytes(32), 0, tree.proof(4))
+
+
+def test_winner_limits():
+    with pytest.raises(ValueError):
+        WinnerTree([])
+    with pytest.raises(ValueError):
+        WinnerTree([(bytes(32), 0)])
+    with pytest.raises(IndexError):
+        WinnerTree([(bytes(32), 1)]).proof(1)
+    assert depth(1) == 0 and depth(256) == 8 and depth(257) == 9
+    assert padding_calls(256) == 0 and padding_calls(257) == 1
+    assert box_size(9) == 48 + 2
+
+
+def test_claims_on_chain():
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    app = deploy(ledger, admin, ["match_payout"])["match_payout"]
+    ledger.fund(ledger.app_address(app), 10 * ALGO)
+    winners = [ledger.new_account(ALGO) for _ in range(3)]
+    tree = WinnerTree([(w, 1000 * (i + 1)) for i, w in enumerate(winners)])
+    match_id = (7).to_bytes(8, "big")
+    box = [(0, match_id)]
+    ledger.submit([app_call(admin, app, *tree.settle_args(match_id), boxes=box)])
+
+    def claim(sender, index, proof=None):
+        args = tree.claim_args(match_id, index)
+        if proof is not None:
+            args[-1] = proof
+        return ledger.submit([app_call(sender, app, *args, boxes=box, fee=2 * MIN_TXN_FEE)])
+
+    before = ledger.balance(winners[1])
+    claim(winners[1], 1)
+    assert ledger.balance(winners[1]) == before + 2000 - 2 * MIN_TXN_FEE
+    with pytest.raises(Rejected):
+        claim(winners[1], 1)                                # already claimed
+    with pytest.raises(Rejected):
+        claim(winners[2], 2, b"".join(tree.proof(0)))       # wrong path
+    claim(winners[2], 2)
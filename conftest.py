@@ -0,0 +1 @@
+"""Puts the repo root on sys.path so tests next to tools/ and contracts/ import them as packages."""
@@ -1,19 +1,93 @@
 from pyteal import *
 
+from contracts.batch_query import address_at, address_count, log_page, string_at, valid_addresses
+from contracts.budget import OPUP_METHOD, pooled
+from contracts.dispatch import called_by_legacy_name, dispatch
+from contracts.reputation import (
+    BOX, DECAY_CURVE_KEY, HALF_LIFE_KEY, LOCAL, TRUST, TRUST_APP_ID, UPDATED_KEY, credit_trust_if_authorized, decayed_trust,
+    fetch_record, last_record, record_field,
+)
+
+BORROW = "borrow(string)void"
+GET_LOANS = "get_loans(address[],string[])(uint64,uint64)[]"    # read-only, contracts/batch_query.py
+
+# Loans live in boxes named [borrower (32 bytes)][item id (1-32 bytes)] with a
+# fixed value [collateral (8 bytes)][borrow time (8 bytes)], so a borrower can
+# hold several items at once. Decoded by tools/loan_index.py.
+MAX_ITEM_ID = 32
+LOAN_SIZE = 16
+
+# sweep() closes loans older than LOAN_PERIOD seconds, sending
+# OVERDUE_RELEASE_PERCENT of the collateral back to the borrower and the
+# rest to the lender (0: the lender keeps it all). Both are template
+# variables (defaults here); the percent is checked at creation.
+LOAN_PERIOD = 14 * 24 * 60 * 60
+OVERDUE_RELEASE_PERCENT = 0
+
+# Worst-case opcodes sweep spends once per call and per loan (both shares
+# paid out). The call makes sure the budget covers sweep_cost first
+# (contracts/budget.py); tools/loan_sweep.py pads its groups for it.
+SWEEP_BASE_COST = 80
+SWEEP_LOAN_COST = 100
+
+
+def sweep_cost(loans):
+    """Worst-case opcodes of one sweep call over `loans` loans."""
+    return SWEEP_BASE_COST + loans * SWEEP_LOAN_COST
+
+# Local state of pre-box loans (one per user; legacy "borrow" and "return" only)
+ITEM_KEY = "item_id"                # bytes ("none" while no loan is open)
+COLLATERAL_KEY = "collateral"       # int (microAlgos held)
+BORROW_TIME_KEY = "borrow_time"     # int (Unix seconds)
+
+# Every state key the app writes, with its type. tools/build.py derives the
+# deploy schema (uints, byte slices) from these, so a new key goes here too.
+GLOBAL_STATE = {}
+LOCAL_STATE = {ITEM_KEY: "bytes", COLLATERAL_KEY: "uint64", BORROW_TIME_KEY: "uint64"}
+
+# Where borrow() reads the trust score: LOCAL reads the trust_score app's
+# local state directly; BOX makes an inner get_record call to
+# trust_score_box (callers then add a box reference and one extra min fee).
+TRUST_STORAGE = LOCAL
+TRUST_BOX_APP_ID = 0    # trust_score_box app ID, once deployed
+
+# Trust credited to the borrower when the lender confirms a return, by an
+# inner add_trust call. Returns are only credited once this app's ID is
+# authorized on the trust app; until then (or on the TestNet trust app,
+# which predates the allowlist) they complete without a credit.
+RETURN_TRUST_CREDIT = 5
+
+# Deploy-time parameters, left as TMPL_ template variables in the TEAL. The
+# build assembles the program once and records where each one sits in the
+# bytecode; tools/template.py patches values in per deployment. These are
+# the defaults (the bytecode in asset_escrow.compiled.json's "result").
+TEMPLATE_VARIABLES = {
+    "TRUST_APP_ID": TRUST_APP_ID,
+    "TRUST_BOX_APP_ID": TRUST_BOX_APP_ID,
+    "TRUST_THRESHOLD": 50,          # decayed trust at which borrowing needs no collateral
+    "MIN_COLLATERAL": 1_000_000,    # microAlgos, below the threshold
+    "LOAN_PERIOD": LOAN_PERIOD,
+    "OVERDUE_RELEASE_PERCENT": OVERDUE_RELEASE_PERCENT,
+}
+
+
 def approval_program():
-    # Local State Keys
-    item_key = Bytes("item_id")
-    collateral_key = Bytes("collateral")
-    borrow_time_key = Bytes("borrow_time")
+    # Local State Keys (single loan per user; legacy "borrow" and "return" only)
+    item_key = Bytes(ITEM_KEY)
+    collateral_key = Bytes(COLLATERAL_KEY)
+    borrow_time_key = Bytes(BORROW_TIME_KEY)
 
-    # Operations
-    op_borrow = Bytes("borrow")
-    op_return = Bytes("return")
+    # Overdue policy (sweep)
+    loan_period = Tmpl.Int("TMPL_LOAN_PERIOD")
+    release_percent = Tmpl.Int("TMPL_OVERDUE_RELEASE_PERCENT")
 
     # Handle Creation
-    handle_creation = Return(Int(1))
+    handle_creation = Seq([
+        Assert(release_percent <= Int(100)),
+        Return(Int(1))
+    ])
 
-    # Handle OptIn (Initialize Local State)
+    # Handle OptIn (Initialize Local State for legacy loans)
     handle_optin = Seq([
         App.localPut(Txn.sender(), item_key, Bytes("none")),
         App.localPut(Txn.sender(), collateral_key, Int(0)),
@@ -23,56 +97,216 @@ def approval_program():
 
     # Borrow Item
     # Group: [Payment (Optional), AppCall]
-    # Arg[1]: Item ID
-    # Note: Payment receiver must be App Address
+    # Arg[1]: Item ID (ARC-4 string; raw bytes from legacy "borrow" callers)
+    # Boxes: [borrower + item id] (none for legacy "borrow", which uses local state)
+    # Note: Payment receiver must be App Address; the app account pays the loan box MBR
     
     # Trust Integration
-    # Hardcoded Trust App ID for Testnet
-    TRUST_APP_ID = Int(755292569) 
+    trust_app = Tmpl.Int("TMPL_TRUST_APP_ID")
+    trust_box_app = Tmpl.Int("TMPL_TRUST_BOX_APP_ID")
+    trust_threshold = Tmpl.Int("TMPL_TRUST_THRESHOLD")
     trust_score_key = Bytes("Trust_Score")
 
     # Helper: Get Trust Score
     # Returns (has_score, score)
-    trust_score_val = App.localGetEx(Txn.sender(), TRUST_APP_ID, trust_score_key)
+    # The stored score is decayed to now with the trust app's own curve
+    # (contracts/reputation.py); get_record returns it already decayed.
+    trust_score_val = App.localGetEx(Txn.sender(), trust_app, trust_score_key)
+    trust_updated = App.localGetEx(Txn.sender(), trust_app, Bytes(UPDATED_KEY))
+    trust_curve = App.globalGetEx(trust_app, Bytes(DECAY_CURVE_KEY))
+    trust_half_life = App.globalGetEx(trust_app, Bytes(HALF_LIFE_KEY))
+    if TRUST_STORAGE == BOX:
+        read_trust = fetch_record(trust_box_app, Txn.sender())
+        high_trust = record_field(last_record(), TRUST) >= trust_threshold
+    else:
+        read_trust = Seq(trust_score_val, trust_updated, trust_curve, trust_half_life)
+        high_trust = And(
+            trust_score_val.hasValue(),
+            decayed_trust(trust_score_val.value(), trust_updated.value(),
+                          trust_curve.value(), trust_half_life.value()) >= trust_threshold,
+        )
 
-    borrow = Seq([
-        Assert(App.localGet(Txn.sender(), item_key) == Bytes("none")), # Ensure not already borrowing
-        
-        # Check Trust Score
-        trust_score_val,
-        
-        # Conditional Logic
+    # Credit Trust on Return
+    # Local-state records are only credited if the borrower opted in to the trust app,
+    # and only while this app is on the trust app's allowlist
+    def credit_borrower(account):
+        if TRUST_STORAGE == BOX:
+            return credit_trust_if_authorized(trust_box_app, account, Int(RETURN_TRUST_CREDIT))
+        return If(App.optedIn(account, trust_app)).Then(
+            credit_trust_if_authorized(trust_app, account, Int(RETURN_TRUST_CREDIT))
+        )
+
+    # Helper: Does an ARC-4 string arg's length prefix cover exactly the bytes after it?
+    # Checked before stripping the prefix, so a malformed arg cannot name another loan.
+    def arc4_string_valid(arg):
+        return ExtractUint16(arg, Int(0)) == Len(arg) - Int(2)
+
+    item = ScratchVar(TealType.bytes)
+    collateral = ScratchVar(TealType.uint64)
+    loan_key = Concat(Txn.sender(), item.load())
+
+    # Helper: Check Trust Score, then store the collateral the borrower owes
+    take_collateral = Seq([
+        read_trust,
         If(
-            And(trust_score_val.hasValue(), trust_score_val.value() >= Int(50)) # Threshold: 50
+            high_trust # Threshold: TMPL_TRUST_THRESHOLD
         ).Then(
             # High Trust: 0 Collateral
-            Seq([
-                App.localPut(Txn.sender(), collateral_key, Int(0)), # Mark 0 collateral
-            ])
+            collateral.store(Int(0))
         ).Else(
-            # Low Trust: Require 1 ALGO Payment (or borrow amount)
+            # Low Trust: Require the minimum collateral payment (or borrow amount)
             Seq([
                 Assert(
                     And(
                         Global.group_size() == Int(2),
                         Gtxn[0].type_enum() == TxnType.Payment,
                         Gtxn[0].receiver() == Global.current_application_address(),
-                        Gtxn[0].amount() >= Int(1000000) # 1 ALGO Fixed Collateral
+                        Gtxn[0].amount() >= Tmpl.Int("TMPL_MIN_COLLATERAL") # 1 ALGO by default
                     )
                 ),
-                App.localPut(Txn.sender(), collateral_key, Gtxn[0].amount())
+                collateral.store(Gtxn[0].amount())
             ])
         ),
+    ])
+
+    box_borrow = Seq([
+        Assert(arc4_string_valid(Txn.application_args[1])),
+        item.store(Suffix(Txn.application_args[1], Int(2))),   # strip the ARC-4 length prefix
+        Assert(Len(item.load()) > Int(0)),
+        Assert(Len(item.load()) <= Int(MAX_ITEM_ID)),
+        Assert(App.box_create(loan_key, Int(LOAN_SIZE))), # Ensure not already borrowing this item
+        take_collateral,
+
+        # Record Borrow (and log it for off-chain indexes: box name + value)
+        App.box_put(loan_key, Concat(Itob(collateral.load()), Itob(Global.latest_timestamp()))),
+        Log(Concat(loan_key, App.box_extract(loan_key, Int(0), Int(LOAN_SIZE)))),
         
-        # Record Borrow
+        Return(Int(1))
+    ])
+
+    # Legacy "borrow" (raw item ID, no box references) still opens a pre-box loan
+    # in local state, one per borrower, closed by the legacy "return", until the
+    # old name is removed
+    legacy_borrow = Seq([
+        Assert(App.localGet(Txn.sender(), item_key) == Bytes("none")), # Ensure not already borrowing
+        take_collateral,
         App.localPut(Txn.sender(), item_key, Txn.application_args[1]),
+        App.localPut(Txn.sender(), collateral_key, collateral.load()),
         App.localPut(Txn.sender(), borrow_time_key, Global.latest_timestamp()),
-        
         Return(Int(1))
     ])
 
+    borrow = If(called_by_legacy_name(BORROW), legacy_borrow, box_borrow)
+
     # Return Item (Admin/Lender Action)
     # Arg[1]: Borrower Address
+    # Arg[2]: Item ID (ARC-4 string)
+    # Boxes: [borrower + item id]; Apps: [trust app] (plus its box for BOX trust)
+    loan_borrower = Txn.application_args[1]
+    returned_key = Concat(loan_borrower, Suffix(Txn.application_args[2], Int(2)))
+    loan = App.box_get(returned_key)
+    loan_collateral = ExtractUint64(loan.value(), Int(0))
+
+    confirm_loan_return = Seq([
+        # Only Creator (Lender) can confirm return to release collateral
+        Assert(Txn.sender() == Global.creator_address()),
+        Assert(Len(loan_borrower) == Int(32)),
+        Assert(arc4_string_valid(Txn.application_args[2])),
+
+        # Check the Loan Exists
+        loan,
+        Assert(loan.hasValue()),
+
+        # Refund Collateral if > 0
+        If(loan_collateral > Int(0)).Then(
+            Seq([
+                InnerTxnBuilder.Begin(),
+                InnerTxnBuilder.SetFields({
+                    TxnField.type_enum: TxnType.Payment,
+                    TxnField.receiver: loan_borrower,
+                    TxnField.amount: loan_collateral,
+                    TxnField.fee: Int(0) # Inner txn fee
+                }),
+                InnerTxnBuilder.Submit(),
+            ])
+        ),
+
+        # Close the Loan (frees the box MBR)
+        Assert(App.box_delete(returned_key)),
+
+        # Credit the Borrower's Trust
+        credit_borrower(loan_borrower),
+
+        Return(Int(1))
+    ])
+
+    # Sweep Overdue Loans (Admin/Lender Action)
+    # Arg[1]: ARC-4 string[] of item IDs, one per foreign account, in order
+    # Accounts: the borrowers (up to 4; repeat an account for a second item)
+    # Boxes: [account i + item i] for each i
+    # Loans older than TMPL_LOAN_PERIOD are closed and their collateral split in one
+    # inner group (fee 0, so the caller pays (2 + accounts) * min fee). Loans
+    # already returned, not yet overdue or taken without collateral (high
+    # trust: nothing to split, and the box is the only record of who holds the
+    # item) are skipped; closed loans are logged by box name.
+    items = Txn.application_args[1]
+    i = ScratchVar(TealType.uint64)
+    head = ScratchVar(TealType.uint64)          # offset of item i's length prefix
+    swept_key = ScratchVar(TealType.bytes)
+    forfeited = ScratchVar(TealType.uint64)
+    paying = ScratchVar(TealType.uint64)        # inner group begun
+    swept = App.box_get(swept_key.load())
+    swept_collateral = ExtractUint64(swept.value(), Int(0))
+    released = swept_collateral * release_percent / Int(100)
+
+    def add_payment(receiver, amount):
+        return Seq([
+            If(paying.load()).Then(InnerTxnBuilder.Next()).Else(InnerTxnBuilder.Begin()),
+            paying.store(Int(1)),
+            InnerTxnBuilder.SetFields({
+                TxnField.type_enum: TxnType.Payment,
+                TxnField.receiver: receiver,
+                TxnField.amount: amount,
+                TxnField.fee: Int(0)
+            }),
+        ])
+
+    release = Seq([
+        If(released > Int(0)).Then(add_payment(Txn.accounts[i.load()], released)),
+        forfeited.store(forfeited.load() + swept_collateral - released),
+    ])
+
+    sweep = pooled(Seq([
+        Assert(Txn.sender() == Global.creator_address()),
+        Assert(Txn.accounts.length() > Int(0)),
+        Assert(ExtractUint16(items, Int(0)) == Txn.accounts.length()),
+        forfeited.store(Int(0)),
+        paying.store(Int(0)),
+        For(i.store(Int(1)), i.load() <= Txn.accounts.length(), i.store(i.load() + Int(1))).Do(Seq([
+            head.store(Int(2) + ExtractUint16(items, Int(2) * i.load())),
+            swept_key.store(Concat(
+                Txn.accounts[i.load()],
+                Extract(items, head.load() + Int(2), ExtractUint16(items, head.load())),
+            )),
+            swept,
+            If(swept.hasValue()).Then(
+                If(And(
+                    swept_collateral > Int(0),
+                    ExtractUint64(swept.value(), Int(8)) + loan_period <= Global.latest_timestamp(),
+                )).Then(Seq([
+                    release,
+                    Assert(App.box_delete(swept_key.load())),
+                    Log(swept_key.load()),      # for off-chain indexes
+                ]))
+            ),
+        ])),
+        If(forfeited.load() > Int(0)).Then(add_payment(Txn.sender(), forfeited.load())),
+        If(paying.load()).Then(InnerTxnBuilder.Submit()),
+        Return(Int(1))
+    ]), Int(SWEEP_BASE_COST) + Txn.accounts.length() * Int(SWEEP_LOAN_COST))
+
+    # Return Item from a pre-box loan in local state (Admin/Lender Action)
+    # Arg[1]: Borrower Address
     borrower = Txn.application_args[1]
     
     confirm_return = Seq([
@@ -100,13 +334,40 @@ def approval_program():
         App.localPut(borrower, item_key, Bytes("none")),
         App.localPut(borrower, collateral_key, Int(0)),
         App.localPut(borrower, borrow_time_key, Int(0)),
+
+        # Credit the Borrower's Trust
+        credit_borrower(borrower),
         
         Return(Int(1))
     ])
 
-    handle_noop = Cond(
-        [Txn.application_args[0] == op_borrow, borrow],
-        [Txn.application_args[0] == op_return, confirm_return]
+    # Get Loans: the status of a page of (borrower, item) loans in one read-only call
+    # Args: [selector, address[] of borrowers, string[] of item IDs, one per borrower]
+    # Logs the ARC-4 (uint64,uint64)[] return: (collateral, borrow time) per loan,
+    # (0, 0) for none. Called through simulate (see contracts/batch_query.py).
+    borrowers = Txn.application_args[1]
+    loan_items = Txn.application_args[2]
+    loan_index = ScratchVar(TealType.uint64)
+    queried = App.box_get(Concat(address_at(borrowers, loan_index.load()), string_at(loan_items, loan_index.load())))
+
+    get_loans = Seq([
+        Assert(valid_addresses(borrowers)),
+        Assert(ExtractUint16(loan_items, Int(0)) == address_count(borrowers)),
+        log_page(address_count(borrowers), lambda i: Seq(
+            loan_index.store(i),
+            queried,
+            If(queried.hasValue(), queried.value(), BytesZero(Int(LOAN_SIZE))),
+        )),
+        Return(Int(1))
+    ])
+
+    handle_noop = dispatch(
+        (BORROW, borrow),
+        ("confirm_return(address,string)void", confirm_loan_return, None),
+        ("confirm_return(address)void", confirm_return, "return"),   # local-state loans
+        ("sweep(string[])void", sweep, None),
+        (GET_LOANS, get_loans, None),
+        OPUP_METHOD,
     )
 
     return Cond(
@@ -120,8 +381,3 @@ def approval_program():
 
 def clear_state_program():
     return Return(Int(1))
-
-if __name__ == "__main__":
-    with open("asset_escrow.teal", "w") as f:
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=6)
-        f.write(compiled)
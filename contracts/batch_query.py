@@ -0,0 +1,67 @@
+"""
+Read-only batch queries: one call returns the state of a page of accounts.
+
+trust_score.get_records, asset_escrow.get_loans and commute_checkin.get_trips
+take an ARC-4 address[] (get_loans also a parallel string[] of item IDs) and
+log one ARC-4 array of fixed-size records, one per address, in order:
+
+    get_records = Seq(
+        Assert(valid_addresses(addresses)),
+        log_page(address_count(addresses), lambda i: record(address_at(addresses, i))),
+        Return(Int(1)),
+    )
+
+They change nothing, so clients call them through algod's simulate endpoint
+(tools/query.py) instead of fetching each account's state: no signatures,
+no fees spent, and with allow_unnamed_resources the addresses and boxes need
+not be listed in the foreign arrays. They still count against the call's
+reference limits (these are v8 programs), so a page is at most 4 addresses
+read from local state or 8 boxes, and never more than
+max_records(record size), so the return value fits in one log; a client
+asks for longer lists with one call per page in a single group.
+"""
+from pyteal import Bytes, Concat, Extract, ExtractUint16, For, Int, Itob, Len, Log, ScratchVar, Seq, TealType
+
+from contracts.reputation import ARC4_RETURN_PREFIX
+
+MAX_LOG_BYTES = 1024
+
+_i = ScratchVar(TealType.uint64)
+_page = ScratchVar(TealType.bytes)
+
+
+def max_records(record_size):
+    """Records of `record_size` bytes that fit in one ARC-4 array return value."""
+    return (MAX_LOG_BYTES - len(ARC4_RETURN_PREFIX) - 2) // record_size
+
+
+def address_count(addresses):
+    """Length of an ARC-4 address[] argument."""
+    return ExtractUint16(addresses, Int(0))
+
+
+def valid_addresses(addresses):
+    """True when an ARC-4 address[] argument is exactly as long as its length prefix says."""
+    return Len(addresses) == Int(2) + address_count(addresses) * Int(32)
+
+
+def address_at(addresses, i):
+    """Element i (0-based) of an ARC-4 address[] argument."""
+    return Extract(addresses, Int(2) + i * Int(32), Int(32))
+
+
+def string_at(strings, i):
+    """Element i (0-based) of an ARC-4 string[] argument, without its length prefix."""
+    head = Int(2) + ExtractUint16(strings, Int(2) + i * Int(2))
+    return Extract(strings, head + Int(2), ExtractUint16(strings, head))
+
+
+def log_page(count, record):
+    """Log the ARC-4 array return of record(i) for i in [0, count); records are fixed-size bytes values."""
+    return Seq([
+        _page.store(Extract(Itob(count), Int(6), Int(2))),     # the array's uint16 length
+        For(_i.store(Int(0)), _i.load() < count, _i.store(_i.load() + Int(1))).Do(
+            _page.store(Concat(_page.load(), record(_i.load()))),
+        ),
+        Log(Concat(Bytes("base16", ARC4_RETURN_PREFIX.hex()), _page.load())),
+    ])
@@ -0,0 +1,50 @@
+"""
+Opcode budget for methods that can need more than one app call's 700.
+
+Every app call in a group adds 700 to one budget the whole group shares,
+and so does every inner app call. An expensive method gets more budget
+either way:
+
+- The client pads the group with `opup()void` calls to the same app, which
+  only approve. tools/budget.py works out how many the group needs from
+  the method's static or simulated cost and moves their fees onto the
+  method's own call.
+- The method tops itself up. `ensure_budget(cost)` issues inner app calls
+  (PyTeal's OpUp: each creates and deletes a one-instruction app) while
+  the remaining budget is below `cost`. Their fees come out of the
+  group's fee credit, so a caller who did not pad pays one extra min fee
+  per inner call instead. With enough padding the check is a few
+  opcodes and issues nothing.
+
+    batch_update = pooled(Seq([...]), Int(BASE_COST) + Txn.accounts.length() * Int(ACCOUNT_COST))
+    methods = [..., OPUP_METHOD]
+
+Wrap the whole method body once, with its worst-case cost for what this
+call will actually do (e.g. per account it carries): one check per call
+costs less than one per loop iteration, running it first leaves the most
+of the call's budget unspent when it runs, and only calls that run short
+top up.
+"""
+from pyteal import Approve, OpUp, OpUpFeeSource, OpUpMode, Seq
+
+OPUP = "opup()void"
+OPUP_METHOD = (OPUP, Approve(), None)       # a dispatch entry, selector only
+
+OPUP_COST = 25              # opcodes an opup call spends of the 700 it adds (dispatch included)
+
+# pooled(body, cost) wants `cost` plus PyTeal's 10-opcode buffer still left
+# when its check runs, after dispatch has spent some of the call's budget
+# (about 35 opcodes). Give `cost` for the whole call, so the on-chain check
+# and the client's padding use one formula: a group padded for its calls'
+# costs plus CHECK_HEADROOM passes every check without topping up.
+CHECK_HEADROOM = 60
+
+
+def ensure_budget(cost):
+    """Top the remaining budget up to at least `cost` with fee-less inner app calls."""
+    return OpUp(OpUpMode.OnCall).ensure_budget(cost, fee_source=OpUpFeeSource.GroupCredit)
+
+
+def pooled(body, cost):
+    """`body` run once the remaining budget covers `cost`."""
+    return Seq(ensure_budget(cost), body)
@@ -1,5 +1,9 @@
 from pyteal import *
 
+from contracts.dispatch import dispatch
+
+MAX_BATCH_TOTAL = 100 * 1_000_000    # microAlgos one batch_payout call may send
+
 def approval_program():
     is_admin = Txn.sender() == Global.creator_address()
     
@@ -12,7 +16,7 @@ def approval_program():
     handle_optin = Return(Int(1))
     
     # 3. Admin Payout Logic (NoOp)
-    # Arg[0] = "payout"
+    # Arg[0] = payout(address,uint64)void selector (or legacy "payout")
     # Arg[1] = Receiver Address
     # Arg[2] = Amount (Int)
     
@@ -32,8 +36,49 @@ def approval_program():
         Return(Int(1))
     ])
     
-    handle_noop = Cond(
-        [Txn.application_args[0] == Bytes("payout"), payout],
+    # 4. Batch Payout (NoOp)
+    # Arg[0] = batch_payout(uint64[])void selector
+    # Arg[1] = ARC-4 uint64[] of amounts, one per foreign account, in order
+    # Accounts = the receivers (up to 4)
+    # All payments go out as one inner group (itxn_next) with fee 0, so the
+    # caller pays (1 + receivers) * min fee on the outer call.
+    amounts = Txn.application_args[1]
+    i = ScratchVar(TealType.uint64)
+    total = ScratchVar(TealType.uint64)
+    amount_i = ExtractUint64(amounts, Int(2) + (i.load() - Int(1)) * Int(8))
+
+    def pay_account_i():
+        return Seq([
+            InnerTxnBuilder.SetFields({
+                TxnField.type_enum: TxnType.Payment,
+                TxnField.receiver: Txn.accounts[i.load()],
+                TxnField.amount: amount_i,
+                TxnField.fee: Int(0)
+            }),
+            total.store(total.load() + amount_i),
+        ])
+
+    batch_payout = Seq([
+        Assert(is_admin),
+        Assert(Txn.accounts.length() > Int(0)),
+        Assert(ExtractUint16(amounts, Int(0)) == Txn.accounts.length()),
+        Assert(Len(amounts) == Int(2) + Txn.accounts.length() * Int(8)),
+        i.store(Int(1)),
+        total.store(Int(0)),
+        InnerTxnBuilder.Begin(),
+        pay_account_i(),
+        For(i.store(Int(2)), i.load() <= Txn.accounts.length(), i.store(i.load() + Int(1))).Do(Seq([
+            InnerTxnBuilder.Next(),
+            pay_account_i(),
+        ])),
+        Assert(total.load() <= Int(MAX_BATCH_TOTAL)),
+        InnerTxnBuilder.Submit(),
+        Return(Int(1))
+    ])
+
+    handle_noop = dispatch(
+        ("payout(address,uint64)void", payout),
+        ("batch_payout(uint64[])void", batch_payout, None),
     )
 
     return Cond(
@@ -44,8 +89,3 @@ def approval_program():
 
 def clear_state_program():
     return Return(Int(1))
-
-if __name__ == "__main__":
-    with open("civic_rewards.teal", "w") as f:
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=6)
-        f.write(compiled)
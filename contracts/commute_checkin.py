@@ -1,23 +1,110 @@
 from pyteal import *
 
+from contracts.batch_query import address_at, address_count, log_page, valid_addresses
+from contracts.dispatch import dispatch
+from contracts.reputation import TRUST_APP_ID, credit_trust_if_authorized
+
+# Trust credited to the rider and the driver for each completed trip, by inner
+# add_trust calls. Only accounts opted in to trust_score are credited, and
+# only once this app's ID is authorized on it; until then trips complete
+# without credits.
+TRIP_TRUST_CREDIT = 1
+
+# Deploy-time parameters, left as TMPL_ template variables in the TEAL
+# (tools/template.py); these are the defaults.
+TEMPLATE_VARIABLES = {
+    "TRUST_APP_ID": TRUST_APP_ID,
+}
+
+# Available drivers wait in a FIFO ring buffer of driver addresses. Global
+# "head" and "tail" count dequeued and enqueued drivers; queue position p
+# lives in page box QUEUE_PREFIX || uint64(page), at slot p % QUEUE_CAPACITY
+# (see queue_slot). Each page is 1024 bytes, so one box reference covers it;
+# the app account pays a page's MBR the first time a driver lands in it.
+QUEUE_PREFIX = b"drivers"
+SLOTS_PER_PAGE = 32
+QUEUE_PAGES = 8
+QUEUE_CAPACITY = SLOTS_PER_PAGE * QUEUE_PAGES
+HEAD_KEY = "head"
+TAIL_KEY = "tail"
+
+# Local state keys
+ROLE_KEY = "role"                   # bytes "rider" or "driver"
+TRIP_ACTIVE_KEY = "trip_active"     # int 0 or 1
+MATCHED_WITH_KEY = "matched_with"   # bytes (address of counterpart, while matched)
+COLLATERAL_KEY = "collateral"       # int (amount locked)
+QUEUED_KEY = "queued"               # int (queue position + 1 while the driver waits in the queue)
+
+# Every state key the app writes, with its type. tools/build.py derives the
+# deploy schema (uints, byte slices) from these, so a new key goes here too.
+GLOBAL_STATE = {HEAD_KEY: "uint64", TAIL_KEY: "uint64"}
+LOCAL_STATE = {
+    ROLE_KEY: "bytes",
+    TRIP_ACTIVE_KEY: "uint64",
+    MATCHED_WITH_KEY: "bytes",
+    COLLATERAL_KEY: "uint64",
+    QUEUED_KEY: "uint64",
+}
+
+# start_trip drops up to this many departed drivers from the head of the
+# queue before matching (one foreign account each, plus the matched driver).
+MAX_STALE_SKIPS = 3
+
+
+# get_trips(address[]) returns one TRIP_STATUS per address (read-only, see
+# contracts/batch_query.py): role code, trip_active, collateral, queued and
+# the matched counterpart (zero address while unmatched).
+GET_TRIPS = "get_trips(address[])(uint8,uint64,uint64,uint64,address)[]"
+TRIP_STATUS_SIZE = 1 + 8 + 8 + 8 + 32
+NOT_OPTED_IN, NO_ROLE, RIDER, DRIVER = 0, 1, 2, 3      # role codes
+
+
+def queue_slot(position):
+    """(page box name, byte offset) of the driver at queue `position`."""
+    page, slot = divmod(position % QUEUE_CAPACITY, SLOTS_PER_PAGE)
+    return QUEUE_PREFIX + page.to_bytes(8, "big"), slot * 32
+
+
 def approval_program():
-    # Local State Variables
-    # "role": bytes "rider" or "driver"
-    # "trip_active": int 0 or 1
-    # "matched_with": bytes (address of counterpart)
-    # "collateral": int (amount locked)
-
-    role_key = Bytes("role")
-    trip_active_key = Bytes("trip_active")
-    matched_with_key = Bytes("matched_with")
-    collateral_key = Bytes("collateral")
-
-    # Operations
-    op_register_driver = Bytes("register_driver")
-    op_register_rider = Bytes("register_rider")
-    op_start_trip = Bytes("start_trip") # Rider deposits collateral
-    op_end_trip = Bytes("end_trip")     # Rider confirms arrival, pays Driver
-    op_cancel_trip = Bytes("cancel_trip") # Refund if no driver found
+    # State Keys (LOCAL_STATE and GLOBAL_STATE above)
+    role_key = Bytes(ROLE_KEY)
+    trip_active_key = Bytes(TRIP_ACTIVE_KEY)
+    matched_with_key = Bytes(MATCHED_WITH_KEY)
+    collateral_key = Bytes(COLLATERAL_KEY)
+    queued_key = Bytes(QUEUED_KEY)
+    head_key = Bytes(HEAD_KEY)
+    tail_key = Bytes(TAIL_KEY)
+
+    # Helpers: Queue Page Box and Offset of a Position
+    def page_name(position):
+        return Concat(Bytes(QUEUE_PREFIX), Itob(position % Int(QUEUE_CAPACITY) / Int(SLOTS_PER_PAGE)))
+
+    def page_offset(position):
+        return position % Int(SLOTS_PER_PAGE) * Int(32)
+
+    # Helper: Is the driver at queue position still waiting there?
+    # Drivers who left, switched role or cleared their state are skipped lazily.
+    def waiting(driver, position):
+        return And(
+            App.optedIn(driver, Global.current_application_id()),
+            App.localGet(driver, queued_key) == position + Int(1),
+        )
+
+    head = App.globalGet(head_key)
+    tail = App.globalGet(tail_key)
+    head_driver = BoxExtract(page_name(head), page_offset(head), Int(32))
+    sender_match = App.localGetEx(Txn.sender(), Global.current_application_id(), matched_with_key)
+
+    # Helper: Clear the driver's side of a match with the rider. A driver on a
+    # pooled ride keeps the latest rider; they may also have cleared state.
+    def unmatch(driver, rider):
+        driver_side = App.localGetEx(driver, Global.current_application_id(), matched_with_key)
+        return If(App.optedIn(driver, Global.current_application_id())).Then(Seq([
+            driver_side,
+            If(driver_side.hasValue()).Then(
+                If(driver_side.value() == rider).Then(App.localDel(driver, matched_with_key))
+            ),
+        ]))
 
     # Handle Creation
     handle_creation = Return(Int(1))
@@ -30,27 +117,75 @@ def approval_program():
         Return(Int(1))
     ])
 
-    # Register as Driver
+    # Register as Driver (joins the back of the queue; no-op while queued)
+    # A matched driver may register again to pick up more riders (pooled rides).
+    # Boxes = [queue page of "tail"]
     register_driver = Seq([
+        Assert(App.localGet(Txn.sender(), trip_active_key) == Int(0)),
         App.localPut(Txn.sender(), role_key, Bytes("driver")),
+        If(App.localGet(Txn.sender(), queued_key) == Int(0)).Then(Seq([
+            Assert(tail - head < Int(QUEUE_CAPACITY)),
+            Pop(App.box_create(page_name(tail), Int(SLOTS_PER_PAGE * 32))),
+            App.box_replace(page_name(tail), page_offset(tail), Txn.sender()),
+            App.localPut(Txn.sender(), queued_key, tail + Int(1)),
+            App.globalPut(tail_key, tail + Int(1)),
+        ])),
+        Return(Int(1))
+    ])
+
+    # Leave the Queue (Driver Action; the slot is skipped when it reaches the head)
+    leave_queue = Seq([
+        App.localPut(Txn.sender(), queued_key, Int(0)),
         Return(Int(1))
     ])
 
-    # Register as Rider
+    # Register as Rider (also leaves the driver queue)
     register_rider = Seq([
         App.localPut(Txn.sender(), role_key, Bytes("rider")),
+        App.localPut(Txn.sender(), queued_key, Int(0)),
+        Return(Int(1))
+    ])
+
+    # Drop the Head of the Queue if that driver is no longer waiting (anyone)
+    # Accounts = [head driver], Boxes = [queue page of "head"]
+    pop_stale = Seq([
+        Assert(head < tail),
+        Assert(Not(waiting(head_driver, head))),
+        App.globalPut(head_key, head + Int(1)),
         Return(Int(1))
     ])
 
     # Start Trip (Rider Action)
     # Rider must send payment transaction to Escrow (App Account)
     # Group Size = 2: [Payment, AppCall]
+    # Matches the rider with the first waiting driver from the head of the
+    # queue, dropping up to MAX_STALE_SKIPS departed drivers ahead of them.
+    # Accounts = [departed drivers..., driver], Boxes = [queue pages they sit in]
+    driver = ScratchVar(TealType.bytes)
+    skipped = ScratchVar(TealType.uint64)
     start_trip = Seq([
         Assert(Global.group_size() == Int(2)),
         Assert(Gtxn[0].type_enum() == TxnType.Payment),
         Assert(Gtxn[0].receiver() == Global.current_application_address()),
         Assert(Gtxn[0].amount() > Int(0)),
         Assert(App.localGet(Txn.sender(), role_key) == Bytes("rider")),
+        Assert(App.localGet(Txn.sender(), trip_active_key) == Int(0)),
+
+        # Dequeue and Match the First Waiting Driver
+        skipped.store(Int(0)),
+        Assert(head < tail),
+        driver.store(head_driver),
+        While(Not(waiting(driver.load(), head))).Do(Seq([
+            Assert(skipped.load() < Int(MAX_STALE_SKIPS)),
+            skipped.store(skipped.load() + Int(1)),
+            App.globalPut(head_key, head + Int(1)),
+            Assert(head < tail),
+            driver.store(head_driver),
+        ])),
+        App.globalPut(head_key, head + Int(1)),
+        App.localPut(driver.load(), queued_key, Int(0)),
+        App.localPut(driver.load(), matched_with_key, Txn.sender()),
+        App.localPut(Txn.sender(), matched_with_key, driver.load()),
         
         # Lock Collateral
         App.localPut(Txn.sender(), trip_active_key, Int(1)),
@@ -59,13 +194,24 @@ def approval_program():
     ])
 
     # End Trip (Rider Action)
-    # Pay Driver from Escrow
-    # Arg[1] = Driver Address
+    # Pay the Matched Driver from Escrow, then credit both parties' trust
+    # Arg[1] = Driver Address (must be the rider's matched_with)
+    # Accounts = [driver], Apps = [trust_score]
     driver_addr = Txn.application_args[1]
+
+    trust_app = Tmpl.Int("TMPL_TRUST_APP_ID")
+
+    def credit(account, amount=Int(TRIP_TRUST_CREDIT)):
+        return If(App.optedIn(account, trust_app)).Then(
+            credit_trust_if_authorized(trust_app, account, amount)
+        )
     
     end_trip = Seq([
         Assert(App.localGet(Txn.sender(), trip_active_key) == Int(1)),
         Assert(App.localGet(Txn.sender(), collateral_key) > Int(0)),
+        sender_match,
+        Assert(sender_match.hasValue()),
+        Assert(sender_match.value() == driver_addr),
         
         # Payment to Driver (Inner Txn)
         InnerTxnBuilder.Begin(),
@@ -80,12 +226,73 @@ def approval_program():
         # Reset State
         App.localPut(Txn.sender(), trip_active_key, Int(0)),
         App.localPut(Txn.sender(), collateral_key, Int(0)),
+        App.localDel(Txn.sender(), matched_with_key),
+        unmatch(driver_addr, Txn.sender()),
+
+        # Credit Trust
+        credit(Txn.sender()),
+        credit(driver_addr),
+        Return(Int(1))
+    ])
+
+    # Settle Trips (Driver or Operator Action)
+    # Pays the driver every listed rider's collateral in one inner payment and
+    # credits trust: each rider once, the driver once for all of them. Riders
+    # without an active trip matched to this driver are skipped.
+    # Arg[1] = Driver Address
+    # Accounts = riders (and the driver, when the operator calls), Apps = [trust_score]
+    i = ScratchVar(TealType.uint64)
+    rider = ScratchVar(TealType.bytes)
+    total = ScratchVar(TealType.uint64)
+    settled = ScratchVar(TealType.uint64)
+    rider_match = App.localGetEx(rider.load(), Global.current_application_id(), matched_with_key)
+
+    settle_trips = Seq([
+        Assert(Or(Txn.sender() == driver_addr, Txn.sender() == Global.creator_address())),
+        total.store(Int(0)),
+        settled.store(Int(0)),
+        For(i.store(Int(1)), i.load() <= Txn.accounts.length(), i.store(i.load() + Int(1))).Do(Seq([
+            rider.store(Txn.accounts[i.load()]),
+            rider_match,
+            If(And(
+                rider_match.hasValue(),
+                App.localGet(rider.load(), trip_active_key) == Int(1),
+                App.localGet(rider.load(), collateral_key) > Int(0),
+            )).Then(If(rider_match.value() == driver_addr).Then(Seq([
+                total.store(total.load() + App.localGet(rider.load(), collateral_key)),
+                settled.store(settled.load() + Int(1)),
+                App.localPut(rider.load(), trip_active_key, Int(0)),
+                App.localPut(rider.load(), collateral_key, Int(0)),
+                App.localDel(rider.load(), matched_with_key),
+                unmatch(driver_addr, rider.load()),
+                credit(rider.load()),
+            ]))),
+        ])),
+        Assert(settled.load() > Int(0)),
+
+        # One Payment to Driver for all settled trips
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields({
+            TxnField.type_enum: TxnType.Payment,
+            TxnField.receiver: driver_addr,
+            TxnField.amount: total.load(),
+            TxnField.fee: Int(0)
+        }),
+        InnerTxnBuilder.Submit(),
+        credit(driver_addr, settled.load() * Int(TRIP_TRUST_CREDIT)),
         Return(Int(1))
     ])
 
     # Cancel Trip (Rider Action - Refund)
+    # The driver is unmatched and registers again to rejoin the queue.
+    # Accounts = [driver] (none for trips started before matching)
     cancel_trip = Seq([
         Assert(App.localGet(Txn.sender(), trip_active_key) == Int(1)),
+        sender_match,
+        If(sender_match.hasValue()).Then(Seq([
+            unmatch(sender_match.value(), Txn.sender()),
+            App.localDel(Txn.sender(), matched_with_key),
+        ])),
         
         # Refund Rider
         InnerTxnBuilder.Begin(),
@@ -103,12 +310,50 @@ def approval_program():
         Return(Int(1))
     ])
 
-    handle_noop = Cond(
-        [Txn.application_args[0] == op_register_driver, register_driver],
-        [Txn.application_args[0] == op_register_rider, register_rider],
-        [Txn.application_args[0] == op_start_trip, start_trip],
-        [Txn.application_args[0] == op_end_trip, end_trip],
-        [Txn.application_args[0] == op_cancel_trip, cancel_trip]
+    # Get Trips: the trip status of a page of users in one read-only call
+    # Args: [selector, address[]]; logs the ARC-4 (uint8,uint64,uint64,uint64,address)[]
+    # return (see GET_TRIPS), all zeros for users not opted in. Called through simulate.
+    users = Txn.application_args[1]
+    user = ScratchVar(TealType.bytes)
+    user_role = App.localGet(user.load(), role_key)
+    user_match = App.localGetEx(user.load(), Global.current_application_id(), matched_with_key)
+
+    def trip_status(i):
+        return Seq(
+            user.store(address_at(users, i)),
+            If(
+                App.optedIn(user.load(), Global.current_application_id()),
+                Seq(
+                    user_match,
+                    Concat(
+                        Extract(Itob(If(user_role == Bytes("driver"), Int(DRIVER),
+                                        If(user_role == Bytes("rider"), Int(RIDER), Int(NO_ROLE)))), Int(7), Int(1)),
+                        Itob(App.localGet(user.load(), trip_active_key)),
+                        Itob(App.localGet(user.load(), collateral_key)),
+                        Itob(App.localGet(user.load(), queued_key)),
+                        If(user_match.hasValue(), user_match.value(), Global.zero_address()),
+                    ),
+                ),
+                BytesZero(Int(TRIP_STATUS_SIZE)),
+            ),
+        )
+
+    get_trips = Seq([
+        Assert(valid_addresses(users)),
+        log_page(address_count(users), trip_status),
+        Return(Int(1))
+    ])
+
+    handle_noop = dispatch(
+        ("register_driver()void", register_driver), # Join the driver queue
+        ("register_rider()void", register_rider),
+        ("leave_queue()void", leave_queue),
+        ("pop_stale()void", pop_stale),             # Skip a departed driver at the head
+        ("start_trip(pay)void", start_trip),        # Rider deposits collateral, matched with the head driver
+        ("end_trip(address)void", end_trip),        # Rider confirms arrival, pays the matched Driver
+        ("settle_trips(address)void", settle_trips), # Driver collects several riders' fares at once
+        ("cancel_trip()void", cancel_trip),         # Refund and unmatch
+        (GET_TRIPS, get_trips, None),               # Read-only: a page of users' trip status
     )
 
     return Cond(
@@ -122,9 +367,3 @@ def approval_program():
 
 def clear_state_program():
     return Return(Int(1))
-
-if __name__ == "__main__":
-    with open("commute_checkin.teal", "w") as f:
-        # Upgrade to Version 8
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=8)
-        f.write(compiled)
@@ -0,0 +1,62 @@
+"""
+NoOp method dispatch shared by the contracts.
+
+    handle_noop = dispatch(
+        ("register_driver()void", register_driver),
+        ("end_trip(address)void", end_trip),
+        ("confirm_return(address)void", confirm_return, "return"),
+        ("batch_settle(byte[])void", batch_settle, None),     # new: no legacy name
+        (("buy(pay,uint64)void", "buy(pay,uint64,uint64)void"), buy),   # overloads, one body
+    )
+
+Txn.application_args[0] selects a method by its ARC-4 selector (first four
+bytes of SHA-512/256 of the signature). Until the Node controllers have
+migrated, the bare method name ("end_trip", or the third tuple item where
+the old name differs) is accepted too; methods added since pass None and
+answer to their selector only. Argument positions are the same for
+both, and signatures use ARC-4 types whose encoding matches what the
+contract already reads (`address` is 32 raw bytes, `uint64` is 8 bytes
+big-endian).
+
+The result is an ordinary Cond. For TEAL v8 and up, tools/lower.py turns
+its compare chain into a single `match` at build time, so dispatch cost no
+longer grows with the method's position.
+"""
+from pyteal import Bytes, Cond, Int, MethodSignature, Or, Txn
+
+# Accept the pre-ARC-4 string method names. Drop after the release that
+# moves server/controllers to selectors.
+LEGACY_NAMES = True
+
+
+def legacy_name(signature, legacy=True):
+    """The old string name for `signature`: True derives it, a string overrides it, None means none."""
+    if not LEGACY_NAMES or legacy is None:
+        return None
+    return signature.split("(", 1)[0] if legacy is True else legacy
+
+
+def called(signature, legacy=True):
+    """True when this call selects `signature` (or its legacy name).
+
+    A tuple of signatures selects any of them; the legacy name is the first's.
+    """
+    signatures = signature if isinstance(signature, tuple) else (signature,)
+    tests = [Txn.application_args[0] == MethodSignature(s) for s in signatures]
+    name = legacy_name(signatures[0], legacy)
+    if name is not None:
+        tests.append(Txn.application_args[0] == Bytes(name))
+    return Or(*tests) if len(tests) > 1 else tests[0]
+
+
+def called_by_legacy_name(signature, legacy=True):
+    """True when the caller used the old string name rather than the selector."""
+    name = legacy_name(signature, legacy)
+    if name is None:
+        return Int(0)
+    return Txn.application_args[0] == Bytes(name)
+
+
+def dispatch(*methods):
+    """Cond over (signature, body[, legacy name or None]) tuples; unknown methods fail."""
+    return Cond(*[[called(m[0], *m[2:]), m[1]] for m in methods])
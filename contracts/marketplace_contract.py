@@ -1,74 +1,100 @@
 from pyteal import *
 
+from contracts.dispatch import dispatch
+
 def approval_program():
     # Constants
-    # Box layout: [Seller (32 bytes)][Price (8 bytes)]
-    BOX_SIZE = Int(32 + 8)
-
-    # Operations
-    op_list = Bytes("list")
-    op_buy = Bytes("buy")
-    op_delist = Bytes("delist")
-
-    # Helper: Get Box Name (Asset ID as 8-byte uint64)
-    def get_box_name(asset_id):
-        return Itob(asset_id)
+    # Box layout v1: [Seller (32 bytes)][Unit Price (8 bytes)][Remaining (8 bytes)][Version = 1 (1 byte)]
+    # Legacy boxes are the first 40 bytes only and hold a single unit.
+    # Boxes are named Itob(asset id) || seller, so several sellers can list the
+    # same fungible ASA. Listings made before that are named Itob(asset id)
+    # alone; buy and delist fall back to them when the seller has no box of
+    # their own for the asset (the call must then reference both names).
+    LEGACY_BOX_SIZE = Int(32 + 8)
+    BOX_VERSION = Bytes("base16", "01")
+
+    # Helper: Units left in a listing box value
+    def remaining_units(value):
+        return If(Len(value) == LEGACY_BOX_SIZE, Int(1), ExtractUint64(value, Int(40)))
+
+    # Helper: Get Box Name (Asset ID as 8-byte uint64, then the seller)
+    def get_box_name(asset_id, seller):
+        return Concat(Itob(asset_id), seller)
+
+    # Helper: Store the seller's listing box name for an asset in `name`,
+    # or the legacy asset-only name if the seller has no box of their own
+    def resolve_box_name(name, asset_id, seller):
+        own_box = App.box_length(get_box_name(asset_id, seller))
+        return Seq([
+            own_box,
+            name.store(If(own_box.hasValue(), get_box_name(asset_id, seller), Itob(asset_id))),
+        ])
+
+    # Each list/buy call is paired with the transaction right before it, so a
+    # group can hold up to 8 (transfer, call) pairs: one checkout, one drop.
+    prev_txn = Gtxn[Txn.group_index() - Int(1)]
 
     # 1. List Item
-    # Args: [list, asset_id, price]
-    # Group: [AssetTransfer(Axfer) to App, AppCall]
+    # Args: [list, asset_id, unit price]
+    # Group: [..., AssetTransfer(Axfer) of the quantity to App, AppCall, ...]
     asset_id_arg = Btoi(Txn.application_args[1])
     price_arg = Btoi(Txn.application_args[2])
-    box_name = get_box_name(asset_id_arg)
+    box_name = get_box_name(asset_id_arg, Txn.sender())
     
     # Check existence
     existing_box = App.box_get(box_name)
 
     list_item = Seq([
-        # Verify Group Size
-        Assert(Global.group_size() == Int(2)),
-        
-        # Verify Asset Transfer
-        Assert(Gtxn[0].type_enum() == TxnType.AssetTransfer),
-        Assert(Gtxn[0].xfer_asset() == asset_id_arg),
-        Assert(Gtxn[0].asset_receiver() == Global.current_application_address()),
-        Assert(Gtxn[0].asset_amount() == Int(1)),
-        Assert(Gtxn[0].sender() == Txn.sender()),
+        # Verify Asset Transfer (the preceding transaction)
+        Assert(prev_txn.type_enum() == TxnType.AssetTransfer),
+        Assert(prev_txn.xfer_asset() == asset_id_arg),
+        Assert(prev_txn.asset_receiver() == Global.current_application_address()),
+        Assert(prev_txn.asset_amount() > Int(0)),
+        Assert(prev_txn.sender() == Txn.sender()),
 
         # Check if Box exists (Prevent overwrite)
         existing_box,
         Assert(Not(existing_box.hasValue())),
 
-        # Create Box and Store [Seller, Price]
-        App.box_put(box_name, Concat(Txn.sender(), Itob(price_arg))),
+        # Create Box and Store [Seller, Unit Price, Remaining, Version]
+        App.box_put(box_name, Concat(Txn.sender(), Itob(price_arg), Itob(prev_txn.asset_amount()), BOX_VERSION)),
         
         Approve()
     ])
 
     # 2. Buy Item
-    # Args: [buy, asset_id]
-    # Group: [Payment to Seller, AppCall]
+    # Args: [buy, asset_id] or [buy, asset_id, quantity]
+    # Group: [..., Payment of unit price x quantity to Seller, AppCall, ...]
+    # The payment's receiver picks the seller's listing; the call logs it so
+    # off-chain indexes know which listing sold.
     buy_asset_id = Btoi(Txn.application_args[1])
-    buy_box_name = get_box_name(buy_asset_id)
+    buy_box_name = ScratchVar(TealType.bytes)
+    buy_quantity = If(Txn.application_args.length() > Int(2), Btoi(Txn.application_args[2]), Int(1))
     
     # Read Box
-    box_data = App.box_get(buy_box_name)
+    box_data = App.box_get(buy_box_name.load())
     seller_addr = Extract(box_data.value(), Int(0), Int(32))
     price_val = Btoi(Extract(box_data.value(), Int(32), Int(8)))
+    quantity = ScratchVar(TealType.uint64)
+    remaining = ScratchVar(TealType.uint64)
 
     buy_item = Seq([
         # Run Box Get
+        Assert(prev_txn.type_enum() == TxnType.Payment),
+        resolve_box_name(buy_box_name, buy_asset_id, prev_txn.receiver()),
         box_data,
         
         # Verify Box Exists
         Assert(box_data.hasValue()),
+        quantity.store(buy_quantity),
+        remaining.store(remaining_units(box_data.value())),
+        Assert(quantity.load() > Int(0)),
+        Assert(quantity.load() <= remaining.load()),
 
-        # Verify Payment
-        Assert(Global.group_size() == Int(2)),
-        Assert(Gtxn[0].type_enum() == TxnType.Payment),
-        Assert(Gtxn[0].receiver() == seller_addr),
-        Assert(Gtxn[0].amount() == price_val),
-        Assert(Gtxn[0].sender() == Txn.sender()),
+        # Verify Payment (the preceding transaction)
+        Assert(prev_txn.receiver() == seller_addr),
+        Assert(prev_txn.amount() == price_val * quantity.load()),
+        Assert(prev_txn.sender() == Txn.sender()),
 
         # Inner Transaction: Send Asset to Buyer
         InnerTxnBuilder.Begin(),
@@ -76,13 +102,18 @@ def approval_program():
             TxnField.type_enum: TxnType.AssetTransfer,
             TxnField.xfer_asset: buy_asset_id,
             TxnField.asset_receiver: Txn.sender(),
-            TxnField.asset_amount: Int(1),
+            TxnField.asset_amount: quantity.load(),
             TxnField.fee: Int(0) # Inner fee covered by outer txn fee pooling
         }),
         InnerTxnBuilder.Submit(),
 
-        # Delete Box (Free up MBR)
-        Assert(App.box_delete(buy_box_name)),
+        # Delete Box once drained (Free up MBR), else record what is left
+        If(quantity.load() == remaining.load()).Then(
+            Assert(App.box_delete(buy_box_name.load()))
+        ).Else(
+            App.box_replace(buy_box_name.load(), Int(40), Itob(remaining.load() - quantity.load()))
+        ),
+        Log(seller_addr),
         
         Approve()
     ])
@@ -90,39 +121,40 @@ def approval_program():
     # 3. Delist Item
     # Args: [delist, asset_id]
     delist_asset_id = Btoi(Txn.application_args[1])
-    delist_box_name = get_box_name(delist_asset_id)
+    delist_box_name = ScratchVar(TealType.bytes)
     
-    delist_data = App.box_get(delist_box_name)
+    delist_data = App.box_get(delist_box_name.load())
     delist_seller = Extract(delist_data.value(), Int(0), Int(32))
 
     delist_item = Seq([
+        resolve_box_name(delist_box_name, delist_asset_id, Txn.sender()),
         delist_data,
         Assert(delist_data.hasValue()),
         
         # Only Original Seller can delist
         Assert(delist_seller == Txn.sender()),
 
-        # Return Asset
+        # Return the Unsold Units
         InnerTxnBuilder.Begin(),
         InnerTxnBuilder.SetFields({
             TxnField.type_enum: TxnType.AssetTransfer,
             TxnField.xfer_asset: delist_asset_id,
             TxnField.asset_receiver: Txn.sender(),
-            TxnField.asset_amount: Int(1),
+            TxnField.asset_amount: remaining_units(delist_data.value()),
             TxnField.fee: Int(0)
         }),
         InnerTxnBuilder.Submit(),
 
         # Delete Box
-        Assert(App.box_delete(delist_box_name)),
+        Assert(App.box_delete(delist_box_name.load())),
         
         Approve()
     ])
 
-    handle_noop = Cond(
-        [Txn.application_args[0] == op_list, list_item],
-        [Txn.application_args[0] == op_buy, buy_item],
-        [Txn.application_args[0] == op_delist, delist_item]
+    handle_noop = dispatch(
+        ("list(axfer,uint64,uint64)void", list_item),   # asset id, price
+        (("buy(pay,uint64)void", "buy(pay,uint64,uint64)void"), buy_item),  # asset id[, quantity]
+        ("delist(uint64)void", delist_item),            # asset id
     )
 
     return Cond(
@@ -136,8 +168,3 @@ def approval_program():
 
 def clear_state_program():
     return Approve()
-
-if __name__ == "__main__":
-    with open("marketplace_contract.teal", "w") as f:
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=8) # Version 8 for Boxes
-        f.write(compiled)
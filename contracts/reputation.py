@@ -0,0 +1,155 @@
+"""
+Reputation record layout shared by trust_score and the contracts that read it.
+
+trust_score keeps each address's scores either in four local-state keys
+(LOCAL, the original layout) or in one RECORD_SIZE-byte box named by the
+address (BOX, no opt-in needed):
+
+    [Trust_Score u64][Fitness_Level u64][Eco_Points u64][last updated u64]
+
+Both layouts answer get_record(address), which logs the record as an ARC-4
+(uint64,uint64,uint64,uint64) return value, and get_records(address[])
+for a page of addresses at once (through simulate, tools/query.py). Boxes are private to their
+app, so another contract reads a box-backed record with one inner call:
+
+    Seq(fetch_record(Int(trust_app_id), account), record_field(last_record(), TRUST))
+
+The caller's transaction must list the trust app in its foreign apps and
+(for BOX) a box reference to (trust app, account), and pay one extra min
+fee for the inner call.
+
+Trust decays with inactivity, lazily: the stored score is as of the
+record's UPDATED time (when trust was last written; local state keeps it
+under UPDATED_KEY), and every read or write evaluates decayed_trust() for
+the time elapsed since. The curve and half-life are set when the
+trust app is created (args [curve, half-life seconds], both uint64) and
+kept in its global state:
+
+    NO_DECAY            the score never changes on its own (the default; half-life 0)
+    LINEAR_DECAY        falls linearly, to half after one half-life and to 0 after two
+    EXPONENTIAL_DECAY   halves every half-life, linear within each period
+
+`decayed_trust_value` is the same function in Python, for clients. A
+record with no last-update time (local state written before decay
+existed) does not decay until its next write.
+
+Besides the creator, apps on the trust app's allowlist (authorize(uint64),
+keyed by app ID) may call add_trust and slash_trust, so a contract can
+credit trust itself once a loan or trip completes:
+
+    If(App.optedIn(account, trust_app)).Then(credit_trust_if_authorized(trust_app, account, Int(5)))
+
+The caller's transaction lists the trust app in its foreign apps (and, for
+BOX, a box reference to (trust app, account)) and pays one extra min fee.
+credit_trust_if_authorized skips the credit unless the caller is on the
+allowlist, so a contract pointed at a trust app deployed before the
+allowlist existed (or not yet authorized there) still completes its loan
+or trip, only without the credit.
+"""
+from pyteal import (
+    App, Bytes, Concat, Extract, ExtractUint64, Global, If, InnerTxn, Itob, InnerTxnBuilder, Int, MethodSignature, OnComplete, Or, Return,
+    ScratchVar, Seq, ShiftRight, Subroutine, TealType, TxnField, TxnType, WideRatio,
+)
+
+LOCAL = "local"
+BOX = "box"
+
+TRUST_APP_ID = 755292569        # deployed local-state trust_score on TestNet
+
+GET_RECORD = "get_record(address)(uint64,uint64,uint64,uint64)"
+GET_RECORDS = "get_records(address[])(uint64,uint64,uint64,uint64)[]"   # read-only, contracts/batch_query.py
+ADD_TRUST = "add_trust(address,uint64)void"
+AUTHORIZED_PREFIX = "auth"          # + Itob(app id): global keys of the caller allowlist
+AUTHORIZED_COUNT_KEY = "auth_count"     # global: apps on the allowlist
+MAX_AUTHORIZED_APPS = 8
+ARC4_RETURN_PREFIX = bytes.fromhex("151f7c75")
+
+RECORD_SIZE = 32
+TRUST, FITNESS, ECO, UPDATED = 0, 8, 16, 24     # field offsets in a record
+TRUST_CAP = 100
+
+NO_DECAY, LINEAR_DECAY, EXPONENTIAL_DECAY = 0, 1, 2
+DECAY_CURVE_KEY = "decay_curve"     # global state of the trust app
+HALF_LIFE_KEY = "half_life"         # seconds
+UPDATED_KEY = "Updated"             # local-state counterpart of the UPDATED field
+
+
+def record_field(record, offset):
+    return ExtractUint64(record, Int(offset))
+
+
+def fetch_record(app_id, account):
+    """Inner call to `app_id`.get_record(account); read the result with last_record()."""
+    return Seq([
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields({
+            TxnField.type_enum: TxnType.ApplicationCall,
+            TxnField.application_id: app_id,
+            TxnField.on_completion: OnComplete.NoOp,
+            TxnField.application_args: [MethodSignature(GET_RECORD), account],
+            TxnField.fee: Int(0),   # covered by the outer transaction's fee
+        }),
+        InnerTxnBuilder.Submit(),
+    ])
+
+
+def credit_trust(app_id, account, amount):
+    """Inner call to `app_id`.add_trust(account, amount); the calling app must be authorized."""
+    return Seq([
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields({
+            TxnField.type_enum: TxnType.ApplicationCall,
+            TxnField.application_id: app_id,
+            TxnField.on_completion: OnComplete.NoOp,
+            TxnField.application_args: [MethodSignature(ADD_TRUST), account, Itob(amount)],
+            TxnField.accounts: [account],
+            TxnField.fee: Int(0),   # covered by the outer transaction's fee
+        }),
+        InnerTxnBuilder.Submit(),
+    ])
+
+
+def credit_trust_if_authorized(app_id, account, amount):
+    """credit_trust, only if this app is on `app_id`'s allowlist (a global key the caller can read)."""
+    entry = App.globalGetEx(app_id, Concat(Bytes(AUTHORIZED_PREFIX), Itob(Global.current_application_id())))
+    return Seq([entry, If(entry.hasValue()).Then(credit_trust(app_id, account, amount))])
+
+
+def last_record():
+    """The record returned by the preceding fetch_record()."""
+    return Extract(InnerTxn.last_log(), Int(len(ARC4_RETURN_PREFIX)), Int(RECORD_SIZE))
+
+
+def decayed_trust_value(score, updated, now, curve=NO_DECAY, half_life=0):
+    """Trust `score` last written at `updated`, as of `now` (Unix seconds); matches decayed_trust()."""
+    if not half_life or not updated or now <= updated:
+        return score
+    elapsed = now - updated
+    if curve == LINEAR_DECAY:
+        return 0 if elapsed >= 2 * half_life else score * (2 * half_life - elapsed) // (2 * half_life)
+    if elapsed // half_life >= 64:
+        return 0
+    halved = score >> elapsed // half_life
+    return halved - halved * (elapsed % half_life) // (2 * half_life)
+
+
+_elapsed = ScratchVar(TealType.uint64)
+_halved = ScratchVar(TealType.uint64)
+
+
+@Subroutine(TealType.uint64)
+def decayed_trust(score, updated, curve, half_life):
+    """decayed_trust_value(score, updated, Global.latest_timestamp(), curve, half_life)."""
+    elapsed, halved = _elapsed.load(), _halved.load()
+    return Seq(
+        If(Or(half_life == Int(0), updated == Int(0), Global.latest_timestamp() <= updated)).Then(Return(score)),
+        _elapsed.store(Global.latest_timestamp() - updated),
+        If(curve == Int(LINEAR_DECAY)).Then(Return(If(
+            elapsed >= Int(2) * half_life,
+            Int(0),
+            WideRatio([score, Int(2) * half_life - elapsed], [Int(2) * half_life]),
+        ))),
+        If(elapsed / half_life >= Int(64)).Then(Return(Int(0))),
+        _halved.store(ShiftRight(score, elapsed / half_life)),
+        halved - WideRatio([halved, elapsed % half_life], [Int(2) * half_life]),
+    )
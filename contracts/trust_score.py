@@ -1,80 +1,338 @@
 from pyteal import *
 
-def approval_program():
+from contracts.batch_query import address_at, address_count, log_page, valid_addresses
+from contracts.budget import OPUP_METHOD, pooled
+from contracts.dispatch import dispatch
+from contracts.reputation import (
+    ADD_TRUST, ARC4_RETURN_PREFIX, AUTHORIZED_COUNT_KEY, AUTHORIZED_PREFIX, BOX, DECAY_CURVE_KEY, ECO, EXPONENTIAL_DECAY,
+    FITNESS, GET_RECORD, GET_RECORDS, HALF_LIFE_KEY, LOCAL, MAX_AUTHORIZED_APPS, NO_DECAY, RECORD_SIZE, TRUST, TRUST_CAP,
+    UPDATED, UPDATED_KEY, decayed_trust,
+)
+
+# batch_update: one record per foreign account (Txn.accounts[1..]), each three
+# big-endian int16 deltas in two's complement: trust, fitness, eco.
+BATCH_RECORD_SIZE = 6
+
+# Worst-case opcodes batch_update spends once per call and per account
+# (every delta applied), plus per account when trust decays. The call first
+# makes sure the budget covers batch_cost (contracts/budget.py), so it can
+# carry four accounts whatever the storage or decay curve: pad its group with
+# opup calls (tools/budget.py) or pay the fees of the inner top-ups.
+BATCH_BASE_COST = 60
+BATCH_ACCOUNT_COST = {LOCAL: 145, BOX: 165}
+BATCH_DECAY_COST = 55
+
+# The TestNet trust app (reputation.TRUST_APP_ID) was created with 3 local
+# ints, and a schema cannot grow on update. Updated in place it has no room
+# for UPDATED_KEY, so the local-state program only writes that key when the
+# app's local schema has a fourth int. Such an app's records keep no update
+# time and never decay; it also has no curve, which only creation args set.
+# Decay therefore needs a fresh deploy with the schema from tools/build.py.
+LEGACY_LOCAL_UINTS = 3
+
+
+def batch_cost(accounts, storage=LOCAL, decay=False):
+    """Worst-case opcodes of one batch_update call over `accounts` accounts."""
+    return BATCH_BASE_COST + accounts * (BATCH_ACCOUNT_COST[storage] + (BATCH_DECAY_COST if decay else 0))
+
+
+@Subroutine(TealType.uint64)
+def add_signed(current, delta, cap):
+    # delta is an int16 in two's complement; the result is clamped to [0, cap].
+    # current never exceeds cap, so comparing against the headroom cannot
+    # overflow even when cap is 2**64 - 1.
+    magnitude = Int(0x10000) - delta
+    return If(
+        delta < Int(0x8000),
+        If(delta > cap - current, cap, current + delta),
+        If(current < magnitude, Int(0), current - magnitude),
+    )
+
+
+def approval_program(storage=LOCAL):
     # Local State Keys
     trust_score_key = Bytes("Trust_Score")
     fitness_level_key = Bytes("Fitness_Level")
     eco_points_key = Bytes("Eco_Points")
+    updated_key = Bytes(UPDATED_KEY)
+    local_keys = {TRUST: trust_score_key, FITNESS: fitness_level_key, ECO: eco_points_key, UPDATED: updated_key}
 
-    # Arguments
-    op_optin = Bytes("opt_in")
-    op_add_trust = Bytes("add_trust")
-    op_slash_trust = Bytes("slash_trust")
-    op_add_fitness = Bytes("add_fitness")
-    op_add_eco = Bytes("add_eco")
+    # Global State Keys: the trust decay curve, fixed at creation
+    curve_key = Bytes(DECAY_CURVE_KEY)
+    half_life_key = Bytes(HALF_LIFE_KEY)
+
+    def decayed(score, updated):
+        return decayed_trust(score, updated, App.globalGet(curve_key), App.globalGet(half_life_key))
+
+    # Score storage (see contracts/reputation.py)
+    # LOCAL: four local-state keys, written once the user has opted in
+    #        (UPDATED_KEY only with room for it, see LEGACY_LOCAL_UINTS).
+    # BOX: one RECORD_SIZE-byte box per address, created by its first write
+    #      (the app account pays the box minimum balance; keep it funded).
+    # Either way the stored trust is as of its UPDATED time: current() decays
+    # it to now, and set_trust() stores a new score as of now.
+    if storage == BOX:
+        stored = ScratchVar(TealType.bytes)
+
+        def get(account, field):
+            return Btoi(App.box_extract(account, Int(field), Int(8)))
+
+        def put(account, field, value):
+            return App.box_replace(account, Int(field), Itob(value))
+
+        def prepare(account):
+            return Seq([
+                Assert(Len(account) == Int(32)),
+                Pop(App.box_create(account, Int(RECORD_SIZE))),
+            ])
+
+        def record(account):
+            box = App.box_get(account)
+            return Seq(box, If(
+                box.hasValue(),
+                Seq(
+                    stored.store(box.value()),
+                    Concat(
+                        Itob(decayed(ExtractUint64(stored.load(), Int(TRUST)),
+                                     ExtractUint64(stored.load(), Int(UPDATED)))),
+                        Extract(stored.load(), Int(FITNESS), Int(RECORD_SIZE - FITNESS)),
+                    ),
+                ),
+                BytesZero(Int(RECORD_SIZE)),
+            ))
+    else:
+        local_uints = AppParam.localNumUint(Global.current_application_id())
+
+        def get(account, field):
+            return App.localGet(account, local_keys[field])
+
+        def put(account, field, value):
+            if field == UPDATED:
+                return Seq(local_uints, If(local_uints.value() > Int(LEGACY_LOCAL_UINTS)).Then(
+                    App.localPut(account, updated_key, value)
+                ))
+            return App.localPut(account, local_keys[field], value)
+
+        def prepare(account):
+            return Seq()
+
+        def record(account):
+            return If(
+                App.optedIn(account, Global.current_application_id()),
+                Concat(Itob(decayed(get(account, TRUST), get(account, UPDATED))), Itob(get(account, FITNESS)),
+                       Itob(get(account, ECO)), Itob(get(account, UPDATED))),
+                BytesZero(Int(RECORD_SIZE)),
+            )
+
+    def current(account):
+        return decayed(get(account, TRUST), get(account, UPDATED))
+
+    def set_trust(account, value):
+        return Seq(put(account, TRUST, value), put(account, UPDATED, Global.latest_timestamp()))
+
+    # Global State Keys (Whitelisted Contracts)
+    # One key per authorized app ID; an inner call from that app may adjust trust.
+    # AUTHORIZED_COUNT_KEY counts them, up to MAX_AUTHORIZED_APPS.
+    def authorized_key(app_id):
+        return Concat(Bytes(AUTHORIZED_PREFIX), Itob(app_id))
+
+    authorized_count_key = Bytes(AUTHORIZED_COUNT_KEY)
+
+    is_admin = Txn.sender() == Global.creator_address()
+    is_authorized = Or(is_admin, App.globalGet(authorized_key(Global.caller_app_id())) == Int(1))
 
-    # Global State Keys (For Whitelisting Contracts - Demo Simplification: Admin Only)
-    # Ideally we'd have a whitelist, but for now we'll check if sender is Creator or hardcoded placeholders
-    # In a full deployment, we would have a method `authorize_contract(app_id)`
-    
     # Initialization
-    handle_creation = Return(Int(1))
+    # Args: none (no decay), or [curve, half-life in seconds] (see contracts/reputation.py)
+    curve = Btoi(Txn.application_args[0])
+    half_life = Btoi(Txn.application_args[1])
+    handle_creation = Seq([
+        If(Txn.application_args.length() == Int(2)).Then(Seq([
+            Assert(curve <= Int(EXPONENTIAL_DECAY)),
+            Assert((curve == Int(NO_DECAY)) == (half_life == Int(0))),
+            App.globalPut(curve_key, curve),
+            App.globalPut(half_life_key, half_life),
+        ])).ElseIf(Txn.application_args.length() != Int(0)).Then(Reject()),
+        Return(Int(1))
+    ])
 
-    # Opt-In (Initialize Local State)
+    # Opt-In (Initialize Local State; nothing to do for box records)
     handle_optin = Seq([
         App.localPut(Txn.sender(), trust_score_key, Int(0)),
         App.localPut(Txn.sender(), fitness_level_key, Int(0)),
         App.localPut(Txn.sender(), eco_points_key, Int(0)),
+        put(Txn.sender(), UPDATED, Global.latest_timestamp()),
         Return(Int(1))
-    ])
+    ]) if storage == LOCAL else Approve()
 
     # Dynamic Scoring Logic
     # Args: [method, address, amount]
     target_addr = Txn.application_args[1]
     amount = Btoi(Txn.application_args[2])
 
-    # Helper to get current score, add amount, cap at 100
-    current_trust = App.localGet(target_addr, trust_score_key)
-    new_trust = If(current_trust + amount > Int(100), Int(100), current_trust + amount)
+    # Helper to get current (decayed) score, add amount, cap at 100
+    trust = ScratchVar(TealType.uint64)
+    current_trust = trust.load()
+    new_trust = If(amount > Int(TRUST_CAP) - current_trust, Int(TRUST_CAP), current_trust + amount)
     
     # Helper to slash trust, floor at 0
     slashed_trust = If(current_trust < amount, Int(0), current_trust - amount)
 
-    # Add Trust (Only callable by Lending Contract)
-    # For DEMO: We will allow the Creator (Admin) to call this. 
-    # In production, we'd check `Txn.sender() == Global.current_application_address()` of the calling contract (via inner txn)
+    # Add Trust (Admin, or an authorized contract such as the lending escrow)
+    # Authorized contracts call this with an inner transaction (contracts/reputation.py credit_trust)
     add_trust = Seq([
         # Authorize: Only Admin or Whitelisted Contracts
-        Assert(Txn.sender() == Global.creator_address()), 
+        Assert(is_authorized),
         
-        App.localPut(target_addr, trust_score_key, new_trust),
+        prepare(target_addr),
+        trust.store(current(target_addr)),
+        set_trust(target_addr, new_trust),
         Return(Int(1))
     ])
 
     slash_trust = Seq([
-        Assert(Txn.sender() == Global.creator_address()),
-        App.localPut(target_addr, trust_score_key, slashed_trust),
+        Assert(is_authorized),
+        prepare(target_addr),
+        trust.store(current(target_addr)),
+        set_trust(target_addr, slashed_trust),
         Return(Int(1))
     ])
 
     add_fitness = Seq([
         Assert(Txn.sender() == Global.creator_address()),
-        App.localPut(target_addr, fitness_level_key, App.localGet(target_addr, fitness_level_key) + amount),
+        prepare(target_addr),
+        put(target_addr, FITNESS, get(target_addr, FITNESS) + amount),
         Return(Int(1))
     ])
 
     add_eco = Seq([
         Assert(Txn.sender() == Global.creator_address()),
-        App.localPut(target_addr, eco_points_key, App.localGet(target_addr, eco_points_key) + amount),
+        prepare(target_addr),
+        put(target_addr, ECO, get(target_addr, ECO) + amount),
         Return(Int(1))
     ])
 
-    handle_noop = Cond(
-        [Txn.application_args[0] == op_add_trust, add_trust],
-        [Txn.application_args[0] == op_slash_trust, slash_trust],
-        [Txn.application_args[0] == op_add_fitness, add_fitness],
-        [Txn.application_args[0] == op_add_eco, add_eco]
-    )
+    # Batch Update: adjust every foreign account in one call
+    # Args: [selector, byte[] of BATCH_RECORD_SIZE-byte records]
+    # Trust is clamped to [0, 100]; fitness and eco points are floored at 0.
+    records = Txn.application_args[1]
+    i = ScratchVar(TealType.uint64)
+    account_i = ScratchVar(TealType.bytes)
+    offset_i = ScratchVar(TealType.uint64)
+    account = account_i.load()
+    offset = offset_i.load()
+
+    def apply(field, delta_offset, cap):
+        return put(account, field, add_signed(
+            get(account, field),
+            ExtractUint16(records, offset + Int(delta_offset)),
+            cap,
+        ))
+
+    trust_delta = ExtractUint16(records, offset)
+
+    batch_update = pooled(Seq([
+        Assert(Txn.sender() == Global.creator_address()),
+        Assert(Txn.accounts.length() > Int(0)),
+        Assert(Len(records) == Int(2) + Txn.accounts.length() * Int(BATCH_RECORD_SIZE)),
+        For(i.store(Int(1)), i.load() <= Txn.accounts.length(), i.store(i.load() + Int(1))).Do(Seq([
+            account_i.store(Txn.accounts[i.load()]),
+            offset_i.store(Int(2) + (i.load() - Int(1)) * Int(BATCH_RECORD_SIZE)),   # after the ARC-4 length prefix
+            prepare(account),
+            If(trust_delta).Then(set_trust(account, add_signed(current(account), trust_delta, Int(TRUST_CAP)))),
+            apply(FITNESS, 2, Int(2**64 - 1)),
+            apply(ECO, 4, Int(2**64 - 1)),
+        ])),
+        Return(Int(1))
+    ]), Int(BATCH_BASE_COST) + Txn.accounts.length() * If(App.globalGet(curve_key) == Int(NO_DECAY),
+                                                          Int(BATCH_ACCOUNT_COST[storage]),
+                                                          Int(BATCH_ACCOUNT_COST[storage] + BATCH_DECAY_COST)))
+
+
+    # Get Record: every score in one read, for clients and other contracts
+    # Args: [selector, address]; logs the ARC-4 (uint64,uint64,uint64,uint64) return
+    get_record = Seq([
+        Log(Concat(Bytes("base16", ARC4_RETURN_PREFIX.hex()), record(target_addr))),
+        Return(Int(1))
+    ])
+
+    # Get Records: a page of addresses' scores in one read-only call (see contracts/batch_query.py)
+    # Args: [selector, address[]]; logs the ARC-4 (uint64,uint64,uint64,uint64)[] return,
+    # all zeros for addresses with no record. Called through simulate.
+    addresses = Txn.application_args[1]
+    get_records = Seq([
+        Assert(valid_addresses(addresses)),
+        log_page(address_count(addresses), lambda i: record(address_at(addresses, i))),
+        Return(Int(1))
+    ])
+
+    # Authorize / Revoke a Contract (Admin)
+    # Args: [selector, app ID (uint64)]
+    # Authorizing an app twice or revoking one that is not listed changes nothing.
+    caller_app = Btoi(Txn.application_args[1])
+    listed = App.globalGetEx(Global.current_application_id(), authorized_key(caller_app))
+    authorize = Seq([
+        Assert(is_admin),
+        Assert(caller_app > Int(0)),
+        listed,
+        If(Not(listed.hasValue())).Then(Seq([
+            Assert(App.globalGet(authorized_count_key) < Int(MAX_AUTHORIZED_APPS)),
+            App.globalPut(authorized_count_key, App.globalGet(authorized_count_key) + Int(1)),
+            App.globalPut(authorized_key(caller_app), Int(1)),
+        ])),
+        Return(Int(1))
+    ])
+
+    revoke = Seq([
+        Assert(is_admin),
+        listed,
+        If(listed.hasValue()).Then(Seq([
+            App.globalDel(authorized_key(caller_app)),
+            App.globalPut(authorized_count_key, App.globalGet(authorized_count_key) - Int(1)),
+        ])),
+        Return(Int(1))
+    ])
+
+    methods = [
+        (ADD_TRUST, add_trust),
+        ("slash_trust(address,uint64)void", slash_trust),
+        ("add_fitness(address,uint64)void", add_fitness),
+        ("add_eco(address,uint64)void", add_eco),
+        ("batch_update(byte[])void", batch_update, None),
+        (GET_RECORD, get_record, None),
+        (GET_RECORDS, get_records, None),
+        ("authorize(uint64)void", authorize, None),
+        ("revoke(uint64)void", revoke, None),
+        OPUP_METHOD,
+    ]
+
+    if storage == BOX:
+        # Migrate: copy an address's scores out of the local-state app once.
+        # Args: [selector, address]; the address and the local-state app
+        # (TMPL_TRUST_APP_ID, see trust_score_box.TEMPLATE_VARIABLES) must be
+        # in the foreign arrays and the box referenced. Fails if a record exists.
+        # Trust is carried over as decayed by the local-state app's own curve.
+        legacy_app = Tmpl.Int("TMPL_TRUST_APP_ID")
+        legacy = [App.localGetEx(target_addr, legacy_app, local_keys[f])
+                  for f in (TRUST, FITNESS, ECO, UPDATED)]
+        legacy_curve = [App.globalGetEx(legacy_app, key) for key in (curve_key, half_life_key)]
+        migrate = Seq([
+            Assert(Or(Txn.sender() == Global.creator_address(), Txn.sender() == target_addr)),
+            Assert(Len(target_addr) == Int(32)),
+            Assert(App.box_create(target_addr, Int(RECORD_SIZE))),
+            *legacy,
+            *legacy_curve,
+            App.box_put(target_addr, Concat(
+                Itob(decayed_trust(legacy[0].value(), legacy[3].value(),
+                                   legacy_curve[0].value(), legacy_curve[1].value())),
+                Itob(legacy[1].value()),
+                Itob(legacy[2].value()),
+                Itob(Global.latest_timestamp()),
+            )),
+            Return(Int(1))
+        ])
+        methods.append(("migrate(address)void", migrate, None))
+
+    handle_noop = dispatch(*methods)
 
     return Cond(
         [Txn.application_id() == Int(0), handle_creation],
@@ -87,9 +345,3 @@ def approval_program():
 
 def clear_state_program():
     return Return(Int(1))
-
-if __name__ == "__main__":
-    with open("trust_score.teal", "w") as f:
-        # Upgrade to Version 8
-        compiled = compileTeal(approval_program(), mode=Mode.Application, version=8)
-        f.write(compiled)
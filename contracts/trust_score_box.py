@@ -0,0 +1,20 @@
+from pyteal import *
+
+from contracts import trust_score
+from contracts.reputation import BOX, TRUST_APP_ID
+
+# trust_score with box-backed records: no opt-in, one box per address.
+# Deploy alongside the local-state app and call migrate(address) per user.
+
+# Deploy-time parameters, left as TMPL_ template variables in the TEAL
+# (tools/template.py); these are the defaults. migrate() copies records out
+# of the local-state app TRUST_APP_ID.
+TEMPLATE_VARIABLES = {
+    "TRUST_APP_ID": TRUST_APP_ID,
+}
+
+def approval_program():
+    return trust_score.approval_program(storage=BOX)
+
+def clear_state_program():
+    return trust_score.clear_state_program()
@@ -1,12 +1,17 @@
 from pyteal import *
 
+# The trust app, score threshold and collateral are template variables;
+# patch them into the bytecode at deploy time (Testnet values shown):
+#   python -m tools.template debug_escrow.teal TRUST_APP_ID=755292569 TRUST_THRESHOLD=50 \
+#       MIN_COLLATERAL=1000000 -o debug_escrow.tok
+
 def approval_program():
     # Local State Keys
     item_key = Bytes("item_id")
     collateral_key = Bytes("collateral")
     borrow_time_key = Bytes("borrow_time")
     
-    TRUST_APP_ID = Int(755292569) 
+    TRUST_APP_ID = Tmpl.Int("TMPL_TRUST_APP_ID")
     trust_score_key = Bytes("Trust_Score")
 
     # Operations
@@ -33,7 +38,7 @@ def approval_program():
         
         # Conditional Logic
         If(
-            And(trust_score_val.hasValue(), trust_score_val.value() >= Int(50))
+            And(trust_score_val.hasValue(), trust_score_val.value() >= Tmpl.Int("TMPL_TRUST_THRESHOLD"))
         ).Then(
             App.localPut(Txn.sender(), collateral_key, Int(0))
         ).Else(
@@ -43,7 +48,7 @@ def approval_program():
                         Global.group_size() == Int(2),
                         Gtxn[0].type_enum() == TxnType.Payment,
                         Gtxn[0].receiver() == Global.current_application_address(),
-                        Gtxn[0].amount() >= Int(1000000)
+                        Gtxn[0].amount() >= Tmpl.Int("TMPL_MIN_COLLATERAL")
                     )
                 ),
                 App.localPut(Txn.sender(), collateral_key, Gtxn[0].amount())
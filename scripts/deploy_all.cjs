@@ -1,6 +1,6 @@
 const algosdk = require('algosdk');
-const fs = require('fs');
 const path = require('path');
+const { loadProgram, loadSchema } = require('./prebuilt.cjs');
 
 // --- CONFIG ---
 const ALGOD_TOKEN = '';
@@ -8,21 +8,32 @@ const ALGOD_SERVER = 'https://testnet-api.algonode.cloud';
 const ALGOD_PORT = 443;
 const algodClient = new algosdk.Algodv2(ALGOD_TOKEN, ALGOD_SERVER, ALGOD_PORT);
 
-// --- HELPER: Compile TEAL ---
-async function compileProgram(client, programSource) {
-    const encoder = new TextEncoder();
-    const programBytes = encoder.encode(programSource);
-    const compileResponse = await client.compile(programBytes).do();
-    return new Uint8Array(Buffer.from(compileResponse.result, 'base64'));
+// --- HELPER: Authorize a Trust Caller ---
+// Apps that credit trust with inner add_trust calls must be on the trust
+// app's allowlist (authorize(uint64)void, creator only).
+async function authorizeCaller(trustAppId, callerAppId, account, params) {
+    const authorize = new algosdk.ABIMethod({ name: 'authorize', args: [{ type: 'uint64' }], returns: { type: 'void' } });
+    const txn = algosdk.makeApplicationNoOpTxnFromObject({
+        sender: account.addr,
+        appIndex: trustAppId,
+        appArgs: [authorize.getSelector(), algosdk.encodeUint64(callerAppId)],
+        suggestedParams: params,
+    });
+    const tx = await algodClient.sendRawTransaction(txn.signTxn(account.sk)).do();
+    await algosdk.waitForConfirmation(algodClient, tx.txid, 4);
+    console.log(`✅ App ${callerAppId} authorized to credit trust on ${trustAppId}`);
 }
 
 // --- HELPER: Deploy Contract ---
-async function deployContract(name, approvalPath, clearStateSource, account, params, schema) {
+// Programs and schemas are the ones `python -m tools.build` recorded in each
+// contract's .compiled.json (scripts/prebuilt.cjs); template variables
+// (TMPL_NAME, see tools/template.py) are spliced in from `templates`.
+async function deployContract(name, approvalPath, account, params, templates = {}) {
     console.log(`\n--- Deploying ${name} ---`);
-    const approvalSource = fs.readFileSync(path.resolve(__dirname, approvalPath), 'utf8');
-
-    const approvalBin = await compileProgram(algodClient, approvalSource);
-    const clearBin = await compileProgram(algodClient, clearStateSource);
+    const tealPath = path.resolve(__dirname, approvalPath);
+    const schema = loadSchema(tealPath);
+    const approvalBin = loadProgram(tealPath, 'approval', templates);
+    const clearBin = loadProgram(tealPath.replace(/\.teal$/, '.clear.teal'), 'clear');
 
     const txn = algosdk.makeApplicationCreateTxnFromObject({
         sender: account.addr,
@@ -54,25 +65,20 @@ async function main() {
     console.log("Deployer Address:", account.addr);
 
     const params = await algodClient.getTransactionParams().do();
-    // Upgrade to version 8 to match Marketplace requirements (Box Storage)
-    const clearState = "#pragma version 8\nint 1\nreturn";
 
     try {
-        // 2. Deploy Trust Score (Local State Schema: 3 Ints)
-        const trustAppId = await deployContract("Trust Score", "../contracts/trust_score.teal", clearState, account, params, {
-            localInts: 3, localBytes: 0, globalInts: 0, globalBytes: 0
-        });
+        // Programs and schemas come from each contract's .compiled.json.
+        // 2. Deploy Trust Score
+        const trustAppId = await deployContract("Trust Score", "../contracts/trust_score.teal", account, params);
 
-        // 3. Deploy Commute App (Local: 4 Ints, 4 Bytes)
-        const commuteAppId = await deployContract("Commute App", "../contracts/commute_checkin.teal", clearState, account, params, {
-            localInts: 4, localBytes: 4, globalInts: 0, globalBytes: 0
-        });
+        // 3. Deploy Commute App
+        const commuteAppId = await deployContract("Commute App", "../contracts/commute_checkin.teal", account, params,
+            { TRUST_APP_ID: trustAppId });
+        await authorizeCaller(trustAppId, commuteAppId, account, params);
 
         // 4. Deploy Marketplace (Boxes required - App Call logic)
         // Marketplace uses Box Storage, not Global State for listings
-        const marketAppId = await deployContract("Marketplace", "../contracts/marketplace_contract.teal", clearState, account, params, {
-            localInts: 0, localBytes: 0, globalInts: 0, globalBytes: 0
-        });
+        const marketAppId = await deployContract("Marketplace", "../contracts/marketplace_contract.teal", account, params);
 
         console.log("\n--- DEPLOYMENT SUMMARY ---");
         console.log("TRUST_APP_ID:", trustAppId);
@@ -39,6 +39,7 @@ Object.defineProperty(exports, "__esModule", { value: true });
 var algosdk_1 = require("algosdk");
 var fs = require("fs");
 var path = require("path");
+var prebuilt_1 = require("./prebuilt.cjs");
 // --- CONFIG ---
 var ALGOD_TOKEN = '';
 var ALGOD_SERVER = 'https://testnet-api.algonode.cloud';
@@ -111,7 +112,7 @@ function compileProgram(client, programSource) {
 // --- DEPLOY SCRIPT ---
 function main() {
     return __awaiter(this, void 0, void 0, function () {
-        var funded, commuteTealPath, commuteTeal, clearState, approvalBin, clearBin, params, txn, signedTxn, tx, confirmedTxn, appId, optInTxn, _a, _b, signedOptIn, txOpt, regTxn, _c, _d, signedReg, txReg, appAddr, payTxn, _e, _f, callTxn, _g, _h, txns, s1, s2, txTrip;
+        var funded, commuteTealPath, schema, commuteTeal, clearState, approvalBin, clearBin, params, txn, signedTxn, tx, confirmedTxn, appId, optInTxn, _a, _b, signedOptIn, txOpt, regTxn, _c, _d, signedReg, txReg, appAddr, payTxn, _e, _f, callTxn, _g, _h, txns, s1, s2, txTrip;
         var _j, _k, _l, _m;
         return __generator(this, function (_o) {
             switch (_o.label) {
@@ -128,7 +129,9 @@ function main() {
                     // 1. Deploy Commute App
                     console.log("\n--- Deploying Commute App ---");
                     commuteTealPath = path.resolve('../contracts/commute_checkin.teal');
-                    commuteTeal = fs.readFileSync(commuteTealPath, 'utf8');
+                    schema = prebuilt_1.loadSchema(commuteTealPath); // CONTRACTS in tools/build.py
+                    commuteTeal = fs.readFileSync(commuteTealPath, 'utf8')
+                        .replace(/\bTMPL_TRUST_APP_ID\b/g, '755292569'); // TestNet trust_score (contracts/reputation.py)
                     clearState = "#pragma version 6\nint 1\nreturn";
                     return [4 /*yield*/, compileProgram(algodClient, commuteTeal)];
                 case 3:
@@ -143,10 +146,10 @@ function main() {
                         sender: account.addr,
                         approvalProgram: approvalBin,
                         clearProgram: clearBin,
-                        numLocalInts: 4, // trip_active, collateral, etc.
-                        numLocalByteSlices: 4, // role, matched_with, etc.
-                        numGlobalInts: 0,
-                        numGlobalByteSlices: 0,
+                        numLocalInts: schema.localInts,
+                        numLocalByteSlices: schema.localBytes,
+                        numGlobalInts: schema.globalInts,
+                        numGlobalByteSlices: schema.globalBytes,
                         onComplete: algosdk_1.default.OnApplicationComplete.NoOpOC,
                         suggestedParams: params,
                     });
@@ -39,6 +39,7 @@ Object.defineProperty(exports, "__esModule", { value: true });
 var algosdk_1 = require("algosdk");
 var fs = require("fs");
 var path = require("path");
+var prebuilt_1 = require("./prebuilt.cjs");
 
 // --- CONFIG ---
 var ALGOD_TOKEN = '';
@@ -98,6 +99,19 @@ function waitForBalance(addr) {
 }
 
 // --- HELPER: Compile TEAL ---
+// Contract parameters are TEAL template variables (TMPL_NAME, see
+// tools/template.py), which algod's compile endpoint rejects; fill in the
+// defaults the build recorded in the contract's .compiled.json.
+function fillTemplate(tealPath) {
+    var compiled = JSON.parse(fs.readFileSync(tealPath.replace(/\.teal$/, '.compiled.json'), 'utf8'));
+    var variables = compiled.approval.template ? compiled.approval.template.variables : {};
+    return fs.readFileSync(tealPath, 'utf8').replace(/\bTMPL_(\w+)\b/g, function (token, name) {
+        var variable = variables[name];
+        if (!variable || variable.default === null)
+            throw new Error("no value for template variable " + token);
+        return variable.type === 'byte' ? '0x' + Buffer.from(variable.default, 'base64').toString('hex') : String(variable.default);
+    });
+}
 function compileProgram(client, programSource) {
     return __awaiter(this, void 0, void 0, function () {
         var encoder, programBytes, compileResponse, compiledBytes;
@@ -119,7 +133,7 @@ function compileProgram(client, programSource) {
 // --- DEPLOY SCRIPT ---
 function main() {
     return __awaiter(this, void 0, void 0, function () {
-        var funded, assetTealPath, assetTeal, clearState, approvalBin, clearBin, params, txn, signedTxn, tx, confirmedTxn, appId, optInTxn, _a, _b, signedOptIn, txOpt;
+        var funded, assetTealPath, schema, assetTeal, clearState, approvalBin, clearBin, params, txn, signedTxn, tx, confirmedTxn, appId, optInTxn, _a, _b, signedOptIn, txOpt;
         var _j;
         return __generator(this, function (_o) {
             switch (_o.label) {
@@ -137,7 +151,8 @@ function main() {
                     // 1. Deploy Asset Lending App
                     console.log("\n--- Deploying Asset Lending App ---");
                     assetTealPath = path.resolve(__dirname, '../contracts/asset_escrow.teal');
-                    assetTeal = fs.readFileSync(assetTealPath, 'utf8');
+                    schema = prebuilt_1.loadSchema(assetTealPath); // CONTRACTS in tools/build.py
+                    assetTeal = fillTemplate(assetTealPath);
                     clearState = "#pragma version 8\nint 1\nreturn";
                     return [4 /*yield*/, compileProgram(algodClient, assetTeal)];
                 case 3:
@@ -152,10 +167,10 @@ function main() {
                         sender: account.addr,
                         approvalProgram: approvalBin,
                         clearProgram: clearBin,
-                        numLocalInts: 4, // item_id, collateral, borrow_time
-                        numLocalByteSlices: 4,
-                        numGlobalInts: 0,
-                        numGlobalByteSlices: 0,
+                        numLocalInts: schema.localInts,
+                        numLocalByteSlices: schema.localBytes,
+                        numGlobalInts: schema.globalInts,
+                        numGlobalByteSlices: schema.globalBytes,
                         onComplete: algosdk_1.default.OnApplicationComplete.NoOpOC,
                         suggestedParams: params,
                     });
@@ -39,6 +39,7 @@ Object.defineProperty(exports, "__esModule", { value: true });
 var algosdk_1 = require("algosdk");
 var fs = require("fs");
 var path = require("path");
+var prebuilt_1 = require("./prebuilt.cjs");
 
 // --- CONFIG ---
 var ALGOD_TOKEN = '';
@@ -77,7 +78,7 @@ function compileProgram(client, programSource) {
 
 function main() {
     return __awaiter(this, void 0, void 0, function () {
-        var params, commuteTealPath, commuteTeal, clearState, approvalBin, clearBin, txn, signedTxn, tx, confirmedTxn, appId, optInTxn, signedOptIn, txOpt;
+        var params, commuteTealPath, schema, commuteTeal, clearState, approvalBin, clearBin, txn, signedTxn, tx, confirmedTxn, appId, optInTxn, signedOptIn, txOpt;
         return __generator(this, function (_a) {
             switch (_a.label) {
                 case 0:
@@ -88,7 +89,9 @@ function main() {
 
                     // 1. Compile Contract
                     commuteTealPath = path.resolve(__dirname, '../contracts/commute_checkin.teal');
-                    commuteTeal = fs.readFileSync(commuteTealPath, 'utf8');
+                    schema = prebuilt_1.loadSchema(commuteTealPath); // CONTRACTS in tools/build.py
+                    commuteTeal = fs.readFileSync(commuteTealPath, 'utf8')
+                        .replace(/\bTMPL_TRUST_APP_ID\b/g, '755292569'); // TestNet trust_score (contracts/reputation.py)
                     clearState = "#pragma version 8\nint 1\nreturn";
 
                     return [4 /*yield*/, compileProgram(algodClient, commuteTeal)];
@@ -103,10 +106,10 @@ function main() {
                         sender: account.addr,
                         approvalProgram: approvalBin,
                         clearProgram: clearBin,
-                        numLocalInts: 4,
-                        numLocalByteSlices: 4,
-                        numGlobalInts: 0,
-                        numGlobalByteSlices: 0,
+                        numLocalInts: schema.localInts,
+                        numLocalByteSlices: schema.localBytes,
+                        numGlobalInts: schema.globalInts,
+                        numGlobalByteSlices: schema.globalBytes,
                         onComplete: algosdk_1.default.OnApplicationComplete.NoOpOC,
                         suggestedParams: params,
                     });
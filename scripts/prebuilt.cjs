@@ -0,0 +1,74 @@
+const crypto = require('crypto');
+const fs = require('fs');
+const path = require('path');
+
+// Prebuilt programs and schemas from `python -m tools.build`, which assembles
+// every contract offline and writes <name>.compiled.json next to its TEAL.
+// Deploys send these bytes as they are, so what goes on chain is exactly what
+// the AVM tests (tools/avm.py) run; no algod compile step is involved.
+
+function loadCompiled(tealPath) {
+    const compiledPath = tealPath.replace(/(\.clear)?\.teal$/, '.compiled.json');
+    if (!fs.existsSync(compiledPath)) throw new Error(`${path.basename(compiledPath)} is missing; run python -m tools.build`);
+    return JSON.parse(fs.readFileSync(compiledPath, 'utf8'));
+}
+
+function uvarint(value) {
+    let n = BigInt(value);
+    const out = [];
+    while (n >= 0x80n) {
+        out.push(Number(n & 0x7fn) | 0x80);
+        n >>= 7n;
+    }
+    out.push(Number(n));
+    return Buffer.from(out);
+}
+
+// Splice template values (TMPL_NAME, see tools/template.py) into the
+// placeholder bytecode the build recorded; unlisted variables keep their
+// defaults. Mirrors Template.patch.
+function patchTemplate(template, values = {}) {
+    const unknown = Object.keys(values).filter((name) => !(name in template.variables));
+    if (unknown.length) throw new Error(`unknown template variable(s): ${unknown.join(', ')}`);
+    const bytecode = Buffer.from(template.result, 'base64');
+    const variables = Object.entries(template.variables).sort((a, b) => a[1].offset - b[1].offset);
+    const parts = [];
+    let pos = 0;
+    for (const [name, variable] of variables) {
+        const given = name in values;
+        if (!given && variable.default === null) throw new Error(`no value for template variable TMPL_${name}`);
+        parts.push(bytecode.subarray(pos, variable.offset));
+        if (variable.type === 'int') {
+            parts.push(uvarint(given ? values[name] : variable.default));
+        } else {
+            const bytes = given ? Buffer.from(values[name]) : Buffer.from(variable.default, 'base64');
+            parts.push(uvarint(bytes.length), bytes);
+        }
+        pos = variable.offset + 1;     // the placeholder: uvarint 0, or a zero length
+    }
+    parts.push(bytecode.subarray(pos));
+    return new Uint8Array(Buffer.concat(parts));
+}
+
+// Bytecode of a contract's approval or clear program (`role`), with
+// `templates` filled in. Refuses artifacts built from other TEAL than the
+// file on disk.
+function loadProgram(tealPath, role, templates = {}) {
+    const entry = loadCompiled(tealPath)[role];
+    const sourceHash = crypto.createHash('sha256').update(fs.readFileSync(tealPath)).digest('hex');
+    if (!entry || entry.sourceHash !== sourceHash) {
+        throw new Error(`${path.basename(tealPath)} changed since the last build; run python -m tools.build`);
+    }
+    if (entry.template) return patchTemplate(entry.template, templates);
+    if (Object.keys(templates).length) throw new Error(`${path.basename(tealPath)} has no template variables`);
+    return new Uint8Array(Buffer.from(entry.result, 'base64'));
+}
+
+// State schema the build derived for the contract (CONTRACTS in tools/build.py).
+function loadSchema(tealPath) {
+    const { schema } = loadCompiled(tealPath);
+    if (!schema) throw new Error(`${path.basename(tealPath)} has no schema; run python -m tools.build`);
+    return schema;
+}
+
+module.exports = { loadProgram, loadSchema, patchTemplate };
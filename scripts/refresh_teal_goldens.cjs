@@ -0,0 +1,35 @@
+const algosdk = require('algosdk');
+const fs = require('fs');
+const path = require('path');
+
+// Compiles every tools/golden/*.teal through algod and writes the returned
+// bytecode next to it as .tok. The Python assembler (python -m tools.assemble
+// --check-golden) must reproduce these files byte for byte.
+// Usage: node scripts/refresh_teal_goldens.cjs [name.teal ...]
+
+const algodClient = new algosdk.Algodv2('', 'https://testnet-api.algonode.cloud', 443);
+const GOLDEN_DIR = path.resolve(__dirname, '../tools/golden');
+
+async function refresh(file) {
+    const source = fs.readFileSync(path.join(GOLDEN_DIR, file));
+    const compileResponse = await algodClient.compile(source).do();
+    const bytecode = Buffer.from(compileResponse.result, 'base64');
+    fs.writeFileSync(path.join(GOLDEN_DIR, file.replace(/\.teal$/, '.tok')), bytecode);
+    console.log(`✅ ${file}: ${bytecode.length} bytes (${compileResponse.hash})`);
+}
+
+async function main() {
+    const files = process.argv.length > 2
+        ? process.argv.slice(2)
+        : fs.readdirSync(GOLDEN_DIR).filter((f) => f.endsWith('.teal'));
+    for (const file of files) {
+        try {
+            await refresh(file);
+        } catch (e) {
+            console.error(`❌ ${file}:`, e.message);
+            process.exitCode = 1;
+        }
+    }
+}
+
+main();
@@ -1,6 +1,7 @@
 const algosdk = require('algosdk');
 const fs = require('fs');
 const path = require('path');
+const { loadSchema } = require('./prebuilt.cjs');
 
 // --- CONFIG ---
 const ALGOD_TOKEN = '';
@@ -15,6 +16,19 @@ const account = algosdk.mnemonicToSecretKey(MNEMONIC);
 console.log("USING ACCOUNT:");
 console.log("Address:", account.addr);
 
+// Contract parameters are TEAL template variables (TMPL_NAME, see
+// tools/template.py), which algod's compile endpoint rejects; fill in the
+// defaults the build recorded in the contract's .compiled.json.
+function fillTemplate(tealPath) {
+    const compiled = JSON.parse(fs.readFileSync(tealPath.replace(/\.teal$/, '.compiled.json'), 'utf8'));
+    const variables = compiled.approval.template ? compiled.approval.template.variables : {};
+    return fs.readFileSync(tealPath, 'utf8').replace(/\bTMPL_(\w+)\b/g, (token, name) => {
+        const variable = variables[name];
+        if (!variable || variable.default === null) throw new Error(`no value for template variable ${token}`);
+        return variable.type === 'byte' ? '0x' + Buffer.from(variable.default, 'base64').toString('hex') : String(variable.default);
+    });
+}
+
 async function compileProgram(client, programSource) {
     const encoder = new TextEncoder();
     const programBytes = encoder.encode(programSource);
@@ -28,7 +42,8 @@ async function main() {
 
     // 1. Compile Contract
     const assetTealPath = path.resolve(__dirname, '../contracts/asset_escrow.teal');
-    const assetTeal = fs.readFileSync(assetTealPath, 'utf8');
+    const schema = loadSchema(assetTealPath);     // CONTRACTS in tools/build.py
+    const assetTeal = fillTemplate(assetTealPath);
     const clearState = "#pragma version 8\nint 1\nreturn";
 
     const approvalBin = await compileProgram(algodClient, assetTeal);
@@ -41,10 +56,10 @@ async function main() {
         sender: account.addr,
         approvalProgram: approvalBin,
         clearProgram: clearBin,
-        numLocalInts: 4,
-        numLocalByteSlices: 4,
-        numGlobalInts: 0,
-        numGlobalByteSlices: 0,
+        numLocalInts: schema.localInts,
+        numLocalByteSlices: schema.localBytes,
+        numGlobalInts: schema.globalInts,
+        numGlobalByteSlices: schema.globalBytes,
         onComplete: algosdk.OnApplicationComplete.NoOpOC,
         suggestedParams: params,
     });
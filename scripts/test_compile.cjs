@@ -4,9 +4,22 @@ const path = require('path');
 
 const algodClient = new algosdk.Algodv2('', 'https://testnet-api.algonode.cloud', 443);
 
+// Contract parameters are TEAL template variables (TMPL_NAME, see
+// tools/template.py), which algod's compile endpoint rejects; fill in the
+// defaults the build recorded in the contract's .compiled.json.
+function fillTemplate(tealPath) {
+    const compiled = JSON.parse(fs.readFileSync(tealPath.replace(/\.teal$/, '.compiled.json'), 'utf8'));
+    const variables = compiled.approval.template ? compiled.approval.template.variables : {};
+    return fs.readFileSync(tealPath, 'utf8').replace(/\bTMPL_(\w+)\b/g, (token, name) => {
+        const variable = variables[name];
+        if (!variable || variable.default === null) throw new Error(`no value for template variable ${token}`);
+        return variable.type === 'byte' ? '0x' + Buffer.from(variable.default, 'base64').toString('hex') : String(variable.default);
+    });
+}
+
 async function testCompile() {
     const tealPath = path.resolve(__dirname, '../contracts/asset_escrow.teal');
-    const programSource = fs.readFileSync(tealPath, 'utf8');
+    const programSource = fillTemplate(tealPath);
     const encoder = new TextEncoder();
     const programBytes = encoder.encode(programSource);
 
@@ -35,6 +35,20 @@ async function waitForBalance(addr) {
     return false;
 }
 
+// --- HELPER: Fill Template Variables ---
+// Contract parameters are TEAL template variables (TMPL_NAME, see
+// tools/template.py), which algod's compile endpoint rejects; fill in the
+// defaults the build recorded in the contract's .compiled.json.
+function fillTemplate(tealPath: string): string {
+    const compiled = JSON.parse(fs.readFileSync(tealPath.replace(/\.teal$/, '.compiled.json'), 'utf8'));
+    const variables = compiled.approval.template ? compiled.approval.template.variables : {};
+    return fs.readFileSync(tealPath, 'utf8').replace(/\bTMPL_(\w+)\b/g, (token: string, name: string) => {
+        const variable = variables[name];
+        if (!variable || variable.default === null) throw new Error(`no value for template variable ${token}`);
+        return variable.type === 'byte' ? '0x' + Buffer.from(variable.default, 'base64').toString('hex') : String(variable.default);
+    });
+}
+
 // --- HELPER: Compile TEAL ---
 async function compileProgram(client, programSource) {
     const encoder = new TextEncoder();
@@ -48,10 +62,10 @@ async function compileProgram(client, programSource) {
 async function main() {
     console.log("\n--- Verifying Contract Compilation ---");
     const commuteTealPath = path.resolve(__dirname, '../contracts/commute_checkin.teal');
-    const commuteTeal = fs.readFileSync(commuteTealPath, 'utf8');
+    const commuteTeal = fillTemplate(commuteTealPath);
     
     const assetTealPath = path.resolve(__dirname, '../contracts/asset_escrow.teal');
-    const assetTeal = fs.readFileSync(assetTealPath, 'utf8');
+    const assetTeal = fillTemplate(assetTealPath);
 
     // Simple Clear State
     const clearState = "#pragma version 6\nint 1\nreturn";
@@ -29,8 +29,8 @@ async function verifyMarketplace() {
         console.log("2. Verifying Item Details...");
 
         for (const box of boxes) {
-            const boxName = box.name; // Base64 encoded asset ID
-            const assetId = algosdk.decodeUint64(boxName, 'safe');
+            const boxName = box.name; // asset ID (8 bytes), then the seller unless the listing predates per-seller boxes
+            const assetId = algosdk.decodeUint64(boxName.slice(0, 8), 'safe');
 
             console.log(`   - Processing Box for Asset ID: ${assetId}`);
 
@@ -38,9 +38,10 @@ async function verifyMarketplace() {
             const valueBytes = boxValue.value;
 
             // Parsing Logic from Marketplace.tsx
-            // [Seller (32)][Price (8)]
-            if (valueBytes.length !== 40) {
-                console.error(`❌ Invalid Box Value Length: ${valueBytes.length} (Expected 40)`);
+            // v1: [Seller (32)][Unit Price (8)][Remaining (8)][Version = 1 (1)]
+            // legacy: [Seller (32)][Price (8)], one unit
+            if (valueBytes.length !== 40 && valueBytes.length !== 49) {
+                console.error(`❌ Invalid Box Value Length: ${valueBytes.length} (Expected 40 or 49)`);
                 continue;
             }
 
@@ -50,9 +51,11 @@ async function verifyMarketplace() {
             const seller = algosdk.encodeAddress(sellerBytes);
             const priceMicros = algosdk.decodeUint64(priceBytes, 'safe');
             const priceAlgo = algosdk.microalgosToAlgos(priceMicros);
+            const quantity = valueBytes.length === 40 ? 1 : algosdk.decodeUint64(valueBytes.slice(40, 48), 'safe');
 
             console.log(`     > Seller: ${seller}`);
-            console.log(`     > Price: ${priceAlgo} ALGO (${priceMicros} µAlgo)`);
+            console.log(`     > Price: ${priceAlgo} ALGO (${priceMicros} µAlgo) per unit`);
+            console.log(`     > Quantity: ${quantity}`);
 
             // Fetch Asset Info
             try {
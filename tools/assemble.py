@@ -0,0 +1,479 @@
+"""
+Offline TEAL assembler.
+
+Produces the same bytecode algod's /v2/teal/compile returns, so deploys
+can use the build artifacts directly instead of round-tripping to a node:
+
+    python -m tools.assemble contracts/trust_score.teal             # hash + size
+    python -m tools.assemble contracts/trust_score.teal -o out.tok  # write bytecode
+    python -m tools.assemble --app-id 755412941 contracts/trust_score.teal
+    python -m tools.assemble --check-golden                         # verify goldens
+
+Byte-identity depends on mirroring go-algorand's constant handling: every
+`int`/`byte`/`addr`/`method` pseudo-op is a constant reference, and from
+version 4 on the constants are ordered by use count (ties keep first-use
+order), values used once become pushint/pushbytes, and the rest go into
+intcblock/bytecblock ahead of the code.
+
+Template variables (`int TMPL_NAME`, `byte TMPL_NAME`) always go at the end
+of the constant blocks, never into push ops, so a value can be spliced in
+later without moving any branch: the blocks precede the code, and every
+jump is relative. `assemble(text, values)` fills them in directly;
+without a value each holds a one-byte placeholder (0, or empty bytes) at
+Assembled.templates[name], which is what tools/template.py patches.
+
+`disassemble` goes the other way, for programs that only exist as bytecode
+(e.g. the approval program an inner transaction creates).
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+
+from algosdk import encoding, logic
+
+from .teal import (
+    FIELDS,
+    OPS,
+    OPS_BY_CODE,
+    TEMPLATE_PREFIX,
+    TealError,
+    is_template,
+    parse,
+    parse_bytes,
+    parse_int,
+)
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+# go-algorand only reorders constants (and uses push ops for singletons) from v4.
+OPTIMIZE_CONSTANTS_VERSION = 4
+
+
+def uvarint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def method_selector(signature):
+    return encoding.checksum(signature.encode())[:4]
+
+
+@dataclass
+class Assembled:
+    bytecode: bytes
+    version: int
+    pc_to_line: dict        # pc of each instruction -> TEAL source line
+    pcs: list               # pc of each instruction, in source order
+    intc: list              # final intcblock values
+    bytec: list             # final bytecblock values
+    templates: dict = field(default_factory=dict)   # template name -> ("int" or "byte", offset of its value)
+
+    @property
+    def hash(self):
+        """Program address, as returned in algod's compile response."""
+        return logic.address(self.bytecode)
+
+    def compile_response(self):
+        return {"hash": self.hash, "result": base64.b64encode(self.bytecode).decode()}
+
+
+class _ConstRef:
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind, value):
+        self.kind = kind    # "int" or "byte"
+        self.value = value
+
+
+@dataclass(frozen=True)
+class _Template:
+    name: str           # without the TMPL_ prefix
+
+
+class _LabelRef:
+    __slots__ = ("labels",)
+
+    def __init__(self, labels):
+        self.labels = labels
+
+
+def _field_code(kind, name, version, line):
+    table = FIELDS[kind]
+    if name not in table:
+        if kind == "txna" and name in FIELDS["txn"]:
+            raise TealError(f"{name} is not an array field", line)
+        raise TealError(f"unknown field {name}", line)
+    code, since = table[name]
+    if since > version:
+        raise TealError(f"{name} available in version {since}. Missed #pragma version?", line)
+    return code
+
+
+def _u8(token, line, signed=False):
+    value = parse_int(token.lstrip("-"), line) * (-1 if token.startswith("-") else 1)
+    lo, hi = (-128, 127) if signed else (0, 255)
+    if not lo <= value <= hi:
+        raise TealError(f"immediate {token} out of range", line)
+    return value & 0xFF
+
+
+def _normalize(instr):
+    """Rewrite the txn/gtxn/itxn/gitxn/gtxns shorthands that take an array index."""
+    op, args = instr.op, instr.args
+    if op in ("txn", "itxn", "gtxns") and len(args) == 2:
+        return op.replace("txn", "txna") if op != "gtxns" else "gtxnsa", args
+    if op in ("gtxn", "gitxn") and len(args) == 3:
+        return op + "a", args
+    return op, args
+
+
+def _encode(instr, version):
+    """Encode one instruction into a list of pieces: bytes, _ConstRef or _LabelRef."""
+    line = instr.line
+    op, args = _normalize(instr)
+
+    if op == "int":
+        if len(args) != 1:
+            raise TealError("int expects one immediate", line)
+        if is_template(args[0]):
+            return [_ConstRef("int", _Template(args[0][len(TEMPLATE_PREFIX):]))]
+        return [_ConstRef("int", parse_int(args[0], line))]
+    if op in ("byte", "addr", "method"):
+        if op == "byte" and len(args) == 1 and is_template(args[0]):
+            return [_ConstRef("byte", _Template(args[0][len(TEMPLATE_PREFIX):]))]
+        if op == "byte":
+            value, used = parse_bytes(args, line)
+            if used != len(args):
+                raise TealError("byte expects one literal", line)
+        elif len(args) != 1:
+            raise TealError(f"{op} expects one immediate", line)
+        elif op == "addr":
+            try:
+                value = encoding.decode_address(args[0])
+            except Exception:
+                raise TealError(f"invalid address {args[0]}", line) from None
+        else:
+            signature, used = parse_bytes(args, line)
+            value = method_selector(signature.decode())
+        return [_ConstRef("byte", value)]
+
+    spec = OPS.get(op)
+    if spec is None:
+        raise TealError(f"unknown opcode: {op}", line)
+    if spec.version > version:
+        raise TealError(f"{op} opcode was introduced in v{spec.version}", line)
+
+    pieces = [bytes([spec.code])]
+    kinds = spec.immediates
+    if kinds in (("labels",), ("varuints",), ("bytess",)):
+        if len(args) > 255:
+            raise TealError(f"{op} cannot take more than 255 immediates", line)
+        if kinds == ("labels",):
+            return pieces + [bytes([len(args)]), _LabelRef(list(args))]
+        if kinds == ("varuints",):
+            return pieces + [uvarint(len(args))] + [uvarint(parse_int(a, line)) for a in args]
+        out = pieces + [uvarint(len(args))]
+        rest = list(args)
+        while rest:
+            value, used = parse_bytes(rest, line)
+            out.append(uvarint(len(value)) + value)
+            rest = rest[used:]
+        return out
+
+    rest = list(args)
+    for kind in kinds:
+        if not rest:
+            raise TealError(f"{op} expects {len(kinds)} immediate arguments", line)
+        token = rest.pop(0)
+        if kind == "uint8":
+            pieces.append(bytes([_u8(token, line)]))
+        elif kind == "int8":
+            pieces.append(bytes([_u8(token, line, signed=True)]))
+        elif kind == "label":
+            pieces.append(_LabelRef([token]))
+        elif kind == "varuint":
+            pieces.append(uvarint(parse_int(token, line)))
+        elif kind == "bytes":
+            value, used = parse_bytes([token] + rest, line)
+            rest = rest[used - 1:]
+            pieces.append(uvarint(len(value)) + value)
+        else:
+            pieces.append(bytes([_field_code(kind, token, version, line)]))
+    if rest:
+        raise TealError(f"{op} expects {len(kinds)} immediate arguments", line)
+    return pieces
+
+
+def _const_plan(refs, version):
+    """Order constants like go-algorand: returns (block values, {value: index or None}).
+
+    Template variables follow the ordinary constants, in first-use order.
+    """
+    counts = {}
+    for value in refs:
+        counts[value] = counts.get(value, 0) + 1
+    order = [v for v in counts if not isinstance(v, _Template)]   # first-use order
+    templates = [v for v in counts if isinstance(v, _Template)]
+    if version < OPTIMIZE_CONSTANTS_VERSION:
+        block = order + templates
+        return block, {v: i for i, v in enumerate(block)}
+    order.sort(key=lambda v: -counts[v])   # stable: ties keep first-use order
+    block = [v for v in order if counts[v] > 1] + templates
+    index = {v: i for i, v in enumerate(block)}
+    return block, {v: index.get(v) for v in order + templates}
+
+
+def _const_bytes(ref, index):
+    if ref.kind == "int":
+        if index is None:
+            return bytes([OPS["pushint"].code]) + uvarint(ref.value)
+        base, indexed = OPS["intc_0"].code, OPS["intc"].code
+    else:
+        if index is None:
+            return bytes([OPS["pushbytes"].code]) + uvarint(len(ref.value)) + ref.value
+        base, indexed = OPS["bytec_0"].code, OPS["bytec"].code
+    if index < 4:
+        return bytes([base + index])
+    return bytes([indexed, index])
+
+
+def template_value(kind, name, value):
+    """`value` checked (and str encoded) for the template variable `name` of kind "int" or "byte"."""
+    if kind == "int":
+        if not isinstance(value, int) or not 0 <= value < 2**64:
+            raise TealError(f"template {TEMPLATE_PREFIX}{name} needs a uint64, got {value!r}")
+        return value
+    if isinstance(value, str):
+        value = value.encode()
+    if not isinstance(value, bytes):
+        raise TealError(f"template {TEMPLATE_PREFIX}{name} needs bytes, got {value!r}")
+    return value
+
+
+def assemble_program(program, values=None):
+    """Assemble a parsed program; `values` fills in template variables by name (without TMPL_)."""
+    values = values or {}
+    version = program.version
+    encoded = [_encode(instr, version) for instr in program.instrs]
+
+    int_refs = [p.value for e in encoded for p in e if isinstance(p, _ConstRef) and p.kind == "int"]
+    byte_refs = [p.value for e in encoded for p in e if isinstance(p, _ConstRef) and p.kind == "byte"]
+    intc, int_index = _const_plan(int_refs, version)
+    bytec, byte_index = _const_plan(byte_refs, version)
+    if len(intc) > 255 or len(bytec) > 255:
+        raise TealError("too many constants")
+
+    # Resolve constants, then lay out code so label offsets are known.
+    pcs = []
+    sizes = []
+    pc = 0
+    for pieces in encoded:
+        for i, piece in enumerate(pieces):
+            if isinstance(piece, _ConstRef):
+                table = int_index if piece.kind == "int" else byte_index
+                pieces[i] = _const_bytes(piece, table[piece.value])
+        size = sum(2 * len(p.labels) if isinstance(p, _LabelRef) else len(p) for p in pieces)
+        pcs.append(pc)
+        sizes.append(size)
+        pc += size
+    end = pc
+
+    def label_pc(label, line):
+        if label not in program.labels:
+            raise TealError(f"reference to undefined label {label!r}", line)
+        index = program.labels[label]
+        return pcs[index] if index < len(pcs) else end
+
+    code = bytearray()
+    for instr, pieces, start, size in zip(program.instrs, encoded, pcs, sizes):
+        after = start + size
+        for piece in pieces:
+            if not isinstance(piece, _LabelRef):
+                code += piece
+                continue
+            for label in piece.labels:
+                jump = label_pc(label, instr.line) - after
+                if jump < 0 and version < 4:
+                    raise TealError(f"label {label!r} is a back reference, back jump support was introduced in v4", instr.line)
+                if not -0x8000 <= jump <= 0x7FFF:
+                    raise TealError(f"label {label!r} is too far away", instr.line)
+                code += (jump & 0xFFFF).to_bytes(2, "big")
+
+    header = bytearray(uvarint(version))
+    templates = {}
+    if intc:
+        header += bytes([OPS["intcblock"].code]) + uvarint(len(intc))
+        for i, value in enumerate(intc):
+            if isinstance(value, _Template):
+                templates[value.name] = ("int", len(header))
+                value = intc[i] = template_value("int", value.name, values.get(value.name, 0))
+            header += uvarint(value)
+    if bytec:
+        header += bytes([OPS["bytecblock"].code]) + uvarint(len(bytec))
+        for i, value in enumerate(bytec):
+            if isinstance(value, _Template):
+                templates[value.name] = ("byte", len(header))
+                value = bytec[i] = template_value("byte", value.name, values.get(value.name, b""))
+            header += uvarint(len(value)) + value
+
+    offset = len(header)
+    pcs = [offset + start for start in pcs]
+    pc_to_line = {pc: instr.line for instr, pc in zip(program.instrs, pcs)}
+    return Assembled(bytes(header + code), version, pc_to_line, pcs, intc, bytec, templates)
+
+
+def assemble(text, values=None):
+    """Assemble TEAL source text into an Assembled program (see assemble_program for `values`)."""
+    return assemble_program(parse(text), values)
+
+
+def _read_uvarint(data, pos):
+    value, shift = 0, 0
+    while True:
+        if pos >= len(data):
+            raise TealError("bytecode ends inside a varuint")
+        byte = data[pos]
+        value |= (byte & 0x7F) << shift
+        pos += 1
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+def disassemble(bytecode):
+    """TEAL text for AVM bytecode; branch targets get labels named after their pc."""
+    version, pos = _read_uvarint(bytecode, 0)
+    field_names = {kind: {code: name for name, (code, _) in table.items()} for kind, table in FIELDS.items()}
+    decoded = []        # (pc, op, immediates, [jump targets])
+    while pos < len(bytecode):
+        pc = pos
+        spec = OPS_BY_CODE.get(bytecode[pos])
+        if spec is None:
+            raise TealError(f"invalid opcode 0x{bytecode[pos]:02x} at pc {pc}")
+        pos += 1
+        args, offsets = [], []
+        for kind in spec.immediates:
+            if pos >= len(bytecode):
+                raise TealError(f"{spec.name} at pc {pc} is missing immediates")
+            if kind in ("uint8", "int8"):
+                value = bytecode[pos]
+                args.append(str(value - 256 if kind == "int8" and value > 127 else value))
+                pos += 1
+            elif kind in ("label", "labels"):
+                count = 1 if kind == "label" else bytecode[pos]
+                pos += 0 if kind == "label" else 1
+                for _ in range(count):
+                    offsets.append(int.from_bytes(bytecode[pos:pos + 2], "big", signed=True))
+                    pos += 2
+            elif kind in ("varuint", "varuints"):
+                count = 1
+                if kind == "varuints":
+                    count, pos = _read_uvarint(bytecode, pos)
+                for _ in range(count):
+                    value, pos = _read_uvarint(bytecode, pos)
+                    args.append(str(value))
+            elif kind in ("bytes", "bytess"):
+                count = 1
+                if kind == "bytess":
+                    count, pos = _read_uvarint(bytecode, pos)
+                for _ in range(count):
+                    length, pos = _read_uvarint(bytecode, pos)
+                    args.append("0x" + bytecode[pos:pos + length].hex())
+                    pos += length
+            else:
+                name = field_names[kind].get(bytecode[pos])
+                if name is None:
+                    raise TealError(f"unknown {kind} field {bytecode[pos]} at pc {pc}")
+                args.append(name)
+                pos += 1
+        decoded.append((pc, spec.name, args, [pos + offset for offset in offsets]))
+    targets = {target for *_, jumps in decoded for target in jumps}
+    lines = [f"#pragma version {version}"]
+    for pc, op, args, jumps in decoded:
+        if pc in targets:
+            lines.append(f"label{pc}:")
+        lines.append(" ".join([op] + args + [f"label{target}" for target in jumps]))
+    if pos in targets:
+        lines.append(f"label{pos}:")
+    return "\n".join(lines) + "\n"
+
+
+def app_address(app_id):
+    return logic.get_application_address(int(app_id))
+
+
+def check_golden(golden_dir=GOLDEN_DIR, log=print):
+    """Assemble every golden .teal and compare against the algod-produced .tok next to it.
+
+    A .teal with no .tok yet is reported as pending (algod has not compiled
+    it), not as a failure.
+    """
+    failures = pending = 0
+    sources = sorted(glob.glob(os.path.join(golden_dir, "*.teal")))
+    for source in sources:
+        expected_path = source[:-5] + ".tok"
+        name = os.path.basename(source)
+        if not os.path.exists(expected_path):
+            pending += 1
+            log(f"PENDING {name}: no algod output yet (node scripts/refresh_teal_goldens.cjs {name})")
+            continue
+        with open(source) as f:
+            actual = assemble(f.read()).bytecode
+        with open(expected_path, "rb") as f:
+            expected = f.read()
+        if actual == expected:
+            log(f"ok      {name} ({len(actual)} bytes)")
+            continue
+        failures += 1
+        first = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b), min(len(actual), len(expected)))
+        log(f"MISMATCH {name}: first difference at byte {first} (got {len(actual)} bytes, want {len(expected)})")
+    if not sources:
+        log(f"no golden files in {golden_dir}")
+    if pending:
+        log(f"{pending} golden(s) pending: their programs are not verified against algod")
+    return failures == 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Assemble TEAL to AVM bytecode.")
+    parser.add_argument("sources", nargs="*", help=".teal files")
+    parser.add_argument("-o", "--output", help="output .tok path (single source only)")
+    parser.add_argument("--app-id", type=int, help="also print the address of this application")
+    parser.add_argument("--check-golden", action="store_true", help="verify against tools/golden")
+    args = parser.parse_args(argv)
+
+    if args.check_golden:
+        return 0 if check_golden() else 1
+    if not args.sources:
+        parser.error("no sources given")
+    if args.output and len(args.sources) != 1:
+        parser.error("-o needs exactly one source")
+
+    for source in args.sources:
+        with open(source) as f:
+            try:
+                result = assemble(f.read())
+            except TealError as e:
+                print(f"{source}: {e}", file=sys.stderr)
+                return 1
+        out = args.output or source[:-5] + ".tok"
+        with open(out, "wb") as f:
+            f.write(result.bytecode)
+        info = dict(result.compile_response(), source=source, output=out, size=len(result.bytecode))
+        if args.app_id is not None:
+            info["appId"] = args.app_id
+            info["appAddress"] = app_address(args.app_id)
+        print(json.dumps(info, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2778 @@
+"""
+In-process AVM: runs our compiled .teal files against a local ledger.
+
+    from tools.avm import Ledger, app_call, payment
+
+    ledger = Ledger()
+    creator = ledger.new_account(100_000_000)
+    trust = ledger.deploy(creator, "contracts/trust_score.teal", local_schema=(4, 0))
+    ledger.call(creator, trust, on_complete=OptIn)
+    ledger.call(creator, trust, "add_trust", creator, 60)
+    ledger.local_state(creator, trust)      # {b"Trust_Score": 60, ...}
+
+Programs are parsed from TEAL text (tools/teal.py; bytecode, such as an
+inner app creation's program, is disassembled first) and each instruction is
+pre-bound to a Python handler, so a typical contract call costs tens of
+microseconds. The ledger covers what our contracts touch: balances and
+minimum balances, ASAs, global/local/box state, atomic groups with pooled
+fees and opcode budget, inner pay/axfer/appl transactions and the v8
+resource-availability rules (foreign accounts, apps, assets and box
+references). A group either applies completely or not at all; a failure
+raises Rejected with the reason and the TEAL line that failed.
+
+Not modelled: logic signatures, keyreg/afrz transactions, rekeying,
+ecdsa/vrf/json_ref/block opcodes, and rewards.
+"""
+import base64
+import hashlib
+import math
+import os
+
+from algosdk import abi, encoding, logic
+
+from .teal import FIELDS, OPS, TealError, parse, parse_bytes, parse_int
+
+MIN_TXN_FEE = 1000
+MIN_BALANCE = 100_000
+MAX_TXN_LIFE = 1000
+APP_CALL_BUDGET = 700
+MAX_GROUP_SIZE = 16
+MAX_INNER_PER_CALL = 16         # pooled across the group's app calls, up to 256
+MAX_CALL_DEPTH = 8
+MAX_STACK = 1000
+MAX_BYTES = 4096
+MAX_APP_ARGS = 16
+MAX_APP_ARGS_BYTES = 2048
+MAX_FOREIGN_ACCOUNTS = 4
+MAX_FOREIGN_REFS = 8
+MAX_KEY_LEN = 64
+MAX_KEY_VALUE_LEN = 128
+MAX_BOX_SIZE = 32768
+BOX_REF_QUOTA = 1024
+MAX_LOG_CALLS = 32
+MAX_LOG_BYTES = 1024
+MAX_UINT = 2**64 - 1
+ZERO_ADDRESS = bytes(32)
+LOGIC_SIG_VERSION = 8
+
+# Minimum-balance increments (protocol constants).
+ASSET_MBR = 100_000
+APP_OPT_IN_MBR = 100_000
+APP_PAGE_MBR = 100_000
+SCHEMA_UINT_MBR = 28_500
+SCHEMA_BYTES_MBR = 50_000
+BOX_FLAT_MBR = 2_500
+BOX_BYTE_MBR = 400
+
+NoOp, OptIn, CloseOut, ClearState, UpdateApplication, DeleteApplication = range(6)
+TYPE_ENUM = {"pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6}
+TYPE_NAMES = {v: k for k, v in TYPE_ENUM.items()}
+
+_MISSING = object()
+_HALT = -1
+
+
+class Rejected(Exception):
+    """A transaction group failed; nothing it did was applied."""
+
+    def __init__(self, reason, txn_index=None, app_id=None, line=None):
+        where = []
+        if txn_index is not None:
+            where.append(f"txn {txn_index}")
+        if app_id:
+            where.append(f"app {app_id}")
+        if line:
+            where.append(f"line {line}")
+        super().__init__(f"{', '.join(where)}: {reason}" if where else reason)
+        self.reason = reason
+        self.txn_index = txn_index
+        self.app_id = app_id
+        self.line = line
+
+
+class AVMError(Exception):
+    """Raised by opcode handlers; turned into Rejected by the evaluator."""
+
+
+def address(value):
+    """Raw 32-byte address from a base32 string or bytes."""
+    if isinstance(value, str):
+        return encoding.decode_address(value)
+    return bytes(value)
+
+
+def encode_address(raw):
+    return encoding.encode_address(raw)
+
+
+def _app_address(app_id):
+    return encoding.decode_address(logic.get_application_address(app_id))
+
+
+# -- transactions ------------------------------------------------------------
+
+_ADDRESS_FIELDS = ("sender", "receiver", "close_remainder_to", "asset_sender", "asset_receiver",
+                   "asset_close_to", "rekey_to", "config_asset_manager", "config_asset_reserve",
+                   "config_asset_freeze", "config_asset_clawback")
+
+
+class Txn:
+    """A transaction. Addresses may be given as base32 strings or raw bytes.
+
+    After a successful submit the evaluation results are filled in:
+    `logs`, `inner_txns`, `created_application_id`, `created_asset_id`,
+    `cost` (opcodes charged to this app call, excluding inner calls) and
+    `box_bytes` / `local_bytes` (key and value bytes read or written by
+    box and local-state opcodes).
+    """
+
+    _defaults = {
+        "fee": MIN_TXN_FEE, "first_valid": 0, "last_valid": MAX_TXN_LIFE, "note": b"",
+        "lease": ZERO_ADDRESS, "receiver": ZERO_ADDRESS, "amount": 0,
+        "close_remainder_to": ZERO_ADDRESS, "xfer_asset": 0, "asset_amount": 0,
+        "asset_sender": ZERO_ADDRESS, "asset_receiver": ZERO_ADDRESS,
+        "asset_close_to": ZERO_ADDRESS, "application_id": 0, "on_completion": NoOp,
+        "approval_program": None, "clear_state_program": None, "global_num_uint": 0,
+        "global_num_byte_slice": 0, "local_num_uint": 0, "local_num_byte_slice": 0,
+        "extra_program_pages": 0, "rekey_to": ZERO_ADDRESS, "config_asset": 0,
+        "config_asset_total": 0, "config_asset_decimals": 0, "config_asset_default_frozen": 0,
+        "config_asset_unit_name": b"", "config_asset_name": b"", "config_asset_url": b"",
+        "config_asset_metadata_hash": b"", "config_asset_manager": ZERO_ADDRESS,
+        "config_asset_reserve": ZERO_ADDRESS, "config_asset_freeze": ZERO_ADDRESS,
+        "config_asset_clawback": ZERO_ADDRESS,
+    }
+    def __init__(self, type, sender, **fields):
+        if type not in TYPE_ENUM:
+            raise ValueError(f"unknown transaction type {type!r}")
+        d = self.__dict__
+        d.update(self._defaults)
+        d.update(type=type, sender=sender if sender.__class__ is bytes else address(sender),
+                 application_args=[], accounts=[], assets=[], applications=[], boxes=[],
+                 group_index=0, txid=ZERO_ADDRESS, logs=[], inner_txns=[],
+                 created_application_id=0, created_asset_id=0, cost=0, box_bytes=0,
+                 local_bytes=0)
+        for name, value in fields.items():
+            normalize = _NORMALIZERS.get(name)
+            if normalize is not None:
+                value = normalize(value)
+            elif name not in self._defaults:
+                raise TypeError(f"unknown transaction field {name!r}")
+            d[name] = value
+
+    def __repr__(self):
+        extra = f" app={self.application_id}" if self.type == "appl" else ""
+        return f"<Txn {self.type}{extra} from {encode_address(self.sender)[:8]}…>"
+
+
+def _box_ref(ref):
+    app, name = ref if isinstance(ref, tuple) else (0, ref)
+    return app, _arg_bytes(name)
+
+
+_NORMALIZERS = {
+    **{name: (lambda v: v if v.__class__ is bytes else address(v)) for name in _ADDRESS_FIELDS[1:]},
+    "application_args": lambda values: [_arg_bytes(v) for v in values],
+    "accounts": lambda values: [address(v) for v in values],
+    "assets": list,
+    "applications": list,
+    "boxes": lambda values: [_box_ref(v) for v in values],
+}
+
+
+def _arg_bytes(value):
+    if isinstance(value, int):
+        return value.to_bytes(8, "big")
+    if isinstance(value, str):
+        return value.encode()
+    return bytes(value)
+
+
+def payment(sender, receiver, amount, **fields):
+    return Txn("pay", sender, receiver=receiver, amount=amount, **fields)
+
+
+def asset_transfer(sender, receiver, asset_id, amount, **fields):
+    return Txn("axfer", sender, asset_receiver=receiver, xfer_asset=asset_id,
+               asset_amount=amount, **fields)
+
+
+def app_call(sender, app_id, *args, on_complete=NoOp, **fields):
+    """App call; int args are encoded as 8-byte big-endian, str as UTF-8."""
+    return Txn("appl", sender, application_id=app_id, on_completion=on_complete,
+               application_args=list(args), **fields)
+
+
+def method_call(sender, app_id, signature, *args, **fields):
+    """ARC-4 call: the method selector followed by `args` encoded per the signature.
+
+    Transaction arguments (pay, axfer, ...) are the preceding group members
+    and take no value here; reference types (account, asset, application)
+    are not supported.
+    """
+    method = abi.Method.from_signature(signature)
+    values = iter(args)
+    encoded = [method.get_selector()]
+    for arg in method.args:
+        if abi.is_abi_transaction_type(arg.type):
+            continue
+        if abi.is_abi_reference_type(arg.type):
+            raise AVMError(f"{signature}: reference argument {arg.type} not supported")
+        encoded.append(arg.type.encode(next(values)))
+    return app_call(sender, app_id, *encoded, **fields)
+
+
+def _txn_getters():
+    g = {
+        "Sender": lambda t: t.sender,
+        "Fee": lambda t: t.fee,
+        "FirstValid": lambda t: t.first_valid,
+        "LastValid": lambda t: t.last_valid,
+        "Note": lambda t: t.note,
+        "Lease": lambda t: t.lease,
+        "Receiver": lambda t: t.receiver,
+        "Amount": lambda t: t.amount,
+        "CloseRemainderTo": lambda t: t.close_remainder_to,
+        "Type": lambda t: t.type.encode(),
+        "TypeEnum": lambda t: TYPE_ENUM[t.type],
+        "XferAsset": lambda t: t.xfer_asset,
+        "AssetAmount": lambda t: t.asset_amount,
+        "AssetSender": lambda t: t.asset_sender,
+        "AssetReceiver": lambda t: t.asset_receiver,
+        "AssetCloseTo": lambda t: t.asset_close_to,
+        "GroupIndex": lambda t: t.group_index,
+        "TxID": lambda t: t.txid,
+        "ApplicationID": lambda t: t.application_id,
+        "OnCompletion": lambda t: t.on_completion,
+        "NumAppArgs": lambda t: len(t.application_args),
+        "NumAccounts": lambda t: len(t.accounts),
+        "NumAssets": lambda t: len(t.assets),
+        "NumApplications": lambda t: len(t.applications),
+        "ApprovalProgram": lambda t: _program_bytes(t.approval_program),
+        "ClearStateProgram": lambda t: _program_bytes(t.clear_state_program),
+        "RekeyTo": lambda t: t.rekey_to,
+        "ConfigAsset": lambda t: t.config_asset,
+        "GlobalNumUint": lambda t: t.global_num_uint,
+        "GlobalNumByteSlice": lambda t: t.global_num_byte_slice,
+        "LocalNumUint": lambda t: t.local_num_uint,
+        "LocalNumByteSlice": lambda t: t.local_num_byte_slice,
+        "ExtraProgramPages": lambda t: t.extra_program_pages,
+        "NumLogs": lambda t: len(t.logs),
+        "LastLog": lambda t: t.logs[-1] if t.logs else b"",
+        "CreatedAssetID": lambda t: t.created_asset_id,
+        "CreatedApplicationID": lambda t: t.created_application_id,
+    }
+    for name in ("Total", "Decimals", "DefaultFrozen", "UnitName", "Name", "URL", "MetadataHash",
+                 "Manager", "Reserve", "Freeze", "Clawback"):
+        attr = "config_asset_" + {"URL": "url", "UnitName": "unit_name", "MetadataHash": "metadata_hash",
+                                  "DefaultFrozen": "default_frozen"}.get(name, name.lower())
+        g["ConfigAsset" + name] = (lambda a: lambda t: getattr(t, a))(attr)
+    return g
+
+
+TXN_GETTERS = _txn_getters()
+# Array fields; Accounts[0] is the sender and Applications[0] the called app.
+TXN_ARRAYS = {
+    "ApplicationArgs": lambda t: t.application_args,
+    "Accounts": lambda t: [t.sender] + t.accounts,
+    "Assets": lambda t: t.assets,
+    "Applications": lambda t: [t.application_id] + t.applications,
+    "Logs": lambda t: t.logs,
+}
+
+# itxn_field name -> (attribute, value kind)
+ITXN_SETTERS = {
+    "Sender": ("sender", "addr"), "Fee": ("fee", "int"), "Note": ("note", "bytes"),
+    "Receiver": ("receiver", "addr"), "Amount": ("amount", "int"),
+    "CloseRemainderTo": ("close_remainder_to", "addr"), "Type": ("type", "type"),
+    "TypeEnum": ("type", "type_enum"), "XferAsset": ("xfer_asset", "asset"),
+    "AssetAmount": ("asset_amount", "int"), "AssetSender": ("asset_sender", "addr"),
+    "AssetReceiver": ("asset_receiver", "addr"), "AssetCloseTo": ("asset_close_to", "addr"),
+    "ApplicationID": ("application_id", "app"), "OnCompletion": ("on_completion", "int"),
+    "ApplicationArgs": ("application_args", "bytes[]"), "Accounts": ("accounts", "addr[]"),
+    "Assets": ("assets", "asset[]"), "Applications": ("applications", "app[]"),
+    "ApprovalProgram": ("approval_program", "bytes"),
+    "ClearStateProgram": ("clear_state_program", "bytes"),
+    "GlobalNumUint": ("global_num_uint", "int"), "GlobalNumByteSlice": ("global_num_byte_slice", "int"),
+    "LocalNumUint": ("local_num_uint", "int"), "LocalNumByteSlice": ("local_num_byte_slice", "int"),
+    "ExtraProgramPages": ("extra_program_pages", "int"), "RekeyTo": ("rekey_to", "addr"),
+    "ConfigAsset": ("config_asset", "asset"), "ConfigAssetTotal": ("config_asset_total", "int"),
+    "ConfigAssetDecimals": ("config_asset_decimals", "int"),
+    "ConfigAssetDefaultFrozen": ("config_asset_default_frozen", "int"),
+    "ConfigAssetUnitName": ("config_asset_unit_name", "bytes"),
+    "ConfigAssetName": ("config_asset_name", "bytes"), "ConfigAssetURL": ("config_asset_url", "bytes"),
+    "ConfigAssetMetadataHash": ("config_asset_metadata_hash", "bytes"),
+    "ConfigAssetManager": ("config_asset_manager", "addr"),
+    "ConfigAssetReserve": ("config_asset_reserve", "addr"),
+    "ConfigAssetFreeze": ("config_asset_freeze", "addr"),
+    "ConfigAssetClawback": ("config_asset_clawback", "addr"),
+}
+
+
+# -- programs ----------------------------------------------------------------
+
+class Compiled:
+    """A parsed TEAL program with every instruction bound to its handler."""
+
+    def __init__(self, text, name="<program>"):
+        self.name = name
+        self.text = text
+        self.program = parse(text)
+        self.version = self.program.version
+        instrs = self.program.instrs
+        self.lines = [i.line for i in instrs] + [instrs[-1].line + 1 if instrs else 1]
+        self.code = []
+        for index, instr in enumerate(instrs):
+            fn, arg, cost = _bind(instr, self.program, index)
+            self.code.append((fn, arg, cost, fn in _SYNC_OPS))
+        self.code.append((_op_end, None, 0, False))
+        self.costs = [entry[2] for entry in self.code]     # per instruction, before fusing
+        _fuse_compare_branches(self.code, instrs)
+        self._bytecode = None
+
+    @property
+    def bytecode(self):
+        if self._bytecode is None:
+            from .assemble import assemble_program
+            self._bytecode = assemble_program(self.program).bytecode
+        return self._bytecode
+
+
+def _reader(fn, arg):
+    """A ctx -> value function for side-effect-free single-push ops, or None."""
+    if fn is _op_txn:
+        return lambda ctx: arg(ctx.txn)
+    if fn is _op_txna:
+        getter, index, field = arg
+        return lambda ctx: _array_item(getter(ctx.txn), index, field)
+    if fn is _op_global:
+        return arg
+    if fn is _op_load:
+        return lambda ctx: ctx.scratch[arg]
+    return None
+
+
+def _fuse_compare_branches(code, instrs):
+    """Collapse `<field> <const> ==|!= bnz|bz L` into one handler.
+
+    This is the shape of every Cond dispatch test PyTeal emits, and most of
+    what a call executes before reaching its method body. The fused entry
+    charges the same total cost; the three instructions it covers stay in
+    place (unreachable, since none of them carries a label) so instruction
+    indices and branch targets are unchanged.
+    """
+    for i in range(len(instrs) - 3):
+        eq, br = instrs[i + 2].op, instrs[i + 3].op
+        if eq not in ("==", "!=") or br not in ("bnz", "bz"):
+            continue
+        if any(instrs[j].labels for j in range(i + 1, i + 4)):
+            continue
+        (fa, aa, ca, _), (fb, ab, cb, _) = code[i], code[i + 1]
+        if fb is _const:
+            read, value = _reader(fa, aa), ab
+        elif fa is _const:
+            read, value = _reader(fb, ab), aa
+        else:
+            continue
+        if read is None:
+            continue
+        jump_if_equal = (eq == "==") == (br == "bnz")
+        cost = ca + cb + code[i + 2][2] + code[i + 3][2]
+        code[i] = (_op_compare_branch, (read, value, jump_if_equal, code[i + 3][1], i + 4), cost, False)
+
+
+def _op_compare_branch(ctx, arg):
+    read, value, jump_if_equal, target, fallthrough = arg
+    v = read(ctx)
+    if v.__class__ is not value.__class__:
+        raise AVMError("== expects arguments of the same type")
+    return target if (v == value) is jump_if_equal else fallthrough
+
+
+_COMPILED = {}
+
+
+def compile_teal(text, name="<program>"):
+    """Compiled program for TEAL text, shared between apps with identical source."""
+    compiled = _COMPILED.get(text)
+    if compiled is None:
+        compiled = _COMPILED[text] = Compiled(text, name)
+    return compiled
+
+
+def load_teal(path):
+    with open(path) as f:
+        return compile_teal(f.read(), os.path.basename(path))
+
+
+def _program(value):
+    if value is None or isinstance(value, Compiled):
+        return value
+    if isinstance(value, bytes):
+        if value[:1] and value[0] < 0x20:       # bytecode: a version byte, not TEAL text
+            from .assemble import disassemble
+
+            return compile_teal(disassemble(value))
+        value = value.decode()
+    if value.endswith(".teal") and "\n" not in value:
+        return load_teal(value)
+    return compile_teal(value)
+
+
+def _program_bytes(value):
+    if value is None:
+        return b""
+    if isinstance(value, Compiled):
+        return value.bytecode
+    return _arg_bytes(value)
+
+
+# -- ledger state ------------------------------------------------------------
+
+class Profile:
+    """Instructions executed per program while set as Ledger.profile.
+
+        ledger.profile = Profile()
+        ledger.submit(group)
+        ledger.profile.lines()      # {Compiled: {TEAL line: [ops, cost]}}
+    """
+
+    def __init__(self):
+        self.hits = {}          # Compiled -> executions per code entry
+
+    def _counter(self, program):
+        hits = self.hits.get(program)
+        if hits is None:
+            hits = self.hits[program] = [0] * len(program.code)
+        return hits
+
+    def lines(self):
+        """Executed ops and their opcode cost per TEAL source line of each program."""
+        out = {}
+        for program, hits in self.hits.items():
+            per_line = out[program] = {}
+            for pc, count in enumerate(hits):
+                if not count:
+                    continue
+                # A fused compare-and-branch entry ran the 4 instructions it covers.
+                span = 4 if program.code[pc][0] is _op_compare_branch else 1
+                for i in range(pc, pc + span):
+                    if i < len(program.lines) - 1:
+                        entry = per_line.setdefault(program.lines[i], [0, 0])
+                        entry[0] += count
+                        entry[1] += count * program.costs[i]
+        return out
+
+
+class Account:
+    __slots__ = ("address", "balance", "assets", "locals", "apps_created", "assets_created", "boxes")
+
+    def __init__(self, addr, balance=0):
+        self.address = addr
+        self.balance = balance
+        self.assets = {}            # asset id -> (amount, frozen)
+        self.locals = {}            # app id -> {key: value}
+        self.apps_created = {}      # app id -> App
+        self.assets_created = {}    # asset id -> Asset
+        self.boxes = [0, 0]         # boxes, box bytes held by an app account
+
+
+class App:
+    __slots__ = ("id", "creator", "approval", "clear", "global_state", "boxes", "global_schema",
+                 "local_schema", "extra_pages", "address")
+
+    def __init__(self, app_id, creator, approval, clear, global_schema, local_schema, extra_pages):
+        self.id = app_id
+        self.creator = creator
+        self.approval = approval
+        self.clear = clear
+        self.global_state = {}
+        self.boxes = {}
+        self.global_schema = global_schema      # (uints, byte slices)
+        self.local_schema = local_schema
+        self.extra_pages = extra_pages
+        self.address = _app_address(app_id)
+
+
+class Asset:
+    __slots__ = ("id", "creator", "total", "decimals", "default_frozen", "unit_name", "name", "url",
+                 "metadata_hash", "manager", "reserve", "freeze", "clawback")
+
+    def __init__(self, asset_id, creator, total, decimals=0, default_frozen=0, unit_name=b"",
+                 name=b"", url=b"", metadata_hash=b"", manager=ZERO_ADDRESS, reserve=ZERO_ADDRESS,
+                 freeze=ZERO_ADDRESS, clawback=ZERO_ADDRESS):
+        self.id = asset_id
+        self.creator = creator
+        self.total = total
+        self.decimals = decimals
+        self.default_frozen = default_frozen
+        self.unit_name = unit_name
+        self.name = name
+        self.url = url
+        self.metadata_hash = metadata_hash
+        self.manager = manager
+        self.reserve = reserve
+        self.freeze = freeze
+        self.clawback = clawback
+
+
+class Result:
+    """Outcome of a submitted group."""
+
+    def __init__(self, txns, cost, budget):
+        self.txns = txns
+        self.cost = cost            # opcodes charged across the group, inner calls included
+        self.budget = budget        # pooled opcode budget the group had
+
+    @property
+    def logs(self):
+        """Logs of the last app call in the group."""
+        for txn in reversed(self.txns):
+            if txn.type == "appl":
+                return txn.logs
+        return []
+
+    @property
+    def return_value(self):
+        """ARC-4 return value (last log minus the 151f7c75 prefix), if any."""
+        logs = self.logs
+        if logs and logs[-1][:4] == b"\x15\x1f\x7c\x75":
+            return logs[-1][4:]
+        return None
+
+
+class _Group:
+    """Per-group evaluation state: pooled budget, fees and resource quotas."""
+
+    __slots__ = ("txns", "budget", "cost", "fee_credit", "inner_left", "box_refs", "box_quota",
+                 "scratch", "touched", "group_id", "unnamed", "top", "unnamed_used")
+
+    def __init__(self, txns, unnamed=False):
+        self.txns = txns
+        self.unnamed = unnamed          # simulate's allow_unnamed_resources
+        self.top = None                 # the top-level transaction being evaluated
+        self.unnamed_used = {}          # its group index -> unnamed resources it used
+        calls = 0
+        fees = 0
+        n_refs = 0
+        self.box_refs = set()
+        for t in txns:
+            fees += t.fee
+            if t.type == "appl":
+                calls += 1
+                for app, name in t.boxes:
+                    n_refs += 1
+                    self.box_refs.add((_resolve_box_app(t, app), name))
+        self.budget = APP_CALL_BUDGET * calls
+        self.cost = 0
+        self.fee_credit = fees - MIN_TXN_FEE * len(txns)
+        self.inner_left = min(256, MAX_INNER_PER_CALL * calls)
+        self.box_quota = BOX_REF_QUOTA * n_refs
+        self.scratch = {}
+        self.touched = {}
+        self.group_id = ZERO_ADDRESS if len(txns) == 1 else hashlib.sha512(
+            b"".join(t.txid for t in txns)).digest()[:32]
+
+
+def _resolve_box_app(txn, index):
+    if index == 0:
+        return txn.application_id
+    if index <= len(txn.applications):
+        return txn.applications[index - 1]
+    return index
+
+
+class _Context:
+    """State of one program execution."""
+
+    __slots__ = ("ledger", "group", "txns", "txn", "app", "app_id", "program", "stack", "scratch", "frames",
+                 "intc", "bytec", "pending", "last_inner", "caller", "depth", "result", "cost",
+                 "log_bytes", "dirty")
+
+    def __init__(self, ledger, group, txns, txn, app, program, caller, depth):
+        self.ledger = ledger
+        self.group = group
+        self.txns = txns            # the (inner) group gtxn and GroupSize refer to
+        self.txn = txn
+        self.app = app
+        self.app_id = app.id
+        self.program = program
+        self.stack = []
+        self.scratch = [0] * 256
+        self.frames = []
+        self.intc = []
+        self.bytec = []
+        self.pending = None
+        self.last_inner = []
+        self.caller = caller
+        self.depth = depth
+        self.result = False
+        self.cost = 0
+        self.log_bytes = 0
+        self.dirty = False          # state was written; schema is checked at the end
+
+    # -- resource availability (AVM v8 rules) --------------------------------
+
+    def account(self, ref):
+        """Account for an address or Accounts-array index."""
+        txn = self.txn
+        if ref.__class__ is int:
+            if ref == 0:
+                return txn.sender
+            if ref <= len(txn.accounts):
+                return txn.accounts[ref - 1]
+            raise AVMError(f"invalid Accounts index {ref}")
+        if ref.__class__ is not bytes or len(ref) != 32:
+            raise AVMError("account reference must be a 32-byte address or an index")
+        if ref == txn.sender or ref == self.app.address or ref in txn.accounts:
+            return ref
+        for app_id in txn.applications:
+            app = self.ledger.apps.get(app_id)
+            if app is not None and app.address == ref:
+                return ref
+        if self.group.unnamed:
+            self.use_unnamed(("account", ref), f"Account {encode_address(ref)}")
+            return ref
+        raise AVMError(f"unavailable Account {encode_address(ref)}")
+
+    def app_ref(self, ref):
+        if ref.__class__ is not int:
+            raise AVMError("app reference must be a uint64")
+        apps = self.txn.applications
+        if ref == 0:
+            return self.app_id
+        if ref <= len(apps):
+            return apps[ref - 1]
+        if ref == self.app_id or ref in apps:
+            return ref
+        if self.group.unnamed and ref in self.ledger.apps:
+            self.use_unnamed(("app", ref), f"App {ref}")
+            return ref
+        raise AVMError(f"unavailable App {ref}")
+
+    def asset_ref(self, ref):
+        if ref.__class__ is not int:
+            raise AVMError("asset reference must be a uint64")
+        assets = self.txn.assets
+        if ref < len(assets):
+            return assets[ref]
+        if ref in assets:
+            return ref
+        if self.group.unnamed and ref in self.ledger.assets:
+            self.use_unnamed(("asset", ref), f"Asset {ref}")
+            return ref
+        raise AVMError(f"unavailable Asset {ref}")
+
+    def box_key(self, name):
+        if name.__class__ is not bytes:
+            raise AVMError("box name must be bytes")
+        if not 1 <= len(name) <= MAX_KEY_LEN:
+            raise AVMError(f"box name length {len(name)} out of range 1..{MAX_KEY_LEN}")
+        if (self.app_id, name) not in self.group.box_refs:
+            if not self.group.unnamed:
+                raise AVMError(f"invalid Box reference {name!r}")
+            self.use_unnamed(("box", self.app_id, name), f"Box {name!r}")
+            self.group.box_refs.add((self.app_id, name))       # as if referenced, with its quota
+            self.group.box_quota += BOX_REF_QUOTA
+        return name
+
+    def use_unnamed(self, resource, description):
+        """Count a resource simulate's allow_unnamed_resources made available.
+
+        Programs before v9 share no resources across the group, so simulate
+        charges each unnamed resource to the top-level transaction, which
+        keeps its own limits: its foreign accounts plus unnamed ones at most
+        MAX_FOREIGN_ACCOUNTS, and every reference at most MAX_FOREIGN_REFS.
+        """
+        top = self.group.top
+        used = self.group.unnamed_used.setdefault(top.group_index, set())
+        if resource in used:
+            return
+        accounts = len(top.accounts) + sum(r[0] == "account" for r in used) + (resource[0] == "account")
+        refs = len(top.accounts) + len(top.assets) + len(top.applications) + len(top.boxes) + len(used) + 1
+        if accounts > MAX_FOREIGN_ACCOUNTS or refs > MAX_FOREIGN_REFS:
+            raise AVMError(f"unnamed {description} exceeds the transaction's references "
+                           f"({MAX_FOREIGN_ACCOUNTS} accounts, {MAX_FOREIGN_REFS} in all)")
+        used.add(resource)
+
+
+class Ledger:
+    """Accounts, apps and assets, plus a group evaluator."""
+
+    def __init__(self, round=1000, timestamp=1_700_000_000, seed=0):
+        self.accounts = {}
+        self.apps = {}
+        self.assets = {}
+        self.round = round
+        self.timestamp = timestamp
+        self._seed = seed
+        self._next_id = 1000
+        self._txn_counter = 0
+        self._account_counter = 0
+        self._journal = None
+        self.profile = None         # a Profile to record executed instructions in
+
+    # -- setup helpers (applied directly, outside any transaction) ------------
+
+    def new_account(self, balance=0):
+        """A fresh, deterministic address funded with `balance` microAlgos."""
+        self._account_counter += 1
+        addr = hashlib.sha512(b"avm-account:%d:%d" % (self._seed, self._account_counter)).digest()[:32]
+        self._acct(addr).balance += balance
+        return addr
+
+    def fund(self, addr, amount):
+        self._acct(address(addr)).balance += amount
+
+    def create_asset(self, creator, total, decimals=0, **params):
+        creator = address(creator)
+        asset_id = self._new_id()
+        asset = Asset(asset_id, creator, total, decimals, **params)
+        self.assets[asset_id] = asset
+        acct = self._acct(creator)
+        acct.assets_created[asset_id] = asset
+        acct.assets[asset_id] = (total, 0)
+        return asset_id
+
+    def opt_in_asset(self, addr, asset_id):
+        """Opt an account (e.g. an app account) into an asset without a transaction."""
+        acct = self._acct(address(addr))
+        if asset_id not in acct.assets:
+            acct.assets[asset_id] = (0, self.assets[asset_id].default_frozen)
+
+    def advance(self, seconds=0, rounds=None):
+        """Move the clock forward; rounds default to one per ~2.8 s of time."""
+        self.timestamp += seconds
+        self.round += rounds if rounds is not None else max(1, round(seconds / 2.8))
+
+    # -- transaction helpers ----------------------------------------------------
+
+    def deploy(self, creator, approval, clear="#pragma version 8\nint 1\nreturn",
+               global_schema=(0, 0), local_schema=(0, 0), extra_pages=0, args=(), app_id=None,
+               **fields):
+        """Create an app from a .teal path, TEAL text or Compiled program; returns its ID.
+
+        Pass `app_id` to pin the new app's ID, e.g. to match an ID that another
+        contract hardcodes (TRUST_APP_ID); IDs handed out later continue above it.
+        """
+        if app_id is not None:
+            if app_id <= self._next_id:
+                raise ValueError(f"app ID {app_id} is not above the last allocated ID {self._next_id}")
+            self._next_id = app_id - 1
+        txn = Txn("appl", creator, approval_program=_program(approval),
+                  clear_state_program=_program(clear), global_num_uint=global_schema[0],
+                  global_num_byte_slice=global_schema[1], local_num_uint=local_schema[0],
+                  local_num_byte_slice=local_schema[1], extra_program_pages=extra_pages,
+                  application_args=list(args), **fields)
+        self.submit([txn])
+        return txn.created_application_id
+
+    def call(self, sender, app_id, *args, on_complete=NoOp, **fields):
+        return self.submit([app_call(sender, app_id, *args, on_complete=on_complete, **fields)])
+
+    def pay(self, sender, receiver, amount, **fields):
+        return self.submit([payment(sender, receiver, amount, **fields)])
+
+    # -- queries ----------------------------------------------------------------
+
+    def balance(self, addr):
+        acct = self.accounts.get(address(addr))
+        return acct.balance if acct else 0
+
+    def min_balance(self, addr):
+        acct = self.accounts.get(address(addr))
+        return self._min_balance(acct) if acct else MIN_BALANCE
+
+    def asset_balance(self, addr, asset_id):
+        acct = self.accounts.get(address(addr))
+        holding = acct.assets.get(asset_id) if acct else None
+        return holding[0] if holding else None
+
+    def global_state(self, app_id):
+        return dict(self.apps[app_id].global_state)
+
+    def local_state(self, addr, app_id):
+        acct = self.accounts.get(address(addr))
+        local = acct.locals.get(app_id) if acct else None
+        return dict(local) if local is not None else None
+
+    def box(self, app_id, name):
+        return self.apps[app_id].boxes.get(_arg_bytes(name))
+
+    def app_address(self, app_id):
+        return self.apps[app_id].address
+
+    # -- submission -------------------------------------------------------------
+
+    def submit(self, txns):
+        """Evaluate an atomic group. Returns a Result or raises Rejected."""
+        return self._evaluate(txns, commit=True)
+
+    def simulate(self, txns, allow_unnamed_resources=False, extra_opcode_budget=0):
+        """Evaluate a group as submit() would, then roll it back; the ledger is left unchanged.
+
+        As with algod's simulate endpoint, `allow_unnamed_resources` lets the
+        programs use accounts, apps, assets and boxes the transactions do not
+        reference, within each transaction's reference limits (v8 programs
+        share nothing across the group), and `extra_opcode_budget` adds to
+        the group's pooled budget.
+        """
+        return self._evaluate(txns, False, allow_unnamed_resources, extra_opcode_budget)
+
+    def _evaluate(self, txns, commit, unnamed=False, extra_budget=0):
+        if not 1 <= len(txns) <= MAX_GROUP_SIZE:
+            raise Rejected(f"group size {len(txns)} out of range 1..{MAX_GROUP_SIZE}")
+        for index, txn in enumerate(txns):
+            self._txn_counter += 1
+            txn.group_index = index
+            txn.txid = self._txn_counter.to_bytes(32, "big")
+            txn.logs = []
+            txn.inner_txns = []
+            txn.cost = txn.box_bytes = txn.local_bytes = 0
+            _check_wellformed(txn, index)
+        group = _Group(txns, unnamed)
+        group.budget += extra_budget
+        if group.fee_credit < 0:
+            raise Rejected(f"fee too small: group is short {-group.fee_credit} microAlgos")
+
+        self._journal = []
+        index = 0
+        try:
+            for index, txn in enumerate(txns):
+                group.top = txn
+                self._apply(group, txns, txn, None, 0)
+                self._check_min_balances(group)
+            if not commit:
+                self._rollback(0)
+        except Rejected as e:
+            self._rollback(0)
+            if e.txn_index is not None:
+                raise
+            raise Rejected(e.reason, index, e.app_id, e.line) from None
+        except AVMError as e:
+            self._rollback(0)
+            raise Rejected(str(e), index) from None
+        except Exception:
+            self._rollback(0)
+            raise
+        finally:
+            self._journal = None
+        return Result(txns, group.cost, group.budget + group.cost)
+
+    # -- journal ------------------------------------------------------------------
+
+    def _put(self, mapping, key, value):
+        journal = self._journal
+        if journal is not None:
+            journal.append((mapping, key, mapping.get(key, _MISSING)))
+        mapping[key] = value
+
+    def _del(self, mapping, key):
+        journal = self._journal
+        if journal is not None:
+            journal.append((mapping, key, mapping.get(key, _MISSING)))
+        mapping.pop(key, None)
+
+    def _set_balance(self, acct, value, group):
+        if value < 0:
+            raise AVMError(f"overspend: {encode_address(acct.address)} balance would be {value}")
+        journal = self._journal
+        if journal is not None:
+            journal.append((acct, "balance", acct.balance))
+        acct.balance = value
+        group.touched[acct.address] = acct
+
+    def _put_boxes(self, acct, count, size, group):
+        journal = self._journal
+        if journal is not None:
+            journal.append((acct, "boxes", acct.boxes))
+        acct.boxes = [count, size]
+        group.touched[acct.address] = acct
+
+    def _rollback(self, mark):
+        journal = self._journal
+        while len(journal) > mark:
+            container, key, old = journal.pop()
+            if container.__class__ is Account:
+                setattr(container, key, old)
+            elif old is _MISSING:
+                container.pop(key, None)
+            else:
+                container[key] = old
+
+    # -- accounts -------------------------------------------------------------------
+
+    def _acct(self, addr):
+        acct = self.accounts.get(addr)
+        if acct is None:
+            acct = Account(addr)
+            self._put(self.accounts, addr, acct)
+        return acct
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _min_balance(self, acct):
+        total = MIN_BALANCE + ASSET_MBR * len(acct.assets)
+        for app_id in acct.locals:
+            app = self.apps.get(app_id)
+            if app is not None:
+                uints, slices = app.local_schema
+                total += APP_OPT_IN_MBR + SCHEMA_UINT_MBR * uints + SCHEMA_BYTES_MBR * slices
+        for app in acct.apps_created.values():
+            uints, slices = app.global_schema
+            total += (APP_PAGE_MBR * (1 + app.extra_pages) + SCHEMA_UINT_MBR * uints
+                      + SCHEMA_BYTES_MBR * slices)
+        boxes, box_bytes = acct.boxes
+        total += BOX_FLAT_MBR * boxes + BOX_BYTE_MBR * box_bytes
+        return total
+
+    def _check_min_balances(self, group):
+        for acct in group.touched.values():
+            if acct.balance < self._min_balance(acct) and not (acct.balance == 0 and _closed(acct)):
+                raise Rejected(f"account {encode_address(acct.address)} balance {acct.balance} "
+                               f"below min {self._min_balance(acct)}")
+        group.touched.clear()
+
+    # -- transaction application ----------------------------------------------------
+
+    def _apply(self, group, txns, txn, caller, depth):
+        sender = self._acct(txn.sender)
+        if caller is None:
+            self._set_balance(sender, sender.balance - txn.fee, group)
+        kind = txn.type
+        if kind == "pay":
+            self._pay(group, txn, sender)
+        elif kind == "axfer":
+            self._axfer(group, txn)
+        elif kind == "appl":
+            self._appl(group, txns, txn, caller, depth)
+        elif kind == "acfg":
+            self._acfg(group, txn)
+        else:
+            raise Rejected(f"{kind} transactions are not supported by the local AVM")
+
+    def _pay(self, group, txn, sender):
+        if txn.amount:
+            receiver = self._acct(txn.receiver)
+            self._set_balance(sender, sender.balance - txn.amount, group)
+            self._set_balance(receiver, receiver.balance + txn.amount, group)
+        if txn.close_remainder_to != ZERO_ADDRESS:
+            if sender.assets or sender.locals or sender.apps_created:
+                raise AVMError("cannot close an account that still holds assets or app state")
+            target = self._acct(txn.close_remainder_to)
+            remainder = sender.balance
+            self._set_balance(sender, 0, group)
+            self._set_balance(target, target.balance + remainder, group)
+
+    def _axfer(self, group, txn):
+        asset = self.assets.get(txn.xfer_asset)
+        if asset is None:
+            raise AVMError(f"asset {txn.xfer_asset} does not exist")
+        source = txn.asset_sender if txn.asset_sender != ZERO_ADDRESS else txn.sender
+        if txn.asset_sender != ZERO_ADDRESS and txn.sender != asset.clawback:
+            raise AVMError("only the clawback address may set AssetSender")
+        src = self._acct(source)
+        dst = self._acct(txn.asset_receiver)
+        if (source == txn.asset_receiver and txn.asset_amount == 0
+                and txn.asset_close_to == ZERO_ADDRESS and asset.id not in src.assets):
+            self._put(src.assets, asset.id, (0, asset.default_frozen))     # opt-in
+            group.touched[src.address] = src
+            return
+        if asset.id not in src.assets:
+            raise AVMError(f"{encode_address(source)} not opted in to asset {asset.id}")
+        if asset.id not in dst.assets:
+            raise AVMError(f"{encode_address(txn.asset_receiver)} not opted in to asset {asset.id}")
+        amount = txn.asset_amount
+        if amount:
+            have, frozen = src.assets[asset.id]
+            if amount > have:
+                raise AVMError(f"underflow on asset {asset.id}: {have} < {amount}")
+            self._put(src.assets, asset.id, (have - amount, frozen))
+            have_dst, frozen_dst = dst.assets[asset.id]
+            self._put(dst.assets, asset.id, (have_dst + amount, frozen_dst))
+        if txn.asset_close_to != ZERO_ADDRESS:
+            target = self._acct(txn.asset_close_to)
+            if asset.id not in target.assets:
+                raise AVMError(f"close target not opted in to asset {asset.id}")
+            remainder, _ = src.assets[asset.id]
+            held, frozen = target.assets[asset.id]
+            self._put(target.assets, asset.id, (held + remainder, frozen))
+            self._del(src.assets, asset.id)
+            group.touched[src.address] = src
+
+    def _acfg(self, group, txn):
+        if txn.config_asset:
+            raise AVMError("only asset creation is supported for acfg")
+        asset_id = self._new_id()
+        asset = Asset(asset_id, txn.sender, txn.config_asset_total, txn.config_asset_decimals,
+                      txn.config_asset_default_frozen, txn.config_asset_unit_name,
+                      txn.config_asset_name, txn.config_asset_url, txn.config_asset_metadata_hash,
+                      txn.config_asset_manager, txn.config_asset_reserve, txn.config_asset_freeze,
+                      txn.config_asset_clawback)
+        self._put(self.assets, asset_id, asset)
+        creator = self._acct(txn.sender)
+        self._put(creator.assets_created, asset_id, asset)
+        self._put(creator.assets, asset_id, (asset.total, 0))
+        group.touched[creator.address] = creator
+        txn.created_asset_id = asset_id
+
+    def _appl(self, group, txns, txn, caller, depth):
+        sender = self._acct(txn.sender)
+        oc = txn.on_completion
+        if txn.application_id == 0:
+            approval = _program(txn.approval_program)
+            if approval is None:
+                raise AVMError("app creation needs an approval program")
+            app_id = self._new_id()
+            app = App(app_id, txn.sender, approval, _program(txn.clear_state_program),
+                      (txn.global_num_uint, txn.global_num_byte_slice),
+                      (txn.local_num_uint, txn.local_num_byte_slice), txn.extra_program_pages)
+            self._put(self.apps, app_id, app)
+            self._put(sender.apps_created, app_id, app)
+            group.touched[sender.address] = sender
+            txn.created_application_id = app_id
+        else:
+            app = self.apps.get(txn.application_id)
+            if app is None:
+                raise AVMError(f"app {txn.application_id} does not exist")
+
+        if oc == OptIn:
+            if app.id in sender.locals:
+                raise AVMError(f"{encode_address(txn.sender)} already opted in to app {app.id}")
+            self._put(sender.locals, app.id, {})
+            group.touched[sender.address] = sender
+        elif oc in (CloseOut, ClearState) and app.id not in sender.locals:
+            raise AVMError(f"{encode_address(txn.sender)} is not opted in to app {app.id}")
+
+        if oc == ClearState:
+            mark = len(self._journal)
+            try:
+                approved = app.clear is None or self._run(group, txns, txn, app, app.clear, caller, depth)
+            except Rejected:
+                approved = False
+            if not approved:
+                self._rollback(mark)
+            self._del(sender.locals, app.id)
+            return
+
+        if not self._run(group, txns, txn, app, app.approval, caller, depth):
+            raise Rejected("approval program rejected the call", app_id=app.id)
+        if oc == CloseOut:
+            self._del(sender.locals, app.id)
+        elif oc == UpdateApplication:
+            self._put_attr(app, "approval", _program(txn.approval_program))
+            self._put_attr(app, "clear", _program(txn.clear_state_program))
+        elif oc == DeleteApplication:
+            self._del(self.apps, app.id)
+            self._del(self._acct(app.creator).apps_created, app.id)
+
+    def _put_attr(self, obj, name, value):
+        journal = self._journal
+        if journal is not None:
+            journal.append((_AttrProxy(obj), name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def _run(self, group, txns, txn, app, program, caller, depth):
+        """Run one program; returns True if it approved."""
+        ctx = _Context(self, group, txns, txn, app, program, caller, depth)
+        code = program.code
+        pc = 0
+        remaining = group.budget
+        used = 0
+        try:
+            if caller is None:
+                _check_box_budget(ctx)
+                group.scratch[txn.group_index] = ctx.scratch
+            # The budget lives in a local; ops that spend or read the pooled
+            # budget themselves (inner app calls, OpcodeBudget) are flagged
+            # `sync` and see it written back first.
+            remaining = group.budget
+            used = 0
+            hits = None if self.profile is None else self.profile._counter(program)
+            while pc >= 0:
+                fn, arg, cost, sync = code[pc]
+                if hits is not None:
+                    hits[pc] += 1
+                remaining -= cost
+                used += cost
+                if remaining < 0:
+                    raise AVMError("dynamic cost budget exceeded")
+                if sync:
+                    group.budget = remaining
+                    nxt = fn(ctx, arg)
+                    remaining = group.budget
+                else:
+                    nxt = fn(ctx, arg)
+                pc = pc + 1 if nxt is None else nxt
+            if ctx.dirty:
+                _check_schema(self, ctx)
+        except AVMError as e:
+            raise Rejected(str(e), app_id=app.id, line=program.lines[pc]) from None
+        except Rejected:
+            raise
+        except (IndexError, TypeError, ValueError, KeyError, OverflowError) as e:
+            reason = "stack underflow" if isinstance(e, IndexError) and not ctx.stack else f"{e}"
+            raise Rejected(reason, app_id=app.id, line=program.lines[pc]) from None
+        finally:
+            group.budget = remaining
+            txn.cost += used
+            group.cost += used
+            ctx.cost = used
+        return ctx.result
+
+    # -- inner transactions -------------------------------------------------------
+
+    def _submit_inner(self, ctx):
+        pending = ctx.pending
+        ctx.pending = None
+        group = ctx.group
+        if len(pending) > group.inner_left:
+            raise AVMError("too many inner transactions")
+        group.inner_left -= len(pending)
+        app_acct = self._acct(ctx.app.address)
+        for index, inner in enumerate(pending):
+            inner.group_index = index
+            self._txn_counter += 1
+            inner.txid = self._txn_counter.to_bytes(32, "big")
+            # Fees come out of the sender (usually the app account); excess
+            # paid by the outer group covers inner fees set to zero.
+            fee_sender = self._acct(inner.sender)
+            shortfall = MIN_TXN_FEE - inner.fee
+            if shortfall > 0:
+                if group.fee_credit < shortfall:
+                    raise AVMError("fee too small for inner transaction")
+                group.fee_credit -= shortfall
+            else:
+                group.fee_credit += inner.fee - MIN_TXN_FEE
+            self._set_balance(fee_sender, fee_sender.balance - inner.fee, group)
+            if inner.type == "appl":
+                group.budget += APP_CALL_BUDGET
+                if ctx.depth + 1 >= MAX_CALL_DEPTH:
+                    raise AVMError("inner app call depth exceeded")
+            if inner.sender != ctx.app.address:
+                raise AVMError("inner transactions must be sent by the app account")
+            try:
+                self._apply(group, pending, inner, ctx.app, ctx.depth + 1)
+            except Rejected as e:
+                raise AVMError(f"inner txn {index}: {e.reason}") from None
+        ctx.txn.inner_txns.extend(pending)
+        ctx.last_inner = pending
+        group.touched[app_acct.address] = app_acct
+
+
+class _AttrProxy:
+    """Journal entry target for attribute writes on non-Account objects."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __setitem__(self, name, value):
+        setattr(self.obj, name, value)
+
+    def pop(self, name, default=None):
+        return default
+
+
+def _closed(acct):
+    return not (acct.assets or acct.locals or acct.apps_created)
+
+
+def _check_wellformed(txn, index):
+    if txn.type != "appl":
+        return
+    args = txn.application_args
+    if len(args) > MAX_APP_ARGS:
+        raise Rejected(f"too many application args ({len(args)} > {MAX_APP_ARGS})", index)
+    if sum(len(a) for a in args) > MAX_APP_ARGS_BYTES:
+        raise Rejected(f"application args exceed {MAX_APP_ARGS_BYTES} bytes", index)
+    if len(txn.accounts) > MAX_FOREIGN_ACCOUNTS:
+        raise Rejected(f"too many foreign accounts ({len(txn.accounts)} > {MAX_FOREIGN_ACCOUNTS})", index)
+    refs = len(txn.accounts) + len(txn.assets) + len(txn.applications) + len(txn.boxes)
+    if refs > MAX_FOREIGN_REFS:
+        raise Rejected(f"too many references ({refs} > {MAX_FOREIGN_REFS})", index)
+
+
+def _check_box_budget(ctx, kind="read"):
+    """Referenced boxes must fit in the group's quota of 1024 bytes per box reference."""
+    group = ctx.group
+    used = 0
+    for app_id, name in group.box_refs:
+        app = ctx.ledger.apps.get(app_id)
+        value = app.boxes.get(name) if app else None
+        if value is not None:
+            used += len(value)
+    if used > group.box_quota:
+        raise AVMError(f"box {kind} budget ({group.box_quota} bytes) exceeded by referenced boxes ({used})")
+
+
+def _check_schema(ledger, ctx):
+    app = ctx.app
+    if app.id not in ledger.apps:
+        return
+    _check_kv_schema(app.global_state, app.global_schema, "global")
+    for addr in {ctx.txn.sender, *ctx.txn.accounts}:
+        acct = ledger.accounts.get(addr)
+        local = acct.locals.get(app.id) if acct else None
+        if local:
+            _check_kv_schema(local, app.local_schema, "local")
+
+
+def _check_kv_schema(state, schema, scope):
+    uints = sum(1 for v in state.values() if v.__class__ is int)
+    slices = len(state) - uints
+    if uints > schema[0]:
+        raise AVMError(f"{scope} state has {uints} uints, schema allows {schema[0]}")
+    if slices > schema[1]:
+        raise AVMError(f"{scope} state has {slices} byte slices, schema allows {schema[1]}")
+
+
+# -- opcode handlers ---------------------------------------------------------
+#
+# Each handler takes (ctx, immediate) and returns None to fall through or the
+# index of the next instruction. Immediates are decoded once, at bind time.
+
+def _need_int(value, op):
+    if value.__class__ is not int:
+        raise AVMError(f"{op} expects a uint64, got bytes")
+    return value
+
+
+def _need_bytes(value, op):
+    if value.__class__ is not bytes:
+        raise AVMError(f"{op} expects bytes, got uint64")
+    return value
+
+
+def _push(ctx, value):
+    stack = ctx.stack
+    stack.append(value)
+    if len(stack) > MAX_STACK:
+        raise AVMError("stack overflow")
+
+
+def _op_end(ctx, _):
+    stack = ctx.stack
+    if len(stack) != 1:
+        raise AVMError(f"program ended with {len(stack)} values on the stack")
+    ctx.result = _need_int(stack[0], "return") != 0
+    return _HALT
+
+
+def _const(ctx, value):
+    ctx.stack.append(value)
+
+
+def _int_binop(name, fn):
+    def op(ctx, _):
+        s = ctx.stack
+        b = s.pop()
+        a = s[-1]
+        if a.__class__ is not int or b.__class__ is not int:
+            raise AVMError(f"{name} expects uint64 arguments")
+        s[-1] = fn(a, b)
+    return op
+
+
+def _checked_add(a, b):
+    r = a + b
+    if r > MAX_UINT:
+        raise AVMError("+ overflowed")
+    return r
+
+
+def _checked_sub(a, b):
+    if b > a:
+        raise AVMError("- would result negative")
+    return a - b
+
+
+def _checked_mul(a, b):
+    r = a * b
+    if r > MAX_UINT:
+        raise AVMError("* overflowed")
+    return r
+
+
+def _checked_div(a, b):
+    if b == 0:
+        raise AVMError("/ 0")
+    return a // b
+
+
+def _checked_mod(a, b):
+    if b == 0:
+        raise AVMError("% 0")
+    return a % b
+
+
+def _checked_exp(a, b):
+    if a == 0 and b == 0:
+        raise AVMError("0^0 is undefined")
+    r = a ** b if b < 64 or a <= 1 else MAX_UINT + 1
+    if r > MAX_UINT:
+        raise AVMError("exp overflowed")
+    return r
+
+
+def _shl(a, b):
+    if b > 63:
+        raise AVMError("shl arg larger than 63")
+    return (a << b) & MAX_UINT
+
+
+def _shr(a, b):
+    if b > 63:
+        raise AVMError("shr arg larger than 63")
+    return a >> b
+
+
+def _op_eq(ctx, _):
+    s = ctx.stack
+    b = s.pop()
+    a = s[-1]
+    if a.__class__ is not b.__class__:
+        raise AVMError("== expects arguments of the same type")
+    s[-1] = 1 if a == b else 0
+
+
+def _op_ne(ctx, _):
+    s = ctx.stack
+    b = s.pop()
+    a = s[-1]
+    if a.__class__ is not b.__class__:
+        raise AVMError("!= expects arguments of the same type")
+    s[-1] = 0 if a == b else 1
+
+
+def _op_not(ctx, _):
+    s = ctx.stack
+    s[-1] = 0 if _need_int(s[-1], "!") else 1
+
+
+def _op_bnot(ctx, _):
+    s = ctx.stack
+    s[-1] = MAX_UINT ^ _need_int(s[-1], "~")
+
+
+def _op_len(ctx, _):
+    s = ctx.stack
+    s[-1] = len(_need_bytes(s[-1], "len"))
+
+
+def _op_itob(ctx, _):
+    s = ctx.stack
+    s[-1] = _need_int(s[-1], "itob").to_bytes(8, "big")
+
+
+def _op_btoi(ctx, _):
+    s = ctx.stack
+    value = _need_bytes(s[-1], "btoi")
+    if len(value) > 8:
+        raise AVMError(f"btoi arg too long, got {len(value)} bytes")
+    s[-1] = int.from_bytes(value, "big")
+
+
+def _op_mulw(ctx, _):
+    s = ctx.stack
+    b = _need_int(s.pop(), "mulw")
+    a = _need_int(s.pop(), "mulw")
+    r = a * b
+    s.append(r >> 64)
+    s.append(r & MAX_UINT)
+
+
+def _op_addw(ctx, _):
+    s = ctx.stack
+    b = _need_int(s.pop(), "addw")
+    a = _need_int(s.pop(), "addw")
+    r = a + b
+    s.append(r >> 64)
+    s.append(r & MAX_UINT)
+
+
+def _op_divmodw(ctx, _):
+    s = ctx.stack
+    d_lo, d_hi = _need_int(s.pop(), "divmodw"), _need_int(s.pop(), "divmodw")
+    n_lo, n_hi = _need_int(s.pop(), "divmodw"), _need_int(s.pop(), "divmodw")
+    d = (d_hi << 64) | d_lo
+    if d == 0:
+        raise AVMError("divmodw 0")
+    q, r = divmod((n_hi << 64) | n_lo, d)
+    s.extend((q >> 64, q & MAX_UINT, r >> 64, r & MAX_UINT))
+
+
+def _op_divw(ctx, _):
+    s = ctx.stack
+    c = _need_int(s.pop(), "divw")
+    b = _need_int(s.pop(), "divw")
+    a = _need_int(s.pop(), "divw")
+    if c == 0:
+        raise AVMError("divw 0")
+    q = ((a << 64) | b) // c
+    if q > MAX_UINT:
+        raise AVMError("divw overflowed")
+    s.append(q)
+
+
+def _op_expw(ctx, _):
+    s = ctx.stack
+    b = _need_int(s.pop(), "expw")
+    a = _need_int(s.pop(), "expw")
+    if a == 0 and b == 0:
+        raise AVMError("0^0 is undefined")
+    r = a ** b if b < 128 or a <= 1 else 2**128
+    if r >= 2**128:
+        raise AVMError("expw overflowed")
+    s.append(r >> 64)
+    s.append(r & MAX_UINT)
+
+
+def _op_sqrt(ctx, _):
+    s = ctx.stack
+    s[-1] = math.isqrt(_need_int(s[-1], "sqrt"))
+
+
+def _op_bitlen(ctx, _):
+    s = ctx.stack
+    v = s[-1]
+    s[-1] = v.bit_length() if v.__class__ is int else int.from_bytes(v, "big").bit_length()
+
+
+def _hash(fn):
+    def op(ctx, _):
+        s = ctx.stack
+        s[-1] = fn(_need_bytes(s[-1], "hash"))
+    return op
+
+
+def _sha512_256(data):
+    return hashlib.new("sha512_256", data).digest()
+
+
+def _keccak256(data):
+    from Cryptodome.Hash import keccak
+    return keccak.new(data=data, digest_bits=256).digest()
+
+
+def _op_ed25519verify_bare(ctx, _):
+    s = ctx.stack
+    pubkey = _need_bytes(s.pop(), "ed25519verify")
+    sig = _need_bytes(s.pop(), "ed25519verify")
+    data = _need_bytes(s[-1], "ed25519verify")
+    s[-1] = _ed25519(data, sig, pubkey)
+
+
+def _op_ed25519verify(ctx, _):
+    s = ctx.stack
+    pubkey = _need_bytes(s.pop(), "ed25519verify")
+    sig = _need_bytes(s.pop(), "ed25519verify")
+    data = _need_bytes(s[-1], "ed25519verify")
+    program_hash = hashlib.new("sha512_256", b"Program" + ctx.program.bytecode).digest()
+    s[-1] = _ed25519(b"ProgData" + program_hash + data, sig, pubkey)
+
+
+def _ed25519(message, sig, pubkey):
+    from nacl.exceptions import BadSignatureError
+    from nacl.signing import VerifyKey
+    try:
+        VerifyKey(pubkey).verify(message, sig)
+        return 1
+    except (BadSignatureError, ValueError):
+        return 0
+
+
+def _op_concat(ctx, _):
+    s = ctx.stack
+    b = _need_bytes(s.pop(), "concat")
+    a = _need_bytes(s[-1], "concat")
+    if len(a) + len(b) > MAX_BYTES:
+        raise AVMError(f"concat produced a too big ({len(a) + len(b)}) byte-array")
+    s[-1] = a + b
+
+
+def _slice(value, start, end, op):
+    if start > end:
+        raise AVMError(f"{op}: start {start} is past end {end}")
+    if end > len(value):
+        raise AVMError(f"{op}: end {end} is beyond length {len(value)}")
+    return value[start:end]
+
+
+def _op_substring(ctx, arg):
+    s = ctx.stack
+    s[-1] = _slice(_need_bytes(s[-1], "substring"), arg[0], arg[1], "substring")
+
+
+def _op_substring3(ctx, _):
+    s = ctx.stack
+    end = _need_int(s.pop(), "substring3")
+    start = _need_int(s.pop(), "substring3")
+    s[-1] = _slice(_need_bytes(s[-1], "substring3"), start, end, "substring3")
+
+
+def _op_extract(ctx, arg):
+    s = ctx.stack
+    value = _need_bytes(s[-1], "extract")
+    start, length = arg
+    end = len(value) if length == 0 else start + length
+    s[-1] = _slice(value, start, end, "extract")
+
+
+def _op_extract3(ctx, _):
+    s = ctx.stack
+    length = _need_int(s.pop(), "extract3")
+    start = _need_int(s.pop(), "extract3")
+    s[-1] = _slice(_need_bytes(s[-1], "extract3"), start, start + length, "extract3")
+
+
+def _extract_uint(size):
+    name = f"extract_uint{size * 8}"
+
+    def op(ctx, _):
+        s = ctx.stack
+        start = _need_int(s.pop(), name)
+        s[-1] = int.from_bytes(_slice(_need_bytes(s[-1], name), start, start + size, name), "big")
+    return op
+
+
+def _op_replace2(ctx, arg):
+    s = ctx.stack
+    new = _need_bytes(s.pop(), "replace2")
+    s[-1] = _replace(_need_bytes(s[-1], "replace2"), arg, new, "replace2")
+
+
+def _op_replace3(ctx, _):
+    s = ctx.stack
+    new = _need_bytes(s.pop(), "replace3")
+    start = _need_int(s.pop(), "replace3")
+    s[-1] = _replace(_need_bytes(s[-1], "replace3"), start, new, "replace3")
+
+
+def _replace(value, start, new, op):
+    end = start + len(new)
+    if end > len(value):
+        raise AVMError(f"{op}: replacement end {end} beyond original length {len(value)}")
+    return value[:start] + new + value[end:]
+
+
+def _op_getbit(ctx, _):
+    s = ctx.stack
+    bit = _need_int(s.pop(), "getbit")
+    target = s[-1]
+    if target.__class__ is int:
+        if bit > 63:
+            raise AVMError(f"getbit index {bit} beyond 64 bits")
+        s[-1] = (target >> bit) & 1
+    else:
+        if bit >= len(target) * 8:
+            raise AVMError(f"getbit index {bit} beyond {len(target)} bytes")
+        s[-1] = (target[bit // 8] >> (7 - bit % 8)) & 1
+
+
+def _op_setbit(ctx, _):
+    s = ctx.stack
+    value = _need_int(s.pop(), "setbit")
+    bit = _need_int(s.pop(), "setbit")
+    target = s[-1]
+    if value > 1:
+        raise AVMError("setbit value must be 0 or 1")
+    if target.__class__ is int:
+        if bit > 63:
+            raise AVMError(f"setbit index {bit} beyond 64 bits")
+        s[-1] = target | (1 << bit) if value else target & ~(1 << bit)
+    else:
+        if bit >= len(target) * 8:
+            raise AVMError(f"setbit index {bit} beyond {len(target)} bytes")
+        out = bytearray(target)
+        mask = 1 << (7 - bit % 8)
+        out[bit // 8] = out[bit // 8] | mask if value else out[bit // 8] & ~mask
+        s[-1] = bytes(out)
+
+
+def _op_getbyte(ctx, _):
+    s = ctx.stack
+    index = _need_int(s.pop(), "getbyte")
+    value = _need_bytes(s[-1], "getbyte")
+    if index >= len(value):
+        raise AVMError(f"getbyte index {index} beyond length {len(value)}")
+    s[-1] = value[index]
+
+
+def _op_setbyte(ctx, _):
+    s = ctx.stack
+    byte = _need_int(s.pop(), "setbyte")
+    index = _need_int(s.pop(), "setbyte")
+    value = _need_bytes(s[-1], "setbyte")
+    if index >= len(value):
+        raise AVMError(f"setbyte index {index} beyond length {len(value)}")
+    if byte > 255:
+        raise AVMError("setbyte value > 255")
+    s[-1] = value[:index] + bytes([byte]) + value[index + 1:]
+
+
+def _op_bzero(ctx, _):
+    s = ctx.stack
+    n = _need_int(s[-1], "bzero")
+    if n > MAX_BYTES:
+        raise AVMError(f"bzero attempted to create a too large string ({n})")
+    s[-1] = bytes(n)
+
+
+def _op_base64_decode(ctx, encoding_name):
+    s = ctx.stack
+    data = _need_bytes(s[-1], "base64_decode")
+    try:
+        if encoding_name == "URLEncoding":
+            s[-1] = base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+        else:
+            s[-1] = base64.b64decode(data, validate=True)
+    except ValueError as e:
+        raise AVMError(f"base64_decode: {e}") from None
+
+
+# byte-math: big-endian unsigned integers of up to 64 bytes
+def _bigint(value, op):
+    if _need_bytes(value, op).__len__() > 64:
+        raise AVMError(f"{op} arg too long ({len(value)} bytes)")
+    return int.from_bytes(value, "big")
+
+
+def _bigbytes(n):
+    return n.to_bytes((n.bit_length() + 7) // 8, "big")
+
+
+def _bmath(name, fn):
+    def op(ctx, _):
+        s = ctx.stack
+        b = _bigint(s.pop(), name)
+        a = _bigint(s[-1], name)
+        s[-1] = fn(a, b)
+    return op
+
+
+def _bsub(a, b):
+    if b > a:
+        raise AVMError("b- would result negative")
+    return _bigbytes(a - b)
+
+
+def _bdiv(a, b):
+    if b == 0:
+        raise AVMError("b/ 0")
+    return _bigbytes(a // b)
+
+
+def _bmod(a, b):
+    if b == 0:
+        raise AVMError("b% 0")
+    return _bigbytes(a % b)
+
+
+def _bitwise(name, fn):
+    def op(ctx, _):
+        s = ctx.stack
+        b = _need_bytes(s.pop(), name)
+        a = _need_bytes(s[-1], name)
+        size = max(len(a), len(b))
+        a, b = a.rjust(size, b"\0"), b.rjust(size, b"\0")
+        s[-1] = bytes(fn(x, y) for x, y in zip(a, b))
+    return op
+
+
+def _op_binvert(ctx, _):
+    s = ctx.stack
+    s[-1] = bytes(255 - x for x in _need_bytes(s[-1], "b~"))
+
+
+def _op_bsqrt(ctx, _):
+    s = ctx.stack
+    s[-1] = _bigbytes(math.isqrt(_bigint(s[-1], "bsqrt")))
+
+
+# stack manipulation
+def _op_pop(ctx, _):
+    ctx.stack.pop()
+
+
+def _op_dup(ctx, _):
+    s = ctx.stack
+    s.append(s[-1])
+
+
+def _op_dup2(ctx, _):
+    s = ctx.stack
+    if len(s) < 2:
+        raise AVMError("dup2 with stack size below 2")
+    s.extend(s[-2:])
+
+
+def _op_dig(ctx, n):
+    s = ctx.stack
+    if n >= len(s):
+        raise AVMError(f"dig {n} with stack size {len(s)}")
+    s.append(s[-1 - n])
+
+
+def _op_swap(ctx, _):
+    s = ctx.stack
+    s[-1], s[-2] = s[-2], s[-1]
+
+
+def _op_select(ctx, _):
+    s = ctx.stack
+    c = _need_int(s.pop(), "select")
+    b = s.pop()
+    if c:
+        s[-1] = b
+
+
+def _op_cover(ctx, n):
+    s = ctx.stack
+    if n >= len(s):
+        raise AVMError(f"cover {n} with stack size {len(s)}")
+    s.insert(len(s) - 1 - n, s.pop())
+
+
+def _op_uncover(ctx, n):
+    s = ctx.stack
+    if n >= len(s):
+        raise AVMError(f"uncover {n} with stack size {len(s)}")
+    s.append(s.pop(-1 - n))
+
+
+def _op_bury(ctx, n):
+    s = ctx.stack
+    if n == 0 or n >= len(s):
+        raise AVMError(f"bury {n} with stack size {len(s)}")
+    s[-1 - n] = s[-1]
+    s.pop()
+
+
+def _op_popn(ctx, n):
+    s = ctx.stack
+    if n > len(s):
+        raise AVMError(f"popn {n} with stack size {len(s)}")
+    if n:
+        del s[-n:]
+
+
+def _op_dupn(ctx, n):
+    s = ctx.stack
+    s.extend([s[-1]] * n)
+    if len(s) > MAX_STACK:
+        raise AVMError("stack overflow")
+
+
+def _op_intcblock(ctx, values):
+    ctx.intc = values
+
+
+def _op_bytecblock(ctx, values):
+    ctx.bytec = values
+
+
+def _op_intc(ctx, n):
+    if n >= len(ctx.intc):
+        raise AVMError(f"intc {n} beyond intcblock")
+    ctx.stack.append(ctx.intc[n])
+
+
+def _op_bytec(ctx, n):
+    if n >= len(ctx.bytec):
+        raise AVMError(f"bytec {n} beyond bytecblock")
+    ctx.stack.append(ctx.bytec[n])
+
+
+def _op_pushn(ctx, values):
+    ctx.stack.extend(values)
+
+
+# scratch space
+def _op_load(ctx, n):
+    ctx.stack.append(ctx.scratch[n])
+
+
+def _op_store(ctx, n):
+    ctx.scratch[n] = ctx.stack.pop()
+
+
+def _op_loads(ctx, _):
+    s = ctx.stack
+    n = _need_int(s[-1], "loads")
+    if n > 255:
+        raise AVMError(f"invalid scratch slot {n}")
+    s[-1] = ctx.scratch[n]
+
+
+def _op_stores(ctx, _):
+    s = ctx.stack
+    value = s.pop()
+    n = _need_int(s.pop(), "stores")
+    if n > 255:
+        raise AVMError(f"invalid scratch slot {n}")
+    ctx.scratch[n] = value
+
+
+def _group_scratch(ctx, t, slot):
+    if t >= ctx.txn.group_index or ctx.caller is not None:
+        raise AVMError(f"gload can only read from earlier transactions, not {t}")
+    scratch = ctx.group.scratch.get(t)
+    if scratch is None:
+        raise AVMError(f"transaction {t} is not an app call")
+    if slot > 255:
+        raise AVMError(f"invalid scratch slot {slot}")
+    return scratch[slot]
+
+
+def _op_gload(ctx, arg):
+    ctx.stack.append(_group_scratch(ctx, arg[0], arg[1]))
+
+
+def _op_gloads(ctx, slot):
+    s = ctx.stack
+    s[-1] = _group_scratch(ctx, _need_int(s[-1], "gloads"), slot)
+
+
+def _op_gloadss(ctx, _):
+    s = ctx.stack
+    slot = _need_int(s.pop(), "gloadss")
+    s[-1] = _group_scratch(ctx, _need_int(s[-1], "gloadss"), slot)
+
+
+def _created_id(ctx, t):
+    if t >= ctx.txn.group_index or ctx.caller is not None:
+        raise AVMError(f"gaid can only read earlier transactions, not {t}")
+    txn = ctx.group.txns[t]
+    created = txn.created_application_id or txn.created_asset_id
+    if not created:
+        raise AVMError(f"transaction {t} did not create an app or asset")
+    return created
+
+
+def _op_gaid(ctx, t):
+    ctx.stack.append(_created_id(ctx, t))
+
+
+def _op_gaids(ctx, _):
+    s = ctx.stack
+    s[-1] = _created_id(ctx, _need_int(s[-1], "gaids"))
+
+
+# control flow
+def _op_err(ctx, _):
+    raise AVMError("err opcode executed")
+
+
+def _op_bnz(ctx, target):
+    v = ctx.stack.pop()
+    if v.__class__ is not int:
+        raise AVMError("bnz expects a uint64")
+    if v:
+        return target
+
+
+def _op_bz(ctx, target):
+    v = ctx.stack.pop()
+    if v.__class__ is not int:
+        raise AVMError("bz expects a uint64")
+    if not v:
+        return target
+
+
+def _op_b(ctx, target):
+    return target
+
+
+def _op_return(ctx, _):
+    ctx.result = _need_int(ctx.stack.pop(), "return") != 0
+    return _HALT
+
+
+def _op_assert(ctx, _):
+    v = ctx.stack.pop()
+    if v.__class__ is not int:
+        raise AVMError("assert expects a uint64")
+    if not v:
+        raise AVMError("assert failed")
+
+
+def _op_callsub(ctx, arg):
+    target, ret = arg
+    if len(ctx.frames) >= 1024:
+        raise AVMError("callsub depth exceeded")
+    ctx.frames.append([ret, len(ctx.stack), None, 0])
+    return target
+
+
+def _op_retsub(ctx, _):
+    if not ctx.frames:
+        raise AVMError("retsub with empty callstack")
+    ret, height, args, returns = ctx.frames.pop()
+    if args is not None:
+        s = ctx.stack
+        if len(s) < height + returns:
+            raise AVMError(f"retsub executed with stack below frame ({len(s)} < {height + returns})")
+        results = s[len(s) - returns:] if returns else []
+        del s[height - args:]
+        s.extend(results)
+    return ret
+
+
+def _op_proto(ctx, arg):
+    if not ctx.frames:
+        raise AVMError("proto executed outside a subroutine")
+    frame = ctx.frames[-1]
+    if frame[2] is not None:
+        raise AVMError("proto executed twice in one frame")
+    if len(ctx.stack) < arg[0]:
+        raise AVMError(f"callsub to proto that requires {arg[0]} args with stack height {len(ctx.stack)}")
+    frame[2], frame[3] = arg
+
+
+def _frame_index(ctx, offset, op):
+    if not ctx.frames or ctx.frames[-1][2] is None:
+        raise AVMError(f"{op} with no frame")
+    frame = ctx.frames[-1]
+    index = frame[1] + offset
+    if index < frame[1] - frame[2] or index >= len(ctx.stack):
+        raise AVMError(f"{op} {offset} outside the frame")
+    return index
+
+
+def _op_frame_dig(ctx, offset):
+    ctx.stack.append(ctx.stack[_frame_index(ctx, offset, "frame_dig")])
+
+
+def _op_frame_bury(ctx, offset):
+    value = ctx.stack.pop()
+    ctx.stack[_frame_index(ctx, offset, "frame_bury")] = value
+
+
+def _op_switch(ctx, targets):
+    n = _need_int(ctx.stack.pop(), "switch")
+    if n < len(targets):
+        return targets[n]
+
+
+def _op_match(ctx, targets):
+    s = ctx.stack
+    subject = s.pop()
+    n = len(targets)
+    if len(s) < n:
+        raise AVMError(f"match expects {n} cases, stack has {len(s)}")
+    cases = s[len(s) - n:]
+    del s[len(s) - n:]
+    for i, case in enumerate(cases):
+        if case.__class__ is subject.__class__ and case == subject:
+            return targets[i]
+
+
+# transaction fields
+def _op_txn(ctx, getter):
+    ctx.stack.append(getter(ctx.txn))
+
+
+def _array_item(values, index, field):
+    if index >= len(values):
+        raise AVMError(f"invalid {field} index {index}")
+    value = values[index]
+    return value
+
+
+def _op_txna(ctx, arg):
+    getter, index, field = arg
+    ctx.stack.append(_array_item(getter(ctx.txn), index, field))
+
+
+def _op_txnas(ctx, arg):
+    getter, field = arg
+    s = ctx.stack
+    s[-1] = _array_item(getter(ctx.txn), _need_int(s[-1], "txnas"), field)
+
+
+def _group_txn(ctx, t):
+    txns = ctx.txns
+    if t >= len(txns):
+        raise AVMError(f"gtxn lookup TxnGroup[{t}] but it only has {len(txns)}")
+    return txns[t]
+
+
+def _op_gtxn(ctx, arg):
+    t, getter = arg
+    ctx.stack.append(getter(_group_txn(ctx, t)))
+
+
+def _op_gtxna(ctx, arg):
+    t, getter, index, field = arg
+    ctx.stack.append(_array_item(getter(_group_txn(ctx, t)), index, field))
+
+
+def _op_gtxnas(ctx, arg):
+    t, getter, field = arg
+    s = ctx.stack
+    s[-1] = _array_item(getter(_group_txn(ctx, t)), _need_int(s[-1], "gtxnas"), field)
+
+
+def _op_gtxns(ctx, getter):
+    s = ctx.stack
+    s[-1] = getter(_group_txn(ctx, _need_int(s[-1], "gtxns")))
+
+
+def _op_gtxnsa(ctx, arg):
+    getter, index, field = arg
+    s = ctx.stack
+    s[-1] = _array_item(getter(_group_txn(ctx, _need_int(s[-1], "gtxnsa"))), index, field)
+
+
+def _op_gtxnsas(ctx, arg):
+    getter, field = arg
+    s = ctx.stack
+    index = _need_int(s.pop(), "gtxnsas")
+    s[-1] = _array_item(getter(_group_txn(ctx, _need_int(s[-1], "gtxnsas"))), index, field)
+
+
+def _last_inner(ctx, t=None):
+    group = ctx.last_inner
+    if not group:
+        raise AVMError("no inner transaction available")
+    if t is None:
+        return group[-1]
+    if t >= len(group):
+        raise AVMError(f"gitxn {t} beyond last inner group of {len(group)}")
+    return group[t]
+
+
+def _op_itxn(ctx, getter):
+    ctx.stack.append(getter(_last_inner(ctx)))
+
+
+def _op_itxna(ctx, arg):
+    getter, index, field = arg
+    ctx.stack.append(_array_item(getter(_last_inner(ctx)), index, field))
+
+
+def _op_itxnas(ctx, arg):
+    getter, field = arg
+    s = ctx.stack
+    s[-1] = _array_item(getter(_last_inner(ctx)), _need_int(s[-1], "itxnas"), field)
+
+
+def _op_gitxn(ctx, arg):
+    t, getter = arg
+    ctx.stack.append(getter(_last_inner(ctx, t)))
+
+
+def _op_gitxna(ctx, arg):
+    t, getter, index, field = arg
+    ctx.stack.append(_array_item(getter(_last_inner(ctx, t)), index, field))
+
+
+def _op_gitxnas(ctx, arg):
+    t, getter, field = arg
+    s = ctx.stack
+    s[-1] = _array_item(getter(_last_inner(ctx, t)), _need_int(s[-1], "gitxnas"), field)
+
+
+def _global_getters():
+    return {
+        "MinTxnFee": lambda ctx: MIN_TXN_FEE,
+        "MinBalance": lambda ctx: MIN_BALANCE,
+        "MaxTxnLife": lambda ctx: MAX_TXN_LIFE,
+        "ZeroAddress": lambda ctx: ZERO_ADDRESS,
+        "GroupSize": lambda ctx: len(ctx.txns),
+        "LogicSigVersion": lambda ctx: LOGIC_SIG_VERSION,
+        "Round": lambda ctx: ctx.ledger.round,
+        "LatestTimestamp": lambda ctx: ctx.ledger.timestamp,
+        "CurrentApplicationID": lambda ctx: ctx.app_id,
+        "CreatorAddress": lambda ctx: ctx.app.creator,
+        "CurrentApplicationAddress": lambda ctx: ctx.app.address,
+        "GroupID": lambda ctx: ctx.group.group_id,
+        "CallerApplicationID": lambda ctx: ctx.caller.id if ctx.caller else 0,
+        "CallerApplicationAddress": lambda ctx: ctx.caller.address if ctx.caller else ZERO_ADDRESS,
+    }
+
+
+GLOBAL_GETTERS = _global_getters()
+
+
+def _op_global(ctx, getter):
+    ctx.stack.append(getter(ctx))
+
+
+def _op_opcode_budget(ctx, _):
+    ctx.stack.append(ctx.group.budget)
+
+
+# state access
+def _local_state(ctx, addr, app_id, op):
+    acct = ctx.ledger.accounts.get(addr)
+    local = acct.locals.get(app_id) if acct else None
+    if local is None:
+        raise AVMError(f"{op}: {encode_address(addr)} is not opted in to app {app_id}")
+    return local
+
+
+def _state_key(key, op):
+    if key.__class__ is not bytes:
+        raise AVMError(f"{op} key must be bytes")
+    if len(key) > MAX_KEY_LEN:
+        raise AVMError(f"{op} key too long ({len(key)} > {MAX_KEY_LEN})")
+    return key
+
+
+def _check_value(key, value, op):
+    if value.__class__ is bytes and len(key) + len(value) > MAX_KEY_VALUE_LEN:
+        raise AVMError(f"{op} key/value total {len(key) + len(value)} exceeds {MAX_KEY_VALUE_LEN}")
+
+
+def _op_balance(ctx, _):
+    s = ctx.stack
+    acct = ctx.ledger.accounts.get(ctx.account(s[-1]))
+    s[-1] = acct.balance if acct else 0
+
+
+def _op_min_balance(ctx, _):
+    s = ctx.stack
+    acct = ctx.ledger.accounts.get(ctx.account(s[-1]))
+    s[-1] = ctx.ledger._min_balance(acct) if acct else 0
+
+
+def _op_app_opted_in(ctx, _):
+    s = ctx.stack
+    app_id = ctx.app_ref(s.pop())
+    acct = ctx.ledger.accounts.get(ctx.account(s[-1]))
+    s[-1] = 1 if acct and app_id in acct.locals else 0
+
+
+def _op_app_local_get(ctx, _):
+    s = ctx.stack
+    key = _state_key(s.pop(), "app_local_get")
+    local = _local_state(ctx, ctx.account(s[-1]), ctx.app_id, "app_local_get")
+    s[-1] = value = local.get(key, 0)
+    ctx.txn.local_bytes += len(key) + _value_size(value)
+
+
+def _op_app_local_get_ex(ctx, _):
+    s = ctx.stack
+    key = _state_key(s.pop(), "app_local_get_ex")
+    app_id = ctx.app_ref(s.pop())
+    addr = ctx.account(s[-1])
+    acct = ctx.ledger.accounts.get(addr)
+    local = acct.locals.get(app_id) if acct else None
+    value = local.get(key, _MISSING) if local is not None else _MISSING
+    if value is _MISSING:
+        s[-1] = 0
+        s.append(0)
+    else:
+        s[-1] = value
+        s.append(1)
+    ctx.txn.local_bytes += len(key) + _value_size(s[-2])
+
+
+def _op_app_global_get(ctx, _):
+    s = ctx.stack
+    s[-1] = ctx.app.global_state.get(_state_key(s[-1], "app_global_get"), 0)
+
+
+def _op_app_global_get_ex(ctx, _):
+    s = ctx.stack
+    key = _state_key(s.pop(), "app_global_get_ex")
+    app = ctx.ledger.apps.get(ctx.app_ref(s[-1]))
+    value = app.global_state.get(key, _MISSING) if app else _MISSING
+    if value is _MISSING:
+        s[-1] = 0
+        s.append(0)
+    else:
+        s[-1] = value
+        s.append(1)
+
+
+def _op_app_local_put(ctx, _):
+    s = ctx.stack
+    value = s.pop()
+    key = _state_key(s.pop(), "app_local_put")
+    addr = ctx.account(s.pop())
+    _check_value(key, value, "app_local_put")
+    local = _local_state(ctx, addr, ctx.app_id, "app_local_put")
+    if local.get(key, _MISSING).__class__ is not value.__class__:
+        ctx.dirty = True        # new key or changed type: recheck the schema
+    ctx.ledger._put(local, key, value)
+    ctx.txn.local_bytes += len(key) + _value_size(value)
+
+
+def _op_app_global_put(ctx, _):
+    s = ctx.stack
+    value = s.pop()
+    key = _state_key(s.pop(), "app_global_put")
+    _check_value(key, value, "app_global_put")
+    state = ctx.app.global_state
+    if state.get(key, _MISSING).__class__ is not value.__class__:
+        ctx.dirty = True
+    ctx.ledger._put(state, key, value)
+
+
+def _op_app_local_del(ctx, _):
+    s = ctx.stack
+    key = _state_key(s.pop(), "app_local_del")
+    addr = ctx.account(s.pop())
+    ctx.ledger._del(_local_state(ctx, addr, ctx.app_id, "app_local_del"), key)
+    ctx.txn.local_bytes += len(key)
+
+
+def _op_app_global_del(ctx, _):
+    ctx.ledger._del(ctx.app.global_state, _state_key(ctx.stack.pop(), "app_global_del"))
+
+
+def _holding_getters():
+    return {
+        "AssetBalance": lambda holding: holding[0],
+        "AssetFrozen": lambda holding: holding[1],
+    }
+
+
+ASSET_HOLDING_GETTERS = _holding_getters()
+ASSET_PARAMS_GETTERS = {
+    "AssetTotal": lambda a: a.total, "AssetDecimals": lambda a: a.decimals,
+    "AssetDefaultFrozen": lambda a: a.default_frozen, "AssetUnitName": lambda a: a.unit_name,
+    "AssetName": lambda a: a.name, "AssetURL": lambda a: a.url,
+    "AssetMetadataHash": lambda a: a.metadata_hash, "AssetManager": lambda a: a.manager,
+    "AssetReserve": lambda a: a.reserve, "AssetFreeze": lambda a: a.freeze,
+    "AssetClawback": lambda a: a.clawback, "AssetCreator": lambda a: a.creator,
+}
+APP_PARAMS_GETTERS = {
+    "AppApprovalProgram": lambda a: a.approval.bytecode,
+    "AppClearStateProgram": lambda a: a.clear.bytecode if a.clear else b"",
+    "AppGlobalNumUint": lambda a: a.global_schema[0],
+    "AppGlobalNumByteSlice": lambda a: a.global_schema[1],
+    "AppLocalNumUint": lambda a: a.local_schema[0],
+    "AppLocalNumByteSlice": lambda a: a.local_schema[1],
+    "AppExtraProgramPages": lambda a: a.extra_pages,
+    "AppCreator": lambda a: a.creator,
+    "AppAddress": lambda a: a.address,
+}
+
+
+def _acct_params_getters():
+    def uints(ledger, acct):
+        return sum(ledger.apps[a].local_schema[0] for a in acct.locals if a in ledger.apps) + \
+            sum(app.global_schema[0] for app in acct.apps_created.values())
+
+    def slices(ledger, acct):
+        return sum(ledger.apps[a].local_schema[1] for a in acct.locals if a in ledger.apps) + \
+            sum(app.global_schema[1] for app in acct.apps_created.values())
+
+    return {
+        "AcctBalance": lambda ledger, acct: acct.balance,
+        "AcctMinBalance": lambda ledger, acct: ledger._min_balance(acct),
+        "AcctAuthAddr": lambda ledger, acct: ZERO_ADDRESS,
+        "AcctTotalNumUint": uints,
+        "AcctTotalNumByteSlice": slices,
+        "AcctTotalExtraAppPages": lambda ledger, acct: sum(a.extra_pages for a in acct.apps_created.values()),
+        "AcctTotalAppsCreated": lambda ledger, acct: len(acct.apps_created),
+        "AcctTotalAppsOptedIn": lambda ledger, acct: len(acct.locals),
+        "AcctTotalAssetsCreated": lambda ledger, acct: len(acct.assets_created),
+        "AcctTotalAssets": lambda ledger, acct: len(acct.assets),
+        "AcctTotalBoxes": lambda ledger, acct: acct.boxes[0],
+        "AcctTotalBoxBytes": lambda ledger, acct: acct.boxes[1],
+    }
+
+
+ACCT_PARAMS_GETTERS = _acct_params_getters()
+
+
+def _op_asset_holding_get(ctx, getter):
+    s = ctx.stack
+    asset_id = ctx.asset_ref(s.pop())
+    acct = ctx.ledger.accounts.get(ctx.account(s[-1]))
+    holding = acct.assets.get(asset_id) if acct else None
+    if holding is None:
+        s[-1] = 0
+        s.append(0)
+    else:
+        s[-1] = getter(holding)
+        s.append(1)
+
+
+def _op_asset_params_get(ctx, getter):
+    s = ctx.stack
+    asset = ctx.ledger.assets.get(ctx.asset_ref(s[-1]))
+    if asset is None:
+        s[-1] = 0
+        s.append(0)
+    else:
+        s[-1] = getter(asset)
+        s.append(1)
+
+
+def _op_app_params_get(ctx, getter):
+    s = ctx.stack
+    app = ctx.ledger.apps.get(ctx.app_ref(s[-1]))
+    if app is None:
+        s[-1] = 0
+        s.append(0)
+    else:
+        s[-1] = getter(app)
+        s.append(1)
+
+
+def _op_acct_params_get(ctx, getter):
+    s = ctx.stack
+    acct = ctx.ledger.accounts.get(ctx.account(s[-1]))
+    if acct is None or (acct.balance == 0 and _closed(acct)):
+        s[-1] = 0
+        s.append(0)
+    else:
+        s[-1] = getter(ctx.ledger, acct)
+        s.append(1)
+
+
+def _op_log(ctx, _):
+    value = _need_bytes(ctx.stack.pop(), "log")
+    logs = ctx.txn.logs
+    if len(logs) >= MAX_LOG_CALLS:
+        raise AVMError(f"too many log calls (> {MAX_LOG_CALLS})")
+    ctx.log_bytes += len(value)
+    if ctx.log_bytes > MAX_LOG_BYTES:
+        raise AVMError(f"program logs too large ({ctx.log_bytes} > {MAX_LOG_BYTES} bytes)")
+    logs.append(value)
+
+
+# inner transactions
+def _new_inner(ctx):
+    fee = MIN_TXN_FEE
+    credit = ctx.group.fee_credit
+    if credit > 0:
+        fee = max(0, fee - credit)
+    return Txn("pay", ctx.app.address, fee=fee)
+
+
+def _op_itxn_begin(ctx, _):
+    if ctx.pending is not None:
+        raise AVMError("itxn_begin without itxn_submit")
+    ctx.pending = [_new_inner(ctx)]
+
+
+def _op_itxn_next(ctx, _):
+    if ctx.pending is None:
+        raise AVMError("itxn_next without itxn_begin")
+    if len(ctx.pending) >= MAX_GROUP_SIZE:
+        raise AVMError("too many inner transactions in one group")
+    ctx.pending.append(_new_inner(ctx))
+
+
+def _op_itxn_field(ctx, arg):
+    if ctx.pending is None:
+        raise AVMError("itxn_field without itxn_begin")
+    attr, kind = arg
+    txn = ctx.pending[-1]
+    value = ctx.stack.pop()
+    if kind == "int":
+        value = _need_int(value, "itxn_field")
+    elif kind == "bytes":
+        value = _need_bytes(value, "itxn_field")
+    elif kind == "addr":
+        value = ctx.account(_need_bytes(value, "itxn_field"))
+    elif kind == "asset":
+        value = ctx.asset_ref(value)
+    elif kind == "app":
+        value = ctx.app_ref(value)
+    elif kind == "type":
+        value = _need_bytes(value, "itxn_field").decode("latin-1")
+        if value not in ("pay", "axfer", "appl", "acfg"):
+            raise AVMError(f"{value} is not a valid inner transaction type")
+    elif kind == "type_enum":
+        value = TYPE_NAMES.get(_need_int(value, "itxn_field"))
+        if value not in ("pay", "axfer", "appl", "acfg"):
+            raise AVMError("invalid inner transaction TypeEnum")
+    elif kind.endswith("[]"):
+        item = kind[:-2]
+        if item == "bytes":
+            value = _need_bytes(value, "itxn_field")
+        elif item == "addr":
+            value = ctx.account(_need_bytes(value, "itxn_field"))
+        elif item == "asset":
+            value = ctx.asset_ref(value)
+        else:
+            value = ctx.app_ref(value)
+        getattr(txn, attr).append(value)
+        return
+    setattr(txn, attr, value)
+
+
+def _op_itxn_submit(ctx, _):
+    if ctx.pending is None:
+        raise AVMError("itxn_submit without itxn_begin")
+    ctx.ledger._submit_inner(ctx)
+
+
+# boxes
+def _value_size(value):
+    return 8 if value.__class__ is int else len(value)
+
+
+def _box_create(ctx, name, size):
+    app = ctx.app
+    ledger = ctx.ledger
+    ledger._put(app.boxes, name, bytes(size))
+    acct = ledger._acct(app.address)
+    ledger._put_boxes(acct, acct.boxes[0] + 1, acct.boxes[1] + len(name) + size, ctx.group)
+    _check_box_budget(ctx, "write")
+
+
+def _op_box_create(ctx, _):
+    s = ctx.stack
+    size = _need_int(s.pop(), "box_create")
+    name = ctx.box_key(s[-1])
+    if size > MAX_BOX_SIZE:
+        raise AVMError(f"box size {size} too large")
+    existing = ctx.app.boxes.get(name)
+    if existing is not None:
+        if len(existing) != size:
+            raise AVMError(f"box {name!r} exists with size {len(existing)}, not {size}")
+        s[-1] = 0
+        return
+    _box_create(ctx, name, size)
+    ctx.txn.box_bytes += len(name) + size
+    s[-1] = 1
+
+
+def _existing_box(ctx, name, op):
+    value = ctx.app.boxes.get(name)
+    if value is None:
+        raise AVMError(f"{op}: no such box {name!r}")
+    return value
+
+
+def _op_box_extract(ctx, _):
+    s = ctx.stack
+    length = _need_int(s.pop(), "box_extract")
+    start = _need_int(s.pop(), "box_extract")
+    name = ctx.box_key(s[-1])
+    s[-1] = _slice(_existing_box(ctx, name, "box_extract"), start, start + length, "box_extract")
+    ctx.txn.box_bytes += len(name) + length
+
+
+def _op_box_replace(ctx, _):
+    s = ctx.stack
+    new = _need_bytes(s.pop(), "box_replace")
+    start = _need_int(s.pop(), "box_replace")
+    name = ctx.box_key(s.pop())
+    value = _existing_box(ctx, name, "box_replace")
+    ctx.ledger._put(ctx.app.boxes, name, _replace(value, start, new, "box_replace"))
+    ctx.txn.box_bytes += len(name) + len(new)
+
+
+def _op_box_del(ctx, _):
+    s = ctx.stack
+    name = ctx.box_key(s[-1])
+    app = ctx.app
+    value = app.boxes.get(name)
+    if value is None:
+        s[-1] = 0
+        return
+    ledger = ctx.ledger
+    ledger._del(app.boxes, name)
+    acct = ledger._acct(app.address)
+    ledger._put_boxes(acct, acct.boxes[0] - 1, acct.boxes[1] - len(name) - len(value), ctx.group)
+    ctx.txn.box_bytes += len(name)
+    s[-1] = 1
+
+
+def _op_box_len(ctx, _):
+    s = ctx.stack
+    value = ctx.app.boxes.get(ctx.box_key(s[-1]))
+    s[-1] = len(value) if value is not None else 0
+    s.append(1 if value is not None else 0)
+
+
+def _op_box_get(ctx, _):
+    s = ctx.stack
+    name = ctx.box_key(s[-1])
+    value = ctx.app.boxes.get(name)
+    if value is not None and len(value) > MAX_BYTES:
+        raise AVMError(f"box_get produced a too big ({len(value)}) byte-array")
+    s[-1] = value if value is not None else b""
+    s.append(1 if value is not None else 0)
+    ctx.txn.box_bytes += len(name) + len(s[-2])
+
+
+def _op_box_put(ctx, _):
+    s = ctx.stack
+    value = _need_bytes(s.pop(), "box_put")
+    name = ctx.box_key(s.pop())
+    existing = ctx.app.boxes.get(name)
+    if existing is None:
+        _box_create(ctx, name, len(value))
+    elif len(existing) != len(value):
+        raise AVMError(f"box_put wrong size {len(existing)} vs {len(value)}")
+    ctx.ledger._put(ctx.app.boxes, name, value)
+    ctx.txn.box_bytes += len(name) + len(value)
+
+
+# Handlers that touch the pooled opcode budget directly.
+_SYNC_OPS = {_op_itxn_submit, _op_opcode_budget}
+
+
+def _unsupported(name):
+    def op(ctx, _):
+        raise AVMError(f"{name} is not supported by the local AVM")
+    return op
+
+
+_SIMPLE = {
+    "+": _int_binop("+", _checked_add),
+    "-": _int_binop("-", _checked_sub),
+    "*": _int_binop("*", _checked_mul),
+    "/": _int_binop("/", _checked_div),
+    "%": _int_binop("%", _checked_mod),
+    "<": _int_binop("<", lambda a, b: 1 if a < b else 0),
+    ">": _int_binop(">", lambda a, b: 1 if a > b else 0),
+    "<=": _int_binop("<=", lambda a, b: 1 if a <= b else 0),
+    ">=": _int_binop(">=", lambda a, b: 1 if a >= b else 0),
+    "&&": _int_binop("&&", lambda a, b: 1 if a and b else 0),
+    "||": _int_binop("||", lambda a, b: 1 if a or b else 0),
+    "|": _int_binop("|", lambda a, b: a | b),
+    "&": _int_binop("&", lambda a, b: a & b),
+    "^": _int_binop("^", lambda a, b: a ^ b),
+    "shl": _int_binop("shl", _shl),
+    "shr": _int_binop("shr", _shr),
+    "exp": _int_binop("exp", _checked_exp),
+    "==": _op_eq,
+    "!=": _op_ne,
+    "!": _op_not,
+    "~": _op_bnot,
+    "len": _op_len,
+    "itob": _op_itob,
+    "btoi": _op_btoi,
+    "mulw": _op_mulw,
+    "addw": _op_addw,
+    "divmodw": _op_divmodw,
+    "divw": _op_divw,
+    "expw": _op_expw,
+    "sqrt": _op_sqrt,
+    "bitlen": _op_bitlen,
+    "sha256": _hash(lambda d: hashlib.sha256(d).digest()),
+    "sha512_256": _hash(_sha512_256),
+    "sha3_256": _hash(lambda d: hashlib.sha3_256(d).digest()),
+    "keccak256": _hash(_keccak256),
+    "ed25519verify": _op_ed25519verify,
+    "ed25519verify_bare": _op_ed25519verify_bare,
+    "concat": _op_concat,
+    "substring3": _op_substring3,
+    "extract3": _op_extract3,
+    "extract_uint16": _extract_uint(2),
+    "extract_uint32": _extract_uint(4),
+    "extract_uint64": _extract_uint(8),
+    "replace3": _op_replace3,
+    "getbit": _op_getbit,
+    "setbit": _op_setbit,
+    "getbyte": _op_getbyte,
+    "setbyte": _op_setbyte,
+    "bzero": _op_bzero,
+    "b+": _bmath("b+", lambda a, b: _bigbytes(a + b)),
+    "b-": _bmath("b-", _bsub),
+    "b*": _bmath("b*", lambda a, b: _bigbytes(a * b)),
+    "b/": _bmath("b/", _bdiv),
+    "b%": _bmath("b%", _bmod),
+    "b<": _bmath("b<", lambda a, b: 1 if a < b else 0),
+    "b>": _bmath("b>", lambda a, b: 1 if a > b else 0),
+    "b<=": _bmath("b<=", lambda a, b: 1 if a <= b else 0),
+    "b>=": _bmath("b>=", lambda a, b: 1 if a >= b else 0),
+    "b==": _bmath("b==", lambda a, b: 1 if a == b else 0),
+    "b!=": _bmath("b!=", lambda a, b: 1 if a != b else 0),
+    "b|": _bitwise("b|", lambda x, y: x | y),
+    "b&": _bitwise("b&", lambda x, y: x & y),
+    "b^": _bitwise("b^", lambda x, y: x ^ y),
+    "b~": _op_binvert,
+    "bsqrt": _op_bsqrt,
+    "pop": _op_pop,
+    "dup": _op_dup,
+    "dup2": _op_dup2,
+    "swap": _op_swap,
+    "select": _op_select,
+    "loads": _op_loads,
+    "stores": _op_stores,
+    "gloadss": _op_gloadss,
+    "gaids": _op_gaids,
+    "err": _op_err,
+    "return": _op_return,
+    "assert": _op_assert,
+    "retsub": _op_retsub,
+    "balance": _op_balance,
+    "min_balance": _op_min_balance,
+    "app_opted_in": _op_app_opted_in,
+    "app_local_get": _op_app_local_get,
+    "app_local_get_ex": _op_app_local_get_ex,
+    "app_global_get": _op_app_global_get,
+    "app_global_get_ex": _op_app_global_get_ex,
+    "app_local_put": _op_app_local_put,
+    "app_global_put": _op_app_global_put,
+    "app_local_del": _op_app_local_del,
+    "app_global_del": _op_app_global_del,
+    "log": _op_log,
+    "itxn_begin": _op_itxn_begin,
+    "itxn_next": _op_itxn_next,
+    "itxn_submit": _op_itxn_submit,
+    "box_create": _op_box_create,
+    "box_extract": _op_box_extract,
+    "box_replace": _op_box_replace,
+    "box_del": _op_box_del,
+    "box_len": _op_box_len,
+    "box_get": _op_box_get,
+    "box_put": _op_box_put,
+}
+
+# Ops with a single uint8 (or int8) immediate.
+_BYTE_IMMEDIATE = {
+    "dig": _op_dig, "cover": _op_cover, "uncover": _op_uncover, "bury": _op_bury,
+    "popn": _op_popn, "dupn": _op_dupn, "load": _op_load, "store": _op_store,
+    "gloads": _op_gloads, "gaid": _op_gaid, "replace2": _op_replace2, "intc": _op_intc,
+    "bytec": _op_bytec, "frame_dig": _op_frame_dig, "frame_bury": _op_frame_bury,
+}
+
+_TXN_OPS = {
+    # op: (handler, has group index immediate, array form, stack-indexed array)
+    "txn": (_op_txn, False, False, False),
+    "txna": (_op_txna, False, True, False),
+    "txnas": (_op_txnas, False, True, True),
+    "gtxn": (_op_gtxn, True, False, False),
+    "gtxna": (_op_gtxna, True, True, False),
+    "gtxnas": (_op_gtxnas, True, True, True),
+    "gtxns": (_op_gtxns, False, False, False),
+    "gtxnsa": (_op_gtxnsa, False, True, False),
+    "gtxnsas": (_op_gtxnsas, False, True, True),
+    "itxn": (_op_itxn, False, False, False),
+    "itxna": (_op_itxna, False, True, False),
+    "itxnas": (_op_itxnas, False, True, True),
+    "gitxn": (_op_gitxn, True, False, False),
+    "gitxna": (_op_gitxna, True, True, False),
+    "gitxnas": (_op_gitxnas, True, True, True),
+}
+
+_FIELD_OPS = {
+    "asset_holding_get": (_op_asset_holding_get, ASSET_HOLDING_GETTERS),
+    "asset_params_get": (_op_asset_params_get, ASSET_PARAMS_GETTERS),
+    "app_params_get": (_op_app_params_get, APP_PARAMS_GETTERS),
+    "acct_params_get": (_op_acct_params_get, ACCT_PARAMS_GETTERS),
+}
+
+
+def _normalize(op, args):
+    if op in ("txn", "itxn", "gtxns") and len(args) == 2:
+        return ("gtxnsa" if op == "gtxns" else op.replace("txn", "txna")), args
+    if op in ("gtxn", "gitxn") and len(args) == 3:
+        return op + "a", args
+    return op, args
+
+
+def _uint8(token, line):
+    value = parse_int(token, line)
+    if value > 255:
+        raise TealError(f"immediate {token} does not fit in a byte", line)
+    return value
+
+
+def _bind(instr, program, index):
+    """(handler, decoded immediate, opcode cost) for one instruction."""
+    line = instr.line
+    op, args = _normalize(instr.op, instr.args)
+
+    def label(name):
+        if name not in program.labels:
+            raise TealError(f"reference to undefined label {name!r}", line)
+        return program.labels[name]
+
+    if op in ("int", "pushint"):
+        return _const, parse_int(args[0], line), 1
+    if op in ("byte", "pushbytes"):
+        return _const, parse_bytes(args, line)[0], 1
+    if op == "addr":
+        return _const, encoding.decode_address(args[0]), 1
+    if op == "method":
+        from .assemble import method_selector
+        return _const, method_selector(parse_bytes(args, line)[0].decode()), 1
+
+    spec = OPS.get(op)
+    if spec is None:
+        raise TealError(f"unknown opcode {op!r}", line)
+    cost = spec.cost
+
+    if op in _SIMPLE:
+        return _SIMPLE[op], None, cost
+    if op in _BYTE_IMMEDIATE:
+        value = int(args[0], 0) if op in ("frame_dig", "frame_bury") else _uint8(args[0], line)
+        return _BYTE_IMMEDIATE[op], value, cost
+    if op in ("intc_0", "intc_1", "intc_2", "intc_3"):
+        return _op_intc, int(op[-1]), cost
+    if op in ("bytec_0", "bytec_1", "bytec_2", "bytec_3"):
+        return _op_bytec, int(op[-1]), cost
+    if op == "intcblock":
+        return _op_intcblock, [parse_int(a, line) for a in args], cost
+    if op == "bytecblock":
+        return _op_bytecblock, _parse_bytes_list(args, line), cost
+    if op == "pushints":
+        return _op_pushn, [parse_int(a, line) for a in args], cost
+    if op == "pushbytess":
+        return _op_pushn, _parse_bytes_list(args, line), cost
+    if op in ("bnz", "bz", "b"):
+        return {"bnz": _op_bnz, "bz": _op_bz, "b": _op_b}[op], label(args[0]), cost
+    if op == "callsub":
+        return _op_callsub, (label(args[0]), index + 1), cost
+    if op in ("switch", "match"):
+        return (_op_switch if op == "switch" else _op_match), [label(a) for a in args], cost
+    if op == "proto":
+        return _op_proto, (_uint8(args[0], line), _uint8(args[1], line)), cost
+    if op in ("substring", "extract"):
+        return (_op_substring if op == "substring" else _op_extract), \
+            (_uint8(args[0], line), _uint8(args[1], line)), cost
+    if op == "gload":
+        return _op_gload, (_uint8(args[0], line), _uint8(args[1], line)), cost
+    if op == "global":
+        if args[0] == "OpcodeBudget":
+            return _op_opcode_budget, None, cost
+        if args[0] not in GLOBAL_GETTERS:
+            raise TealError(f"unknown global field {args[0]}", line)
+        return _op_global, GLOBAL_GETTERS[args[0]], cost
+    if op in _TXN_OPS:
+        handler, grouped, array, stack_indexed = _TXN_OPS[op]
+        rest = list(args)
+        group_index = _uint8(rest.pop(0), line) if grouped else None
+        field = rest.pop(0)
+        getter = (TXN_ARRAYS if array else TXN_GETTERS).get(field)
+        if getter is None:
+            raise TealError(f"{op} does not support field {field}", line)
+        if array and not stack_indexed:
+            parts = (getter, _uint8(rest[0], line), field)
+        elif array:
+            parts = (getter, field)
+        else:
+            parts = getter
+        if grouped:
+            parts = (group_index,) + (parts if isinstance(parts, tuple) else (parts,))
+        return handler, parts, cost
+    if op == "itxn_field":
+        if args[0] not in ITXN_SETTERS:
+            raise TealError(f"itxn_field does not support {args[0]}", line)
+        return _op_itxn_field, ITXN_SETTERS[args[0]], cost
+    if op in _FIELD_OPS:
+        handler, getters = _FIELD_OPS[op]
+        if args[0] not in getters:
+            raise TealError(f"{op} does not support field {args[0]}", line)
+        return handler, getters[args[0]], cost
+    if op == "base64_decode":
+        if args[0] not in FIELDS["base64"]:
+            raise TealError(f"unknown base64 encoding {args[0]}", line)
+        return _op_base64_decode, args[0], cost
+    return _unsupported(op), None, cost
+
+
+def _parse_bytes_list(args, line):
+    values = []
+    while args:
+        value, used = parse_bytes(args, line)
+        values.append(value)
+        args = args[used:]
+    return values
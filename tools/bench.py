@@ -0,0 +1,502 @@
+"""
+Per-method benchmarks on the local AVM, checked against a stored baseline.
+
+    python -m tools.bench                   # run, compare with tools/bench_baseline.json
+    python -m tools.bench --update          # record a new baseline
+    python -m tools.bench --threshold 5     # fail when a metric grows by more than 5%
+
+Each scenario drives a contract through a representative flow (marketplace
+list -> buy -> delist, commute register -> match -> end/cancel, escrow
+opt-in -> borrow -> return for high- and low-trust borrowers and overdue
+sweeps, trust add/slash, box-backed trust records and migration, decayed trust, ...). Every group it submits is recorded under a
+"contract.method" label with:
+
+  cost            opcodes charged to the group, inner app calls included
+  inner_txns      inner transactions issued
+  box_bytes       box key+value bytes read or written
+  local_bytes     local-state key+value bytes read or written
+  program_bytes   approval program size of the contract
+  time_us         median wall-clock time to evaluate the group
+
+Everything but time_us is deterministic and is compared with --threshold
+(default 10%). Wall-clock time is compared with the looser
+--time-threshold (default 100%, i.e. twice as slow); pass --no-time on
+noisy CI machines.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+from algorand.merkle import WinnerTree
+from contracts.asset_escrow import LOAN_PERIOD
+from contracts.commute_checkin import HEAD_KEY, TAIL_KEY, queue_slot
+from contracts.reputation import EXPONENTIAL_DECAY, GET_RECORD
+
+from .avm import (
+    APP_CALL_BUDGET, MIN_TXN_FEE, Ledger, OptIn, address, app_call, asset_transfer, method_call, payment,
+)
+from .loan_index import Loan
+from .loan_sweep import MAX_LOANS
+from .loan_sweep import avm_groups as sweep_groups
+from .localnet import deploy
+from .market_batch import PAIRS_PER_GROUP, box_name, cart_groups, listing_groups
+from .payout_batch import MAX_ACCOUNTS as PAYOUT_ACCOUNTS
+from .payout_batch import avm_groups as payout_groups
+from .trip_settlement import MAX_RIDERS as SETTLE_RIDERS
+from .trip_settlement import avm_groups as settle_groups
+from .trust_batch import MAX_ACCOUNTS, avm_groups
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+METRICS = ("cost", "inner_txns", "box_bytes", "local_bytes", "program_bytes")
+DEFAULT_ROUNDS = 50
+DEFAULT_THRESHOLD = 10.0
+DEFAULT_TIME_THRESHOLD = 100.0
+
+ALGO = 1_000_000
+PRICE = 5 * ALGO
+FARE = 2 * ALGO
+COLLATERAL = ALGO
+EDITION_SIZE = 100          # units in one fungible listing
+MATCH_WINNERS = 96          # depth-7 claim proofs
+TRUST_THRESHOLD = 50        # asset_escrow.py waives collateral at this trust score
+DECAY_HALF_LIFE = 30 * 24 * 60 * 60
+
+
+def _all_txns(txns):
+    for txn in txns:
+        yield txn
+        yield from _all_txns(txn.inner_txns)
+
+
+class Bench:
+    """A ledger with every contract deployed, recording one sample per submitted group."""
+
+    def __init__(self, cse=False):
+        self.ledger = Ledger()
+        self.admin = self.ledger.new_account(10**15)
+        self.apps = deploy(self.ledger, self.admin, funding=100 * ALGO, cse=cse)
+        self.samples = {}
+
+    def account(self, balance=100 * ALGO):
+        return self.ledger.new_account(balance)
+
+    def setup(self, txns):
+        """Submit a group that is not part of any measurement."""
+        return self.ledger.submit(txns)
+
+    def submit(self, label, txns):
+        start = time.perf_counter_ns()
+        result = self.ledger.submit(txns)
+        elapsed = time.perf_counter_ns() - start
+        everything = list(_all_txns(txns))
+        self.samples.setdefault(label, []).append({
+            "cost": result.cost,
+            "inner_txns": len(everything) - len(txns),
+            "box_bytes": sum(t.box_bytes for t in everything),
+            "local_bytes": sum(t.local_bytes for t in everything),
+            "ns": elapsed,
+        })
+        return result
+
+    def program_bytes(self, label):
+        app_id = self.apps[label.split(".", 1)[0]]
+        return len(self.ledger.apps[app_id].approval.bytecode)
+
+    def summary(self):
+        out = {}
+        for label, samples in sorted(self.samples.items()):
+            row = {key: max(s[key] for s in samples) for key in METRICS if key != "program_bytes"}
+            row["program_bytes"] = self.program_bytes(label)
+            row["time_us"] = round(statistics.median(s["ns"] for s in samples) / 1000, 1)
+            out[label] = row
+        return out
+
+
+# -- scenarios -------------------------------------------------------------
+
+def marketplace(b):
+    app = b.apps["marketplace_contract"]
+    app_addr = b.ledger.app_address(app)
+    seller, buyer = b.account(), b.account()
+    asset = b.ledger.create_asset(seller, 2)
+    # The contract has no method to opt its account into an asset, so seed
+    # the holding directly (on TestNet this was done out of band).
+    b.ledger.opt_in_asset(app_addr, asset)
+    box = box_name(asset, seller)
+
+    def list_item():
+        b.submit("marketplace_contract.list", [
+            asset_transfer(seller, app_addr, asset, 1),
+            method_call(seller, app, "list(axfer,uint64,uint64)void", asset, PRICE, boxes=[box]),
+        ])
+
+    list_item()
+    b.setup([asset_transfer(buyer, buyer, asset, 0)])
+    b.submit("marketplace_contract.buy", [
+        payment(buyer, seller, PRICE),
+        method_call(buyer, app, "buy(pay,uint64)void", asset, boxes=[box], assets=[asset],
+                    fee=2 * MIN_TXN_FEE),
+    ])
+    list_item()
+    b.submit("marketplace_contract.delist", [
+        method_call(seller, app, "delist(uint64)void", asset, boxes=[box], assets=[asset],
+                    fee=2 * MIN_TXN_FEE),
+    ])
+
+
+def marketplace_batch(b):
+    app = b.apps["marketplace_contract"]
+    seller, buyer = b.account(), b.account()
+    assets = [b.ledger.create_asset(seller, 1) for _ in range(PAIRS_PER_GROUP)]
+    for asset in assets:
+        b.ledger.opt_in_asset(b.ledger.app_address(app), asset)
+        b.ledger.opt_in_asset(buyer, asset)
+    (group,) = listing_groups(seller, app, [(a, PRICE) for a in assets], b.ledger.app_address(app))
+    b.submit(f"marketplace_contract.list[{len(assets)}]", group)
+    (group,) = cart_groups(buyer, app, [(a, seller, PRICE) for a in assets])
+    b.submit(f"marketplace_contract.buy[{len(assets)}]", group)
+    edition = b.ledger.create_asset(seller, EDITION_SIZE)
+    b.ledger.opt_in_asset(b.ledger.app_address(app), edition)
+    b.ledger.opt_in_asset(buyer, edition)
+    (group,) = listing_groups(seller, app, [(edition, ALGO, EDITION_SIZE)], b.ledger.app_address(app))
+    b.submit("marketplace_contract.list[qty]", group)
+    (group,) = cart_groups(buyer, app, [(edition, seller, ALGO, EDITION_SIZE // 2)])
+    b.submit("marketplace_contract.buy[partial]", group)
+
+
+def commute(b):
+    app = b.apps["commute_checkin"]
+    app_addr = b.ledger.app_address(app)
+    trust = b.apps["trust_score"]
+
+    def page(key):      # queue page box of the "head" or "tail" position
+        return queue_slot(b.ledger.global_state(app).get(key.encode(), 0))[0]
+
+    driver, rider, other = b.account(), b.account(), b.account()
+    b.submit("commute_checkin.opt_in", [app_call(driver, app, on_complete=OptIn)])
+    b.setup([app_call(rider, app, on_complete=OptIn)])
+    b.setup([app_call(other, app, on_complete=OptIn)])
+    for user in (driver, rider):    # so end_trip credits both
+        b.setup([app_call(user, trust, on_complete=OptIn)])
+    b.submit("commute_checkin.register_driver", [
+        method_call(driver, app, "register_driver()void", boxes=[page(TAIL_KEY)]),
+    ])
+    b.submit("commute_checkin.register_rider", [method_call(rider, app, "register_rider()void")])
+
+    def start_trip():
+        b.submit("commute_checkin.start_trip", [
+            payment(rider, app_addr, FARE),
+            method_call(rider, app, "start_trip(pay)void", accounts=[driver], boxes=[page(HEAD_KEY)]),
+        ])
+
+    start_trip()
+    b.submit("commute_checkin.end_trip", [
+        method_call(rider, app, "end_trip(address)void", driver, accounts=[driver], applications=[trust],
+                    fee=4 * MIN_TXN_FEE),     # the fare and two trust credits are inner transactions
+    ])
+    b.setup([method_call(driver, app, "register_driver()void", boxes=[page(TAIL_KEY)])])
+    start_trip()
+    b.submit("commute_checkin.cancel_trip", [
+        method_call(rider, app, "cancel_trip()void", accounts=[driver], fee=2 * MIN_TXN_FEE),
+    ])
+    # A pooled ride: the driver picks up SETTLE_RIDERS riders, then settles them at once.
+    riders = [b.account() for _ in range(SETTLE_RIDERS)]
+    for pooled in riders:
+        b.setup([app_call(pooled, app, on_complete=OptIn)])
+        b.setup([app_call(pooled, trust, on_complete=OptIn)])
+        b.setup([method_call(pooled, app, "register_rider()void")])
+        b.setup([method_call(driver, app, "register_driver()void", boxes=[page(TAIL_KEY)])])
+        b.setup([
+            payment(pooled, app_addr, FARE),
+            method_call(pooled, app, "start_trip(pay)void", accounts=[driver], boxes=[page(HEAD_KEY)]),
+        ])
+    (group,) = settle_groups(driver, app, driver, riders, trust)
+    b.submit("commute_checkin.settle_trips", group)
+    b.setup([method_call(other, app, "register_driver()void", boxes=[page(TAIL_KEY)])])
+    b.submit("commute_checkin.leave_queue", [method_call(other, app, "leave_queue()void")])
+    b.submit("commute_checkin.pop_stale", [
+        method_call(rider, app, "pop_stale()void", accounts=[other], boxes=[page(HEAD_KEY)]),
+    ])
+    # start_trip drops a departed driver at the head itself.
+    b.setup([method_call(other, app, "register_driver()void", boxes=[page(TAIL_KEY)])])
+    b.setup([method_call(other, app, "leave_queue()void")])
+    stale = page(HEAD_KEY)
+    b.setup([method_call(driver, app, "register_driver()void", boxes=[page(TAIL_KEY)])])
+    b.submit("commute_checkin.start_trip_skip", [
+        payment(rider, app_addr, FARE),
+        method_call(rider, app, "start_trip(pay)void", accounts=[other, driver],
+                    boxes=sorted({stale, page(TAIL_KEY)})),     # the two may straddle a page
+    ])
+
+
+def escrow(b, trusted):
+    app = b.apps["asset_escrow"]
+    trust = b.apps["trust_score"]
+    tag = "[high_trust]" if trusted else "[low_trust]"
+    borrower = b.account()
+    loan = borrower + b"item-1"     # loan box: borrower || item id
+    b.submit("asset_escrow.opt_in", [app_call(borrower, app, on_complete=OptIn)])
+    if trusted:
+        b.setup([app_call(borrower, trust, on_complete=OptIn)])
+        b.setup([method_call(b.admin, trust, "add_trust(address,uint64)void", borrower, TRUST_THRESHOLD + 10,
+                             accounts=[borrower])])
+        borrow = [method_call(borrower, app, "borrow(string)void", "item-1", applications=[trust], boxes=[loan])]
+        fee = 2 * MIN_TXN_FEE       # the trust credit is an inner app call
+    else:
+        borrow = [
+            payment(borrower, b.ledger.app_address(app), COLLATERAL),
+            method_call(borrower, app, "borrow(string)void", "item-1", applications=[trust], boxes=[loan]),
+        ]
+        fee = 2 * MIN_TXN_FEE       # the refund is an inner payment (not opted in to trust: no credit)
+    b.submit("asset_escrow.borrow" + tag, borrow)
+    b.submit("asset_escrow.confirm_return" + tag, [
+        method_call(b.admin, app, "confirm_return(address,string)void", borrower, "item-1", accounts=[borrower],
+                    applications=[trust], boxes=[loan], fee=fee),
+    ])
+
+
+def escrow_sweep(b):
+    app = b.apps["asset_escrow"]
+    trust = b.apps["trust_score"]
+    loans = []
+    for _ in range(MAX_LOANS):
+        borrower = b.account()
+        b.setup([
+            payment(borrower, b.ledger.app_address(app), COLLATERAL),
+            method_call(borrower, app, "borrow(string)void", "item-1", applications=[trust],
+                        boxes=[borrower + b"item-1"]),
+        ])
+        loans.append(Loan(borrower, b"item-1", COLLATERAL, b.ledger.timestamp))
+    b.ledger.advance(LOAN_PERIOD)
+    (group,) = sweep_groups(b.admin, app, loans)
+    b.submit(f"asset_escrow.sweep[{MAX_LOANS}]", group)
+
+
+def trust_score(b):
+    app = b.apps["trust_score"]
+    user = b.account()
+    b.submit("trust_score.opt_in", [app_call(user, app, on_complete=OptIn)])
+    for method, amount in (("add_trust", 30), ("slash_trust", 10), ("add_fitness", 5), ("add_eco", 5)):
+        b.submit(f"trust_score.{method}", [
+            method_call(b.admin, app, f"{method}(address,uint64)void", user, amount, accounts=[user]),
+        ])
+    users = [user] + [b.account() for _ in range(MAX_ACCOUNTS - 1)]
+    for other in users[1:]:
+        b.setup([app_call(other, app, on_complete=OptIn)])
+    (group,) = avm_groups(b.admin, app, {u: (5, 10, -1) for u in users})
+    b.submit("trust_score.batch_update[4]", group)
+    b.submit("trust_score.get_record", [
+        method_call(b.admin, app, GET_RECORD, user, accounts=[user]),
+    ])
+
+
+def trust_score_box(b):
+    legacy, app = b.apps["trust_score"], b.apps["trust_score_box"]
+    user = b.account()
+    b.setup([app_call(user, legacy, on_complete=OptIn)])
+    b.setup([method_call(b.admin, legacy, "add_trust(address,uint64)void", user, 30, accounts=[user])])
+    box = [(0, address(user))]
+    b.submit("trust_score_box.migrate", [
+        method_call(user, app, "migrate(address)void", user, accounts=[user], applications=[legacy], boxes=box),
+    ])
+    for method, amount in (("add_trust", 30), ("slash_trust", 10), ("add_fitness", 5), ("add_eco", 5)):
+        b.submit(f"trust_score_box.{method}", [
+            method_call(b.admin, app, f"{method}(address,uint64)void", user, amount, accounts=[user], boxes=box),
+        ])
+    b.submit("trust_score_box.get_record", [
+        method_call(b.admin, app, GET_RECORD, user, accounts=[user], boxes=box),
+    ])
+    users = [b.account() for _ in range(MAX_ACCOUNTS)]      # no opt-in; first write creates the box
+    (group,) = avm_groups(b.admin, app, {u: (5, 10, -1) for u in users}, boxes=True)
+    b.submit("trust_score_box.batch_update[4]", group)
+
+
+def trust_decay(b):
+    """trust_score_box created with an exponential decay curve, used a little over a half-life later."""
+    label = "trust_score_box_decay"
+    if label not in b.apps:
+        b.apps[label] = deploy(b.ledger, b.admin, ["trust_score_box"], funding=100 * ALGO, rebuild=False,
+                               args={"trust_score_box": [EXPONENTIAL_DECAY, DECAY_HALF_LIFE]})["trust_score_box"]
+    app = b.apps[label]
+    users = [b.account() for _ in range(MAX_ACCOUNTS)]
+    for group in avm_groups(b.admin, app, {u: (80, 10, 10) for u in users}, boxes=True, decay=True):
+        b.setup(group)
+    b.ledger.advance(DECAY_HALF_LIFE + 24 * 60 * 60)
+    b.submit(f"{label}.get_record", [
+        method_call(b.admin, app, GET_RECORD, users[0], accounts=[users[0]], boxes=[(0, address(users[0]))]),
+    ])
+    (group,) = avm_groups(b.admin, app, {u: (5, 10, -1) for u in users}, boxes=True, decay=True)
+    b.submit(f"{label}.batch_update[4]", group)
+
+
+def civic_rewards(b):
+    app = b.apps["civic_rewards"]
+    receiver = b.account()
+    b.submit("civic_rewards.payout", [
+        method_call(b.admin, app, "payout(address,uint64)void", receiver, 1000, accounts=[receiver],
+                    fee=2 * MIN_TXN_FEE),
+    ])
+    receivers = [b.account() for _ in range(PAYOUT_ACCOUNTS)]
+    (group,) = payout_groups(b.admin, app, {r: 1000 for r in receivers})
+    b.submit("civic_rewards.batch_payout[4]", group)
+
+
+_match_ids = itertools.count(1)
+
+
+def match_payout(b):
+    # payout sends the app's whole balance minus one fee, which leaves the
+    # account below its minimum balance, so only deposit is benchmarked.
+    app = b.apps["match_payout"]
+    b.submit("match_payout.deposit", [
+        payment(b.account(), b.ledger.app_address(app), ALGO),
+        app_call(b.admin, app, "deposit"),
+    ])
+    winners = [b.account() for _ in range(3)]
+    tree = WinnerTree([(w, 1000) for w in winners] * (MATCH_WINNERS // len(winners)))
+    match_id = next(_match_ids)
+    box = [(0, match_id)]
+    b.submit(f"match_payout.settle[{len(tree)}]", [
+        app_call(b.admin, app, *tree.settle_args(match_id), boxes=box),
+    ])
+    b.submit(f"match_payout.claim[{len(tree)}]", [
+        app_call(winners[0], app, *tree.claim_args(match_id, 0), boxes=box, fee=2 * MIN_TXN_FEE),
+    ])
+
+
+SCENARIOS = {
+    "marketplace": marketplace,
+    "marketplace_batch": marketplace_batch,
+    "commute": commute,
+    "escrow_high_trust": lambda b: escrow(b, trusted=True),
+    "escrow_low_trust": lambda b: escrow(b, trusted=False),
+    "escrow_sweep": escrow_sweep,
+    "trust_score": trust_score,
+    "trust_score_box": trust_score_box,
+    "trust_decay": trust_decay,
+    "civic_rewards": civic_rewards,
+    "match_payout": match_payout,
+}
+
+
+def run(scenarios=None, rounds=DEFAULT_ROUNDS, cse=False):
+    bench = Bench(cse)
+    for _ in range(rounds):
+        for name in scenarios or SCENARIOS:
+            SCENARIOS[name](bench)
+    return bench.summary()
+
+
+# -- baseline comparison --------------------------------------------------------
+
+def _regressed(new, old, threshold):
+    if old is None or new <= old:
+        return False
+    return old == 0 or (new - old) * 100.0 / old > threshold
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD, time_threshold=DEFAULT_TIME_THRESHOLD):
+    """List of (label, metric, old, new) that grew past their threshold."""
+    regressions = []
+    for label, row in current.items():
+        base = baseline.get(label)
+        if base is None:
+            continue
+        for key in METRICS:
+            if _regressed(row[key], base.get(key), threshold):
+                regressions.append((label, key, base[key], row[key]))
+        if time_threshold is not None and _regressed(row["time_us"], base.get("time_us"), time_threshold):
+            regressions.append((label, "time_us", base["time_us"], row["time_us"]))
+    return regressions
+
+
+def _delta(new, old):
+    if old is None or old == new:
+        return ""
+    if old == 0:
+        return " (new)"
+    return f" ({(new - old) * 100.0 / old:+.0f}%)"
+
+
+def format_table(current, baseline):
+    header = (f"{'method':<38} {'cost':>12} {'budget':>7} {'inner':>5} {'box B':>6} "
+              f"{'local B':>7} {'prog B':>6} {'time us':>14}")
+    lines = [header, "-" * len(header)]
+    for label, row in current.items():
+        base = baseline.get(label, {})
+        cost = f"{row['cost']}{_delta(row['cost'], base.get('cost'))}"
+        timing = f"{row['time_us']}{_delta(row['time_us'], base.get('time_us'))}"
+        lines.append(
+            f"{label:<38} {cost:>12} {100.0 * row['cost'] / APP_CALL_BUDGET:>6.1f}% "
+            f"{row['inner_txns']:>5} {row['box_bytes']:>6} {row['local_bytes']:>7} "
+            f"{row['program_bytes']:>6} {timing:>14}"
+        )
+    return "\n".join(lines)
+
+
+def load_baseline(path=BASELINE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)["methods"]
+    except OSError:
+        return None
+
+
+def save_baseline(current, rounds, path=BASELINE_PATH):
+    with open(path, "w") as f:
+        json.dump({"rounds": rounds, "methods": current}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-method contract benchmarks with a stored baseline.")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="times each scenario runs")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON path")
+    parser.add_argument("--update", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed growth in percent for deterministic metrics")
+    parser.add_argument("--time-threshold", type=float, default=DEFAULT_TIME_THRESHOLD,
+                        help="allowed growth in percent for wall-clock time")
+    parser.add_argument("--no-time", action="store_true", help="do not compare wall-clock time")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH")
+    parser.add_argument("--cse", action="store_true", help="benchmark contracts built with the CSE pass")
+    args = parser.parse_args(argv)
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    current = run(args.scenarios or None, args.rounds, args.cse)
+    baseline = load_baseline(args.baseline)
+    print(format_table(current, baseline or {}))
+    if args.json:
+        save_baseline(current, args.rounds, args.json)
+
+    if args.update:
+        save_baseline(current, args.rounds, args.baseline)
+        print(f"\nbaseline written to {os.path.relpath(args.baseline)}")
+        return 0
+    if baseline is None:
+        print(f"\nno baseline at {os.path.relpath(args.baseline)}; run with --update to record one")
+        return 0
+
+    missing = sorted(set(baseline) - set(current)) if not args.scenarios else []
+    if missing:
+        print("\nin the baseline but not measured: " + ", ".join(missing))
+    regressions = compare(current, baseline, args.threshold, None if args.no_time else args.time_threshold)
+    if regressions:
+        print("\nregressions:")
+        for label, key, old, new in regressions:
+            print(f"  {label:<38} {key:<14} {old} -> {new}")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
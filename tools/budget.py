@@ -0,0 +1,200 @@
+"""
+Pad app-call groups with opup()void calls until their pooled opcode budget covers them.
+
+    from tools.budget import pack, pad, padding
+
+    padding(cost, calls=1)                      # opup calls a group of `calls` app calls costing `cost` needs
+    txns = pad(txns, app_id, cost=batch_cost(4, BOX, decay=True))  # static cost
+    txns = pad(txns, app_id, ledger=ledger)     # measured with Ledger.simulate
+    txns = pad_algosdk(txns, app_id, params, client=algod)     # measured with algod's simulate
+    pack(items, call_cost, per_call=4)          # [(calls, padding)] per 16-transaction group
+
+Every app call in a group adds 700 to one pooled budget, and each
+`opup()void` call (contracts/budget.py) adds 700 for OPUP_COST of its own.
+Padding calls go to the app being called, from the sender of its first
+call, with no fee: that call's fee rises by one min fee per padding call
+instead (fees pool across the group too), so callers keep signing one
+sender's transactions.
+
+A static cost (trust_score.batch_cost) is a worst case and may over-pad
+by a call. A ledger or algod client measures the group instead: it is
+simulated once with extra budget to see what it spends, padded by the
+shortfall, and the padded group is simulated again (one more padding call
+at a time) until it passes without topping itself up. Batch sizes then
+follow from the group limits rather than a per-call cap tuned to one
+call's 700: `pack` fills each group with as many items as fit in
+MAX_GROUP_SIZE transactions together with their padding.
+"""
+from contracts.budget import CHECK_HEADROOM, OPUP, OPUP_COST
+
+APP_CALL_BUDGET = 700
+MAX_GROUP_SIZE = 16
+MIN_TXN_FEE = 1000
+EXTRA_OPCODE_BUDGET = 20_000 * MAX_GROUP_SIZE     # the most simulate allows
+
+
+def padding_for(shortfall):
+    """opup calls that cover `shortfall` opcodes beyond the group's own budget."""
+    if shortfall <= 0:
+        return 0
+    return -(-shortfall // (APP_CALL_BUDGET - OPUP_COST))
+
+
+def padding(cost, calls=1):
+    """opup calls a group of `calls` app calls needs to spend `cost` opcodes.
+
+    Leaves CHECK_HEADROOM on top, so the methods' own budget checks
+    (contracts/budget.pooled) pass without topping up.
+    """
+    return padding_for(cost + CHECK_HEADROOM - APP_CALL_BUDGET * calls)
+
+
+def pack(items, call_cost, per_call, max_group=MAX_GROUP_SIZE):
+    """Split items into [(calls, padding)] groups of at most `max_group` transactions.
+
+    Each call carries up to `per_call` items and `call_cost(chunk)` is its
+    opcode cost; a group takes items until one more would not fit even with
+    padding, so its last call may carry fewer.
+    """
+    def fits(calls):
+        return len(calls) + padding(sum(map(call_cost, calls)), len(calls)) <= max_group
+
+    groups, calls = [], []
+    for item in items:
+        grown = calls[:-1] + [calls[-1] + [item]] if calls and len(calls[-1]) < per_call else calls + [[item]]
+        if not fits(grown):
+            if not fits([[item]]):
+                raise ValueError(f"a call costing {call_cost([item])} opcodes does not fit in one group")
+            groups.append(calls)
+            grown = [[item]]
+        calls = grown
+    if calls:
+        groups.append(calls)
+    return [(calls, padding(sum(map(call_cost, calls)), len(calls))) for calls in groups]
+
+
+def _lead(txns, app_id):
+    for txn in txns:
+        if _app_id(txn) == app_id:
+            return txn
+    raise ValueError(f"no call to app {app_id} in the group")
+
+
+def _app_id(txn):
+    return getattr(txn, "application_id", None) or getattr(txn, "index", None)
+
+
+def padding_calls(sender, app_id, count):
+    """`count` fee-less opup calls for tools/avm."""
+    from .avm import method_call
+
+    return [method_call(sender, app_id, OPUP, fee=0, note=b"opup %d" % i) for i in range(count)]
+
+
+def pad(txns, app_id, cost=None, ledger=None):
+    """`txns` plus the opup calls to `app_id` they need; the first call to the app pays their fees.
+
+    Give the group's opcode `cost`, or a tools/avm.Ledger to measure it on.
+    """
+    from .avm import Rejected
+
+    lead = _lead(txns, app_id)
+    fee = lead.fee
+
+    def padded(count):
+        lead.fee = fee + count * MIN_TXN_FEE
+        return list(txns) + padding_calls(lead.sender, app_id, count)
+
+    if ledger is None:
+        count = padding(cost, sum(1 for t in txns if t.type == "appl"))
+        if len(txns) + count > MAX_GROUP_SIZE:
+            raise ValueError(f"{len(txns)} transactions need {count} padding calls, over the group limit")
+        return padded(count)
+    result = ledger.simulate(txns, extra_opcode_budget=EXTRA_OPCODE_BUDGET)
+    count = padding_for(result.cost - (result.budget - EXTRA_OPCODE_BUDGET))
+    while True:
+        group = padded(count)
+        try:
+            ledger.simulate(group)
+        except Rejected:
+            if len(group) >= MAX_GROUP_SIZE:
+                raise
+            count += 1
+            continue
+        if not any(t.type == "appl" for call in group for t in call.inner_txns if t.application_id == 0):
+            return group
+        count += 1      # it only passed by topping itself up out of other fees
+
+
+def _simulate_algod(client, txns, extra_budget=0):
+    from algosdk import transaction
+    from algosdk.v2client.models import SimulateRequest, SimulateRequestTransactionGroup
+
+    for txn in txns:
+        txn.group = None
+    grouped = transaction.assign_group_id(list(txns))
+    request = SimulateRequest(
+        txn_groups=[SimulateRequestTransactionGroup(txns=[transaction.SignedTransaction(t, None) for t in grouped])],
+        allow_empty_signatures=True,
+        extra_opcode_budget=extra_budget,
+    )
+    return client.simulate_transactions(request)["txn-groups"][0]
+
+
+def _algod_app_calls(results):
+    """App calls among algod simulate txn results, inner ones included, and whether any created an app."""
+    calls, created = 0, False
+    for entry in results:
+        txn = entry["txn"]["txn"]
+        if txn.get("type") == "appl":
+            calls += 1
+            created = created or not txn.get("apid")
+        inner, inner_created = _algod_app_calls(entry.get("inner-txns", []))
+        calls, created = calls + inner, created or inner_created
+    return calls, created
+
+
+def pad_algosdk(txns, app_id, params, cost=None, client=None):
+    """Unsigned algosdk transactions plus opup calls, ungrouped; assign a group ID before signing.
+
+    Give the group's opcode `cost`, or an AlgodClient to measure it with simulate.
+    """
+    import copy
+
+    from algosdk import transaction
+
+    from .assemble import method_selector
+
+    lead = _lead(txns, app_id)
+    fee = lead.fee
+    min_fee = params.min_fee or MIN_TXN_FEE
+
+    def padded(count):
+        lead.fee = fee + count * min_fee
+        sp = copy.copy(params)
+        sp.flat_fee, sp.fee = True, 0
+        return list(txns) + [
+            transaction.ApplicationNoOpTxn(lead.sender, sp, app_id, app_args=[method_selector(OPUP)],
+                                           note=b"opup %d" % i)
+            for i in range(count)
+        ]
+
+    if client is None:
+        count = padding(cost, sum(1 for t in txns if isinstance(t, transaction.ApplicationCallTxn)))
+        if len(txns) + count > MAX_GROUP_SIZE:
+            raise ValueError(f"{len(txns)} transactions need {count} padding calls, over the group limit")
+        return padded(count)
+    result = _simulate_algod(client, txns, EXTRA_OPCODE_BUDGET)
+    if result.get("failure-message"):
+        raise RuntimeError(f"group fails in simulate: {result['failure-message']}")
+    calls, _ = _algod_app_calls(result["txn-results"])
+    count = padding_for(result["app-budget-consumed"] - APP_CALL_BUDGET * calls)
+    while True:
+        group = padded(count)
+        result = _simulate_algod(client, group)
+        _, created = _algod_app_calls(result["txn-results"]) if not result.get("failure-message") else (0, True)
+        if not created:
+            return group
+        if len(group) >= MAX_GROUP_SIZE:
+            raise RuntimeError(f"group fails in simulate: {result.get('failure-message', 'out of budget')}")
+        count += 1
@@ -0,0 +1,389 @@
+"""
+Single build entry point for every PyTeal contract in the repo.
+
+    python -m tools.build                 # build everything that changed
+    python -m tools.build trust_score     # build one contract
+    python -m tools.build contracts/trust_score.py     # the same, by source file
+    python -m tools.build --force         # ignore the cache
+
+Each contract's approval/clear pair is compiled in a worker process and
+written next to its source module (contracts/trust_score.py ->
+contracts/trust_score.teal + contracts/trust_score.clear.teal), which is
+where the deploy scripts already look for it. The TEAL is then assembled
+offline (tools/assemble.py) into .tok bytecode plus a .compiled.json that
+mirrors algod's compile response, so deploys need no /v2/teal/compile call.
+For v8 contracts the method/OnCompletion dispatch chains PyTeal emits are
+rewritten into `match`/`switch` first (tools/lower.py), and --cse caches
+repeated state reads and arithmetic in scratch slots (tools/cse.py). Each
+approval program also gets a source map (contracts/trust_score.teal.map,
+tools/sourcemap.py) from its TEAL lines back to the PyTeal source lines,
+which tools/heatmap.py uses to charge executed opcodes to source.
+Programs with template variables (TMPL_*, defaults in the module's
+TEMPLATE_VARIABLES) are assembled with the defaults filled in, and the
+.compiled.json also records the placeholder bytecode and each variable's
+offset so deploys can patch in other values (tools/template.py). It also
+records the state schema to request at deploy, which a contract can derive
+from its declared state keys (state_schema).
+Pass --app-id NAME=ID to also record a deployed app's address.
+
+Artifacts are keyed on a hash of the contract source (plus any local
+modules it imports), the PyTeal version, the TEAL version and the build
+pipeline itself. A contract whose key and outputs are unchanged is skipped
+without importing PyTeal at all, so a warm no-op build is just a handful
+of file hashes.
+"""
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from importlib import metadata
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ROOT, ".build-cache")
+MANIFEST_PATH = os.path.join(CACHE_DIR, "manifest.json")
+
+# Bump when the artifact format changes so every cache entry is invalidated.
+BUILD_FORMAT = 4
+
+
+@dataclass(frozen=True)
+class Contract:
+    name: str
+    source: str      # path relative to ROOT
+    version: int     # TEAL version
+    global_schema: tuple = (0, 0)   # (uints, byte slices) requested at deploy
+    local_schema: tuple = (0, 0)
+
+    @property
+    def module(self):
+        return self.source[:-3].replace("/", ".")
+
+    @property
+    def approval_path(self):
+        return self.source[:-3] + ".teal"
+
+    @property
+    def clear_path(self):
+        return self.source[:-3] + ".clear.teal"
+
+    @property
+    def compiled_path(self):
+        return self.source[:-3] + ".compiled.json"
+
+    @property
+    def map_path(self):
+        return self.approval_path + ".map"
+
+
+_SCHEMA_SLOTS = {"uint64": 0, "bytes": 1}
+
+
+def state_schema(rel, name):
+    """(uints, byte slices) for the {key: "uint64" | "bytes"} dict `name` in `rel`.
+
+    The module is parsed, not imported, so this stays PyTeal-free; keys may
+    be string literals or module-level string constants.
+    """
+    with open(os.path.join(ROOT, rel)) as f:
+        tree = ast.parse(f.read())
+    constants, state = {}, None
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            if isinstance(node.value, ast.Constant):
+                constants[node.targets[0].id] = node.value.value
+            elif node.targets[0].id == name:
+                state = node.value
+    if not isinstance(state, ast.Dict):
+        raise ValueError(f"{rel}: no {name} dict literal")
+    keys = [constants[k.id] if isinstance(k, ast.Name) else ast.literal_eval(k) for k in state.keys]
+    if len(set(keys)) != len(keys):
+        raise ValueError(f"{rel}: {name} repeats a key")
+    schema = [0, 0]
+    for value in state.values:
+        schema[_SCHEMA_SLOTS[ast.literal_eval(value)]] += 1
+    return tuple(schema)
+
+
+# Decay curve and half-life, the allowlist count, plus one key per
+# authorized caller app (MAX_AUTHORIZED_APPS in contracts/reputation.py).
+TRUST_GLOBAL_SCHEMA = (2 + 1 + 8, 0)
+
+CONTRACTS = {
+    c.name: c
+    for c in [
+        Contract("trust_score", "contracts/trust_score.py", 8, global_schema=TRUST_GLOBAL_SCHEMA, local_schema=(4, 0)),
+        Contract("trust_score_box", "contracts/trust_score_box.py", 8, global_schema=TRUST_GLOBAL_SCHEMA),
+        Contract("asset_escrow", "contracts/asset_escrow.py", 8,
+                 global_schema=state_schema("contracts/asset_escrow.py", "GLOBAL_STATE"),
+                 local_schema=state_schema("contracts/asset_escrow.py", "LOCAL_STATE")),
+        Contract("commute_checkin", "contracts/commute_checkin.py", 8,
+                 global_schema=state_schema("contracts/commute_checkin.py", "GLOBAL_STATE"),
+                 local_schema=state_schema("contracts/commute_checkin.py", "LOCAL_STATE")),
+        Contract("marketplace_contract", "contracts/marketplace_contract.py", 8),
+        Contract("civic_rewards", "contracts/civic_rewards.py", 8),
+        Contract("match_payout", "algorand/contract.py", 8, global_schema=(2, 1)),
+    ]
+}
+
+# Modules whose code changes what we emit; editing them invalidates the cache.
+PIPELINE_MODULES = [
+    "tools/build.py", "tools/teal.py", "tools/assemble.py", "tools/lower.py", "tools/cse.py", "tools/cfg.py",
+    "tools/sourcemap.py", "tools/template.py",
+]
+
+
+def contract_name(arg):
+    """The contract named `arg`, or whose source file `arg` is (contracts/trust_score.py)."""
+    if arg in CONTRACTS:
+        return arg
+    rel = os.path.relpath(os.path.abspath(arg), ROOT).replace(os.sep, "/")
+    return next((c.name for c in CONTRACTS.values() if c.source == rel), arg)
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _read(rel):
+    with open(os.path.join(ROOT, rel), "rb") as f:
+        return f.read()
+
+
+def _local_imports(rel):
+    """Repo-local modules imported by `rel`, e.g. contracts/dispatch.py."""
+    tree = ast.parse(_read(rel), filename=rel)
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module] + [f"{node.module}.{a.name}" for a in node.names]
+        else:
+            continue
+        for name in names:
+            candidate = name.replace(".", "/") + ".py"
+            if os.path.isfile(os.path.join(ROOT, candidate)):
+                found.append(candidate)
+    return found
+
+
+def source_closure(rel):
+    """`rel` plus every repo-local module it (transitively) imports."""
+    seen = []
+    pending = [rel]
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.append(path)
+        pending.extend(_local_imports(path))
+    return sorted(seen)
+
+
+def pyteal_version():
+    try:
+        return metadata.version("pyteal")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def cache_key(contract, options):
+    h = hashlib.sha256()
+    h.update(f"format={BUILD_FORMAT}\n".encode())
+    h.update(f"pyteal={pyteal_version()}\n".encode())
+    h.update(f"teal={contract.version}\n".encode())
+    h.update(f"options={json.dumps(options, sort_keys=True)}\n".encode())
+    for rel in source_closure(contract.source) + PIPELINE_MODULES:
+        h.update(rel.encode() + b"\0" + _read(rel) + b"\0")
+    return h.hexdigest()
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def is_fresh(contract, key, entry):
+    """True when the cached entry matches `key` and its outputs are untouched."""
+    if not entry or entry.get("key") != key:
+        return False
+    for rel, digest in entry.get("outputs", {}).items():
+        try:
+            if _sha256(_read(rel)) != digest:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def compile_contract(contract, options):
+    """Worker: compile and assemble one contract.
+
+    Returns ({relative path: text or bytes}, CSE report or None).
+    """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from pyteal import Mode, compileTeal
+    from tools.assemble import app_address, assemble
+    from tools.lower import lower_dispatch
+    from tools.sourcemap import compile_mapped, dump, remap
+    from tools.template import Template
+
+    module = importlib.import_module(contract.module)
+    sources = [rel for rel in source_closure(contract.source) if not rel.startswith("tools/")]
+    emitted, lines = compile_mapped(module.approval_program, contract.version, ROOT, sources)
+    approval = lower_dispatch(emitted)
+    lines = remap(emitted, approval, lines)
+    clear = compileTeal(module.clear_state_program(), mode=Mode.Application, version=contract.version)
+    report = None
+    if options.get("cse"):
+        from tools.cse import compare, eliminate, format_report
+
+        optimized, rewritten = eliminate(approval)
+        report = format_report(contract.name, compare(approval, optimized), rewritten)
+        lines = remap(approval, optimized, lines)
+        approval = optimized
+
+    outputs = {contract.approval_path: approval, contract.clear_path: clear,
+               contract.map_path: dump(lines, contract.approval_path)}
+    compiled = {}
+    defaults = getattr(module, "TEMPLATE_VARIABLES", {})
+    for role, path, text in (("approval", contract.approval_path, approval), ("clear", contract.clear_path, clear)):
+        program = assemble(text, defaults)
+        outputs[path[:-5] + ".tok"] = program.bytecode
+        compiled[role] = dict(program.compile_response(), size=len(program.bytecode),
+                              sourceHash=_sha256(text.encode()))
+        if program.templates:
+            template = Template.from_assembled(assemble(text), defaults)
+            if template.patch() != program.bytecode:
+                raise RuntimeError(f"{contract.name}: patching the {role} template does not reproduce its bytecode")
+            compiled[role]["template"] = template.to_json()
+    compiled["schema"] = dict(zip(("globalInts", "globalBytes", "localInts", "localBytes"),
+                                  contract.global_schema + contract.local_schema))
+    if options.get("app_id") is not None:
+        compiled["appId"] = options["app_id"]
+        compiled["appAddress"] = app_address(options["app_id"])
+    outputs[contract.compiled_path] = json.dumps(compiled, indent=2) + "\n"
+    return outputs, report
+
+
+def _write_outputs(outputs):
+    digests = {}
+    for rel, text in outputs.items():
+        data = text.encode() if isinstance(text, str) else text
+        path = os.path.join(ROOT, rel)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        digests[rel] = _sha256(data)
+    return digests
+
+
+def build(names=None, force=False, jobs=None, app_ids=None, cse=False, log=print):
+    """Build the named contracts (default: all). Returns {name: "built"|"cached"}.
+
+    With `cse`, repeated state reads and arithmetic are cached in scratch
+    (tools/cse.py) and the before/after cost of each changed method is logged.
+    """
+    app_ids = app_ids or {}
+    targets = [CONTRACTS[n] for n in (names or CONTRACTS)]
+    manifest = load_manifest()
+    status = {}
+
+    stale = []
+    for contract in targets:
+        options = {"app_id": app_ids.get(contract.name)}
+        if cse:
+            options["cse"] = True
+        key = cache_key(contract, options)
+        if not force and is_fresh(contract, key, manifest.get(contract.name)):
+            status[contract.name] = "cached"
+        else:
+            stale.append((contract, key, options))
+
+    def finish(contract, key, result, elapsed):
+        outputs, report = result
+        manifest[contract.name] = {"key": key, "outputs": _write_outputs(outputs)}
+        status[contract.name] = "built"
+        log(f"built   {contract.name:<22} {elapsed:6.2f}s")
+        if report:
+            log(report)
+
+    if len(stale) == 1:
+        contract, key, options = stale[0]
+        start = time.perf_counter()
+        finish(contract, key, compile_contract(contract, options), time.perf_counter() - start)
+    elif stale:
+        workers = min(len(stale), jobs or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            futures = [(c, k, pool.submit(compile_contract, c, o)) for c, k, o in stale]
+            for contract, key, future in futures:
+                finish(contract, key, future.result(), time.perf_counter() - start)
+
+    for contract in targets:
+        if status[contract.name] == "cached":
+            log(f"cached  {contract.name}")
+
+    if stale:
+        save_manifest(manifest)
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile PyTeal contracts to TEAL.")
+    parser.add_argument("contracts", nargs="*", metavar="NAME",
+                        help="contracts to build, by name or source file (default: all)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is fresh")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="worker processes")
+    parser.add_argument("--app-id", action="append", default=[], metavar="NAME=ID",
+                        help="record the address of a deployed app (repeatable)")
+    parser.add_argument("--cse", action="store_true",
+                        help="cache repeated state reads/arithmetic in scratch and report the savings")
+    parser.add_argument("--list", action="store_true", help="list known contracts and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for c in CONTRACTS.values():
+            print(f"{c.name:<22} v{c.version}  {c.source}")
+        return 0
+
+    app_ids = {}
+    for item in args.app_id:
+        name, _, app_id = item.partition("=")
+        if not app_id.isdigit():
+            parser.error(f"--app-id expects NAME=ID, got {item!r}")
+        app_ids[name] = int(app_id)
+
+    args.contracts = [contract_name(arg) for arg in args.contracts]
+    unknown = [n for n in list(args.contracts) + list(app_ids) if n not in CONTRACTS]
+    if unknown:
+        parser.error(f"unknown contract(s): {', '.join(unknown)}")
+
+    start = time.perf_counter()
+    status = build(args.contracts or None, force=args.force, jobs=args.jobs, app_ids=app_ids, cse=args.cse)
+    built = sum(1 for s in status.values() if s == "built")
+    print(f"{built} built, {len(status) - built} cached in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
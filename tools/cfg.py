@@ -0,0 +1,269 @@
+"""
+Control-flow graph over parsed TEAL, plus detection of the dispatch
+branches PyTeal's `Cond` produces for each contract method (either as
+compare/bnz chains or lowered to match/switch by tools/lower.py).
+"""
+from dataclasses import dataclass, field
+
+from .assemble import method_selector
+from .teal import BRANCHES, TERMINATORS, is_template, parse_bytes, parse_int
+
+ON_COMPLETION_NAMES = {
+    0: "no_op", 1: "opt_in", 2: "close_out", 3: "clear_state", 4: "update", 5: "delete",
+}
+
+
+@dataclass
+class Block:
+    index: int
+    start: int                      # first instruction index
+    end: int                        # one past the last instruction index
+    succs: list = field(default_factory=list)
+    calls: list = field(default_factory=list)    # subroutine entry blocks called from here
+
+    def instrs(self, program):
+        return program.instrs[self.start:self.end]
+
+
+class CFG:
+    def __init__(self, program):
+        self.program = program
+        self.blocks = []
+        self.block_at = {}          # instruction index -> block starting there
+        self._build()
+
+    def _build(self):
+        program = self.program
+        instrs = program.instrs
+        leaders = {0}
+        for i, instr in enumerate(instrs):
+            if instr.labels:
+                leaders.add(i)
+            if instr.op in BRANCHES or instr.op in TERMINATORS:
+                leaders.add(i + 1)
+        leaders = sorted(x for x in leaders if x < len(instrs))
+        for n, start in enumerate(leaders):
+            end = leaders[n + 1] if n + 1 < len(leaders) else len(instrs)
+            block = Block(n, start, end)
+            self.blocks.append(block)
+            self.block_at[start] = block
+
+        for block in self.blocks:
+            last = instrs[block.end - 1]
+            targets = [self.block_for_label(l) for l in _label_args(last)]
+            if last.op == "callsub":
+                block.calls = targets
+                targets = []
+            falls_through = last.op not in TERMINATORS
+            if falls_through and block.end < len(instrs):
+                targets.append(self.block_at[block.end])
+            for target in targets:
+                if target is not None and target not in block.succs:
+                    block.succs.append(target)
+
+    def block_for_label(self, label):
+        index = self.program.labels[label]
+        return self.block_at.get(index)
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def reachable(self, start):
+        """Blocks reachable from `start`, following subroutine calls."""
+        seen = {start.index: start}
+        stack = [start]
+        while stack:
+            block = stack.pop()
+            for nxt in block.succs + block.calls:
+                if nxt.index not in seen:
+                    seen[nxt.index] = nxt
+                    stack.append(nxt)
+        return [seen[i] for i in sorted(seen)]
+
+    def sccs(self):
+        """Strongly connected components (Tarjan), as lists of blocks."""
+        index = {}
+        low = {}
+        on_stack = set()
+        stack = []
+        out = []
+        counter = [0]
+
+        def visit(root):
+            work = [(root, iter(root.succs))]
+            index[root.index] = low[root.index] = counter[0]
+            counter[0] += 1
+            stack.append(root)
+            on_stack.add(root.index)
+            while work:
+                block, it = work[-1]
+                advanced = False
+                for nxt in it:
+                    if nxt.index not in index:
+                        index[nxt.index] = low[nxt.index] = counter[0]
+                        counter[0] += 1
+                        stack.append(nxt)
+                        on_stack.add(nxt.index)
+                        work.append((nxt, iter(nxt.succs)))
+                        advanced = True
+                        break
+                    if nxt.index in on_stack:
+                        low[block.index] = min(low[block.index], index[nxt.index])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent.index] = min(low[parent.index], low[block.index])
+                if low[block.index] == index[block.index]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member.index)
+                        component.append(member)
+                        if member is block:
+                            break
+                    out.append(component)
+
+        for block in self.blocks:
+            if block.index not in index:
+                visit(block)
+        return out
+
+
+def _label_args(instr):
+    if instr.op in ("bnz", "bz", "b", "callsub"):
+        return instr.args[:1]
+    if instr.op in ("switch", "match"):
+        return list(instr.args)
+    return []
+
+
+@dataclass
+class Entry:
+    name: str           # method name, e.g. "borrow", or an OnCompletion name
+    kind: str           # "method" or "on_completion"
+    label: str
+    test_block: Block   # block holding the comparison that selects this entry
+    block: Block        # first block of the handler
+
+
+def _const_value(instr):
+    """Value pushed by a constant-producing instruction, or None (also for template variables)."""
+    if instr.args and is_template(instr.args[0]):
+        return None
+    if instr.op in ("int", "pushint") and len(instr.args) == 1:
+        return parse_int(instr.args[0], instr.line)
+    if instr.op in ("byte", "pushbytes"):
+        return parse_bytes(instr.args, instr.line)[0]
+    if instr.op == "method":
+        return method_selector(parse_bytes(instr.args, instr.line)[0].decode())
+    return None
+
+
+def _display(value):
+    if isinstance(value, bytes):
+        try:
+            text = value.decode()
+            if text.isprintable():
+                return text
+        except UnicodeDecodeError:
+            pass
+        return "0x" + value.hex()
+    return str(value)
+
+
+def _dispatch_subject(instr):
+    if instr.op == "txna" and instr.args == ["ApplicationArgs", "0"]:
+        return "method"
+    if instr.op == "txn" and instr.args == ["OnCompletion"]:
+        return "on_completion"
+    if instr.op == "txn" and instr.args == ["ApplicationID"]:
+        return "create"
+    return None
+
+
+def _const_name(instr):
+    if instr.op == "method":
+        return parse_bytes(instr.args, instr.line)[0].decode().split("(", 1)[0]
+    return _display(_const_value(instr))
+
+
+def _multiway_entries(cfg, i):
+    """Entries for `subject; switch ...` or `consts...; subject; match ...` at instruction i."""
+    instrs = cfg.program.instrs
+    br = instrs[i]
+    if br.op not in ("switch", "match") or i == 0:
+        return []
+    subject = _dispatch_subject(instrs[i - 1])
+    if subject not in ("method", "on_completion"):
+        return []
+    test_block = next(blk for blk in cfg.blocks if blk.start <= i < blk.end)
+    out = []
+    if br.op == "switch":
+        if subject != "on_completion":
+            return []
+        for value, label in enumerate(br.args):
+            if value in ON_COMPLETION_NAMES and cfg.program.labels[label] != i + 1:  # not the fallthrough
+                out.append(Entry(ON_COMPLETION_NAMES[value], "on_completion", label, test_block,
+                                 cfg.block_for_label(label)))
+        return out
+    consts = instrs[i - 1 - len(br.args):i - 1]
+    if len(consts) != len(br.args) or any(_const_value(c) is None for c in consts):
+        return []
+    for const, label in zip(consts, br.args):
+        if subject == "method":
+            out.append(Entry(_const_name(const), "method", label, test_block, cfg.block_for_label(label)))
+        else:
+            value = _const_value(const)
+            out.append(Entry(ON_COMPLETION_NAMES.get(value, str(value)), "on_completion", label,
+                             test_block, cfg.block_for_label(label)))
+    return out
+
+
+def find_entries(cfg):
+    """Handlers selected by `subject == const; bnz label` tests or by match/switch, in program order."""
+    program = cfg.program
+    instrs = program.instrs
+    entries = []
+    for i in range(len(instrs)):
+        multiway = _multiway_entries(cfg, i)
+        if multiway:
+            # A label reached from an earlier arm (a selector) keeps that name;
+            # later arms for it are overloads or legacy aliases.
+            named = {e.label for e in entries}
+            for e in multiway:
+                if e.label not in named:
+                    named.add(e.label)
+                    entries.append(e)
+            continue
+        if i + 3 >= len(instrs):
+            continue
+        a, b, eq, br = instrs[i:i + 4]
+        if eq.op != "==" or br.op != "bnz":
+            continue
+        subject, const = _dispatch_subject(a), b
+        if subject is None:
+            subject, const = _dispatch_subject(b), a
+        value = _const_value(const) if subject else None
+        if value is None:
+            continue
+        target = cfg.block_for_label(br.args[0])
+        test_block = next(blk for blk in cfg.blocks if blk.start <= i < blk.end)
+        if subject == "method":
+            entries.append(Entry(_const_name(const), "method", br.args[0], test_block, target))
+        elif subject == "on_completion":
+            entries.append(Entry(ON_COMPLETION_NAMES.get(value, str(value)), "on_completion",
+                                 br.args[0], test_block, target))
+        elif value == 0:
+            entries.append(Entry("create", "on_completion", br.args[0], test_block, target))
+
+    # A handler that only dispatches further (the NoOp branch) is a router, not a method.
+    routers = {e.test_block.index for e in entries if e.kind == "method"}
+    entries = [e for e in entries if not (e.kind == "on_completion" and e.block.index in routers)]
+    # A method-name test inside a handler is an ordinary `If`, not dispatch.
+    methods = [e for e in entries if e.kind == "method"]
+    nested = {id(e) for e in methods for h in methods
+              if h.label != e.label and e.test_block in cfg.reachable(h.block)}
+    return [e for e in entries if id(e) not in nested]
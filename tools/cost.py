@@ -0,0 +1,301 @@
+"""
+Static opcode-cost and program-size report for every contract method.
+
+    python -m tools.cost                       # table for all contracts
+    python -m tools.cost asset_escrow --json cost.json
+    python -m tools.cost contracts/foo.teal    # any TEAL file
+
+For each Cond dispatch branch (ABI-less method or OnCompletion handler) it
+walks the compiled TEAL control-flow graph and reports:
+
+  cost      worst-case opcode cost of a successful call, including the
+            dispatch compares needed to reach the method
+  inner     worst-case number of inner transactions issued
+  bytes     bytecode reachable from the method's handler
+  calls     app calls that must be pooled in the group to cover `cost`
+
+Paths ending in `err` are ignored (the call fails anyway). Loops have no
+static bound, so every block inside a loop is charged --loop-bound times;
+treat the numbers for looping methods as an upper bound.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+from dataclasses import asdict, dataclass
+
+from .assemble import assemble_program
+from .cfg import CFG, find_entries
+from .teal import OPS, TERMINATORS, parse
+
+APP_CALL_BUDGET = 700
+MAX_PROGRAM_PAGE = 2048     # approval + clear bytes per page
+MAX_EXTRA_PAGES = 3
+DEFAULT_LOOP_BOUND = 16
+
+_PSEUDO_COST = {"int": 1, "byte": 1, "addr": 1, "method": 1}
+_NEG_INF = float("-inf")
+
+
+def op_cost(instr):
+    if instr.op in _PSEUDO_COST:
+        return _PSEUDO_COST[instr.op]
+    name = instr.op
+    if name in ("txn", "itxn", "gtxns") and len(instr.args) == 2:
+        name = "gtxnsa" if name == "gtxns" else name.replace("txn", "txna")
+    if name in ("gtxn", "gitxn") and len(instr.args) == 3:
+        name += "a"
+    return OPS[name].cost
+
+
+def inner_count(instr):
+    return 1 if instr.op in ("itxn_begin", "itxn_next") else 0
+
+
+@dataclass
+class MethodCost:
+    name: str
+    kind: str
+    cost: int
+    dispatch: int
+    inner: int
+    bytes: int
+    calls: int
+    loops: bool
+
+    @property
+    def budget_pct(self):
+        return 100.0 * self.cost / APP_CALL_BUDGET
+
+
+@dataclass
+class ProgramReport:
+    name: str
+    source: str
+    approval_bytes: int
+    clear_bytes: int
+    methods: list
+
+    @property
+    def extra_pages(self):
+        return max(0, math.ceil((self.approval_bytes + self.clear_bytes) / MAX_PROGRAM_PAGE) - 1)
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "source": self.source,
+            "approval_bytes": self.approval_bytes,
+            "clear_bytes": self.clear_bytes,
+            "extra_pages": self.extra_pages,
+            "methods": [dict(asdict(m), budget_pct=round(m.budget_pct, 1)) for m in self.methods],
+        }
+
+
+class Analyzer:
+    """Worst-case path metrics over a program's CFG."""
+
+    def __init__(self, program, loop_bound=DEFAULT_LOOP_BOUND):
+        self.program = program
+        self.cfg = CFG(program)
+        self.loop_bound = loop_bound
+        assembled = assemble_program(program)
+        ends = assembled.pcs[1:] + [len(assembled.bytecode)]
+        self.sizes = [end - pc for pc, end in zip(assembled.pcs, ends)]
+        self.bytecode_len = len(assembled.bytecode)
+
+        self.scc_of = {}
+        self.cyclic = set()
+        self.components = self.cfg.sccs()
+        for n, component in enumerate(self.components):
+            for block in component:
+                self.scc_of[block.index] = n
+            if len(component) > 1 or component[0] in component[0].succs:
+                self.cyclic.add(n)
+        self._sub_cache = {}
+
+    # -- per-block metrics -------------------------------------------------
+
+    def _block_metrics(self, block):
+        instrs = block.instrs(self.program)
+        cost = sum(op_cost(i) for i in instrs)
+        inner = sum(inner_count(i) for i in instrs)
+        for callee in block.calls:
+            sub_cost, sub_inner = self.subroutine(callee)
+            cost += sub_cost
+            inner += sub_inner
+        return cost, inner
+
+    def _ending(self, component):
+        """How paths may end inside a component: 'ok', 'sub' (retsub) or None."""
+        ops = {self.program.instrs[b.end - 1].op for b in component}
+        ends = set()
+        if "return" in ops:
+            ends.add("ok")
+        if "retsub" in ops:
+            ends.add("sub")
+        for b in component:
+            last = self.program.instrs[b.end - 1].op
+            if not b.succs and last not in TERMINATORS:
+                ends.add("ok")      # fell off the end of the program
+        return ends
+
+    def _component_metrics(self, n):
+        component = self.components[n]
+        totals = [self._block_metrics(b) for b in component]
+        cost = sum(c for c, _ in totals)
+        inner = sum(i for _, i in totals)
+        if n in self.cyclic:
+            cost *= self.loop_bound
+            inner *= self.loop_bound
+        return cost, inner
+
+    def _longest(self, start, end_kind):
+        """Max (cost, inner) over paths from `start` that end with `end_kind`."""
+        memo = {}
+
+        def walk(n):
+            if n in memo:
+                return memo[n]
+            memo[n] = (_NEG_INF, _NEG_INF)  # guards against re-entry; SCCs form a DAG
+            cost, inner = self._component_metrics(n)
+            best_cost = best_inner = _NEG_INF
+            if end_kind in self._ending(self.components[n]):
+                best_cost, best_inner = 0, 0
+            succs = {self.scc_of[s.index] for b in self.components[n] for s in b.succs} - {n}
+            for m in succs:
+                c, i = walk(m)
+                best_cost = max(best_cost, c)
+                best_inner = max(best_inner, i)
+            memo[n] = (cost + best_cost, inner + best_inner)
+            return memo[n]
+
+        return walk(self.scc_of[start.index])
+
+    def subroutine(self, entry):
+        if entry.index not in self._sub_cache:
+            self._sub_cache[entry.index] = (0, 0)   # recursion: count the body once
+            cost, inner = self._longest(entry, "sub")
+            self._sub_cache[entry.index] = (max(cost, 0), max(inner, 0))
+        return self._sub_cache[entry.index]
+
+    def _prefix_cost(self, target):
+        """Worst-case cost from program entry up to and including `target`."""
+        best = {}
+        order = self.cfg.blocks   # PyTeal lays dispatch chains out top to bottom
+        best[self.cfg.entry.index] = self._block_metrics(self.cfg.entry)[0]
+        for block in order:
+            if block.index not in best:
+                continue
+            for nxt in block.succs:
+                if nxt.start <= block.start:
+                    continue    # ignore back edges; dispatch never loops
+                cost = best[block.index] + self._block_metrics(nxt)[0]
+                if cost > best.get(nxt.index, _NEG_INF):
+                    best[nxt.index] = cost
+        return best.get(target.index, 0)
+
+    def _bytes_from(self, block):
+        return sum(self.sizes[i] for b in self.cfg.reachable(block) for i in range(b.start, b.end))
+
+    def _loops_from(self, block):
+        return any(self.scc_of[b.index] in self.cyclic for b in self.cfg.reachable(block))
+
+    def methods(self):
+        out = []
+        for entry in find_entries(self.cfg):
+            dispatch = self._prefix_cost(entry.test_block)
+            body_cost, inner = self._longest(entry.block, "ok")
+            if body_cost == _NEG_INF:
+                body_cost, inner = 0, 0     # handler always fails (e.g. rejected updates)
+            cost = dispatch + body_cost
+            out.append(MethodCost(
+                name=entry.name,
+                kind=entry.kind,
+                cost=cost,
+                dispatch=dispatch,
+                inner=inner,
+                bytes=self._bytes_from(entry.block),
+                calls=max(1, math.ceil(cost / APP_CALL_BUDGET)),
+                loops=self._loops_from(entry.block),
+            ))
+        return out
+
+
+def analyze_teal(name, path, clear_path=None, loop_bound=DEFAULT_LOOP_BOUND):
+    with open(path) as f:
+        analyzer = Analyzer(parse(f.read()), loop_bound)
+    clear_bytes = 0
+    if clear_path and os.path.exists(clear_path):
+        with open(clear_path) as f:
+            clear_bytes = len(assemble_program(parse(f.read())).bytecode)
+    return ProgramReport(name, os.path.relpath(path), analyzer.bytecode_len, clear_bytes, analyzer.methods())
+
+
+def analyze_contracts(names=None, loop_bound=DEFAULT_LOOP_BOUND):
+    from .build import CONTRACTS, ROOT, build
+
+    build(names, log=lambda *_: None)
+    reports = []
+    for name in names or CONTRACTS:
+        contract = CONTRACTS[name]
+        reports.append(analyze_teal(
+            name,
+            os.path.join(ROOT, contract.approval_path),
+            os.path.join(ROOT, contract.clear_path),
+            loop_bound,
+        ))
+    return reports
+
+
+def format_table(reports):
+    lines = []
+    header = f"{'contract':<22} {'method':<18} {'cost':>6} {'budget':>7} {'dispatch':>8} {'inner':>5} {'bytes':>6} {'calls':>5}"
+    lines.append(header)
+    lines.append("-" * len(header))
+    for report in reports:
+        for m in report.methods:
+            flag = "*" if m.loops else " "
+            lines.append(
+                f"{report.name:<22} {m.name:<18} {m.cost:>5}{flag} {m.budget_pct:>6.1f}% "
+                f"{m.dispatch:>8} {m.inner:>5} {m.bytes:>6} {m.calls:>5}"
+            )
+        total = report.approval_bytes + report.clear_bytes
+        lines.append(
+            f"{report.name:<22} {'(program)':<18} approval {report.approval_bytes} B + clear "
+            f"{report.clear_bytes} B = {total}/{MAX_PROGRAM_PAGE * (1 + report.extra_pages)} B, "
+            f"{report.extra_pages} extra page(s)"
+        )
+    if any(m.loops for r in reports for m in r.methods):
+        lines.append("* contains a loop; cost assumes every loop block runs --loop-bound times")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-method opcode cost and size report.")
+    parser.add_argument("targets", nargs="*", help="contract names or .teal files (default: all contracts)")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("--loop-bound", type=int, default=DEFAULT_LOOP_BOUND,
+                        help=f"iterations charged per loop (default {DEFAULT_LOOP_BOUND})")
+    args = parser.parse_args(argv)
+
+    files = [t for t in args.targets if t.endswith(".teal")]
+    names = [t for t in args.targets if not t.endswith(".teal")]
+    reports = []
+    if names or not files:
+        reports += analyze_contracts(names or None, args.loop_bound)
+    for path in files:
+        reports.append(analyze_teal(os.path.basename(path)[:-5], path, loop_bound=args.loop_bound))
+
+    print(format_table(reports))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([r.to_json() for r in reports], f, indent=2)
+    over = [(r.name, m.name) for r in reports for m in r.methods if m.cost > APP_CALL_BUDGET]
+    if over:
+        print("\nover the single-call budget: " + ", ".join(f"{r}.{m}" for r, m in over))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
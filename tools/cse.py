@@ -0,0 +1,319 @@
+"""
+Common-subexpression elimination over compiled TEAL, with a cost report.
+
+    python -m tools.cse                    # before/after cost for every contract
+    python -m tools.cse asset_escrow
+    python -m tools.build --cse            # write optimized TEAL
+
+PyTeal compiles every occurrence of an expression separately, so
+
+    App.localGet(borrower, collateral_key) > Int(0)
+    ... TxnField.amount: App.localGet(borrower, collateral_key)
+
+reads local state twice. This pass finds runs of instructions that compute
+one value from nothing but constants, transaction fields, arithmetic and
+state reads (`txna ApplicationArgs 1; byte "collateral"; app_local_get`),
+and where the same run appears again at a point the first one dominates,
+with nothing on the way that could change it, it keeps the first run,
+saves its result with `dup; store N` and replaces the others with
+`load N`. A state read is invalidated by a write to the same kind of
+state, a scratch load by a store to its slot, and anything by `callsub`.
+
+A run is only rewritten when it saves opcodes: (uses - 1) * (cost - 1)
+must exceed the two opcodes spent saving it. Scratch slots are taken from
+255 downwards; PyTeal allocates from 0 up.
+"""
+import argparse
+import sys
+
+from .cfg import CFG
+from .cost import Analyzer, op_cost
+from .teal import OPS, Instr, parse
+
+FIRST_SLOT = 255
+
+_CONSTANTS = {"int", "byte", "addr", "method", "pushint", "pushbytes",
+              "intc", "intc_0", "intc_1", "intc_2", "intc_3",
+              "bytec", "bytec_0", "bytec_1", "bytec_2", "bytec_3"}
+_PURE = _CONSTANTS | {
+    "txn", "txna", "gtxn", "gtxna", "gtxns", "gtxnsa", "global",
+    "+", "-", "/", "*", "<", ">", "<=", ">=", "&&", "||", "==", "!=", "!", "%",
+    "|", "&", "^", "~", "len", "itob", "btoi", "concat", "substring", "substring3",
+    "getbyte", "getbit", "extract", "extract3", "extract_uint16", "extract_uint32",
+    "extract_uint64", "shl", "shr", "sqrt", "exp", "bitlen",
+    "sha256", "sha512_256", "keccak256",
+    "load", "app_local_get", "app_global_get", "balance",
+}
+_PSEUDO = {"int", "byte", "addr", "method"}
+
+# State a read depends on -> instructions that may change it.
+_KILLED_BY = {
+    "app_local_get": {"app_local_put", "app_local_del"},
+    "app_global_get": {"app_global_put", "app_global_del"},
+    "balance": {"itxn_submit"},
+}
+_VOLATILE_GLOBALS = {"OpcodeBudget"}
+
+
+def _pure(instr):
+    if instr.op not in _PURE:
+        return False
+    return not (instr.op == "global" and instr.args and instr.args[0] in _VOLATILE_GLOBALS)
+
+
+def _stack_effect(instr):
+    if instr.op in _PSEUDO:
+        return 0, 1
+    spec = OPS.get(instr.op)
+    if spec is None:
+        return None, None
+    pops, pushes = spec.pops, spec.pushes
+    if instr.op in ("txn", "txna", "gtxn", "gtxna", "gtxns", "gtxnsa"):
+        pushes = 1
+    return pops, pushes
+
+
+def _windows(instrs, block):
+    """(start, end) spans inside `block` that push one pure value and pop nothing."""
+    stack = []          # (start, end) of the run that produced each value, or None
+    out = []
+    for i in range(block.start, block.end):
+        instr = instrs[i]
+        pops, pushes = _stack_effect(instr)
+        if pops is None or pushes is None:
+            stack = []
+            continue
+        args = [stack.pop() if stack else None for _ in range(pops)][::-1]
+        if _pure(instr) and pushes == 1:
+            start = expected = args[0][0] if args and args[0] else i
+            for span in args:
+                if span is None or span[0] != expected:
+                    expected = None
+                    break
+                expected = span[1]
+            if expected == i:
+                stack.append((start, i + 1))
+                if i + 1 - start > 1:
+                    out.append((start, i + 1))
+                continue
+        stack.extend([None] * pushes)
+    return out
+
+
+def _kills(instrs, span):
+    """Instructions that invalidate a value computed by `instrs[span]`."""
+    ops = set()
+    for instr in instrs[span[0]:span[1]]:
+        ops |= _KILLED_BY.get(instr.op, set())
+    slots = {instr.args[0] for instr in instrs[span[0]:span[1]] if instr.op == "load"}
+    return ops, slots
+
+
+def _clobbers(instrs, start, end, kills):
+    ops, slots = kills
+    for instr in instrs[start:end]:
+        if instr.op in ops or instr.op in ("callsub", "stores"):
+            return True
+        if instr.op == "store" and instr.args[0] in slots:
+            return True
+    return False
+
+
+class _Flow:
+    """Dominators and path queries over a program's CFG."""
+
+    def __init__(self, program):
+        self.cfg = CFG(program)
+        blocks = self.cfg.blocks
+        self.block_of = {}
+        for block in blocks:
+            for i in range(block.start, block.end):
+                self.block_of[i] = block
+        self.preds = {b.index: [] for b in blocks}
+        roots = [self.cfg.entry]
+        for block in blocks:
+            for nxt in block.succs:
+                self.preds[nxt.index].append(block)
+            roots += block.calls
+        self.roots = {b.index for b in roots}
+        self.dom = self._dominators()
+
+    def _dominators(self):
+        blocks = self.cfg.blocks
+        every = {b.index for b in blocks}
+        dom = {b.index: ({b.index} if b.index in self.roots else set(every)) for b in blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks:
+                if block.index in self.roots:
+                    continue
+                preds = self.preds[block.index]
+                new = set.intersection(*(dom[p.index] for p in preds)) if preds else set()
+                new = new | {block.index}
+                if new != dom[block.index]:
+                    dom[block.index] = new
+                    changed = True
+        return dom
+
+    def dominates(self, a, b):
+        """Instruction index a executes before b on every path to b."""
+        ba, bb = self.block_of[a], self.block_of[b]
+        if ba is bb:
+            return a < b
+        return ba.index in self.dom[bb.index]
+
+    def _forward(self, starts):
+        seen = set()
+        stack = list(starts)
+        while stack:
+            block = stack.pop()
+            if block.index not in seen:
+                seen.add(block.index)
+                stack += block.succs
+        return seen
+
+    def _backward(self, starts):
+        seen = set()
+        stack = list(starts)
+        while stack:
+            block = stack.pop()
+            if block.index not in seen:
+                seen.add(block.index)
+                stack += self.preds[block.index]
+        return seen
+
+    def clean_path(self, instrs, def_end, use_start, kills):
+        """No instruction between def_end and use_start (on any path) clobbers `kills`."""
+        bd, bu = self.block_of[def_end - 1], self.block_of[use_start]
+        if bd is bu:
+            return not _clobbers(instrs, def_end, use_start, kills)
+        between = self._forward(bd.succs) & self._backward(self.preds[bu.index])
+        if bd.index in between or bu.index in between:
+            return False            # a loop around the definition or the use
+        if _clobbers(instrs, def_end, bd.end, kills) or _clobbers(instrs, bu.start, use_start, kills):
+            return False
+        blocks = {b.index: b for b in self.cfg.blocks}
+        return not any(_clobbers(instrs, blocks[n].start, blocks[n].end, kills) for n in between)
+
+
+def _groups(program, flow):
+    """Candidate rewrites: (saving, def span, [use spans]) for each repeated run."""
+    instrs = program.instrs
+    by_key = {}
+    for block in flow.cfg.blocks:
+        for span in _windows(instrs, block):
+            key = tuple(str(instr) for instr in instrs[span[0]:span[1]])
+            by_key.setdefault(key, []).append(span)
+
+    out = []
+    for key, spans in by_key.items():
+        if len(spans) < 2:
+            continue
+        cost = sum(op_cost(instr) for instr in instrs[spans[0][0]:spans[0][1]])
+        kills = _kills(instrs, spans[0])
+        groups = []         # [def span, use spans]
+        for span in sorted(spans):
+            for group in groups:
+                d = group[0]
+                if flow.dominates(d[1] - 1, span[0]) and flow.clean_path(instrs, d[1], span[0], kills):
+                    group[1].append(span)
+                    break
+            else:
+                groups.append([span, []])
+        for d, uses in groups:
+            saving = len(uses) * (cost - 1) - 2
+            if saving > 0:
+                out.append((saving, d, uses))
+    return out
+
+
+def _emit(program, instrs):
+    lines = [f"#pragma version {program.version}"]
+    for instr in instrs:
+        lines += [f"{label}:" for label in instr.labels]
+        lines.append(str(instr))
+    trailing = [label for label, index in program.labels.items() if index == len(program.instrs)]
+    lines += [f"{label}:" for label in trailing]
+    return "\n".join(lines)
+
+
+def _used_slots(program):
+    return {int(i.args[0]) for i in program.instrs if i.op in ("load", "store")}
+
+
+def eliminate(text):
+    """Return (optimized TEAL, number of runs rewritten)."""
+    program = parse(text)
+    if any(i.op in ("loads", "stores") for i in program.instrs):
+        return text, 0      # dynamic scratch access; slots can't be proven free
+    rewritten = 0
+    while True:
+        flow = _Flow(program)
+        candidates = _groups(program, flow)
+        free = [s for s in range(FIRST_SLOT, -1, -1) if s not in _used_slots(program)]
+        if not candidates or not free:
+            break
+        _, d, uses = max(candidates, key=lambda c: (c[0], -c[1][0]))
+        slot = str(free[0])
+        new = []
+        replace = {span[0]: span for span in uses}
+        i = 0
+        instrs = program.instrs
+        while i < len(instrs):
+            if i in replace:
+                span = replace[i]
+                new.append(Instr("load", [slot], instrs[i].line, instrs[i].labels))
+                i = span[1]
+                continue
+            new.append(instrs[i])
+            if i == d[1] - 1:
+                new.append(Instr("dup", [], instrs[i].line))
+                new.append(Instr("store", [slot], instrs[i].line))
+            i += 1
+        program = parse(_emit(program, new))
+        rewritten += 1
+    return (_emit(program, program.instrs) if rewritten else text), rewritten
+
+
+# -- report --------------------------------------------------------------------
+
+def compare(before_text, after_text):
+    """[(method, cost before, cost after)] for every dispatch entry."""
+    before = {m.name: m.cost for m in Analyzer(parse(before_text)).methods()}
+    after = {m.name: m.cost for m in Analyzer(parse(after_text)).methods()}
+    return [(name, cost, after.get(name, cost)) for name, cost in before.items()]
+
+
+def format_report(name, rows, rewritten):
+    lines = []
+    for method, before, after in rows:
+        if before != after:
+            lines.append(f"{name:<22} {method:<18} {before:>6} -> {after:<6} ({after - before:+d})")
+    if not lines:
+        lines.append(f"{name:<22} (no change)")
+    lines.append(f"{name:<22} {rewritten} expression(s) cached in scratch")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from .build import CONTRACTS, compile_contract
+
+    parser = argparse.ArgumentParser(description="Before/after opcode cost of the CSE pass.")
+    parser.add_argument("contracts", nargs="*", metavar="NAME", help="contracts (default: all)")
+    args = parser.parse_args(argv)
+    unknown = [n for n in args.contracts if n not in CONTRACTS]
+    if unknown:
+        parser.error(f"unknown contract(s): {', '.join(unknown)}")
+
+    for name in args.contracts or CONTRACTS:
+        contract = CONTRACTS[name]
+        outputs, _ = compile_contract(contract, {})     # in memory; artifacts are left alone
+        before = outputs[contract.approval_path]
+        after, rewritten = eliminate(before)
+        print(format_report(name, compare(before, after), rewritten))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
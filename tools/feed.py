@@ -0,0 +1,106 @@
+"""
+Transaction feeds in the Algorand indexer's JSON shape, shared by the
+off-chain indexes (tools/market_index.py, tools/loan_index.py).
+
+A feed is a sequence of transactions as `/v2/transactions` returns them,
+stored one per line (JSON lines) so it can be fetched once and replayed
+offline. Indexes apply a feed in chain order, i.e. by `chain_position`.
+"""
+import base64
+import json
+
+ON_COMPLETION = ["noop", "optin", "closeout", "clear", "update", "delete"]
+
+
+def chain_position(txn):
+    """(round, intra-round offset): a transaction's place in chain order."""
+    return txn["confirmed-round"], txn.get("intra-round-offset", 0)
+
+
+def encode_address(raw):
+    from algosdk import encoding
+
+    return encoding.encode_address(raw)
+
+
+def read_feed(*paths):
+    """Transactions from JSON-lines feed files, in file order."""
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_feed(path, txns):
+    with open(path, "a") as f:
+        for txn in txns:
+            f.write(json.dumps(txn, sort_keys=True) + "\n")
+
+
+def app_args(txn):
+    """Raw application args of an indexer-format app call."""
+    call = txn.get("application-transaction") or {}
+    return [base64.b64decode(a) for a in call.get("application-args", [])]
+
+
+def logs(txn):
+    return [base64.b64decode(entry) for entry in txn.get("logs", [])]
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError(f"bad cursor {cursor!r}") from None
+
+
+def avm_record(txn, round, offset, round_time=0, group=None):
+    """Indexer-style JSON for a transaction submitted to tools/avm.Ledger.
+
+    `group` stands in for the group ID; give every member of a group the same one.
+    """
+    record = {
+        "confirmed-round": round,
+        "intra-round-offset": offset,
+        "round-time": round_time,
+        "id": base64.b32encode(txn.txid).decode().rstrip("="),
+        "sender": encode_address(txn.sender),
+        "tx-type": txn.type,
+    }
+    if group is not None:
+        record["group"] = group
+    if txn.type == "axfer":
+        record["asset-transfer-transaction"] = {
+            "asset-id": txn.xfer_asset,
+            "amount": txn.asset_amount,
+            "receiver": encode_address(txn.asset_receiver),
+        }
+    elif txn.type == "pay":
+        record["payment-transaction"] = {"amount": txn.amount, "receiver": encode_address(txn.receiver)}
+    elif txn.type == "appl":
+        record["application-transaction"] = {
+            "application-id": txn.application_id,
+            "on-completion": ON_COMPLETION[txn.on_completion],
+            "application-args": [base64.b64encode(a).decode() for a in txn.application_args],
+        }
+        if txn.logs:
+            record["logs"] = [base64.b64encode(entry).decode() for entry in txn.logs]
+    if txn.inner_txns:
+        record["inner-txns"] = [avm_record(inner, round, offset, round_time) for inner in txn.inner_txns]
+    return record
+
+
+def search(indexer, page_size=1000, **query):
+    """Every transaction an algosdk IndexerClient returns for `query`, following next-token."""
+    token = None
+    while True:
+        response = indexer.search_transactions(next_page=token, limit=page_size, **query)
+        yield from response.get("transactions", [])
+        token = response.get("next-token")
+        if not token or not response.get("transactions"):
+            return
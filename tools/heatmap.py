@@ -0,0 +1,235 @@
+"""
+Per-source-line opcode cost of each contract method, from execution traces.
+
+    python -m tools.heatmap                         # every bench scenario
+    python -m tools.heatmap escrow_high_trust --method asset_escrow.borrow
+    python -m tools.heatmap --json heat.json --folded heat.folded
+    flamegraph.pl heat.folded > heat.svg            # or load it in speedscope
+
+Runs the tools/bench.py scenarios on the local AVM with a Profile
+attached, so every executed instruction is counted, inner app calls
+included. The source map the build writes next to each approval program
+(tools/sourcemap.py) turns TEAL lines into contracts/*.py lines, and the
+cost of each method ("contract.method" bench label) is reported per source
+line, averaged over the calls made with that label:
+
+    asset_escrow.borrow: 94 opcodes per call
+       cost      %   ops  source
+         24  25.5%    24  contracts/asset_escrow.py:97      Assert(...)
+    ...
+
+Instructions with no mapped source (the #pragma line, a program built
+outside tools/build.py) are charged to their TEAL file and line instead.
+
+--json writes {label: {"calls", "cost", "lines": [{source, line, function,
+code, ops, cost}, ...]}}; --folded writes collapsed stacks
+("label;source:function;source:line code cost") for flamegraph.pl,
+speedscope or inferno.
+"""
+import argparse
+import ast
+import json
+import os
+import sys
+from functools import lru_cache
+
+from .avm import Profile
+from .bench import SCENARIOS, Bench
+from .build import CONTRACTS, ROOT
+from .sourcemap import load
+from .teal import TEMPLATE_PREFIX
+
+DEFAULT_TOP = 10
+
+
+class Heatmap(Bench):
+    """A Bench that profiles each labelled group and charges its cost to source lines."""
+
+    def __init__(self, cse=False):
+        super().__init__(cse)
+        self.heat = {}          # label -> {(source, line): [ops, cost]}
+        self.calls = {}         # label -> groups submitted
+        self._maps = _program_maps()
+        self._mapped = {}       # program text -> (path, source lines) or None
+
+    def submit(self, label, txns):
+        self.ledger.profile = Profile()
+        try:
+            return super().submit(label, txns)
+        finally:
+            profile, self.ledger.profile = self.ledger.profile, None
+            self.calls[label] = self.calls.get(label, 0) + 1
+            heat = self.heat.setdefault(label, {})
+            for program, lines in profile.lines().items():
+                for teal_line, (ops, cost) in lines.items():
+                    entry = heat.setdefault(self._source(program, teal_line), [0, 0])
+                    entry[0] += ops
+                    entry[1] += cost
+
+    def _source(self, program, teal_line):
+        if program.text not in self._mapped:
+            self._mapped[program.text] = program_map(self._maps, program.name, program.text)
+        mapped = self._mapped[program.text]
+        if mapped:
+            path, lines = mapped
+            if teal_line <= len(lines) and lines[teal_line - 1]:
+                return lines[teal_line - 1]
+            return path, teal_line
+        return program.name, teal_line
+
+    def report(self):
+        """{label: {"calls", "cost", "lines": [...]}}, costs per call, hottest lines first."""
+        out = {}
+        for label, heat in sorted(self.heat.items()):
+            calls = self.calls[label]
+            rows = [
+                {
+                    "source": source,
+                    "line": line,
+                    "function": _function(source, line),
+                    "code": _code(source, line),
+                    "ops": round(ops / calls, 1),
+                    "cost": round(cost / calls, 1),
+                }
+                for (source, line), (ops, cost) in heat.items()
+            ]
+            rows.sort(key=lambda r: (-r["cost"], r["source"], r["line"]))
+            out[label] = {"calls": calls, "cost": round(sum(r["cost"] for r in rows), 1), "lines": rows}
+        return out
+
+
+def _program_maps():
+    """{approval file name: (built TEAL text, path, source lines)} for every built contract with a source map."""
+    maps = {}
+    for contract in CONTRACTS.values():
+        teal, map_path = os.path.join(ROOT, contract.approval_path), os.path.join(ROOT, contract.map_path)
+        if os.path.exists(teal) and os.path.exists(map_path):
+            with open(teal) as f:
+                maps[os.path.basename(teal)] = (f.read(), contract.approval_path, load(map_path))
+    return maps
+
+
+def _same_program(built, text):
+    """Whether `text` is `built` with its template variables (if any) filled in, line for line."""
+    if built == text:
+        return True
+    built_lines, lines = built.splitlines(), text.splitlines()
+    return len(built_lines) == len(lines) and all(
+        a == b or TEMPLATE_PREFIX in a for a, b in zip(built_lines, lines)
+    )
+
+
+def program_map(maps, name, text):
+    """(path, source lines) for a program deployed from a built contract, or None.
+
+    Programs are matched by file name, so a contract deployed with template
+    values substituted (tools/localnet.py) still maps to its source.
+    """
+    entry = maps.get(name)
+    if entry is None or not _same_program(entry[0], text):
+        return None
+    return entry[1:]
+
+
+@lru_cache(maxsize=None)
+def _source_lines(source):
+    try:
+        with open(os.path.join(ROOT, source)) as f:
+            return f.read().splitlines()
+    except OSError:
+        return []
+
+
+@lru_cache(maxsize=None)
+def _functions(source):
+    """[(first line, last line, name)] of the functions defined in a Python source file."""
+    if not source.endswith(".py"):
+        return []
+    try:
+        tree = ast.parse("\n".join(_source_lines(source)))
+    except SyntaxError:
+        return []
+    return [
+        (node.lineno, node.end_lineno, node.name)
+        for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+    ]
+
+
+def _function(source, line):
+    """Innermost function around `line`, or "<module>"."""
+    best = None
+    for first, last, name in _functions(source):
+        if first <= line <= last and (best is None or first >= best[0]):
+            best = (first, name)
+    return best[1] if best else "<module>"
+
+
+def _code(source, line):
+    lines = _source_lines(source)
+    return lines[line - 1].strip() if 0 < line <= len(lines) else ""
+
+
+def run(scenarios=None, cse=False):
+    """Profile the named bench scenarios (default: all) once; returns Heatmap.report()."""
+    heatmap = Heatmap(cse)
+    for name in scenarios or SCENARIOS:
+        SCENARIOS[name](heatmap)
+    return heatmap.report()
+
+
+def format_text(report, top=DEFAULT_TOP):
+    out = []
+    for label, entry in report.items():
+        out.append(f"{label}: {entry['cost']:g} opcodes per call")
+        out.append(f"{'cost':>7} {'%':>6} {'ops':>5}  source")
+        for row in entry["lines"][:top]:
+            share = 100.0 * row["cost"] / entry["cost"] if entry["cost"] else 0.0
+            where = f"{row['source']}:{row['line']}"
+            out.append(f"{row['cost']:>7g} {share:>5.1f}% {row['ops']:>5g}  {where:<36} {row['code'][:70]}")
+        out.append("")
+    return "\n".join(out)
+
+
+def format_folded(report):
+    """Collapsed stacks, one per (method, source line), weighted by cost per call."""
+    out = []
+    for label, entry in report.items():
+        for row in entry["lines"]:
+            frames = [label, f"{row['source']}:{row['function']}", f"{row['source']}:{row['line']} {row['code']}"]
+            stack = ";".join(frame.replace(";", ",") for frame in frames)
+            out.append(f"{stack} {round(row['cost'])}")
+    return "\n".join(out) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-source-line opcode cost of each contract method.")
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO", help=f"bench scenarios (default: all): "
+                        f"{', '.join(SCENARIOS)}")
+    parser.add_argument("--method", action="append", default=[], metavar="LABEL",
+                        help="only report these contract.method labels (repeatable; prefix match)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="source lines per method in the text report")
+    parser.add_argument("--json", metavar="PATH", help="also write the full report as JSON")
+    parser.add_argument("--folded", metavar="PATH", help="also write collapsed stacks for flame graphs")
+    parser.add_argument("--cse", action="store_true", help="profile the --cse build")
+    args = parser.parse_args(argv)
+
+    unknown = [s for s in args.scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    report = run(args.scenarios or None, args.cse)
+    if args.method:
+        report = {label: entry for label, entry in report.items()
+                  if any(label.startswith(prefix) for prefix in args.method)}
+    print(format_text(report, args.top))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.folded:
+        with open(args.folded, "w") as f:
+            f.write(format_folded(report))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
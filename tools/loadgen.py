@@ -0,0 +1,541 @@
+"""
+Concurrent load and contention tests for the contracts on the local AVM.
+
+    python -m tools.loadgen tools/scenarios/marketplace_rush.json
+    python -m tools.loadgen tools/scenarios/commute_rush_hour.json --workers 8 --rounds 200
+    python -m tools.loadgen SCENARIO --seed 7 --worker 3     # replay worker 3 of seed 7 exactly
+    python -m tools.loadgen SCENARIO --json load.json --trace trace.jsonl
+
+A scenario file is JSON:
+
+    {
+      "description": "buyers racing for a few hot listings",
+      "seed": 1,              # base seed; worker k runs on seed "<seed>:<k>"
+      "workers": 4,           # processes, each with its own ledger
+      "rounds": 50,           # blocks per worker
+      "round_seconds": 2.8,   # ledger time per block
+      "rate": 10,             # groups offered per second of ledger time, per ledger
+      "accounts": 64,         # funded users, opted in to every app
+      "mix": {"marketplace_contract.buy": 8, "marketplace_contract.list": 2},
+      "params": {"listings": 3}
+    }
+
+Every worker deploys all contracts into its own tools/avm Ledger, then for
+each round picks rate * round_seconds actions from `mix` by weight (an
+action with nothing to act on, e.g. a buy with no listings, is skipped). Like concurrent clients, every group of a round is built from
+the state at the start of the round, e.g. each rider reads the same head of
+the driver queue. The groups are then evaluated one after the other in a
+seeded random order, like transactions in a block. A group that is rejected
+but would have passed against the round's starting state
+(Ledger.simulate) is a state conflict: another group in the round got there
+first. Any other rejection is counted with its reason and source line.
+
+The report gives committed groups per second of wall time (all workers)
+and of ledger time (per ledger), p50/p99 evaluation latency per action,
+and conflict and rejection rates. A run is deterministic given the seed
+and worker index. The report names the seed, worker and round of the
+first occurrence of each rejection, and --worker replays that worker
+in-process with the same outcome.
+
+Actions (see ACTIONS, and `params` for their knobs):
+
+  marketplace_contract.list / buy / delist       listings (1 unit each)
+  commute_checkin.register_driver / leave_queue / pop_stale / start_trip / end_trip / cancel_trip /
+    settle_trips
+  asset_escrow.borrow / confirm_return           confirm_return sends bulk groups (params.return_batch)
+  trust_score.add_trust
+"""
+import argparse
+import json
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from contracts.commute_checkin import HEAD_KEY, MAX_STALE_SKIPS, TAIL_KEY, queue_slot
+
+from .avm import MIN_TXN_FEE, Ledger, OptIn, Rejected, app_call, method_call, payment
+from .build import CONTRACTS, ROOT
+from .localnet import deploy
+from .market_batch import cart_groups, listing_groups
+
+ALGO = 1_000_000
+PRICE = 5 * ALGO
+FARE = 2 * ALGO
+COLLATERAL = ALGO
+TRUSTED_SCORE = 60
+DEFAULT_TOP = 10
+_ADDRESS = re.compile(r"\b[A-Z2-7]{58}\b")
+
+DEFAULTS = {
+    "seed": 1,
+    "workers": 1,
+    "rounds": 20,
+    "round_seconds": 2.8,
+    "rate": 5,
+    "accounts": 32,
+    "mix": {},
+    "params": {},
+}
+
+DEFAULT_PARAMS = {
+    "drivers": 0.25,        # share of accounts that drive; the rest ride
+    "trusted": 0.5,         # share of accounts with a trust score above asset_escrow's threshold
+    "listings": 0,          # listings created before the first round
+    "items": 8,             # distinct escrow item IDs per borrower
+    "return_batch": 8,      # confirm_return calls per bulk group (up to 16)
+}
+
+
+def _local(ledger, addr, app):
+    return ledger.local_state(addr, app) or {}
+
+
+class World:
+    """One worker's ledger with every contract deployed and its users set up."""
+
+    def __init__(self, seed, accounts, params):
+        self.params = dict(DEFAULT_PARAMS, **params)
+        self.ledger = Ledger(seed=zlib.crc32(seed.encode()))      # account addresses
+        self.admin = self.ledger.new_account(10**15)
+        self.apps = deploy(self.ledger, self.admin, funding=1000 * ALGO)
+        self.names = {app_id: name for name, app_id in self.apps.items()}
+        self.users = [self.ledger.new_account(10**12) for _ in range(accounts)]
+        self.drivers = self.users[:round(accounts * self.params["drivers"])]
+        self.riders = self.users[len(self.drivers):]
+        self.maps = {}
+        trust, commute = self.apps["trust_score"], self.apps["commute_checkin"]
+        for user in self.users:
+            for app in (trust, commute, self.apps["asset_escrow"]):
+                self.setup([app_call(user, app, on_complete=OptIn)])
+        self.trusted = set(self.users[:round(accounts * self.params["trusted"])])
+        for user in self.trusted:
+            self.setup([method_call(self.admin, trust, "add_trust(address,uint64)void", user, TRUSTED_SCORE,
+                                    accounts=[user])])
+        for rider in self.riders:
+            self.setup([method_call(rider, commute, "register_rider()void")])
+        rng = random.Random(f"{seed}:setup")
+        for _ in range(self.params["listings"]):
+            self.setup(market_list(self, rng))
+
+    def setup(self, txns):
+        return self.ledger.submit(txns)
+
+    def where(self, error):
+        """Rejection reason with the contract source line it failed on, if known."""
+        reason = _ADDRESS.sub("<address>", error.reason)
+        name = self.names.get(error.app_id)
+        if name is None or not error.line:
+            return reason
+        if name not in self.maps:
+            from .sourcemap import load
+
+            path = os.path.join(ROOT, CONTRACTS[name].map_path)
+            self.maps[name] = load(path) if os.path.exists(path) else []
+        lines = self.maps[name]
+        if error.line <= len(lines) and lines[error.line - 1]:
+            source, line = lines[error.line - 1]
+            return f"{reason} ({source}:{line})"
+        return f"{reason} ({CONTRACTS[name].approval_path}:{error.line})"
+
+
+# -- actions: (world, rng) -> a group built from the current state, or None --------
+
+def _listings(world):
+    app = world.ledger.apps[world.apps["marketplace_contract"]]
+    return sorted(app.boxes.items())
+
+
+def market_list(world, rng):
+    app = world.apps["marketplace_contract"]
+    seller = rng.choice(world.users)
+    asset = world.ledger.create_asset(seller, 1)
+    world.ledger.opt_in_asset(world.ledger.app_address(app), asset)
+    (group,) = listing_groups(seller, app, [(asset, PRICE)], world.ledger.app_address(app))
+    return group
+
+
+def market_buy(world, rng):
+    listings = _listings(world)
+    if not listings:
+        return None
+    name, value = rng.choice(listings)
+    asset, seller, price = struct.unpack(">Q", name[:8])[0], value[:32], struct.unpack(">Q", value[32:40])[0]
+    buyer = rng.choice([u for u in world.users if u != seller])
+    (group,) = cart_groups(buyer, world.apps["marketplace_contract"], [(asset, seller, price)], opt_in=True)
+    return group
+
+
+def market_delist(world, rng):
+    listings = _listings(world)
+    if not listings:
+        return None
+    name, value = rng.choice(listings)
+    asset = struct.unpack(">Q", name[:8])[0]
+    return [method_call(value[:32], world.apps["marketplace_contract"], "delist(uint64)void", asset,
+                        boxes=[name], assets=[asset], fee=2 * MIN_TXN_FEE)]
+
+
+def _queue_page(world, key):
+    position = world.ledger.global_state(world.apps["commute_checkin"]).get(key.encode(), 0)
+    return queue_slot(position)[0]
+
+
+def register_driver(world, rng):
+    app = world.apps["commute_checkin"]
+    idle = [d for d in world.drivers if not _local(world.ledger, d, app).get(b"queued")]
+    if not idle:
+        return None
+    return [method_call(rng.choice(idle), app, "register_driver()void", boxes=[_queue_page(world, TAIL_KEY)])]
+
+
+def leave_queue(world, rng):
+    app = world.apps["commute_checkin"]
+    queued = [d for d in world.drivers if _local(world.ledger, d, app).get(b"queued")]
+    if not queued:
+        return None
+    return [method_call(rng.choice(queued), app, "leave_queue()void")]
+
+
+def _head(world, skip=0):
+    """[(driver, queue page, still waiting)] from the head of the driver queue.
+
+    Stops at the first waiting driver, after `skip` departed ones, or at the
+    tail; empty when the queue is.
+    """
+    app = world.apps["commute_checkin"]
+    state = world.ledger.global_state(app)
+    head, tail = state.get(HEAD_KEY.encode(), 0), state.get(TAIL_KEY.encode(), 0)
+    entries = []
+    for position in range(head, min(tail, head + skip + 1)):
+        page, offset = queue_slot(position)
+        driver = world.ledger.box(app, page)[offset:offset + 32]
+        entries.append((driver, page, _local(world.ledger, driver, app).get(b"queued") == position + 1))
+        if entries[-1][2]:
+            break
+    return entries
+
+
+def pop_stale(world, rng):
+    head = _head(world)
+    if not head or head[0][2]:
+        return None
+    driver, page, _ = head[0]
+    return [method_call(rng.choice(world.users), world.apps["commute_checkin"], "pop_stale()void",
+                        accounts=[driver], boxes=[page])]
+
+
+def start_trip(world, rng):
+    app = world.apps["commute_checkin"]
+    head = _head(world, MAX_STALE_SKIPS)
+    waiting = [r for r in world.riders if not _local(world.ledger, r, app).get(b"trip_active")]
+    if not head or not waiting or not head[-1][2]:
+        return None         # nobody to match yet, or more departed drivers than start_trip drops
+    rider = rng.choice(waiting)
+    return [
+        payment(rider, world.ledger.app_address(app), FARE),
+        method_call(rider, app, "start_trip(pay)void", accounts=[driver for driver, _, _ in head],
+                    boxes=sorted({page for _, page, _ in head})),
+    ]
+
+
+def _on_trip(world):
+    app = world.apps["commute_checkin"]
+    trips = []
+    for rider in world.riders:
+        local = _local(world.ledger, rider, app)
+        if local.get(b"trip_active") and b"matched_with" in local:
+            trips.append((rider, local[b"matched_with"]))
+    return trips
+
+
+def end_trip(world, rng):
+    trips = _on_trip(world)
+    if not trips:
+        return None
+    rider, driver = rng.choice(trips)
+    return [method_call(rider, world.apps["commute_checkin"], "end_trip(address)void", driver, accounts=[driver],
+                        applications=[world.apps["trust_score"]], fee=4 * MIN_TXN_FEE)]
+
+
+def cancel_trip(world, rng):
+    trips = _on_trip(world)
+    if not trips:
+        return None
+    rider, driver = rng.choice(trips)
+    return [method_call(rider, world.apps["commute_checkin"], "cancel_trip()void", accounts=[driver],
+                        fee=2 * MIN_TXN_FEE)]
+
+
+def settle_trips(world, rng):
+    from .trip_settlement import avm_groups
+
+    trips = _on_trip(world)
+    if not trips:
+        return None
+    _, driver = rng.choice(trips)
+    riders = [rider for rider, matched in trips if matched == driver]
+    return avm_groups(driver, world.apps["commute_checkin"], driver, riders, world.apps["trust_score"])[0]
+
+
+def _loans(world):
+    app = world.ledger.apps[world.apps["asset_escrow"]]
+    return sorted(name for name in app.boxes if len(name) > 32)
+
+
+def borrow(world, rng):
+    app = world.apps["asset_escrow"]
+    borrower = rng.choice(world.users)
+    open_loans = world.ledger.apps[app].boxes
+    items = [f"item-{i}" for i in range(world.params["items"]) if borrower + b"item-%d" % i not in open_loans]
+    if not items:
+        return None
+    item = rng.choice(items)
+    loan = borrower + item.encode()
+    call = method_call(borrower, app, "borrow(string)void", item, applications=[world.apps["trust_score"]],
+                       boxes=[loan])
+    if borrower in world.trusted:        # trust only grows here, so they stay above the threshold
+        return [call]
+    return [payment(borrower, world.ledger.app_address(app), COLLATERAL), call]
+
+
+def confirm_return(world, rng):
+    loans = _loans(world)
+    if not loans:
+        return None
+    app, trust = world.apps["asset_escrow"], world.apps["trust_score"]
+    batch = rng.sample(loans, min(len(loans), world.params["return_batch"]))
+    return [
+        method_call(world.admin, app, "confirm_return(address,string)void", loan[:32], loan[32:].decode(),
+                    accounts=[loan[:32]], applications=[trust], boxes=[loan], fee=3 * MIN_TXN_FEE)
+        for loan in batch
+    ]
+
+
+def add_trust(world, rng):
+    user = rng.choice(world.users)
+    return [method_call(world.admin, world.apps["trust_score"], "add_trust(address,uint64)void", user, 1,
+                        accounts=[user])]
+
+
+ACTIONS = {
+    "marketplace_contract.list": market_list,
+    "marketplace_contract.buy": market_buy,
+    "marketplace_contract.delist": market_delist,
+    "commute_checkin.register_driver": register_driver,
+    "commute_checkin.leave_queue": leave_queue,
+    "commute_checkin.pop_stale": pop_stale,
+    "commute_checkin.start_trip": start_trip,
+    "commute_checkin.end_trip": end_trip,
+    "commute_checkin.cancel_trip": cancel_trip,
+    "commute_checkin.settle_trips": settle_trips,
+    "asset_escrow.borrow": borrow,
+    "asset_escrow.confirm_return": confirm_return,
+    "trust_score.add_trust": add_trust,
+}
+
+
+# -- running ------------------------------------------------------------------------
+
+def load_scenario(path):
+    with open(path) as f:
+        scenario = dict(DEFAULTS, **json.load(f))
+    unknown = [action for action in scenario["mix"] if action not in ACTIONS]
+    if unknown:
+        raise ValueError(f"{path}: unknown action(s) {', '.join(unknown)}")
+    if not scenario["mix"]:
+        raise ValueError(f"{path}: empty mix")
+    return scenario
+
+
+def run_worker(scenario, worker, trace=False):
+    """Run one worker's rounds; returns its stats (and per-group events with `trace`)."""
+    seed = f"{scenario['seed']}:{worker}"
+    world = World(seed, scenario["accounts"], scenario["params"])
+    rng = random.Random(seed)
+    actions, weights = zip(*sorted(scenario["mix"].items()))
+    per_round = max(1, round(scenario["rate"] * scenario["round_seconds"]))
+    stats = {a: {"offered": 0, "committed": 0, "conflicts": 0, "rejected": 0, "latency_ns": []} for a in actions}
+    reasons = {}
+    events = []
+    clock = 0.0
+    start = time.perf_counter()
+    for round_no in range(scenario["rounds"]):
+        # One block per round; the ledger clock only moves in whole seconds.
+        seconds = int(clock + scenario["round_seconds"]) - int(clock)
+        clock += scenario["round_seconds"]
+        world.ledger.advance(seconds, rounds=1)
+        built = []
+        for action in rng.choices(actions, weights, k=per_round):
+            group = ACTIONS[action](world, rng)
+            if group is not None:
+                built.append((action, group))
+        feasible = []
+        for action, group in built:     # against the round's starting state
+            try:
+                world.ledger.simulate(group)
+                feasible.append(True)
+            except Rejected:
+                feasible.append(False)
+        order = list(range(len(built)))
+        rng.shuffle(order)
+        for index in order:
+            action, group = built[index]
+            entry = stats[action]
+            entry["offered"] += 1
+            began = time.perf_counter_ns()
+            try:
+                world.ledger.submit(group)
+                status, reason = "committed", None
+            except Rejected as e:
+                status, reason = ("conflict" if feasible[index] else "rejected"), world.where(e)
+            entry["latency_ns"].append(time.perf_counter_ns() - began)
+            entry[{"committed": "committed", "conflict": "conflicts", "rejected": "rejected"}[status]] += 1
+            if reason is not None:
+                key = f"{status} {action}: {reason}"
+                if key not in reasons:
+                    reasons[key] = {"count": 0, "first": [worker, round_no, index]}
+                reasons[key]["count"] += 1
+            if trace:
+                events.append({"worker": worker, "round": round_no, "index": index, "action": action,
+                               "status": status, "reason": reason})
+    return {"worker": worker, "elapsed": time.perf_counter() - start, "actions": stats, "reasons": reasons,
+            "events": events}
+
+
+def run(scenario, workers=None, only=None, trace=False):
+    """Run every worker (or just `only`) and merge their stats into one report."""
+    indices = [only] if only is not None else list(range(workers or scenario["workers"]))
+    if len(indices) == 1:
+        results = [run_worker(scenario, indices[0], trace)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(len(indices), os.cpu_count() or 1)) as pool:
+            results = list(pool.map(run_worker, [scenario] * len(indices), indices, [trace] * len(indices)))
+    return merge(scenario, results)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] / 1000
+
+
+def merge(scenario, results):
+    actions = {}
+    for result in results:
+        for action, entry in result["actions"].items():
+            total = actions.setdefault(action, {"offered": 0, "committed": 0, "conflicts": 0, "rejected": 0,
+                                                "latency_ns": []})
+            for key in ("offered", "committed", "conflicts", "rejected"):
+                total[key] += entry[key]
+            total["latency_ns"] += entry["latency_ns"]
+    reasons = {}
+    for result in sorted(results, key=lambda r: r["worker"]):
+        for key, entry in result["reasons"].items():
+            total = reasons.setdefault(key, {"count": 0, "first": entry["first"]})
+            total["count"] += entry["count"]
+    every = [ns for entry in actions.values() for ns in entry["latency_ns"]]
+    committed = sum(entry["committed"] for entry in actions.values())
+    offered = sum(entry["offered"] for entry in actions.values())
+    elapsed = max(result["elapsed"] for result in results)
+    ledger_seconds = scenario["rounds"] * scenario["round_seconds"]
+    return {
+        "seed": scenario["seed"],
+        "workers": sorted(result["worker"] for result in results),
+        "rounds": scenario["rounds"],
+        "offered": offered,
+        "committed": committed,
+        "conflicts": sum(entry["conflicts"] for entry in actions.values()),
+        "rejected": sum(entry["rejected"] for entry in actions.values()),
+        "wall_tps": round(committed / elapsed, 1) if elapsed else 0.0,
+        "ledger_tps": round(committed / len(results) / ledger_seconds, 2),
+        "p50_us": _percentile(every, 50),
+        "p99_us": _percentile(every, 99),
+        "actions": {
+            action: {
+                "offered": entry["offered"],
+                "committed": entry["committed"],
+                "conflicts": entry["conflicts"],
+                "rejected": entry["rejected"],
+                "conflict_rate": round(entry["conflicts"] / entry["offered"], 4) if entry["offered"] else 0.0,
+                "p50_us": _percentile(entry["latency_ns"], 50),
+                "p99_us": _percentile(entry["latency_ns"], 99),
+            }
+            for action, entry in sorted(actions.items())
+        },
+        "reasons": dict(sorted(reasons.items(), key=lambda item: -item[1]["count"])),
+        "events": [event for result in results for event in result["events"]],
+    }
+
+
+def format_report(report, scenario_path=None, top=DEFAULT_TOP):
+    out = [
+        f"{report['offered']} groups offered by {len(report['workers'])} worker(s) x {report['rounds']} rounds: "
+        f"{report['committed']} committed, {report['conflicts']} conflicts, {report['rejected']} rejected",
+        f"throughput: {report['wall_tps']} groups/s wall (all workers), {report['ledger_tps']} groups/s "
+        f"ledger time per ledger; latency p50 {report['p50_us']:.0f} us, p99 {report['p99_us']:.0f} us",
+        "",
+        f"{'action':<34} {'offered':>7} {'commit':>7} {'confl':>6} {'reject':>6} {'confl%':>6} "
+        f"{'p50 us':>7} {'p99 us':>7}",
+    ]
+    for action, entry in report["actions"].items():
+        out.append(
+            f"{action:<34} {entry['offered']:>7} {entry['committed']:>7} {entry['conflicts']:>6} "
+            f"{entry['rejected']:>6} {100 * entry['conflict_rate']:>5.1f}% {entry['p50_us']:>7.0f} "
+            f"{entry['p99_us']:>7.0f}"
+        )
+    if report["reasons"]:
+        out += ["", "rejections (first occurrence -> replay):"]
+        for key, entry in list(report["reasons"].items())[:top]:
+            worker, round_no, index = entry["first"]
+            replay = f"--seed {report['seed']} --worker {worker} --rounds {round_no + 1}"
+            if scenario_path:
+                replay = f"python -m tools.loadgen {scenario_path} {replay}"
+            out.append(f"{entry['count']:>6} {key}")
+            out.append(f"{'':>6} round {round_no} group {index}: {replay}")
+        if len(report["reasons"]) > top:
+            out.append(f"{'':>6} ... {len(report['reasons']) - top} more (--top, --json)")
+    return "\n".join(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load and contention tests on the local AVM.")
+    parser.add_argument("scenario", help="scenario JSON file (see tools/scenarios/)")
+    parser.add_argument("--seed", help="override the scenario's seed")
+    parser.add_argument("--workers", type=int, help="override the number of worker processes")
+    parser.add_argument("--worker", type=int, help="run only this worker, in-process (replay)")
+    parser.add_argument("--rounds", type=int, help="override the rounds per worker")
+    parser.add_argument("--rate", type=float, help="override groups offered per second of ledger time")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="rejection reasons in the text report")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("--trace", metavar="PATH", help="write every group's outcome as JSON lines")
+    args = parser.parse_args(argv)
+
+    try:
+        scenario = load_scenario(args.scenario)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    for key in ("seed", "workers", "rounds", "rate"):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+
+    report = run(scenario, only=args.worker, trace=bool(args.trace))
+    events = report.pop("events")
+    print(format_report(report, args.scenario, args.top))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.trace:
+        with open(args.trace, "w") as f:
+            for event in events:
+                f.write(json.dumps(event) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
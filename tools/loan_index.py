@@ -0,0 +1,263 @@
+"""
+SQLite index of open asset_escrow loans, built from its transactions.
+
+    python -m tools.loan_index replay feed.jsonl --app APP_ID --lender ADDR --db loans.sqlite
+    python -m tools.loan_index fetch --app APP_ID --out feed.jsonl
+    python -m tools.loan_index query --app APP_ID --db loans.sqlite --borrower ADDR
+    python -m tools.loan_index query --app APP_ID --db loans.sqlite --lender ADDR
+
+Each loan is a box named [borrower 32][item id 1-32] holding
+[collateral u64][borrow time u64] (`decode_loan`). borrow logs the box name
+and value, confirm_return(address,string) names the loan it closes, and
+sweep logs the name of each overdue loan it closes, so the index follows
+the app's feed (tools/feed.py) without reading any box:
+
+    index = LoanIndex("loans.sqlite", app_id, lender)
+    index.apply_feed(read_feed("feed.jsonl"))
+    index.loans(borrower=addr)          # a borrower's open loans, oldest first
+    index.loans(lender=lender)          # every open loan the lender holds collateral for
+
+The lender is the escrow app's creator, the only account that can confirm a
+return; one database can hold several escrow apps, and lender queries span
+all apps of that lender. Calls that log nothing are from the pre-box
+contract (one loan per borrower, in local state) and are skipped, as are
+the legacy "return" calls that close them. As in tools/market_index.py,
+the index records the last position it applied, so replaying an
+overlapping feed is harmless, and `load_boxes` seeds it from a box
+snapshot.
+"""
+import argparse
+import sqlite3
+import struct
+import sys
+from collections import namedtuple
+
+from contracts.asset_escrow import BORROW, LOAN_SIZE, MAX_ITEM_ID
+
+from .assemble import method_selector
+from .feed import app_args, chain_position, encode_address, logs, read_feed, search, write_feed
+
+CONFIRM_RETURN = "confirm_return(address,string)void"
+SWEEP = "sweep(string[])void"
+MAX_SQLITE_INT = 2**63 - 1
+
+_BORROWS = (method_selector(BORROW), b"borrow")
+_RETURN = method_selector(CONFIRM_RETURN)
+_SWEEP = method_selector(SWEEP)
+
+Loan = namedtuple("Loan", "borrower item_id collateral borrow_time")
+OpenLoan = namedtuple("OpenLoan", "app_id lender borrower item_id collateral borrow_time round txid")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS loans (
+    app_id INTEGER NOT NULL,
+    lender TEXT NOT NULL,
+    borrower TEXT NOT NULL,
+    item_id BLOB NOT NULL,
+    collateral INTEGER NOT NULL,
+    borrow_time INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    txid TEXT,
+    PRIMARY KEY (app_id, borrower, item_id)
+);
+CREATE INDEX IF NOT EXISTS loans_lender ON loans (lender, borrow_time);
+CREATE INDEX IF NOT EXISTS loans_borrower ON loans (borrower, borrow_time);
+CREATE TABLE IF NOT EXISTS sync (
+    app_id INTEGER PRIMARY KEY,
+    round INTEGER NOT NULL,
+    intra INTEGER NOT NULL
+);
+"""
+
+
+def decode_loan(name, value):
+    """Loan(borrower address, item id bytes, collateral, borrow time) from a loan box's raw name and value."""
+    if not 32 < len(name) <= 32 + MAX_ITEM_ID or len(value) != LOAN_SIZE:
+        raise ValueError(f"not a loan box: {len(name)}-byte name, {len(value)}-byte value")
+    collateral, borrow_time = struct.unpack(">QQ", value)
+    return Loan(encode_address(name[:32]), bytes(name[32:]), collateral, borrow_time)
+
+
+class LoanIndex:
+    """Open loans of one asset_escrow app (lent by `lender`) in a SQLite database."""
+
+    def __init__(self, path, app_id, lender):
+        self.app_id = app_id
+        self.lender = lender
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # -- sync ---------------------------------------------------------------------
+
+    @property
+    def position(self):
+        """(round, intra-round offset) of the last applied transaction, or None."""
+        row = self.db.execute("SELECT round, intra FROM sync WHERE app_id = ?", (self.app_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def _set_position(self, position):
+        self.db.execute("INSERT OR REPLACE INTO sync (app_id, round, intra) VALUES (?, ?, ?)",
+                        (self.app_id, *position))
+
+    def load_boxes(self, boxes, round):
+        """Replace the index with a snapshot of (name, value) loan boxes taken at `round`."""
+        with self.db:
+            self.db.execute("DELETE FROM loans WHERE app_id = ?", (self.app_id,))
+            for name, value in boxes:
+                self._put(decode_loan(name, value), round, None)
+            self._set_position((round, MAX_SQLITE_INT))
+
+    def apply_feed(self, txns):
+        """Apply transactions in feed order; returns how many calls changed the index."""
+        applied = 0
+        position = self.position
+        with self.db:
+            for txn in txns:
+                here = chain_position(txn)
+                if position is not None and here <= position:
+                    continue
+                applied += self._apply(txn, here[0], txn.get("id"))
+                position = here
+                self._set_position(position)
+        return applied
+
+    def _apply(self, txn, round, txid):
+        applied = 0
+        call = txn.get("application-transaction")
+        if txn.get("tx-type") == "appl" and call and call.get("application-id") == self.app_id \
+                and call.get("on-completion", "noop") == "noop":
+            args = app_args(txn)
+            if args and args[0] in _BORROWS:
+                logged = logs(txn)
+                if logged:
+                    entry = logged[-1]
+                    self._put(decode_loan(entry[:-LOAN_SIZE], entry[-LOAN_SIZE:]), round, txid)
+                    applied += 1
+            elif args and args[0] == _RETURN:
+                self._delete(args[1] + args[2][2:])
+                applied += 1
+            elif args and args[0] == _SWEEP:
+                for name in logs(txn):          # one per loan the sweep closed
+                    self._delete(name)
+                applied += 1
+        for inner in txn.get("inner-txns", []):
+            applied += self._apply(inner, round, txid)
+        return applied
+
+    def _delete(self, name):
+        self.db.execute("DELETE FROM loans WHERE app_id = ? AND borrower = ? AND item_id = ?",
+                        (self.app_id, encode_address(name[:32]), name[32:]))
+
+    def _put(self, loan, round, txid):
+        self.db.execute(
+            "INSERT OR REPLACE INTO loans (app_id, lender, borrower, item_id, collateral, borrow_time, round, txid)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.app_id, self.lender, loan.borrower, loan.item_id, min(loan.collateral, MAX_SQLITE_INT),
+             min(loan.borrow_time, MAX_SQLITE_INT), round, txid),
+        )
+
+    # -- queries ------------------------------------------------------------------
+
+    def loans(self, borrower=None, lender=None, due_before=None):
+        """Open loans, oldest first: this app's, a borrower's, or (lender=) all of a lender's apps.
+
+        `due_before` keeps loans borrowed before that Unix time.
+        """
+        where, params = [], []
+        if lender is not None:
+            where.append("lender = ?")
+            params.append(lender)
+        else:
+            where.append("app_id = ?")
+            params.append(self.app_id)
+        if borrower is not None:
+            where.append("borrower = ?")
+            params.append(borrower)
+        if due_before is not None:
+            where.append("borrow_time < ?")
+            params.append(due_before)
+        rows = self.db.execute(
+            "SELECT app_id, lender, borrower, item_id, collateral, borrow_time, round, txid FROM loans"
+            f" WHERE {' AND '.join(where)} ORDER BY borrow_time, borrower, item_id",
+            params,
+        ).fetchall()
+        return [OpenLoan(*row) for row in rows]
+
+    def get(self, borrower, item_id):
+        row = self.db.execute(
+            "SELECT app_id, lender, borrower, item_id, collateral, borrow_time, round, txid FROM loans"
+            " WHERE app_id = ? AND borrower = ? AND item_id = ?", (self.app_id, borrower, item_id),
+        ).fetchone()
+        return OpenLoan(*row) if row else None
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM loans WHERE app_id = ?", (self.app_id,)).fetchone()[0]
+
+
+# -- feeds ----------------------------------------------------------------------
+
+def fetch(indexer, app_id, min_round=None, page_size=1000):
+    """The app's calls from an algosdk IndexerClient, oldest first."""
+    return search(indexer, page_size, application_id=app_id, min_round=min_round)
+
+
+# -- CLI ------------------------------------------------------------------------
+
+def _format_loans(loans):
+    lines = [f"{'collateral':>12} {'borrowed at':>12}  {'item':<20} borrower"]
+    for loan in loans:
+        item = loan.item_id.decode(errors="replace")
+        lines.append(f"{loan.collateral:>12} {loan.borrow_time:>12}  {item:<20} {loan.borrower}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Off-chain index of open asset_escrow loans.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    replay = sub.add_parser("replay", help="apply feed files to the index")
+    replay.add_argument("feeds", nargs="+", metavar="FEED")
+    replay.add_argument("--lender", required=True, help="the app's creator address")
+
+    fetch_cmd = sub.add_parser("fetch", help="append the app's calls from an indexer to a feed file")
+    fetch_cmd.add_argument("--out", required=True)
+    fetch_cmd.add_argument("--indexer", default="https://testnet-idx.algonode.cloud")
+    fetch_cmd.add_argument("--min-round", type=int)
+
+    query = sub.add_parser("query", help="print open loans")
+    query.add_argument("--borrower")
+    query.add_argument("--lender")
+    query.add_argument("--due-before", type=int, help="only loans borrowed before this Unix time")
+
+    for p in (replay, fetch_cmd, query):
+        p.add_argument("--app", type=int, required=True, help="asset_escrow app ID")
+    for p in (replay, query):
+        p.add_argument("--db", default="loans.sqlite")
+    args = parser.parse_args(argv)
+
+    if args.command == "fetch":
+        from algosdk.v2client.indexer import IndexerClient
+
+        client = IndexerClient("", args.indexer)
+        txns = list(fetch(client, args.app, args.min_round))
+        write_feed(args.out, txns)
+        print(f"{len(txns)} transaction(s) appended to {args.out}")
+        return 0
+
+    index = LoanIndex(args.db, args.app, args.lender)
+    try:
+        if args.command == "replay":
+            applied = index.apply_feed(read_feed(*args.feeds))
+            print(f"{applied} call(s) applied; {index.count()} open loan(s); at {index.position}")
+        else:
+            print(_format_loans(index.loans(args.borrower, args.lender, args.due_before)))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
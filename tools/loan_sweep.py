@@ -0,0 +1,177 @@
+"""
+Pack overdue asset_escrow loans into sweep calls.
+
+    from tools.loan_index import LoanIndex
+    from tools.loan_sweep import overdue, plan
+
+    loans = overdue(LoanIndex("loans.sqlite", app_id, lender), now)
+    for group in plan(loans):        # each fits one atomic group (<= 16 calls)
+        for accounts, items, fee in group:
+            ...                      # one sweep(string[])void call
+
+    python -m tools.loan_sweep --app APP_ID --db loans.sqlite    # print the plan
+
+Each call closes up to MAX_LOANS loans: the borrowers go in as foreign
+accounts, the item IDs as the matching ARC-4 string[], and each loan box
+as a box reference, which fills the 8 references a call may carry. The
+contract splits the collateral (OVERDUE_RELEASE_PERCENT back to the
+borrower, the rest to the lender) in one inner group with fee 0, so each
+call pays a min fee for itself and each inner payment. N overdue loans
+therefore settle in ceil(N / 4) calls and ceil(N / 64) groups.
+
+LOAN_PERIOD and OVERDUE_RELEASE_PERCENT are the contract's template
+defaults; pass the deployed values (`period=`, `release_percent=`, or
+--period / --release-percent) when the app was deployed with others.
+Groups are packed by budget (tools/budget.py, asset_escrow.sweep_cost)
+and padded with opup()void calls if they ever need more than their own.
+
+A loan returned after the index was read is skipped by the contract
+rather than failing the group, so plans may be built from a slightly
+stale index. So is a loan taken without collateral (a high-trust
+borrower): there is nothing to split, and its box stays as the record of
+who holds the item until the lender confirms the return.
+"""
+import argparse
+import struct
+import sys
+import time
+
+from contracts.asset_escrow import LOAN_PERIOD, OVERDUE_RELEASE_PERCENT, sweep_cost
+
+SWEEP = "sweep(string[])void"
+MAX_LOANS = 4               # foreign accounts and box references per app call
+MIN_TXN_FEE = 1000
+
+
+def pack(items):
+    """ARC-4 string[] for a list of item IDs (bytes)."""
+    head, tail = [], b""
+    for item in items:
+        head.append(2 * len(items) + len(tail))
+        tail += struct.pack(">H", len(item)) + item
+    return struct.pack(f">H{len(items)}H", len(items), *head) + tail
+
+
+def unpack(data):
+    """Inverse of pack()."""
+    (count,) = struct.unpack_from(">H", data)
+    items = []
+    for offset in struct.unpack_from(f">{count}H", data, 2):
+        (length,) = struct.unpack_from(">H", data, 2 + offset)
+        items.append(data[4 + offset:4 + offset + length])
+    return items
+
+
+def split(collateral, release_percent=OVERDUE_RELEASE_PERCENT):
+    """(released to the borrower, forfeited to the lender), as the contract computes them."""
+    released = collateral * release_percent // 100
+    return released, collateral - released
+
+
+def fee(loans, min_fee=MIN_TXN_FEE, release_percent=OVERDUE_RELEASE_PERCENT):
+    """Outer fee for one call: itself plus the inner payments its loans produce."""
+    shares = [split(loan.collateral, release_percent) for loan in loans]
+    payments = sum(1 for released, _ in shares if released) + any(forfeited for _, forfeited in shares)
+    return (1 + payments) * min_fee
+
+
+def overdue(index, now=None, period=LOAN_PERIOD):
+    """Loans in a tools/loan_index.LoanIndex that sweep would close at Unix time `now`.
+
+    Loans taken without collateral are left out: sweep skips them.
+    """
+    now = int(time.time()) if now is None else now
+    return [loan for loan in index.loans(due_before=now - period + 1) if loan.collateral]
+
+
+def plan(loans, min_fee=MIN_TXN_FEE, release_percent=OVERDUE_RELEASE_PERCENT):
+    """Split loans into groups of (accounts, packed item IDs, fee) calls.
+
+    `loans` are tools/loan_index OpenLoan (or Loan) tuples.
+    """
+    from .budget import pack as pack_groups
+
+    return [
+        [([loan.borrower for loan in chunk], pack([loan.item_id for loan in chunk]), fee(chunk, min_fee, release_percent))
+         for chunk in calls]
+        for calls, _ in pack_groups(list(loans), lambda chunk: sweep_cost(len(chunk)), MAX_LOANS)
+    ]
+
+
+def _group_cost(group):
+    return sum(sweep_cost(len(accounts)) for accounts, _, _ in group)
+
+
+def _boxes(accounts, items):
+    from .avm import address
+
+    return [address(a) + item for a, item in zip(accounts, unpack(items))]
+
+
+def avm_groups(sender, app_id, loans, release_percent=OVERDUE_RELEASE_PERCENT):
+    """Transaction groups for tools/avm.Ledger.submit."""
+    from .assemble import method_selector
+    from .avm import app_call
+    from .budget import pad
+
+    selector = method_selector(SWEEP)
+    return [
+        pad([
+            app_call(sender, app_id, selector, items, accounts=accounts, boxes=_boxes(accounts, items), fee=call_fee)
+            for accounts, items, call_fee in group
+        ], app_id, cost=_group_cost(group))
+        for group in plan(loans, release_percent=release_percent)
+    ]
+
+
+def algosdk_groups(sender, app_id, loans, params, release_percent=OVERDUE_RELEASE_PERCENT):
+    """Unsigned, grouped algosdk transactions; `params` is algod's suggested params."""
+    import copy
+
+    from algosdk import transaction
+
+    from .assemble import method_selector
+    from .budget import pad_algosdk
+
+    selector = method_selector(SWEEP)
+    out = []
+    for group in plan(loans, params.min_fee or MIN_TXN_FEE, release_percent):
+        txns = []
+        for accounts, items, call_fee in group:
+            sp = copy.copy(params)
+            sp.flat_fee, sp.fee = True, call_fee
+            txns.append(transaction.ApplicationNoOpTxn(
+                sender, sp, app_id, app_args=[selector, items], accounts=accounts,
+                boxes=[(0, box) for box in _boxes(accounts, items)],
+            ))
+        txns = pad_algosdk(txns, app_id, params, cost=_group_cost(group))
+        out.append(transaction.assign_group_id(txns))
+    return out
+
+
+def main(argv=None):
+    from .loan_index import LoanIndex
+
+    parser = argparse.ArgumentParser(description="Plan sweep calls for overdue asset_escrow loans.")
+    parser.add_argument("--app", type=int, required=True, help="asset_escrow app ID")
+    parser.add_argument("--db", default="loans.sqlite")
+    parser.add_argument("--now", type=int, help="Unix time to sweep at (default: now)")
+    parser.add_argument("--period", type=int, default=LOAN_PERIOD, help="the app's TMPL_LOAN_PERIOD (seconds)")
+    parser.add_argument("--release-percent", type=int, default=OVERDUE_RELEASE_PERCENT,
+                        help="the app's TMPL_OVERDUE_RELEASE_PERCENT")
+    args = parser.parse_args(argv)
+
+    index = LoanIndex(args.db, args.app, None)
+    try:
+        loans = overdue(index, args.now, args.period)
+    finally:
+        index.close()
+    groups = plan(loans, release_percent=args.release_percent)
+    calls = sum(len(group) for group in groups)
+    total_fee = sum(call_fee for group in groups for _, _, call_fee in group)
+    print(f"{len(loans)} overdue loan(s): {calls} sweep call(s) in {len(groups)} group(s), {total_fee} microAlgos in fees")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
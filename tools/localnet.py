@@ -0,0 +1,91 @@
+"""
+Deploy the repo's contracts into an in-process AVM ledger (tools/avm.py).
+
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    apps = deploy(ledger, admin)          # {"trust_score": 755292569, ...}
+
+Contracts are built first (a no-op when the build cache is fresh) and
+deployed from their generated .teal with the schemas recorded in
+tools/build.py. Each app account is funded so it can hold boxes, assets and
+pay inner-transaction amounts. Contracts that credit trust are put on the
+trust app's allowlist (AUTHORIZED_CALLERS) when both are deployed.
+Template variables (tools/template.py) keep their defaults unless
+`templates` overrides them, except that app IDs listed in TEMPLATE_APP_IDS
+point at the app deployed here when it was deployed first.
+"""
+import os
+
+from .avm import MIN_BALANCE, compile_teal, method_call
+from .build import CONTRACTS, ROOT, build
+from .teal import TEMPLATE_PREFIX
+from .template import load, substitute
+
+# App IDs other contracts hardcode; these apps are deployed at that ID.
+PINNED_APP_IDS = {
+    "trust_score": 755292569,      # TRUST_APP_ID in contracts/reputation.py
+}
+
+# Template variables holding another contract's app ID: {contract: {variable: app}}.
+TEMPLATE_APP_IDS = {
+    "asset_escrow": {"TRUST_APP_ID": "trust_score", "TRUST_BOX_APP_ID": "trust_score_box"},
+    "commute_checkin": {"TRUST_APP_ID": "trust_score"},
+    "trust_score_box": {"TRUST_APP_ID": "trust_score"},
+}
+
+# Apps that call trust_score's add_trust from inner transactions.
+AUTHORIZED_CALLERS = {
+    "trust_score": ("asset_escrow", "commute_checkin"),
+}
+
+APP_FUNDING = 10 * MIN_BALANCE
+
+
+def _approval(name, apps, overrides):
+    """Approval program of a built contract with its template variables filled in."""
+    path = os.path.join(ROOT, CONTRACTS[name].approval_path)
+    with open(path) as f:
+        text = f.read()
+    if TEMPLATE_PREFIX in text:
+        template = load(name)
+        wired = {var: apps[app] for var, app in TEMPLATE_APP_IDS.get(name, {}).items()
+                 if var in template.variables and app in apps}
+        text = substitute(text, template.values(dict(wired, **overrides)))
+    return compile_teal(text, os.path.basename(path))
+
+
+def deploy(ledger, creator, names=None, funding=APP_FUNDING, rebuild=True, cse=False, args=None, templates=None):
+    """Deploy the named contracts (default: all); returns {name: app id}.
+
+    `args` maps a contract name to its creation args, e.g. a trust decay
+    curve: {"trust_score": [EXPONENTIAL_DECAY, 30 * 86400]}. `templates`
+    maps a contract name to template values, e.g.
+    {"asset_escrow": {"TRUST_THRESHOLD": 70}}.
+    """
+    args = args or {}
+    templates = templates or {}
+    names = list(names or CONTRACTS)
+    if rebuild:
+        build(names, cse=cse, log=lambda *_: None)
+    # Pinned IDs must be allocated before anything that would pass them.
+    names.sort(key=lambda n: (n not in PINNED_APP_IDS, PINNED_APP_IDS.get(n, 0)))
+    apps = {}
+    for name in names:
+        contract = CONTRACTS[name]
+        app_id = ledger.deploy(
+            creator,
+            _approval(name, apps, templates.get(name, {})),
+            os.path.join(ROOT, contract.clear_path),
+            global_schema=contract.global_schema,
+            local_schema=contract.local_schema,
+            args=args.get(name, ()),
+            app_id=PINNED_APP_IDS.get(name),
+        )
+        if funding:
+            ledger.fund(ledger.app_address(app_id), funding)
+        apps[name] = app_id
+    for trust, callers in AUTHORIZED_CALLERS.items():
+        for caller in callers:
+            if trust in apps and caller in apps:
+                ledger.submit([method_call(creator, apps[trust], "authorize(uint64)void", apps[caller])])
+    return apps
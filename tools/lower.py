@@ -0,0 +1,162 @@
+"""
+Rewrite PyTeal's linear `Cond` dispatch into TEAL v8 `match` / `switch`.
+
+PyTeal has no multi-way branch, so a `Cond` over method names compiles to
+
+    txna ApplicationArgs 0
+    method "borrow(string)void"
+    ==
+    bnz main_l5
+    txna ApplicationArgs 0
+    method "confirm_return(address)void"
+    ==
+    bnz main_l4
+    err
+
+and the last method pays for every compare above it. `lower_dispatch`
+replaces each such chain with one push per constant and a single branch:
+
+    method "borrow(string)void"
+    method "confirm_return(address)void"
+    txna ApplicationArgs 0
+    match main_l5 main_l4
+    err
+
+Tests joined with `||` (an ARC-4 selector or its legacy name, see
+contracts/dispatch.py) become several `match` arms to the same label.
+Selectors are matched first and legacy names only when no selector
+matched, so ARC-4 callers pay for the selectors alone. `txn OnCompletion`
+chains become a `switch` indexed by the OnCompletion value.
+
+Only chains on `txna ApplicationArgs 0` and `txn OnCompletion` are touched,
+the first matching test still wins, and programs below v8 are returned
+unchanged.
+"""
+from .assemble import method_selector
+from .teal import is_template, parse, parse_bytes, parse_int
+
+MIN_VERSION = 8
+SUBJECTS = ("txna ApplicationArgs 0", "txn OnCompletion")
+CONSTANT_OPS = ("int", "pushint", "byte", "pushbytes", "method")
+MAX_SWITCH_TARGET = 5       # DeleteApplication
+
+
+def _const_value(instr):
+    if instr.op in ("int", "pushint"):
+        return parse_int(instr.args[0], instr.line)
+    value = parse_bytes(instr.args, instr.line)[0]
+    return method_selector(value.decode()) if instr.op == "method" else value
+
+
+def _test(instrs, i):
+    """Parse `subject const == [subject const == ||]* bnz L` at i -> (subject, consts, label, end)."""
+    subject = str(instrs[i])
+    if subject not in SUBJECTS:
+        return None
+    consts = []
+    j = i
+    while j + 2 < len(instrs) and str(instrs[j]) == subject and instrs[j + 1].op in CONSTANT_OPS \
+            and not is_template(instrs[j + 1].args[0]) and instrs[j + 2].op == "==":
+        consts.append(instrs[j + 1])
+        j += 3
+        if len(consts) > 1:
+            if j >= len(instrs) or instrs[j].op != "||":
+                return None
+            j += 1
+        if j < len(instrs) and instrs[j].op == "bnz":
+            return subject, consts, instrs[j].args[0], j + 1
+        if j < len(instrs) and instrs[j].labels:
+            return None
+    return None
+
+
+def _chain(instrs, i):
+    """Consecutive tests on one subject starting at i -> (subject, [(const, label)], end)."""
+    first = _test(instrs, i)
+    if first is None:
+        return None
+    subject, consts, label, end = first
+    arms = [(c, label) for c in consts]
+    while end < len(instrs) and not instrs[end].labels:
+        nxt = _test(instrs, end)
+        if nxt is None or nxt[0] != subject:
+            break
+        arms += [(c, nxt[2]) for c in nxt[1]]
+        end = nxt[3]
+    return subject, arms, end
+
+
+def _switch(subject, arms, default):
+    targets = {}
+    for const, label in arms:
+        targets.setdefault(_const_value(const), label)
+    if not all(isinstance(k, int) and 0 <= k <= MAX_SWITCH_TARGET for k in targets):
+        return None
+    labels = [targets.get(k, default) for k in range(max(targets) + 1)]
+    return [subject, "switch " + " ".join(labels)]
+
+
+def _match(subject, arms):
+    # Dropping repeated values keeps first-match-wins, and once every value
+    # is distinct, moving the selectors in front cannot change which arm hits.
+    seen = set()
+    tiers = ([], [])        # selectors first, then legacy names
+    for const, label in arms:
+        value = _const_value(const)
+        if value in seen:
+            continue
+        seen.add(value)
+        tiers[0 if const.op == "method" else 1].append((const, label))
+    out = []
+    for tier in tiers:
+        if tier:
+            out += [str(c) for c, _ in tier]
+            out += [subject, "match " + " ".join(label for _, label in tier)]
+    return out
+
+
+def lower_dispatch(text):
+    """Return `text` with every dispatch chain lowered to match/switch."""
+    program = parse(text)
+    if program.version < MIN_VERSION:
+        return text
+    instrs = program.instrs
+    replacements = {}       # first source line -> (last source line, new lines)
+    new_labels = {}         # source line -> label inserted before it
+    i = 0
+    while i < len(instrs):
+        found = _chain(instrs, i)
+        if found is None:
+            i += 1
+            continue
+        subject, arms, end = found
+        new = None
+        if subject == "txna ApplicationArgs 0":
+            new = _match(subject, arms)
+        elif len(arms) > 1:
+            if end < len(instrs) and instrs[end].labels:
+                default = instrs[end].labels[0]
+            else:
+                default = f"dispatch_default_{len(new_labels)}"
+            new = _switch(subject, arms, default)
+            if new is not None and default not in program.labels:
+                new_labels[instrs[end].line if end < len(instrs) else None] = default
+        if new is not None:
+            replacements[instrs[i].line] = (instrs[end - 1].line, new)
+        i = end
+
+    out = []
+    skip_to = 0
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if lineno <= skip_to:
+            continue
+        if lineno in new_labels:
+            out.append(new_labels[lineno] + ":")
+        if lineno in replacements:
+            skip_to, new = replacements[lineno]
+            out += new
+        else:
+            out.append(line)
+    if None in new_labels:
+        out.append(new_labels[None] + ":")
+    return "\n".join(out) + ("\n" if text.endswith("\n") else "")
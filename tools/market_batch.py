@@ -0,0 +1,117 @@
+"""
+Batch listings and cart checkouts for marketplace_contract.
+
+    from tools.market_batch import listing_groups, cart_groups
+
+    listing_groups(seller, app_id, [(asset_id, price), ...])            # an NFT drop
+    listing_groups(seller, app_id, [(asset_id, unit_price, 500)])       # 500 units, one box
+    cart_groups(buyer, app_id, [(asset_id, seller, price), ...])        # a cart
+    cart_groups(buyer, app_id, [(asset_id, seller, unit_price, 20)])    # 20 of the 500
+
+list and buy check the transaction immediately before them (the asset
+transfer to the app, or the payment to the seller), so one atomic group
+holds up to PAIRS_PER_GROUP (transfer, call) pairs and a cart of 8 items
+confirms in one group: it all goes through or nothing does. With
+opt_in=True each purchase is preceded by the buyer's asset opt-in, which
+leaves room for 5 items per group.
+
+The builders return tools/avm transactions; `algosdk_groups` converts
+them for algod with the given suggested params. Seller and price for a
+cart come from the listing boxes, or from tools/market_index.
+
+Listing boxes are named by asset ID and seller (`box_name`). A cart item
+from a listing made before that, named by asset ID alone, needs
+legacy=True so its call also references the old name.
+"""
+from .avm import MAX_GROUP_SIZE, MIN_TXN_FEE, address, app_call, asset_transfer, payment
+
+LIST = "list(axfer,uint64,uint64)void"
+BUY = "buy(pay,uint64)void"
+BUY_QUANTITY = "buy(pay,uint64,uint64)void"
+PAIRS_PER_GROUP = MAX_GROUP_SIZE // 2
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _call(sender, app_id, signature, *args, **fields):
+    from .assemble import method_selector
+
+    return app_call(sender, app_id, method_selector(signature), *args, **fields)
+
+
+def box_name(asset_id, seller):
+    """Name of a seller's listing box for an asset: Itob(asset id) || seller."""
+    return asset_id.to_bytes(8, "big") + address(seller)
+
+
+def _box(asset_id, seller):
+    return (0, box_name(asset_id, seller))
+
+
+def listing_groups(seller, app_id, items, app_address=None):
+    """Groups of [axfer to app, list] pairs for [(asset_id, unit price[, quantity]), ...].
+
+    The app account must already hold (be opted in to) each asset.
+    """
+    from algosdk import logic
+
+    app_address = app_address or logic.get_application_address(app_id)
+    groups = []
+    for chunk in _chunks(list(items), PAIRS_PER_GROUP):
+        group = []
+        for asset_id, price, *quantity in chunk:
+            group.append(asset_transfer(seller, app_address, asset_id, quantity[0] if quantity else 1))
+            group.append(_call(seller, app_id, LIST, asset_id, price, boxes=[_box(asset_id, seller)]))
+        groups.append(group)
+    return groups
+
+
+def cart_groups(buyer, app_id, items, opt_in=False, legacy=False):
+    """Groups of [payment to seller, buy] pairs for [(asset_id, seller, unit price[, quantity]), ...].
+
+    Each buy pays 2 x min fee to cover the inner asset transfer. With
+    legacy=True each buy also references its asset's legacy listing box.
+    """
+    per_item = 3 if opt_in else 2
+    groups = []
+    for chunk in _chunks(list(items), MAX_GROUP_SIZE // per_item):
+        group = []
+        for asset_id, seller, price, *quantity in chunk:
+            args = (BUY, asset_id) if not quantity else (BUY_QUANTITY, asset_id, quantity[0])
+            if opt_in:
+                group.append(asset_transfer(buyer, buyer, asset_id, 0))
+            group.append(payment(buyer, seller, price * (quantity[0] if quantity else 1)))
+            boxes = [_box(asset_id, seller)] + ([(0, asset_id.to_bytes(8, "big"))] if legacy else [])
+            group.append(_call(buyer, app_id, *args, boxes=boxes, assets=[asset_id], fee=2 * MIN_TXN_FEE))
+        groups.append(group)
+    return groups
+
+
+def algosdk_groups(groups, params):
+    """Unsigned, grouped algosdk transactions for the builders' output."""
+    import copy
+
+    from algosdk import encoding, transaction
+
+    out = []
+    for group in groups:
+        txns = []
+        for t in group:
+            sp = copy.copy(params)
+            sp.flat_fee, sp.fee = True, max(t.fee, params.min_fee or MIN_TXN_FEE)
+            sender = encoding.encode_address(t.sender)
+            if t.type == "pay":
+                txns.append(transaction.PaymentTxn(sender, sp, encoding.encode_address(t.receiver), t.amount))
+            elif t.type == "axfer":
+                txns.append(transaction.AssetTransferTxn(
+                    sender, sp, encoding.encode_address(t.asset_receiver), t.asset_amount, t.xfer_asset,
+                ))
+            else:
+                txns.append(transaction.ApplicationNoOpTxn(
+                    sender, sp, t.application_id, app_args=t.application_args,
+                    foreign_assets=t.assets, boxes=t.boxes,
+                ))
+        out.append(transaction.assign_group_id(txns))
+    return out
@@ -0,0 +1,352 @@
+"""
+SQLite index of marketplace_contract listings, built from its transactions.
+
+    python -m tools.market_index replay feed.jsonl --db market.sqlite
+    python -m tools.market_index fetch --app 755297353 --out feed.jsonl
+    python -m tools.market_index query --db market.sqlite --max-price 5000000 --limit 20
+    python -m tools.market_index query --db market.sqlite --seller ADDR --cursor <next>
+
+The contract keeps each listing in a box named by Itob(asset id) || seller
+(Itob(asset id) alone for listings made before several sellers could list
+one asset): [seller 32][unit price u64][remaining u64][version 1], or the
+legacy 40-byte [seller 32][price u64] for a single unit. Reading a page from
+algod means listing every box and fetching each one. This module instead
+follows the app's calls (list / buy / delist, by ARC-4 selector or legacy
+name) and keeps one row per live (asset, seller) listing, so a page is one
+indexed query:
+
+    index = MarketIndex("market.sqlite", app_id)
+    index.apply_feed(read_feed("feed.jsonl"))
+    page = index.listings(min_price=1_000_000, order="price", limit=20)
+    page.items, page.cursor            # pass cursor=page.cursor for the next page
+
+A feed is a sequence of transactions in the Algorand indexer's JSON shape
+(`/v2/transactions`), one per line when stored in a file, so feeds fetched
+once can be replayed offline. It holds the app's calls and the asset
+transfers into the app account, in chain order: a listing's quantity is
+the amount of the transfer right before its list call (a list call
+without one is taken as a single unit), and a buy's seller is the address
+it logs (buys from before that log nothing and match the asset alone). The index records the last (round,
+intra-round offset) it applied and skips anything at or before it, so
+replaying an overlapping feed is harmless. `load_boxes` seeds the index
+from a box snapshot (`decode_box` on each name/value) when the feed does
+not reach back to the app's creation.
+
+Prices above 2**63 - 1 microAlgos (more than the Algo supply, so never
+payable) are stored as 2**63 - 1, the largest SQLite integer.
+"""
+import argparse
+import heapq
+import sqlite3
+import struct
+import sys
+from collections import namedtuple
+
+from .assemble import method_selector
+from .feed import (  # noqa: F401  (read_feed, write_feed, avm_record are part of this module's API)
+    app_args, avm_record, chain_position, decode_cursor, encode_address, encode_cursor, logs, read_feed, search,
+    write_feed,
+)
+
+LEGACY_BOX_SIZE = 40
+BOX_SIZE = 49
+BOX_VERSION = 1
+MAX_SQLITE_INT = 2**63 - 1
+
+METHODS = {
+    "list": ("list(axfer,uint64,uint64)void",),
+    "buy": ("buy(pay,uint64)void", "buy(pay,uint64,uint64)void"),     # one unit, or a quantity
+    "delist": ("delist(uint64)void",),
+}
+_ACTIONS = {}
+for _action, _signatures in METHODS.items():
+    for _signature in _signatures:
+        _ACTIONS[method_selector(_signature)] = _action
+    _ACTIONS[_action.encode()] = _action
+
+ORDERS = ("newest", "price", "-price")
+
+Listing = namedtuple("Listing", "asset_id seller price quantity round intra time txid")
+Page = namedtuple("Page", "items cursor")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    app_id INTEGER NOT NULL,
+    asset_id INTEGER NOT NULL,
+    seller TEXT NOT NULL,
+    price INTEGER NOT NULL,
+    quantity INTEGER NOT NULL DEFAULT 1,
+    round INTEGER NOT NULL,
+    intra INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    txid TEXT,
+    PRIMARY KEY (app_id, asset_id, seller)
+);
+CREATE INDEX IF NOT EXISTS listings_newest ON listings (app_id, round, intra, asset_id, seller);
+CREATE INDEX IF NOT EXISTS listings_price ON listings (app_id, price, asset_id, seller);
+CREATE INDEX IF NOT EXISTS listings_seller ON listings (app_id, seller, round, intra, asset_id);
+CREATE TABLE IF NOT EXISTS sync (
+    app_id INTEGER PRIMARY KEY,
+    round INTEGER NOT NULL,
+    intra INTEGER NOT NULL
+);
+"""
+
+
+def decode_box(name, value):
+    """(asset id, seller address, unit price, quantity) from a listing box's raw name and value."""
+    if len(name) not in (8, 8 + 32) or len(value) not in (LEGACY_BOX_SIZE, BOX_SIZE) \
+            or name[8:] not in (b"", value[:32]):
+        raise ValueError(f"not a listing box: {len(name)}-byte name, {len(value)}-byte value")
+    (asset_id,) = struct.unpack(">Q", name[:8])
+    (price,) = struct.unpack_from(">Q", value, 32)
+    if len(value) == LEGACY_BOX_SIZE:
+        return asset_id, encode_address(value[:32]), price, 1
+    if value[48] != BOX_VERSION:
+        raise ValueError(f"unknown listing box version {value[48]}")
+    (quantity,) = struct.unpack_from(">Q", value, 40)
+    return asset_id, encode_address(value[:32]), price, quantity
+
+
+class MarketIndex:
+    """Live listings of one marketplace app in a SQLite database."""
+
+    def __init__(self, path, app_id):
+        self.app_id = app_id
+        self.db = sqlite3.connect(path)
+        columns = {row[1]: row[5] for row in self.db.execute("PRAGMA table_info(listings)")}
+        if columns and "quantity" not in columns:      # index built before partial fills
+            self.db.execute("ALTER TABLE listings ADD COLUMN quantity INTEGER NOT NULL DEFAULT 1")
+        if columns and not columns["seller"]:           # index built before per-seller listings
+            with self.db:
+                self.db.execute("ALTER TABLE listings RENAME TO listings_by_asset")
+                for index in ("listings_newest", "listings_price", "listings_seller"):
+                    self.db.execute(f"DROP INDEX IF EXISTS {index}")
+                self.db.executescript(_SCHEMA)
+                self.db.execute("INSERT INTO listings SELECT app_id, asset_id, seller, price, quantity, round, intra,"
+                                " time, txid FROM listings_by_asset")
+                self.db.execute("DROP TABLE listings_by_asset")
+        self.db.executescript(_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    # -- sync ---------------------------------------------------------------------
+
+    @property
+    def position(self):
+        """(round, intra-round offset) of the last applied transaction, or None."""
+        row = self.db.execute("SELECT round, intra FROM sync WHERE app_id = ?", (self.app_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def _set_position(self, position):
+        self.db.execute("INSERT OR REPLACE INTO sync (app_id, round, intra) VALUES (?, ?, ?)",
+                        (self.app_id, *position))
+
+    def load_boxes(self, boxes, round):
+        """Replace the index with a snapshot of (name, value) boxes taken at `round`."""
+        with self.db:
+            self.db.execute("DELETE FROM listings WHERE app_id = ?", (self.app_id,))
+            for name, value in boxes:
+                asset_id, seller, price, quantity = decode_box(name, value)
+                self._put(asset_id, seller, price, quantity, (round, 0), 0, None)
+            self._set_position((round, MAX_SQLITE_INT))
+
+    def apply_feed(self, txns):
+        """Apply transactions in feed order; returns how many calls changed the index."""
+        applied = 0
+        position = self.position
+        previous = None
+        with self.db:
+            for txn in txns:
+                here = chain_position(txn)
+                if position is not None and here <= position:
+                    continue
+                applied += self._apply(txn, here, txn.get("round-time", 0), txn.get("id"), previous)
+                previous = txn
+                position = here
+                self._set_position(position)
+        return applied
+
+    def _apply(self, txn, position, time, txid, previous=None):
+        applied = 0
+        call = txn.get("application-transaction")
+        if txn.get("tx-type") == "appl" and call and call.get("application-id") == self.app_id \
+                and call.get("on-completion", "noop") == "noop":
+            args = app_args(txn)
+            action = _ACTIONS.get(args[0]) if args else None
+            if action is not None:
+                (asset_id,) = struct.unpack(">Q", args[1])
+                if action == "list":
+                    (price,) = struct.unpack(">Q", args[2])
+                    self._put(asset_id, txn["sender"], price, _listed_quantity(txn, previous),
+                              position, time, txid)
+                elif action == "buy":
+                    (quantity,) = struct.unpack(">Q", args[2]) if len(args) > 2 else (1,)
+                    logged = [entry for entry in logs(txn) if len(entry) == 32]
+                    self._take(asset_id, encode_address(logged[0]) if logged else None, quantity)
+                else:
+                    self._take(asset_id, txn["sender"], None)
+                applied += 1
+        for inner in txn.get("inner-txns", []):
+            applied += self._apply(inner, position, time, txid)
+        return applied
+
+    def _put(self, asset_id, seller, price, quantity, position, time, txid):
+        self.db.execute(
+            "INSERT OR REPLACE INTO listings (app_id, asset_id, seller, price, quantity, round, intra, time, txid)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.app_id, asset_id, seller, min(price, MAX_SQLITE_INT), min(quantity, MAX_SQLITE_INT),
+             *position, time, txid),
+        )
+
+    def _take(self, asset_id, seller, quantity):
+        """Remove `quantity` units (None: all) from a listing; drained listings go.
+
+        seller=None matches the asset alone, for calls from before listings were per seller.
+        """
+        match = "app_id = ? AND asset_id = ? AND (? IS NULL OR seller = ?)"
+        params = (self.app_id, asset_id, seller, seller)
+        if quantity is not None:
+            self.db.execute(f"UPDATE listings SET quantity = quantity - ? WHERE {match}",
+                            (min(quantity, MAX_SQLITE_INT), *params))
+        self.db.execute(f"DELETE FROM listings WHERE {match} AND (? OR quantity <= 0)", (*params, quantity is None))
+
+    # -- queries ------------------------------------------------------------------
+
+    def listings(self, min_price=None, max_price=None, seller=None, order="newest", limit=20, cursor=None):
+        """One page of live listings; `cursor` is the previous page's Page.cursor."""
+        if order not in ORDERS:
+            raise ValueError(f"order must be one of {', '.join(ORDERS)}")
+        where, params = ["app_id = ?"], [self.app_id]
+        if min_price is not None:
+            where.append("price >= ?")
+            params.append(min(min_price, MAX_SQLITE_INT))
+        if max_price is not None:
+            where.append("price <= ?")
+            params.append(min(max_price, MAX_SQLITE_INT))
+        if seller is not None:
+            where.append("seller = ?")
+            params.append(seller)
+
+        if order == "newest":
+            key, direction = ("round", "intra", "asset_id", "seller"), "DESC"
+        else:
+            key, direction = ("price", "asset_id", "seller"), "DESC" if order == "-price" else "ASC"
+        if cursor is not None:
+            after = decode_cursor(cursor)
+            if len(after) != len(key):
+                raise ValueError(f"cursor is not for order {order!r}")
+            where.append(f"({', '.join(key)}) {'<' if direction == 'DESC' else '>'} ({', '.join('?' * len(key))})")
+            params += after
+
+        rows = self.db.execute(
+            f"SELECT asset_id, seller, price, quantity, round, intra, time, txid FROM listings"
+            f" WHERE {' AND '.join(where)}"
+            f" ORDER BY {', '.join(f'{k} {direction}' for k in key)} LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        items = [Listing(*row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = encode_cursor([getattr(last, k) for k in key])
+        return Page(items, next_cursor)
+
+    def get(self, asset_id, seller=None):
+        """A live listing of the asset (the seller's, if given), or None."""
+        row = self.db.execute(
+            "SELECT asset_id, seller, price, quantity, round, intra, time, txid FROM listings"
+            " WHERE app_id = ? AND asset_id = ? AND (? IS NULL OR seller = ?) ORDER BY round, intra, seller",
+            (self.app_id, asset_id, seller, seller),
+        ).fetchone()
+        return Listing(*row) if row else None
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM listings WHERE app_id = ?", (self.app_id,)).fetchone()[0]
+
+
+def _listed_quantity(call, previous):
+    """Amount of the asset transfer paired with a list call, or 1 if the feed lacks it."""
+    transfer = (previous or {}).get("asset-transfer-transaction")
+    if transfer is None or previous.get("group") != call.get("group") \
+            or previous.get("intra-round-offset", 0) + 1 != call.get("intra-round-offset", 0) \
+            or previous.get("confirmed-round") != call.get("confirmed-round"):
+        return 1
+    return transfer.get("amount", 1)
+
+
+# -- feeds ----------------------------------------------------------------------
+
+def fetch(indexer, app_id, min_round=None, page_size=1000):
+    """The app's feed from an algosdk IndexerClient: its calls and the asset
+    transfers into its account, oldest first."""
+    from algosdk import logic
+
+    calls = search(indexer, page_size, application_id=app_id, min_round=min_round)
+    transfers = search(indexer, page_size, address=logic.get_application_address(app_id),
+                        address_role="receiver", txn_type="axfer", min_round=min_round)
+    return heapq.merge(calls, transfers, key=chain_position)
+
+
+# -- CLI ------------------------------------------------------------------------
+
+def _format_page(page):
+    lines = [f"{'asset':>12} {'unit price':>14} {'quantity':>10}  {'round':>10}  seller"]
+    for item in page.items:
+        lines.append(f"{item.asset_id:>12} {item.price:>14} {item.quantity:>10}  {item.round:>10}  {item.seller}")
+    if page.cursor:
+        lines.append(f"next: --cursor {page.cursor}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Off-chain index of marketplace listings.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    replay = sub.add_parser("replay", help="apply feed files to the index")
+    replay.add_argument("feeds", nargs="+", metavar="FEED")
+
+    fetch_cmd = sub.add_parser("fetch", help="append the app's transactions from an indexer to a feed file")
+    fetch_cmd.add_argument("--out", required=True)
+    fetch_cmd.add_argument("--indexer", default="https://testnet-idx.algonode.cloud")
+    fetch_cmd.add_argument("--min-round", type=int)
+
+    query = sub.add_parser("query", help="print one page of listings")
+    query.add_argument("--min-price", type=int)
+    query.add_argument("--max-price", type=int)
+    query.add_argument("--seller")
+    query.add_argument("--order", choices=ORDERS, default="newest")
+    query.add_argument("--limit", type=int, default=20)
+    query.add_argument("--cursor")
+
+    for p in (replay, fetch_cmd, query):
+        p.add_argument("--app", type=int, default=755297353, help="marketplace app ID (default: TestNet)")
+    for p in (replay, query):
+        p.add_argument("--db", default="market.sqlite")
+    args = parser.parse_args(argv)
+
+    if args.command == "fetch":
+        from algosdk.v2client.indexer import IndexerClient
+
+        client = IndexerClient("", args.indexer)
+        txns = list(fetch(client, args.app, args.min_round))
+        write_feed(args.out, txns)
+        print(f"{len(txns)} transaction(s) appended to {args.out}")
+        return 0
+
+    index = MarketIndex(args.db, args.app)
+    try:
+        if args.command == "replay":
+            applied = index.apply_feed(read_feed(*args.feeds))
+            print(f"{applied} call(s) applied; {index.count()} live listing(s); at {index.position}")
+        else:
+            print(_format_page(index.listings(args.min_price, args.max_price, args.seller,
+                                              args.order, args.limit, args.cursor)))
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
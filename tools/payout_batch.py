@@ -0,0 +1,110 @@
+"""
+Pack civic reward payouts into batch_payout calls on civic_rewards.
+
+    from tools.payout_batch import plan
+
+    groups = plan({alice: 2_000_000, bob: 500_000})
+    for group in groups:             # each fits one atomic group (<= 16 calls)
+        for accounts, amounts in group:
+            ...                      # one batch_payout(uint64[])void call
+
+Each call pays up to MAX_ACCOUNTS receivers, passed as foreign accounts,
+as one inner group of payments; its argument is the ARC-4 uint64[] of their
+amounts. A call may send at most MAX_BATCH_TOTAL microAlgos in total and
+must carry a fee of (1 + receivers) * min fee, since the inner payments pay
+none. A reward round over N citizens therefore takes ceil(N / 4) app calls
+in ceil(N / 64) groups instead of N.
+
+`avm_groups` and `algosdk_groups` turn a plan into transactions for the
+local AVM (tools/avm.py) or for algod.
+"""
+import struct
+
+from contracts.civic_rewards import MAX_BATCH_TOTAL
+
+BATCH_PAYOUT = "batch_payout(uint64[])void"
+MAX_ACCOUNTS = 4            # foreign accounts per app call
+MAX_GROUP_SIZE = 16
+MIN_TXN_FEE = 1000
+
+
+def pack(amounts):
+    """ARC-4 uint64[] for a list of amounts."""
+    for amount in amounts:
+        if not 0 <= amount < 2**64:
+            raise ValueError(f"amount {amount} does not fit in a uint64")
+    return struct.pack(f">H{len(amounts)}Q", len(amounts), *amounts)
+
+
+def unpack(data):
+    """Inverse of pack()."""
+    (count,) = struct.unpack_from(">H", data)
+    if len(data) != 2 + 8 * count:
+        raise ValueError("malformed payout amounts")
+    return list(struct.unpack_from(f">{count}Q", data, 2))
+
+
+def fee(accounts, min_fee=MIN_TXN_FEE):
+    """Outer fee for one call: itself plus one inner payment per receiver."""
+    return (1 + len(accounts)) * min_fee
+
+
+def plan(payouts, max_total=MAX_BATCH_TOTAL):
+    """Split {address: amount} into groups of (accounts, packed amounts) calls.
+
+    Zero amounts are dropped. Receivers are packed in order, starting a new
+    call when the next one would push the call's total over `max_total`.
+    """
+    calls = []
+    accounts, amounts = [], []
+    for addr, amount in payouts.items():
+        if not amount:
+            continue
+        if amount > max_total:
+            raise ValueError(f"payout of {amount} to {addr} exceeds the per-call total {max_total}")
+        if len(accounts) == MAX_ACCOUNTS or sum(amounts) + amount > max_total:
+            calls.append((accounts, pack(amounts)))
+            accounts, amounts = [], []
+        accounts.append(addr)
+        amounts.append(amount)
+    if accounts:
+        calls.append((accounts, pack(amounts)))
+    return [calls[i:i + MAX_GROUP_SIZE] for i in range(0, len(calls), MAX_GROUP_SIZE)]
+
+
+def avm_groups(sender, app_id, payouts):
+    """Transaction groups for tools/avm.Ledger.submit."""
+    from .assemble import method_selector
+    from .avm import app_call
+
+    selector = method_selector(BATCH_PAYOUT)
+    return [
+        [
+            app_call(sender, app_id, selector, amounts, accounts=accounts, fee=fee(accounts))
+            for accounts, amounts in group
+        ]
+        for group in plan(payouts)
+    ]
+
+
+def algosdk_groups(sender, app_id, payouts, params):
+    """Unsigned, grouped algosdk transactions; `params` is algod's suggested params."""
+    import copy
+
+    from algosdk import encoding, transaction
+
+    from .assemble import method_selector
+
+    selector = method_selector(BATCH_PAYOUT)
+    out = []
+    for group in plan(payouts):
+        txns = []
+        for accounts, amounts in group:
+            sp = copy.copy(params)
+            sp.flat_fee, sp.fee = True, fee(accounts, params.min_fee or MIN_TXN_FEE)
+            txns.append(transaction.ApplicationNoOpTxn(
+                sender, sp, app_id, app_args=[selector, amounts],
+                accounts=[a if isinstance(a, str) else encoding.encode_address(a) for a in accounts],
+            ))
+        out.append(transaction.assign_group_id(txns))
+    return out
@@ -0,0 +1,224 @@
+"""
+Read a page of users' trust, loan or trip state with one simulate call.
+
+    from tools.query import AlgodSimulator, loans, trips, trust_records
+
+    node = AlgodSimulator(algod_client, sender=backend_address)
+    trust_records(node, trust_app_id, addresses)    # {address: TrustRecord(trust, fitness, eco, updated)}
+    trips(node, commute_app_id, addresses)          # {address: TripStatus(role, trip_active, ...)}
+    loans(node, escrow_app_id, [(borrower, "item-1"), ...])   # {(borrower, item): LoanStatus}
+
+    python -m tools.query trust --app APP_ID --sender ADDR ADDR1 ADDR2 ...
+
+The contracts' read-only methods (contracts/batch_query.py) return the
+state of up to a page of addresses per call; these helpers split the list
+into pages, put one call per page in a group (up to 16) and run each group
+through algod's simulate endpoint: nothing is signed or submitted, the
+addresses need not be in the foreign arrays (allow_unnamed_resources) and
+the extra opcode budget covers the loops. Unnamed resources still count
+against each transaction's reference limits, which set the page sizes: 4
+trust records or trips, 8 loans. A leaderboard of 400 users is 7 node
+requests instead of one account lookup per user per app.
+
+`sender` must be an existing account that can cover the (simulated) min
+fees; no funds move. LedgerSimulator runs the same groups on a
+tools/avm.Ledger for tests and benchmarks. Addresses are base32 strings or
+32 raw bytes; results are keyed by the addresses as given, in order.
+"""
+import argparse
+import base64
+import json
+import sys
+from collections import namedtuple
+
+from contracts.asset_escrow import GET_LOANS
+from contracts.batch_query import max_records
+from contracts.commute_checkin import DRIVER, GET_TRIPS, NO_ROLE, NOT_OPTED_IN, RIDER, TRIP_STATUS_SIZE
+from contracts.reputation import GET_RECORDS, RECORD_SIZE
+
+MAX_GROUP_SIZE = 16
+MAX_APP_ARGS_BYTES = 2048
+EXTRA_OPCODE_BUDGET = 20_000 * MAX_GROUP_SIZE     # the most simulate allows
+LOAN_STATUS_SIZE = 16
+
+# The contracts are v8, so simulate keeps each transaction's reference limits
+# for the unnamed resources it fills in: an account per local-state record
+# or trip, a box reference per box-backed record or loan.
+MAX_TXN_ACCOUNTS = 4
+MAX_TXN_REFERENCES = 8
+
+RECORDS_PER_CALL = min(max_records(RECORD_SIZE), MAX_TXN_ACCOUNTS)     # trust_score; trust_score_box could take 8
+TRIPS_PER_CALL = min(max_records(TRIP_STATUS_SIZE), MAX_TXN_ACCOUNTS)
+LOANS_PER_CALL = min(max_records(LOAN_STATUS_SIZE), MAX_TXN_REFERENCES)     # fewer when long item IDs fill the app args
+
+ROLES = {NOT_OPTED_IN: None, NO_ROLE: "none", RIDER: "rider", DRIVER: "driver"}
+
+TrustRecord = namedtuple("TrustRecord", "trust fitness eco updated")
+LoanStatus = namedtuple("LoanStatus", "collateral borrow_time")
+TripStatus = namedtuple("TripStatus", "role trip_active collateral queued matched_with")
+
+
+def _abi(type_string):
+    from algosdk import abi
+
+    return abi.ABIType.from_string(type_string)
+
+
+def _raw_address(address):
+    from algosdk import encoding
+
+    return address if isinstance(address, bytes) else encoding.decode_address(address)
+
+
+def _return_type(signature):
+    return signature[signature.index(")") + 1:]
+
+
+class LedgerSimulator:
+    """Runs query groups with tools/avm.Ledger.simulate."""
+
+    def __init__(self, ledger, sender):
+        self.ledger = ledger
+        self.sender = sender
+
+    def returns(self, app_id, signature, pages):
+        """Raw ARC-4 return value of one `signature` call per page of encoded args, in order."""
+        from .assemble import method_selector
+        from .avm import app_call
+
+        selector = method_selector(signature)
+        out = []
+        for group in _groups(pages):
+            txns = [app_call(self.sender, app_id, selector, *args) for args in group]
+            self.ledger.simulate(txns, allow_unnamed_resources=True, extra_opcode_budget=EXTRA_OPCODE_BUDGET)
+            out += [txn.logs[-1][4:] for txn in txns]
+        return out
+
+
+class AlgodSimulator:
+    """Runs query groups through an algosdk AlgodClient's simulate endpoint."""
+
+    def __init__(self, client, sender):
+        self.client = client
+        self.sender = sender
+
+    def returns(self, app_id, signature, pages):
+        from algosdk import transaction
+        from algosdk.v2client.models import SimulateRequest, SimulateRequestTransactionGroup
+
+        from .assemble import method_selector
+
+        params = self.client.suggested_params()
+        selector = method_selector(signature)
+        out = []
+        for group in _groups(pages):
+            txns = transaction.assign_group_id([
+                transaction.ApplicationNoOpTxn(self.sender, params, app_id, app_args=[selector, *args])
+                for args in group
+            ])
+            request = SimulateRequest(
+                txn_groups=[SimulateRequestTransactionGroup(txns=[transaction.SignedTransaction(t, None)
+                                                                  for t in txns])],
+                allow_empty_signatures=True,
+                allow_unnamed_resources=True,
+                extra_opcode_budget=EXTRA_OPCODE_BUDGET,
+            )
+            result = self.client.simulate_transactions(request)["txn-groups"][0]
+            if result.get("failure-message"):
+                raise RuntimeError(f"{signature} failed in simulate: {result['failure-message']}")
+            for entry in result["txn-results"]:
+                logged = entry["txn-result"].get("logs", [])
+                out.append(base64.b64decode(logged[-1])[4:])
+        return out
+
+
+def _groups(pages):
+    return [pages[i:i + MAX_GROUP_SIZE] for i in range(0, len(pages), MAX_GROUP_SIZE)]
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _query(simulator, app_id, signature, pages):
+    """Decoded records of every page, concatenated."""
+    decode = _abi(_return_type(signature)).decode
+    return [row for raw in simulator.returns(app_id, signature, pages) for row in decode(raw)]
+
+
+def _address_pages(addresses, per_call):
+    encode = _abi("address[]").encode
+    return [[encode([_raw_address(a) for a in chunk])] for chunk in _chunks(list(addresses), per_call)]
+
+
+def trust_records(simulator, app_id, addresses):
+    """{address: TrustRecord}, trust already decayed to now; zeros for addresses with no record."""
+    addresses = list(addresses)
+    rows = _query(simulator, app_id, GET_RECORDS, _address_pages(addresses, RECORDS_PER_CALL))
+    return {address: TrustRecord(*row) for address, row in zip(addresses, rows)}
+
+
+def trips(simulator, app_id, addresses):
+    """{address: TripStatus}; role is None for users not opted in, matched_with None while unmatched."""
+    from algosdk import encoding
+
+    addresses = list(addresses)
+    rows = _query(simulator, app_id, GET_TRIPS, _address_pages(addresses, TRIPS_PER_CALL))
+    zero = encoding.encode_address(bytes(32))
+    return {
+        address: TripStatus(ROLES.get(role, "none"), active, collateral, queued, None if match == zero else match)
+        for address, (role, active, collateral, queued, match) in zip(addresses, rows)
+    }
+
+
+def loan_pages(loans):
+    """Page args for get_loans: [(borrower, item id)] split by the log and app-arg limits."""
+    encode_addresses, encode_items = _abi("address[]").encode, _abi("string[]").encode
+    pages, page, size = [], [], 0
+    for borrower, item in loans:
+        item = item.decode() if isinstance(item, bytes) else item
+        cost = 32 + 4 + len(item.encode())      # address, string offset and length, item bytes
+        if page and (len(page) == LOANS_PER_CALL or 4 + 4 + size + cost > MAX_APP_ARGS_BYTES):
+            pages.append(page)
+            page, size = [], 0
+        page.append((_raw_address(borrower), item))
+        size += cost
+    if page:
+        pages.append(page)
+    return [[encode_addresses([b for b, _ in p]), encode_items([i for _, i in p])] for p in pages]
+
+
+def loans(simulator, app_id, loans):
+    """{(borrower, item id): LoanStatus}; (0, 0) for loans that are not open."""
+    loans = list(loans)
+    rows = _query(simulator, app_id, GET_LOANS, loan_pages(loans))
+    return {loan: LoanStatus(*row) for loan, row in zip(loans, rows)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read users' contract state with one simulate call.")
+    parser.add_argument("kind", choices=("trust", "trips", "loans"))
+    parser.add_argument("addresses", nargs="+", metavar="ADDRESS",
+                        help="addresses (for loans: BORROWER:ITEM_ID)")
+    parser.add_argument("--app", type=int, required=True)
+    parser.add_argument("--sender", required=True, help="an existing account to simulate from (nothing is signed)")
+    parser.add_argument("--algod", default="https://testnet-api.algonode.cloud")
+    parser.add_argument("--token", default="")
+    args = parser.parse_args(argv)
+
+    from algosdk.v2client.algod import AlgodClient
+
+    node = AlgodSimulator(AlgodClient(args.token, args.algod), args.sender)
+    if args.kind == "trust":
+        result = {a: r._asdict() for a, r in trust_records(node, args.app, args.addresses).items()}
+    elif args.kind == "trips":
+        result = {a: r._asdict() for a, r in trips(node, args.app, args.addresses).items()}
+    else:
+        pairs = [tuple(a.split(":", 1)) for a in args.addresses]
+        result = {f"{b}:{i}": r._asdict() for (b, i), r in loans(node, args.app, pairs).items()}
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+PyTeal source maps for the built TEAL.
+
+The build compiles each approval program with PyTeal's source mapper and
+writes contracts/foo.teal.map next to contracts/foo.teal: a standard
+Source Map v3 file with one segment per TEAL line, pointing at the
+contract source line (contracts/*.py and the repo modules it imports) whose
+PyTeal expression emitted it. Editors, debuggers and tools/heatmap.py read
+it as is.
+
+PyTeal maps the TEAL it emits itself; the build then rewrites that TEAL
+(tools/lower.py, tools/cse.py). `remap` carries the mapping across a
+rewrite by diffing the two texts: unchanged lines keep their source, and
+lines a rewrite replaced or inserted take the source of the lines they
+replaced (or of the line before them).
+
+    lines = load("contracts/asset_escrow.teal.map")
+    lines[41]       # ("contracts/asset_escrow.py", 97) for TEAL line 42
+"""
+import contextlib
+import difflib
+import io
+import json
+import os
+
+_BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_DIGITS = {c: i for i, c in enumerate(_BASE64)}
+
+
+def _vlq(value):
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    out = ""
+    while True:
+        digit, value = value & 31, value >> 5
+        out += _BASE64[digit | (32 if value else 0)]
+        if not value:
+            return out
+
+
+def _unvlq(segment):
+    values, value, shift = [], 0, 0
+    for c in segment:
+        digit = _DIGITS[c]
+        value |= (digit & 31) << shift
+        shift += 5
+        if not digit & 32:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    return values
+
+
+def compile_mapped(program, version, root, sources):
+    """PyTeal-compile `program()`; returns (teal, [(source, line) or None per TEAL line]).
+
+    PyTeal records where each expression was built only while source
+    mapping is on, so the program is built here rather than passed in.
+    `sources` are the repo-relative files to map to (a contract and its
+    local imports); lines PyTeal attributes elsewhere map to None.
+    """
+    from feature_gates import FeatureGates
+
+    enabled = FeatureGates.sourcemap_enabled()
+    FeatureGates.set_sourcemap_enabled(True)
+    try:
+        from pyteal import Compilation, Mode
+
+        # Expressions PyTeal built at import time (OnComplete constants,
+        # subroutine scaffolding) have no frames; it prints a warning for
+        # each, and those lines simply stay unmapped.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = Compilation(program(), mode=Mode.Application, version=version).compile(with_sourcemap=True)
+    finally:
+        FeatureGates.set_sourcemap_enabled(enabled)
+    lines = [None] * len(result.teal.splitlines())
+    for (teal_line, _), mapping in sorted(result.sourcemap.r3_sourcemap.entries.items()):
+        source = os.path.relpath(os.path.abspath(mapping.source), root).replace(os.sep, "/")
+        if source in sources and lines[teal_line] is None:
+            lines[teal_line] = (source, mapping.source_line + 1)
+    return result.teal, lines
+
+
+def remap(before, after, lines):
+    """Source lines for `after`, a rewrite of the TEAL text `before` mapped by `lines`."""
+    old, new = before.splitlines(), after.splitlines()
+    out = [None] * len(new)
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        for j in range(j1, j2):
+            if tag == "equal":
+                out[j] = lines[i1 + j - j1]
+            elif i2 > i1:
+                out[j] = lines[min(i1 + j - j1, i2 - 1)]
+            elif j > 0:
+                out[j] = out[j - 1]
+    return out
+
+
+def dump(lines, teal_path):
+    """Source Map v3 text for the TEAL file at `teal_path` (sources relative to the map)."""
+    base = os.path.dirname(teal_path)
+    sources = sorted({line[0] for line in lines if line})
+    index = {source: i for i, source in enumerate(sources)}
+    segments, previous = [], (0, 0)
+    for line in lines:
+        if line is None:
+            segments.append("")
+            continue
+        source, row = index[line[0]], line[1] - 1
+        # Fields: generated column, source index, 0-based source line, source
+        # column; all but the first are deltas from the previous segment.
+        segments.append(_vlq(0) + _vlq(source - previous[0]) + _vlq(row - previous[1]) + _vlq(0))
+        previous = (source, row)
+    return json.dumps({
+        "version": 3,
+        "file": os.path.basename(teal_path),
+        "sources": [os.path.relpath(source, base).replace(os.sep, "/") for source in sources],
+        "names": [],
+        "mappings": ";".join(segments),
+    }, indent=1) + "\n"
+
+
+def load(map_path):
+    """[(repo-relative source, 1-based line) or None per TEAL line] from a .teal.map file."""
+    with open(map_path) as f:
+        data = json.load(f)
+    base = os.path.dirname(os.path.abspath(map_path))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sources = [os.path.relpath(os.path.join(base, source), root).replace(os.sep, "/") for source in data["sources"]]
+    lines, source, row = [], 0, 0
+    for segment in data["mappings"].split(";"):
+        if not segment:
+            lines.append(None)
+            continue
+        fields = _unvlq(segment.split(",")[0])
+        source += fields[1]
+        row += fields[2]
+        lines.append((sources[source], row + 1))
+    return lines
@@ -0,0 +1,490 @@
+"""
+TEAL opcode tables and a small source parser.
+
+Shared by the assembler, the cost analyzer and anything else in tools/
+that needs to read the .teal files PyTeal produces. The tables cover the
+AVM up to version 8, which is the newest version our contracts target.
+"""
+import base64
+from dataclasses import dataclass, field
+
+MAX_VERSION = 8
+
+
+@dataclass(frozen=True)
+class OpSpec:
+    name: str
+    code: int
+    version: int
+    immediates: tuple = ()
+    pops: int = 0           # stack args; None when it depends on immediates
+    pushes: int = 0         # stack results; None when it depends on immediates
+    cost: int = 1
+
+
+def _op(code, name, version, immediates=(), pops=0, pushes=0, cost=1):
+    return OpSpec(name, code, version, tuple(immediates), pops, pushes, cost)
+
+
+# Immediate kinds:
+#   uint8 / int8    one byte            label     2-byte signed offset
+#   varuint         uvarint             bytes     uvarint length + data
+#   labels / varuints / bytess          1-byte count followed by the above
+#   anything else names a field group in FIELDS (e.g. "txn", "global")
+_OPS = [
+    _op(0x00, "err", 1),
+    _op(0x01, "sha256", 1, pops=1, pushes=1, cost=35),
+    _op(0x02, "keccak256", 1, pops=1, pushes=1, cost=130),
+    _op(0x03, "sha512_256", 1, pops=1, pushes=1, cost=45),
+    _op(0x04, "ed25519verify", 1, pops=3, pushes=1, cost=1900),
+    _op(0x05, "ecdsa_verify", 5, ["ecdsa"], pops=5, pushes=1, cost=1700),
+    _op(0x06, "ecdsa_pk_decompress", 5, ["ecdsa"], pops=1, pushes=2, cost=650),
+    _op(0x07, "ecdsa_pk_recover", 5, ["ecdsa"], pops=4, pushes=2, cost=2000),
+    _op(0x08, "+", 1, pops=2, pushes=1),
+    _op(0x09, "-", 1, pops=2, pushes=1),
+    _op(0x0A, "/", 1, pops=2, pushes=1),
+    _op(0x0B, "*", 1, pops=2, pushes=1),
+    _op(0x0C, "<", 1, pops=2, pushes=1),
+    _op(0x0D, ">", 1, pops=2, pushes=1),
+    _op(0x0E, "<=", 1, pops=2, pushes=1),
+    _op(0x0F, ">=", 1, pops=2, pushes=1),
+    _op(0x10, "&&", 1, pops=2, pushes=1),
+    _op(0x11, "||", 1, pops=2, pushes=1),
+    _op(0x12, "==", 1, pops=2, pushes=1),
+    _op(0x13, "!=", 1, pops=2, pushes=1),
+    _op(0x14, "!", 1, pops=1, pushes=1),
+    _op(0x15, "len", 1, pops=1, pushes=1),
+    _op(0x16, "itob", 1, pops=1, pushes=1),
+    _op(0x17, "btoi", 1, pops=1, pushes=1),
+    _op(0x18, "%", 1, pops=2, pushes=1),
+    _op(0x19, "|", 1, pops=2, pushes=1),
+    _op(0x1A, "&", 1, pops=2, pushes=1),
+    _op(0x1B, "^", 1, pops=2, pushes=1),
+    _op(0x1C, "~", 1, pops=1, pushes=1),
+    _op(0x1D, "mulw", 1, pops=2, pushes=2),
+    _op(0x1E, "addw", 2, pops=2, pushes=2),
+    _op(0x1F, "divmodw", 4, pops=4, pushes=4, cost=20),
+    _op(0x20, "intcblock", 1, ["varuints"]),
+    _op(0x21, "intc", 1, ["uint8"], pushes=1),
+    _op(0x22, "intc_0", 1, pushes=1),
+    _op(0x23, "intc_1", 1, pushes=1),
+    _op(0x24, "intc_2", 1, pushes=1),
+    _op(0x25, "intc_3", 1, pushes=1),
+    _op(0x26, "bytecblock", 1, ["bytess"]),
+    _op(0x27, "bytec", 1, ["uint8"], pushes=1),
+    _op(0x28, "bytec_0", 1, pushes=1),
+    _op(0x29, "bytec_1", 1, pushes=1),
+    _op(0x2A, "bytec_2", 1, pushes=1),
+    _op(0x2B, "bytec_3", 1, pushes=1),
+    _op(0x2C, "arg", 1, ["uint8"], pushes=1),
+    _op(0x2D, "arg_0", 1, pushes=1),
+    _op(0x2E, "arg_1", 1, pushes=1),
+    _op(0x2F, "arg_2", 1, pushes=1),
+    _op(0x30, "arg_3", 1, pushes=1),
+    _op(0x31, "txn", 1, ["txn"], pushes=1),
+    _op(0x32, "global", 1, ["global"], pushes=1),
+    _op(0x33, "gtxn", 1, ["uint8", "txn"], pushes=1),
+    _op(0x34, "load", 1, ["uint8"], pushes=1),
+    _op(0x35, "store", 1, ["uint8"], pops=1),
+    _op(0x36, "txna", 2, ["txna", "uint8"], pushes=1),
+    _op(0x37, "gtxna", 2, ["uint8", "txna", "uint8"], pushes=1),
+    _op(0x38, "gtxns", 3, ["txn"], pops=1, pushes=1),
+    _op(0x39, "gtxnsa", 3, ["txna", "uint8"], pops=1, pushes=1),
+    _op(0x3A, "gload", 4, ["uint8", "uint8"], pushes=1),
+    _op(0x3B, "gloads", 4, ["uint8"], pops=1, pushes=1),
+    _op(0x3C, "gaid", 4, ["uint8"], pushes=1),
+    _op(0x3D, "gaids", 4, pops=1, pushes=1),
+    _op(0x3E, "loads", 5, pops=1, pushes=1),
+    _op(0x3F, "stores", 5, pops=2),
+    _op(0x40, "bnz", 1, ["label"], pops=1),
+    _op(0x41, "bz", 2, ["label"], pops=1),
+    _op(0x42, "b", 2, ["label"]),
+    _op(0x43, "return", 2, pops=1),
+    _op(0x44, "assert", 3, pops=1),
+    _op(0x45, "bury", 8, ["uint8"], pops=1),
+    _op(0x46, "popn", 8, ["uint8"], pops=None),
+    _op(0x47, "dupn", 8, ["uint8"], pops=1, pushes=None),
+    _op(0x48, "pop", 1, pops=1),
+    _op(0x49, "dup", 1, pops=1, pushes=2),
+    _op(0x4A, "dup2", 2, pops=2, pushes=4),
+    _op(0x4B, "dig", 3, ["uint8"], pops=None, pushes=None),
+    _op(0x4C, "swap", 3, pops=2, pushes=2),
+    _op(0x4D, "select", 3, pops=3, pushes=1),
+    _op(0x4E, "cover", 5, ["uint8"], pops=None, pushes=None),
+    _op(0x4F, "uncover", 5, ["uint8"], pops=None, pushes=None),
+    _op(0x50, "concat", 2, pops=2, pushes=1),
+    _op(0x51, "substring", 2, ["uint8", "uint8"], pops=1, pushes=1),
+    _op(0x52, "substring3", 2, pops=3, pushes=1),
+    _op(0x53, "getbit", 3, pops=2, pushes=1),
+    _op(0x54, "setbit", 3, pops=3, pushes=1),
+    _op(0x55, "getbyte", 3, pops=2, pushes=1),
+    _op(0x56, "setbyte", 3, pops=3, pushes=1),
+    _op(0x57, "extract", 5, ["uint8", "uint8"], pops=1, pushes=1),
+    _op(0x58, "extract3", 5, pops=3, pushes=1),
+    _op(0x59, "extract_uint16", 5, pops=2, pushes=1),
+    _op(0x5A, "extract_uint32", 5, pops=2, pushes=1),
+    _op(0x5B, "extract_uint64", 5, pops=2, pushes=1),
+    _op(0x5C, "replace2", 7, ["uint8"], pops=2, pushes=1),
+    _op(0x5D, "replace3", 7, pops=3, pushes=1),
+    _op(0x5E, "base64_decode", 7, ["base64"], pops=1, pushes=1),
+    _op(0x5F, "json_ref", 7, ["json_ref"], pops=2, pushes=1),
+    _op(0x60, "balance", 2, pops=1, pushes=1),
+    _op(0x61, "app_opted_in", 2, pops=2, pushes=1),
+    _op(0x62, "app_local_get", 2, pops=2, pushes=1),
+    _op(0x63, "app_local_get_ex", 2, pops=3, pushes=2),
+    _op(0x64, "app_global_get", 2, pops=1, pushes=1),
+    _op(0x65, "app_global_get_ex", 2, pops=2, pushes=2),
+    _op(0x66, "app_local_put", 2, pops=3),
+    _op(0x67, "app_global_put", 2, pops=2),
+    _op(0x68, "app_local_del", 2, pops=2),
+    _op(0x69, "app_global_del", 2, pops=1),
+    _op(0x70, "asset_holding_get", 2, ["asset_holding"], pops=2, pushes=2),
+    _op(0x71, "asset_params_get", 2, ["asset_params"], pops=1, pushes=2),
+    _op(0x72, "app_params_get", 5, ["app_params"], pops=1, pushes=2),
+    _op(0x73, "acct_params_get", 6, ["acct_params"], pops=1, pushes=2),
+    _op(0x78, "min_balance", 3, pops=1, pushes=1),
+    _op(0x80, "pushbytes", 3, ["bytes"], pushes=1),
+    _op(0x81, "pushint", 3, ["varuint"], pushes=1),
+    _op(0x82, "pushbytess", 8, ["bytess"], pushes=None),
+    _op(0x83, "pushints", 8, ["varuints"], pushes=None),
+    _op(0x84, "ed25519verify_bare", 7, pops=3, pushes=1, cost=1900),
+    _op(0x88, "callsub", 4, ["label"]),
+    _op(0x89, "retsub", 4),
+    _op(0x8A, "proto", 8, ["uint8", "uint8"]),
+    _op(0x8B, "frame_dig", 8, ["int8"], pushes=1),
+    _op(0x8C, "frame_bury", 8, ["int8"], pops=1),
+    _op(0x8D, "switch", 8, ["labels"], pops=1),
+    _op(0x8E, "match", 8, ["labels"], pops=None),
+    _op(0x90, "shl", 4, pops=2, pushes=1),
+    _op(0x91, "shr", 4, pops=2, pushes=1),
+    _op(0x92, "sqrt", 4, pops=1, pushes=1, cost=4),
+    _op(0x93, "bitlen", 4, pops=1, pushes=1),
+    _op(0x94, "exp", 4, pops=2, pushes=1),
+    _op(0x95, "expw", 4, pops=2, pushes=2, cost=10),
+    _op(0x96, "bsqrt", 6, pops=1, pushes=1, cost=40),
+    _op(0x97, "divw", 6, pops=3, pushes=1),
+    _op(0x98, "sha3_256", 7, pops=1, pushes=1, cost=130),
+    _op(0xA0, "b+", 4, pops=2, pushes=1, cost=10),
+    _op(0xA1, "b-", 4, pops=2, pushes=1, cost=10),
+    _op(0xA2, "b/", 4, pops=2, pushes=1, cost=20),
+    _op(0xA3, "b*", 4, pops=2, pushes=1, cost=20),
+    _op(0xA4, "b<", 4, pops=2, pushes=1),
+    _op(0xA5, "b>", 4, pops=2, pushes=1),
+    _op(0xA6, "b<=", 4, pops=2, pushes=1),
+    _op(0xA7, "b>=", 4, pops=2, pushes=1),
+    _op(0xA8, "b==", 4, pops=2, pushes=1),
+    _op(0xA9, "b!=", 4, pops=2, pushes=1),
+    _op(0xAA, "b%", 4, pops=2, pushes=1, cost=20),
+    _op(0xAB, "b|", 4, pops=2, pushes=1, cost=6),
+    _op(0xAC, "b&", 4, pops=2, pushes=1, cost=6),
+    _op(0xAD, "b^", 4, pops=2, pushes=1, cost=6),
+    _op(0xAE, "b~", 4, pops=1, pushes=1, cost=4),
+    _op(0xAF, "bzero", 4, pops=1, pushes=1),
+    _op(0xB0, "log", 5, pops=1),
+    _op(0xB1, "itxn_begin", 5),
+    _op(0xB2, "itxn_field", 5, ["itxn_field"], pops=1),
+    _op(0xB3, "itxn_submit", 5),
+    _op(0xB4, "itxn", 5, ["txn"], pushes=1),
+    _op(0xB5, "itxna", 5, ["txna", "uint8"], pushes=1),
+    _op(0xB6, "itxn_next", 6),
+    _op(0xB7, "gitxn", 6, ["uint8", "txn"], pushes=1),
+    _op(0xB8, "gitxna", 6, ["uint8", "txna", "uint8"], pushes=1),
+    _op(0xB9, "box_create", 8, pops=2, pushes=1),
+    _op(0xBA, "box_extract", 8, pops=3, pushes=1),
+    _op(0xBB, "box_replace", 8, pops=3),
+    _op(0xBC, "box_del", 8, pops=1, pushes=1),
+    _op(0xBD, "box_len", 8, pops=1, pushes=2),
+    _op(0xBE, "box_get", 8, pops=1, pushes=2),
+    _op(0xBF, "box_put", 8, pops=2),
+    _op(0xC0, "txnas", 5, ["txna"], pops=1, pushes=1),
+    _op(0xC1, "gtxnas", 5, ["uint8", "txna"], pops=1, pushes=1),
+    _op(0xC2, "gtxnsas", 5, ["txna"], pops=2, pushes=1),
+    _op(0xC3, "args", 5, pops=1, pushes=1),
+    _op(0xC4, "gloadss", 6, pops=2, pushes=1),
+    _op(0xC5, "itxnas", 6, ["txna"], pops=1, pushes=1),
+    _op(0xC6, "gitxnas", 6, ["uint8", "txna"], pops=1, pushes=1),
+    _op(0xD0, "vrf_verify", 7, ["vrf"], pops=3, pushes=2, cost=5700),
+    _op(0xD1, "block", 7, ["block"], pops=1, pushes=1),
+]
+
+OPS = {spec.name: spec for spec in _OPS}
+OPS_BY_CODE = {spec.code: spec for spec in _OPS}
+
+# Constants named TMPL_* are template variables (tools/template.py).
+TEMPLATE_PREFIX = "TMPL_"
+
+# Ops that end a basic block without falling through. switch and match are
+# branches that fall through when no target is selected.
+TERMINATORS = {"err", "return", "b", "retsub"}
+BRANCHES = {"bnz", "bz", "b", "callsub", "switch", "match"}
+
+
+def _fields(*names, version=1):
+    """Sequentially numbered fields; a (name, version) entry sets the version from there on."""
+    out = {}
+    code = 0
+    for name in names:
+        if isinstance(name, tuple):
+            name, version = name
+        out[name] = (code, version)
+        code += 1
+    return out
+
+
+# name -> (code, first AVM version)
+TXN_FIELDS = _fields(
+    "Sender", "Fee", "FirstValid", ("FirstValidTime", 7), ("LastValid", 1), "Note", "Lease",
+    "Receiver", "Amount", "CloseRemainderTo", "VotePK", "SelectionPK", "VoteFirst", "VoteLast",
+    "VoteKeyDilution", "Type", "TypeEnum", "XferAsset", "AssetAmount", "AssetSender",
+    "AssetReceiver", "AssetCloseTo", "GroupIndex", "TxID", ("ApplicationID", 2), "OnCompletion",
+    "ApplicationArgs", "NumAppArgs", "Accounts", "NumAccounts", "ApprovalProgram",
+    "ClearStateProgram", "RekeyTo", "ConfigAsset", "ConfigAssetTotal", "ConfigAssetDecimals",
+    "ConfigAssetDefaultFrozen", "ConfigAssetUnitName", "ConfigAssetName", "ConfigAssetURL",
+    "ConfigAssetMetadataHash", "ConfigAssetManager", "ConfigAssetReserve", "ConfigAssetFreeze",
+    "ConfigAssetClawback", "FreezeAsset", "FreezeAssetAccount", "FreezeAssetFrozen",
+    ("Assets", 3), "NumAssets", "Applications", "NumApplications", "GlobalNumUint",
+    "GlobalNumByteSlice", "LocalNumUint", "LocalNumByteSlice", ("ExtraProgramPages", 4),
+    ("Nonparticipation", 5), "Logs", "NumLogs", "CreatedAssetID", "CreatedApplicationID",
+    ("LastLog", 6), "StateProofPK", ("ApprovalProgramPages", 7), "NumApprovalProgramPages",
+    "ClearStateProgramPages", "NumClearStateProgramPages",
+)
+TXN_ARRAY_FIELDS = {
+    name: TXN_FIELDS[name]
+    for name in ("ApplicationArgs", "Accounts", "Assets", "Applications", "Logs",
+                 "ApprovalProgramPages", "ClearStateProgramPages")
+}
+# Fields an inner transaction may set (itxn_field), with their first version.
+ITXN_FIELDS = {
+    name: (TXN_FIELDS[name][0], version)
+    for name, version in [
+        ("Sender", 5), ("Fee", 5), ("Note", 6), ("Receiver", 5), ("Amount", 5),
+        ("CloseRemainderTo", 5), ("VotePK", 6), ("SelectionPK", 6), ("VoteFirst", 6),
+        ("VoteLast", 6), ("VoteKeyDilution", 6), ("Type", 5), ("TypeEnum", 5), ("XferAsset", 5),
+        ("AssetAmount", 5), ("AssetSender", 5), ("AssetReceiver", 5), ("AssetCloseTo", 5),
+        ("ApplicationID", 6), ("OnCompletion", 6), ("ApplicationArgs", 6), ("Accounts", 6),
+        ("ApprovalProgram", 6), ("ClearStateProgram", 6), ("RekeyTo", 6), ("ConfigAsset", 5),
+        ("ConfigAssetTotal", 5), ("ConfigAssetDecimals", 5), ("ConfigAssetDefaultFrozen", 5),
+        ("ConfigAssetUnitName", 5), ("ConfigAssetName", 5), ("ConfigAssetURL", 5),
+        ("ConfigAssetMetadataHash", 5), ("ConfigAssetManager", 5), ("ConfigAssetReserve", 5),
+        ("ConfigAssetFreeze", 5), ("ConfigAssetClawback", 5), ("FreezeAsset", 5),
+        ("FreezeAssetAccount", 5), ("FreezeAssetFrozen", 5), ("Assets", 6), ("Applications", 6),
+        ("GlobalNumUint", 6), ("GlobalNumByteSlice", 6), ("LocalNumUint", 6),
+        ("LocalNumByteSlice", 6), ("ExtraProgramPages", 6), ("Nonparticipation", 6),
+        ("StateProofPK", 6), ("ApprovalProgramPages", 7), ("ClearStateProgramPages", 7),
+    ]
+}
+GLOBAL_FIELDS = _fields(
+    "MinTxnFee", "MinBalance", "MaxTxnLife", "ZeroAddress", "GroupSize", ("LogicSigVersion", 2),
+    "Round", "LatestTimestamp", "CurrentApplicationID", ("CreatorAddress", 3),
+    ("CurrentApplicationAddress", 5), "GroupID", ("OpcodeBudget", 6), "CallerApplicationID",
+    "CallerApplicationAddress",
+)
+ASSET_HOLDING_FIELDS = _fields("AssetBalance", "AssetFrozen", version=2)
+ASSET_PARAMS_FIELDS = _fields(
+    "AssetTotal", "AssetDecimals", "AssetDefaultFrozen", "AssetUnitName", "AssetName", "AssetURL",
+    "AssetMetadataHash", "AssetManager", "AssetReserve", "AssetFreeze", "AssetClawback",
+    ("AssetCreator", 5), version=2,
+)
+APP_PARAMS_FIELDS = _fields(
+    "AppApprovalProgram", "AppClearStateProgram", "AppGlobalNumUint", "AppGlobalNumByteSlice",
+    "AppLocalNumUint", "AppLocalNumByteSlice", "AppExtraProgramPages", "AppCreator", "AppAddress",
+    version=5,
+)
+ACCT_PARAMS_FIELDS = _fields(
+    "AcctBalance", "AcctMinBalance", "AcctAuthAddr", ("AcctTotalNumUint", 8),
+    "AcctTotalNumByteSlice", "AcctTotalExtraAppPages", "AcctTotalAppsCreated",
+    "AcctTotalAppsOptedIn", "AcctTotalAssetsCreated", "AcctTotalAssets", "AcctTotalBoxes",
+    "AcctTotalBoxBytes", version=6,
+)
+
+FIELDS = {
+    "txn": TXN_FIELDS,
+    "txna": TXN_ARRAY_FIELDS,
+    "itxn_field": ITXN_FIELDS,
+    "global": GLOBAL_FIELDS,
+    "asset_holding": ASSET_HOLDING_FIELDS,
+    "asset_params": ASSET_PARAMS_FIELDS,
+    "app_params": APP_PARAMS_FIELDS,
+    "acct_params": ACCT_PARAMS_FIELDS,
+    "ecdsa": {"Secp256k1": (0, 5), "Secp256r1": (1, 7)},
+    "base64": {"URLEncoding": (0, 7), "StdEncoding": (1, 7)},
+    "json_ref": {"JSONString": (0, 7), "JSONUint64": (1, 7), "JSONObject": (2, 7)},
+    "vrf": {"VrfAlgorand": (0, 7)},
+    "block": {"BlkSeed": (0, 7), "BlkTimestamp": (1, 7)},
+}
+
+# Named constants accepted by the `int` pseudo-op.
+NAMED_INTS = {
+    "NoOp": 0, "OptIn": 1, "CloseOut": 2, "ClearState": 3, "UpdateApplication": 4,
+    "DeleteApplication": 5,
+    "unknown": 0, "pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6,
+}
+
+
+class TealError(Exception):
+    def __init__(self, message, line=None):
+        super().__init__(f"line {line}: {message}" if line else message)
+        self.line = line
+
+
+@dataclass
+class Instr:
+    op: str
+    args: list
+    line: int
+    labels: list = field(default_factory=list)   # labels that point at this instruction
+
+    def __str__(self):
+        return " ".join([self.op] + self.args)
+
+
+@dataclass
+class Program:
+    version: int
+    instrs: list
+    labels: dict          # label -> index into instrs (len(instrs) for a trailing label)
+
+    def target(self, label):
+        return self.labels[label]
+
+
+def tokenize(line):
+    """Split a TEAL line into tokens, keeping quoted strings intact and dropping comments."""
+    tokens = []
+    i, n = 0, len(line)
+    while i < n:
+        ch = line[i]
+        if ch.isspace():
+            i += 1
+            continue
+        if line.startswith("//", i):
+            break
+        start = i
+        if ch == '"':
+            i += 1
+            while i < n and line[i] != '"':
+                i += 2 if line[i] == "\\" else 1
+            if i >= n:
+                raise TealError("unterminated string literal")
+            i += 1
+        else:
+            while i < n and not line[i].isspace():
+                if line[i] == '"':
+                    i += 1
+                    while i < n and line[i] != '"':
+                        i += 2 if line[i] == "\\" else 1
+                i += 1
+        tokens.append(line[start:i])
+    return tokens
+
+
+def parse(text):
+    """Parse TEAL source into a Program of instructions and label positions."""
+    version = 1
+    instrs = []
+    labels = {}
+    pending = []
+    for lineno, raw in enumerate(text.splitlines(), 1):
+        try:
+            tokens = tokenize(raw)
+        except TealError as e:
+            raise TealError(str(e), lineno) from None
+        if not tokens:
+            continue
+        if tokens[0] == "#pragma":
+            if len(tokens) == 3 and tokens[1] == "version":
+                version = int(tokens[2])
+                if not 1 <= version <= MAX_VERSION:
+                    raise TealError(f"unsupported version {version}", lineno)
+                continue
+            raise TealError(f"unknown pragma: {raw.strip()}", lineno)
+        while tokens and tokens[0].endswith(":") and not tokens[0].startswith('"'):
+            label = tokens.pop(0)[:-1]
+            if label in labels:
+                raise TealError(f"duplicate label {label}", lineno)
+            labels[label] = len(instrs)
+            pending.append(label)
+        if not tokens:
+            continue
+        instrs.append(Instr(tokens[0], tokens[1:], lineno, pending))
+        pending = []
+    return Program(version, instrs, labels)
+
+
+def is_template(token):
+    """True for a template variable (`int TMPL_NAME`), filled in when the program is deployed."""
+    return token.startswith(TEMPLATE_PREFIX)
+
+
+def parse_int(token, line=None):
+    """Parse an integer literal the way go's strconv.ParseUint(s, 0, 64) does."""
+    if token in NAMED_INTS:
+        return NAMED_INTS[token]
+    try:
+        if len(token) > 1 and token[0] == "0" and token[1].isdigit():
+            value = int(token[1:].replace("_", ""), 8)
+        else:
+            value = int(token, 0)
+    except ValueError:
+        raise TealError(f"unable to parse {token!r} as integer", line) from None
+    if not 0 <= value < 2**64:
+        raise TealError(f"{token} overflows uint64", line)
+    return value
+
+
+_ESCAPES = {"n": b"\n", "r": b"\r", "t": b"\t", "\\": b"\\", '"': b'"'}
+
+
+def parse_string(token, line=None):
+    body = token[1:-1]
+    out = bytearray()
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if ch != "\\":
+            out += ch.encode()
+            i += 1
+            continue
+        esc = body[i + 1:i + 2]
+        if esc in _ESCAPES:
+            out += _ESCAPES[esc]
+            i += 2
+        elif esc == "x":
+            try:
+                out.append(int(body[i + 2:i + 4], 16))
+            except ValueError:
+                raise TealError(f"bad escape in {token}", line) from None
+            i += 4
+        else:
+            raise TealError(f"invalid escape \\{esc} in {token}", line)
+    return bytes(out)
+
+
+def parse_bytes(args, line=None):
+    """Decode a byte-string literal; returns (value, tokens consumed)."""
+    if not args:
+        raise TealError("missing byte literal", line)
+    first = args[0]
+    for prefix in ("base64", "b64", "base32", "b32"):
+        if first == prefix and len(args) > 1:
+            return _decode_prefixed(prefix, args[1], line), 2
+        if first.startswith(prefix + "(") and first.endswith(")"):
+            return _decode_prefixed(prefix, first[len(prefix) + 1:-1], line), 1
+    if first.startswith("0x"):
+        try:
+            return bytes.fromhex(first[2:]), 1
+        except ValueError:
+            raise TealError(f"bad hex literal {first}", line) from None
+    if first.startswith('"') and first.endswith('"') and len(first) >= 2:
+        return parse_string(first, line), 1
+    raise TealError(f"unable to parse byte literal {first!r}", line)
+
+
+def _decode_prefixed(prefix, data, line):
+    try:
+        if prefix.startswith("b64") or prefix == "base64":
+            return base64.b64decode(data, validate=True)
+        padded = data + "=" * (-len(data) % 8)
+        return base64.b32decode(padded)
+    except ValueError:
+        raise TealError(f"bad {prefix} literal {data}", line) from None
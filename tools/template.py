@@ -0,0 +1,171 @@
+"""
+Deploy-time parameters patched into prebuilt bytecode.
+
+A contract leaves a constant open as a TEAL template variable
+(`Tmpl.Int("TMPL_TRUST_APP_ID")`) and lists its default in a module-level
+TEMPLATE_VARIABLES. The build assembles the program once, with a one-byte
+placeholder for each variable at the end of the constant blocks, and
+records the placeholder bytecode and offsets in the contract's
+.compiled.json ("template" under "approval"). Deploying with other values
+is then a splice into that bytecode: no PyTeal, no assembly, no node.
+
+    from tools.template import load
+    template = load("asset_escrow")
+    program = template.patch(TRUST_APP_ID=trust_app_id, MIN_COLLATERAL=2_000_000)
+
+    python -m tools.template asset_escrow TRUST_APP_ID=123 -o escrow.tok
+    python -m tools.template debug_escrow.teal TRUST_APP_ID=123 TRUST_THRESHOLD=50 MIN_COLLATERAL=1000000
+
+Values left out keep the contract's defaults. The patched program is
+byte-identical to `assemble(teal, values)` (the build checks this for the
+defaults), though not to assembling TEAL with the values written in: a
+literal used once would become a push op instead of a block constant.
+`substitute` writes values into the TEAL text instead, for tools/avm and
+algod's compile endpoint.
+"""
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+from dataclasses import dataclass
+
+from algosdk import logic
+
+from .assemble import assemble, template_value, uvarint
+from .teal import TEMPLATE_PREFIX, TealError
+
+Variable = namedtuple("Variable", "kind offset default")    # kind: "int" or "byte"; default None if required
+
+_TOKEN = re.compile(r"\b" + TEMPLATE_PREFIX + r"(\w+)\b")
+
+
+@dataclass
+class Template:
+    bytecode: bytes         # with every variable's placeholder in place
+    variables: dict         # name (without TMPL_) -> Variable
+
+    @classmethod
+    def from_assembled(cls, program, defaults=None):
+        """Template for a program assembled without template values."""
+        defaults = defaults or {}
+        return cls(program.bytecode, {
+            name: Variable(kind, offset, defaults.get(name)) for name, (kind, offset) in program.templates.items()
+        })
+
+    @classmethod
+    def from_json(cls, data):
+        variables = {}
+        for name, var in data["variables"].items():
+            default = var.get("default")
+            if var["type"] == "byte" and default is not None:
+                default = base64.b64decode(default)
+            variables[name] = Variable(var["type"], var["offset"], default)
+        return cls(base64.b64decode(data["result"]), variables)
+
+    def to_json(self):
+        variables = {}
+        for name, var in self.variables.items():
+            default = var.default
+            if isinstance(default, bytes):
+                default = base64.b64encode(default).decode()
+            variables[name] = {"type": var.kind, "offset": var.offset, "default": default}
+        return {"result": base64.b64encode(self.bytecode).decode(), "variables": variables}
+
+    def values(self, overrides=None):
+        """Every variable's value: the defaults updated with `overrides`."""
+        overrides = overrides or {}
+        unknown = sorted(set(overrides) - set(self.variables))
+        if unknown:
+            raise ValueError(f"unknown template variable(s): {', '.join(unknown)}")
+        values = {}
+        for name, var in self.variables.items():
+            value = overrides.get(name, var.default)
+            if value is None:
+                raise ValueError(f"no value for template variable {TEMPLATE_PREFIX}{name}")
+            values[name] = template_value(var.kind, name, value)
+        return values
+
+    def patch(self, values=None, **kwargs):
+        """Bytecode with the given values (defaults for the rest) spliced into the placeholders."""
+        values = self.values(dict(values or {}, **kwargs))
+        out, pos = bytearray(), 0
+        for name, var in sorted(self.variables.items(), key=lambda item: item[1].offset):
+            value = values[name]
+            out += self.bytecode[pos:var.offset]
+            out += uvarint(value) if var.kind == "int" else uvarint(len(value)) + value
+            pos = var.offset + 1    # the placeholder: uvarint 0, or a zero length
+        out += self.bytecode[pos:]
+        return bytes(out)
+
+
+def substitute(text, values):
+    """TEAL text with each TMPL_NAME replaced by values[NAME] (ints in decimal, bytes in hex)."""
+    def replace(match):
+        name = match.group(1)
+        if name not in values:
+            raise ValueError(f"no value for template variable {match.group(0)}")
+        value = values[name]
+        if isinstance(value, int):
+            return str(value)
+        return "0x" + (value.encode() if isinstance(value, str) else value).hex()
+
+    return _TOKEN.sub(replace, text)
+
+
+def load(source, role="approval"):
+    """Template of a built contract by name, or of a .teal file (then assembled here, with no defaults)."""
+    if source.endswith(".teal"):
+        with open(source) as f:
+            return Template.from_assembled(assemble(f.read()))
+    from .build import CONTRACTS, ROOT
+
+    contract = CONTRACTS[source]
+    with open(os.path.join(ROOT, contract.compiled_path)) as f:
+        entry = json.load(f)[role]
+    if "template" not in entry:
+        raise ValueError(f"{source} {role} has no template variables")
+    return Template.from_json(entry["template"])
+
+
+def _parse_value(text):
+    if text.isdigit():
+        return int(text)
+    if text.startswith("0x"):
+        return bytes.fromhex(text[2:])
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Patch template variables into prebuilt bytecode.")
+    parser.add_argument("source", help="a contract name from tools/build.py, or a .teal file")
+    parser.add_argument("values", nargs="*", metavar="NAME=VALUE",
+                        help="template values without the TMPL_ prefix (ints, 0x hex or text)")
+    parser.add_argument("-o", "--output", help="write the bytecode here")
+    args = parser.parse_args(argv)
+
+    values = {}
+    for item in args.values:
+        name, sep, value = item.partition("=")
+        if not sep:
+            parser.error(f"expected NAME=VALUE, got {item!r}")
+        values[name.removeprefix(TEMPLATE_PREFIX)] = _parse_value(value)
+    try:
+        template = load(args.source)
+        bytecode = template.patch(values)
+    except (KeyError, ValueError, TealError) as e:
+        print(f"{args.source}: {e}", file=sys.stderr)
+        return 1
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(bytecode)
+    used = {k: v if isinstance(v, int) else "0x" + v.hex() for k, v in template.values(values).items()}
+    print(json.dumps({"hash": logic.address(bytecode), "result": base64.b64encode(bytecode).decode(),
+                      "size": len(bytecode), "output": args.output, "values": used}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
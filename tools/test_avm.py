@@ -0,0 +1,174 @@
+import pytest
+
+from tools.avm import MIN_TXN_FEE, Ledger, Rejected, app_call
+
+CALLS_ONLY = "#pragma version 8\ntxn ApplicationID\nbz ok\n{body}\nok:\nint 1\n"    # creation just approves
+
+
+def _app(body, funding=0):
+    ledger = Ledger()
+    creator = ledger.new_account(10**9)
+    app = ledger.deploy(creator, CALLS_ONLY.format(body=body))
+    if funding:
+        ledger.fund(ledger.app_address(app), funding)
+    return ledger, creator, app
+
+
+@pytest.mark.parametrize("body, error", [
+    ("int 18446744073709551615\nint 1\n+", r"\+ overflowed"),
+    ("int 0\nint 1\n-", "- would result negative"),
+    ("int 4294967296\ndup\n*", r"\* overflowed"),
+    ("int 2\nint 64\nexp", "exp overflowed"),
+    ("int 1\nint 0\n/", "/ 0"),
+    ("int 1\nint 0\n%", "% 0"),
+    ("byte 0x010000000000000000\nbtoi", "btoi arg too long"),
+])
+def test_arithmetic_panics(body, error):
+    ledger, creator, app = _app(body + "\npop")
+    with pytest.raises(Rejected, match=error):
+        ledger.call(creator, app)
+
+
+@pytest.mark.parametrize("body, value", [
+    ("int 18446744073709551614\nint 1\n+", 2**64 - 1),
+    ("int 1\nint 1\n-", 0),
+    ("int 4294967295\ndup\n*", (2**32 - 1) ** 2),
+    ("int 2\nint 63\nexp", 2**63),
+])
+def test_arithmetic_at_the_limits(body, value):
+    ledger, creator, app = _app(body + "\nitob\nlog")
+    assert ledger.call(creator, app).logs == [value.to_bytes(8, "big")]
+
+
+SWITCH = """txna ApplicationArgs 0
+btoi
+switch zero one
+byte "none"
+log
+b ok
+zero:
+byte "zero"
+log
+b ok
+one:
+byte "one"
+log"""
+
+MATCH = """byte "a"
+byte "b"
+txna ApplicationArgs 0
+match la lb
+byte "none"
+log
+b ok
+la:
+byte "a"
+log
+b ok
+lb:
+byte "b"
+log"""
+
+
+@pytest.mark.parametrize("body, arg, logged", [
+    (SWITCH, 0, b"zero"),
+    (SWITCH, 1, b"one"),
+    (SWITCH, 2, b"none"),           # past the last label: falls through
+    (MATCH, b"a", b"a"),
+    (MATCH, b"b", b"b"),
+    (MATCH, b"c", b"none"),         # no match: falls through
+])
+def test_switch_and_match_fall_through(body, arg, logged):
+    ledger, creator, app = _app(body)
+    assert ledger.call(creator, app, arg).logs == [logged]
+
+
+BOXES = """txna ApplicationArgs 0
+byte "create"
+==
+bnz create
+byte "big"
+box_get
+assert
+len
+itob
+log
+b ok
+create:
+byte "big"
+int 1500
+box_create
+assert"""
+
+
+def test_box_io_is_limited_by_references():
+    ledger, creator, app = _app(BOXES, funding=10**7)
+    # each reference grants 1024 bytes of box I/O, shared by the group
+    with pytest.raises(Rejected, match=r"box write budget \(1024 bytes\)"):
+        ledger.call(creator, app, b"create", boxes=[b"big"])
+    ledger.call(creator, app, b"create", boxes=[b"big", b"big"])
+    with pytest.raises(Rejected, match=r"box read budget \(1024 bytes\)"):
+        ledger.call(creator, app, b"read", boxes=[b"big"])
+    with pytest.raises(Rejected, match="invalid Box reference"):
+        ledger.call(creator, app, b"read")
+    assert ledger.call(creator, app, b"read", boxes=[b"big", b""]).logs == [(1500).to_bytes(8, "big")]
+    group = [app_call(creator, app, b"read", boxes=[b"big"]), app_call(creator, app, b"read", boxes=[b""])]
+    ledger.submit(group)
+    assert group[0].logs == group[1].logs == [(1500).to_bytes(8, "big")]
+
+
+LOOP = """txn NumAppArgs
+bz ok
+int 0
+store 0
+loop:
+load 0
+int 1
++
+dup
+store 0
+int 200
+<
+bnz loop"""                     # 8 opcodes a round: 1600 in all
+
+
+def test_budget_pools_across_the_group():
+    ledger, creator, app = _app(LOOP)
+    with pytest.raises(Rejected, match="dynamic cost budget exceeded"):
+        ledger.call(creator, app, b"loop")
+    with pytest.raises(Rejected, match="dynamic cost budget exceeded"):
+        ledger.submit([app_call(creator, app, b"loop"), app_call(creator, app)])
+    result = ledger.submit([app_call(creator, app, b"loop"), app_call(creator, app), app_call(creator, app)])
+    assert 1600 < result.cost <= 3 * 700
+
+
+INNER_PAY = """itxn_begin
+int pay
+itxn_field TypeEnum
+txn Sender
+itxn_field Receiver
+int 1000
+itxn_field Amount
+txna ApplicationArgs 0
+btoi
+bz submit
+int 0
+itxn_field Fee
+submit:
+itxn_submit"""
+
+
+def test_inner_fees():
+    ledger, creator, app = _app(INNER_PAY, funding=10**6)
+    app_address = ledger.app_address(app)
+
+    def spent(arg, fee):
+        before = ledger.balance(app_address)
+        ledger.call(creator, app, arg, fee=fee)
+        return before - ledger.balance(app_address)
+
+    assert spent(0, MIN_TXN_FEE) == 1000 + MIN_TXN_FEE       # the app account pays its own fee
+    assert spent(0, 2 * MIN_TXN_FEE) == 1000                  # the outer fee's surplus covers it
+    assert spent(1, 2 * MIN_TXN_FEE) == 1000                  # Fee 0, pooled explicitly
+    with pytest.raises(Rejected, match="fee too small for inner transaction"):
+        ledger.call(creator, app, 1, fee=MIN_TXN_FEE)
@@ -0,0 +1,41 @@
+import json
+
+from tools.bench import METRICS, compare, load_baseline, main, run
+
+ROW = {"cost": 100, "inner_txns": 1, "box_bytes": 0, "local_bytes": 10, "program_bytes": 500, "time_us": 50.0}
+
+
+def test_compare_flags_growth_past_the_thresholds():
+    baseline = {"a": ROW, "b": dict(ROW, box_bytes=0)}
+    current = {
+        "a": dict(ROW, cost=110, local_bytes=12, time_us=99.0),    # +10% cost is allowed, +20% is not
+        "b": dict(ROW, box_bytes=1, cost=50),                       # anything from zero is growth
+        "new": dict(ROW, cost=10**6),                               # not in the baseline yet
+    }
+    assert compare(current, baseline) == [("a", "local_bytes", 10, 12), ("b", "box_bytes", 0, 1)]
+    assert ("a", "time_us", 50.0, 101.0) in compare(dict(current, a=dict(current["a"], time_us=101.0)), baseline)
+    assert compare(current, baseline, threshold=25, time_threshold=None) == [("b", "box_bytes", 0, 1)]
+
+
+def test_deterministic_metrics_match_the_baseline():
+    # One round measures the same maxima as the baseline's rounds; a change
+    # here means the baseline needs `python -m tools.bench --update`.
+    current = run(rounds=1)
+    baseline = load_baseline()
+    assert set(current) == set(baseline)
+    for label, row in current.items():
+        assert {key: row[key] for key in METRICS} == {key: baseline[label][key] for key in METRICS}, label
+
+
+def test_main_fails_on_a_regression(tmp_path, capsys):
+    path = str(tmp_path / "baseline.json")
+    args = ["civic_rewards", "--rounds", "1", "--no-time", "--baseline", path]
+    assert main(args + ["--update"]) == 0
+    assert main(args) == 0
+    with open(path) as f:
+        saved = json.load(f)
+    saved["methods"]["civic_rewards.payout"]["cost"] -= 10
+    with open(path, "w") as f:
+        json.dump(saved, f)
+    assert main(args) == 1
+    assert "civic_rewards.payout" in capsys.readouterr().out.split("regressions:")[1]
@@ -0,0 +1,60 @@
+import pytest
+
+from contracts.budget import CHECK_HEADROOM, OPUP_COST
+from contracts.reputation import EXPONENTIAL_DECAY
+from tools.avm import Ledger, OptIn, app_call
+from tools.budget import APP_CALL_BUDGET, MAX_GROUP_SIZE, pack, padding
+from tools.localnet import deploy
+from tools.trust_batch import MAX_ACCOUNTS, avm_groups, plan
+
+HALF_LIFE = 30 * 24 * 60 * 60
+GROUP_USERS = {(False, False): 64, (True, False): 61, (False, True): 51, (True, True): 46}
+
+
+def test_padding_covers_the_shortfall_and_the_check():
+    assert padding(APP_CALL_BUDGET - CHECK_HEADROOM) == 0
+    assert padding(APP_CALL_BUDGET - CHECK_HEADROOM + 1) == 1
+    assert padding(APP_CALL_BUDGET - CHECK_HEADROOM + APP_CALL_BUDGET - OPUP_COST + 1) == 2
+    assert padding(3 * APP_CALL_BUDGET, calls=3) == 1
+
+
+def test_pack_fills_groups_up_to_the_limit():
+    groups = pack(range(10), lambda items: 400 * len(items), per_call=2)
+    for calls, count in groups:
+        assert len(calls) + count <= MAX_GROUP_SIZE
+        assert count == padding(400 * sum(map(len, calls)), len(calls))
+    assert [item for calls, _ in groups for call in calls for item in call] == list(range(10))
+    with pytest.raises(ValueError, match="does not fit in one group"):
+        pack([1], lambda items: 20 * APP_CALL_BUDGET * MAX_GROUP_SIZE, per_call=1)
+
+
+@pytest.mark.parametrize("boxes, decay", sorted(GROUP_USERS))
+def test_full_trust_batches_pass_on_chain(boxes, decay):
+    name = "trust_score_box" if boxes else "trust_score"
+    users = GROUP_USERS[boxes, decay]
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    args = {name: [EXPONENTIAL_DECAY, HALF_LIFE]} if decay else None
+    app = deploy(ledger, admin, [name], funding=10**8, args=args)[name]
+    accounts = [ledger.new_account(10**9) for _ in range(users + 1)]
+    if not boxes:
+        for account in accounts:
+            ledger.submit([app_call(account, app, on_complete=OptIn)])
+    updates = {account: (5, 1, 1) for account in accounts}
+    assert [sum(map(len, (a for a, _ in group))) for group in plan(updates, boxes, decay)] == [users, 1]
+
+    # a second pass writes over decayed records, each method's worst case
+    for measure in (None, ledger):
+        groups = avm_groups(admin, app, updates, boxes, decay, ledger=measure)
+        assert len(groups[0]) <= MAX_GROUP_SIZE
+        assert sum(1 for call in groups[0] if call.accounts) == -(-users // MAX_ACCOUNTS)
+        for group in groups:
+            ledger.submit(group)
+            # the padding covered the pooled check: no call topped itself up with inner opups
+            assert not [t for call in group for t in call.inner_txns if t.type == "appl"]
+        ledger.advance(HALF_LIFE // 2)
+    if decay:
+        # unpadded, the same calls only pass by topping themselves up out of the fees
+        group = [call for call in avm_groups(admin, app, updates, boxes, decay)[0] if call.accounts]
+        ledger.submit(group)
+        assert [t for call in group for t in call.inner_txns if t.type == "appl"]
@@ -0,0 +1,113 @@
+import base64
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from contracts import asset_escrow as escrow
+from contracts.commute_checkin import GLOBAL_STATE, LOCAL_STATE, queue_slot
+from tools.avm import Ledger, OptIn, app_call, method_call, payment
+from tools.bench import SCENARIOS, Bench
+from tools.build import CONTRACTS, ROOT, contract_name, main
+from tools.localnet import deploy
+from tools.template import Template
+
+# What scripts/deploy_all.cjs sends: a contract's programs from scripts/prebuilt.cjs.
+LOAD_PROGRAMS = """
+const { loadProgram, loadSchema } = require('./scripts/prebuilt.cjs');
+const [teal, templates] = [process.argv[1], JSON.parse(process.argv[2])];
+const encode = (bytes) => Buffer.from(bytes).toString('base64');
+process.stdout.write(JSON.stringify({
+    approval: encode(loadProgram(teal, 'approval', templates)),
+    clear: encode(loadProgram(teal.replace(/\\.teal$/, '.clear.teal'), 'clear')),
+    schema: loadSchema(teal),
+}));
+"""
+
+
+def _keys(state):
+    return {key.decode(): "bytes" if isinstance(value, bytes) else "uint64" for key, value in state.items()}
+
+
+def _written_local_keys(ledger, app):
+    written = {}
+    for addr in ledger.accounts:
+        written.update(_keys(ledger.local_state(addr, app) or {}))
+    return written
+
+
+def test_commute_schema_matches_written_keys():
+    bench = Bench()
+    SCENARIOS["commute"](bench)
+    app = bench.apps["commute_checkin"]
+    assert _written_local_keys(bench.ledger, app) == LOCAL_STATE
+    assert _keys(bench.ledger.global_state(app)) == GLOBAL_STATE
+
+    contract = CONTRACTS["commute_checkin"]
+    assert contract.global_schema == (2, 0)
+    assert contract.local_schema == (3, 2)
+    with open(os.path.join(ROOT, contract.compiled_path)) as f:
+        schema = json.load(f)["schema"]
+    assert schema == {"globalInts": 2, "globalBytes": 0, "localInts": 3, "localBytes": 2}
+
+
+def test_escrow_schema_matches_written_keys():
+    ledger = Ledger()
+    lender = ledger.new_account(10**12)
+    apps = deploy(ledger, lender, ["trust_score", "asset_escrow"])
+    app, trust = apps["asset_escrow"], apps["trust_score"]
+    borrower = ledger.new_account(10**9)
+    ledger.submit([app_call(borrower, app, on_complete=OptIn)])
+    ledger.submit([payment(borrower, ledger.app_address(app), 10**6),
+                   app_call(borrower, app, b"borrow", b"item", applications=[trust])])     # a legacy loan
+    assert _written_local_keys(ledger, app) == escrow.LOCAL_STATE
+    assert _keys(ledger.global_state(app)) == escrow.GLOBAL_STATE
+
+    contract = CONTRACTS["asset_escrow"]
+    assert (contract.global_schema, contract.local_schema) == ((0, 0), (2, 1))
+    with open(os.path.join(ROOT, contract.compiled_path)) as f:
+        assert json.load(f)["schema"] == {"globalInts": 0, "globalBytes": 0, "localInts": 2, "localBytes": 1}
+
+
+def test_builds_by_source_file():
+    assert contract_name("contracts/asset_escrow.py") == "asset_escrow"
+    assert contract_name(os.path.join(ROOT, "algorand", "contract.py")) == "match_payout"
+    assert contract_name("trust_score") == "trust_score"
+    with pytest.raises(SystemExit):
+        main(["contracts/reputation.py"])          # a helper module, not a contract
+
+
+def _deploy_all_programs(name, templates=None):
+    out = subprocess.run(["node", "-e", LOAD_PROGRAMS, CONTRACTS[name].approval_path, json.dumps(templates or {})],
+                         cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    loaded = json.loads(out)
+    return base64.b64decode(loaded["approval"]), base64.b64decode(loaded["clear"]), loaded["schema"]
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_deploy_all_sends_the_prebuilt_bytes():
+    ledger = Ledger()
+    creator = ledger.new_account(10**12)
+    apps = {}
+    for name in ("trust_score", "commute_checkin"):
+        templates = {"TRUST_APP_ID": apps["trust_score"]} if name == "commute_checkin" else {}
+        approval, clear, schema = _deploy_all_programs(name, templates)
+        with open(os.path.join(ROOT, CONTRACTS[name].compiled_path)) as f:
+            compiled = json.load(f)
+        if "template" in compiled["approval"]:
+            assert approval == Template.from_json(compiled["approval"]["template"]).patch(templates)
+        else:
+            assert approval == base64.b64decode(compiled["approval"]["result"])
+        assert clear == base64.b64decode(compiled["clear"]["result"])
+        apps[name] = ledger.deploy(creator, approval, clear=clear,
+                                   global_schema=(schema["globalInts"], schema["globalBytes"]),
+                                   local_schema=(schema["localInts"], schema["localBytes"]))
+        ledger.fund(ledger.app_address(apps[name]), 10**6)
+
+    driver = ledger.new_account(10**9)
+    commute = apps["commute_checkin"]
+    ledger.submit([app_call(driver, commute, on_complete=OptIn)])
+    ledger.submit([method_call(driver, commute, "register_driver()void", boxes=[queue_slot(0)[0]])])
+    assert ledger.local_state(driver, commute)[b"role"] == b"driver"
@@ -0,0 +1,126 @@
+import pytest
+
+from contracts.commute_checkin import HEAD_KEY, MAX_STALE_SKIPS, SLOTS_PER_PAGE, TAIL_KEY, queue_slot
+from tools.avm import MIN_TXN_FEE, Ledger, OptIn, Rejected, address, app_call, method_call, payment
+from tools.localnet import deploy
+
+FARE = 2_000_000
+
+
+class Commute:
+    """commute_checkin and its trust app on a ledger, with the queue's box references filled in."""
+
+    def __init__(self):
+        self.ledger = Ledger()
+        operator = self.ledger.new_account(10**12)
+        apps = deploy(self.ledger, operator, ["trust_score", "commute_checkin"])
+        self.app, self.trust = apps["commute_checkin"], apps["trust_score"]
+
+    def position(self, key):
+        return self.ledger.global_state(self.app).get(key.encode(), 0)
+
+    def join(self, role):
+        account = self.ledger.new_account(10**9)
+        self.ledger.submit([app_call(account, self.app, on_complete=OptIn)])
+        self.call(account, f"register_{role}()void")
+        return account
+
+    def call(self, sender, method, *args, **fields):
+        if method == "register_driver()void":
+            fields["boxes"] = [queue_slot(self.position(TAIL_KEY))[0]]
+        return self.ledger.submit([method_call(sender, self.app, method, *args, **fields)])
+
+    def start_trip(self, rider, *drivers, pages=1):
+        head = self.position(HEAD_KEY)
+        boxes = [queue_slot(head + SLOTS_PER_PAGE * i)[0] for i in range(pages)]
+        self.ledger.submit([
+            payment(rider, self.ledger.app_address(self.app), FARE),
+            method_call(rider, self.app, "start_trip(pay)void", accounts=list(drivers), boxes=boxes),
+        ])
+
+    def matched_with(self, account):
+        return self.ledger.local_state(account, self.app).get(b"matched_with")
+
+
+def test_riders_match_drivers_in_order():
+    commute = Commute()
+    drivers = [commute.join("driver") for _ in range(3)]
+    commute.call(drivers[0], "register_driver()void")         # already queued: a no-op
+    assert commute.position(TAIL_KEY) == 3
+    for driver in drivers:
+        rider = commute.join("rider")
+        with pytest.raises(Rejected, match="unavailable Account"):
+            commute.start_trip(rider, commute.ledger.new_account())     # not the head driver
+        commute.start_trip(rider, driver)
+        assert commute.matched_with(rider) == address(driver)
+        assert commute.matched_with(driver) == address(rider)
+    assert commute.position(HEAD_KEY) == 3
+    with pytest.raises(Rejected, match="assert failed"):
+        commute.start_trip(commute.join("rider"))                # the queue is empty
+
+
+def test_start_trip_skips_departed_drivers():
+    commute = Commute()
+    left, became_rider, also_left, waiting = [commute.join("driver") for _ in range(4)]
+    commute.call(left, "leave_queue()void")
+    commute.call(became_rider, "register_rider()void")
+    commute.call(also_left, "leave_queue()void")
+    rider = commute.join("rider")
+    with pytest.raises(Rejected, match="unavailable Account"):
+        commute.start_trip(rider, left, became_rider, waiting)        # every skipped driver is referenced
+    commute.start_trip(rider, left, became_rider, also_left, waiting)
+    assert commute.matched_with(waiting) == address(rider)
+    assert commute.position(HEAD_KEY) == 4
+
+
+def test_start_trip_skips_at_most_max_stale_skips():
+    commute = Commute()
+    drivers = [commute.join("driver") for _ in range(MAX_STALE_SKIPS + 2)]
+    for driver in drivers[:MAX_STALE_SKIPS + 1]:
+        commute.call(driver, "leave_queue()void")
+    rider = commute.join("rider")
+    # with the driver, one more departed entry would not fit in the foreign accounts
+    with pytest.raises(Rejected, match="unavailable Account"):
+        commute.start_trip(rider, *drivers[:MAX_STALE_SKIPS], drivers[-1])
+    commute.call(rider, "pop_stale()void", accounts=[drivers[0]], boxes=[queue_slot(0)[0]])
+    commute.start_trip(rider, *drivers[1:])
+    assert commute.matched_with(rider) == address(drivers[-1])
+    with pytest.raises(Rejected, match="assert failed"):                  # the head is waiting
+        commute.call(rider, "pop_stale()void", accounts=[drivers[-1]], boxes=[queue_slot(0)[0]])
+
+
+def test_skips_cross_queue_pages():
+    commute = Commute()
+    for _ in range(SLOTS_PER_PAGE - 2):
+        driver = commute.join("driver")
+        commute.call(driver, "leave_queue()void")
+        commute.call(driver, "pop_stale()void", accounts=[driver], boxes=[queue_slot(0)[0]])
+    first, second, waiting = [commute.join("driver") for _ in range(3)]
+    for driver in (first, second):
+        commute.call(driver, "leave_queue()void")
+    rider = commute.join("rider")
+    assert queue_slot(commute.position(TAIL_KEY) - 1)[0] != queue_slot(commute.position(HEAD_KEY))[0]
+    with pytest.raises(Rejected, match="invalid Box reference"):
+        commute.start_trip(rider, first, second, waiting)
+    commute.start_trip(rider, first, second, waiting, pages=2)
+    assert commute.matched_with(rider) == address(waiting)
+
+
+def test_end_trip_pays_only_the_matched_driver():
+    commute = Commute()
+    driver, other = commute.join("driver"), commute.join("driver")
+    rider = commute.join("rider")
+    commute.start_trip(rider, driver)
+    end = "end_trip(address)void"
+    fields = dict(applications=[commute.trust], fee=3 * MIN_TXN_FEE)
+    with pytest.raises(Rejected, match="assert failed"):
+        commute.call(rider, end, other, accounts=[other], **fields)
+    before = commute.ledger.balance(driver)
+    commute.call(rider, end, driver, accounts=[driver], **fields)
+    assert commute.ledger.balance(driver) == before + FARE
+    assert commute.matched_with(rider) is None and commute.matched_with(driver) is None
+    # the driver rejoins at the back, behind the one still waiting
+    commute.call(driver, "register_driver()void")
+    rider = commute.join("rider")
+    commute.start_trip(rider, other)
+    assert commute.matched_with(rider) == address(other)
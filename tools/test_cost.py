@@ -0,0 +1,103 @@
+import pytest
+
+from tools.assemble import assemble, method_selector
+from tools.avm import Ledger
+from tools.cost import Analyzer
+from tools.lower import lower_dispatch
+from tools.teal import parse
+
+SOURCE = """#pragma version 8
+txn ApplicationID
+int 0
+==
+bnz create
+txna ApplicationArgs 0
+method "pay()void"
+==
+bnz pay
+txna ApplicationArgs 0
+method "count()void"
+==
+bnz count
+txna ApplicationArgs 0
+method "double()void"
+==
+bnz double
+err
+create:
+int 1
+return
+pay:
+itxn_begin
+int pay
+itxn_field TypeEnum
+txn Sender
+itxn_field Receiver
+int 1000
+itxn_field Amount
+itxn_submit
+int 1
+return
+count:
+int 0
+store 0
+loop:
+load 0
+int 1
++
+dup
+store 0
+int 3
+<
+bnz loop
+int 1
+return
+double:
+int 21
+callsub twice
+itob
+log
+int 1
+return
+twice:
+dup
++
+retsub
+"""
+
+LOOP_ROUNDS = 3         # count's loop runs 3 times
+
+
+def _methods(source, loop_bound=LOOP_ROUNDS):
+    return {m.name: m for m in Analyzer(parse(source), loop_bound).methods()}
+
+
+@pytest.mark.parametrize("lower", [False, True])
+def test_static_costs_match_execution(lower):
+    source = lower_dispatch(SOURCE) if lower else SOURCE
+    methods = _methods(source)
+    ledger = Ledger()
+    creator = ledger.new_account(10**9)
+    app = ledger.deploy(creator, source)
+    ledger.fund(ledger.app_address(app), 10**6)
+    for name in ("pay", "count", "double"):
+        result = ledger.call(creator, app, method_selector(f"{name}()void"))
+        assert methods[name].cost == result.cost, name
+        assert methods[name].inner == len(result.txns[0].inner_txns)
+    assert (methods["count"].loops, methods["pay"].loops) == (True, False)
+    assert Analyzer(parse(source)).bytecode_len == len(assemble(source).bytecode)
+
+
+def test_dispatch_costs():
+    chain = _methods(SOURCE)
+    # each compare/bnz test costs 4, and the last method pays for every test above it
+    assert [chain[name].dispatch for name in ("create", "pay", "count", "double")] == [4, 8, 12, 16]
+    lowered = _methods(lower_dispatch(SOURCE))
+    # match: one push per selector plus the subject and the branch, the same for every method
+    assert {lowered[name].dispatch for name in ("pay", "count", "double")} == {4 + 3 + 2}
+    assert lowered["double"].cost < chain["double"].cost
+
+
+def test_loops_are_charged_the_bound():
+    assert _methods(SOURCE, 16)["count"].cost - _methods(SOURCE, 3)["count"].cost == 13 * 8
+    assert _methods(SOURCE, 16)["count"].calls == 1 and _methods(SOURCE, 100)["count"].calls == 2
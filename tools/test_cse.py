@@ -0,0 +1,91 @@
+import pytest
+
+from tools.avm import Ledger, app_call
+from tools.cse import eliminate
+
+GLOBAL_RUN = 'byte "k"\napp_global_get\nitob\nsha256'
+SLOT_RUN = "load 0\nitob\nsha256"
+PUT = 'byte "k"\nint 4\napp_global_put'
+
+SOURCE = """#pragma version 8
+int 7
+store 0
+byte "k"
+int 3
+app_global_put
+{run}
+log
+{between}
+{run}
+log
+int 1
+"""
+
+
+def _logs(text):
+    ledger = Ledger()
+    creator = ledger.new_account(10**9)
+    app = ledger.deploy(creator, text, global_schema=(2, 0))
+    return ledger.submit([app_call(creator, app)]).logs
+
+
+@pytest.mark.parametrize("run, between, rewritten", [
+    (GLOBAL_RUN, "", 1),
+    (GLOBAL_RUN, PUT, 0),                              # a global write kills a global read
+    (GLOBAL_RUN, 'byte "other"\nint 4\napp_global_put', 0),   # whatever the key
+    (GLOBAL_RUN, "int 4\nstore 1", 1),
+    (SLOT_RUN, "int 4\nstore 0", 0),                   # a store kills loads of its slot
+    (SLOT_RUN, "int 4\nstore 1", 1),
+    (SLOT_RUN, PUT, 1),
+])
+def test_kill_sets(run, between, rewritten):
+    source = SOURCE.format(run=run, between=between)
+    optimized, count = eliminate(source)
+    assert count == rewritten
+    assert ("store 255" in optimized) == bool(rewritten)
+    assert _logs(optimized) == _logs(source)
+
+
+def test_callsub_kills_everything():
+    source = SOURCE.format(run=GLOBAL_RUN, between="callsub f") + "return\nf:\nretsub\n"
+    assert eliminate(source) == (source, 0)
+
+
+def test_only_dominated_uses_are_rewritten():
+    # the second run is reachable without passing the first
+    source = f"#pragma version 8\ntxn ApplicationID\nbz skip\n{GLOBAL_RUN}\nlog\nskip:\n{GLOBAL_RUN}\nlog\nint 1\n"
+    assert eliminate(source) == (source, 0)
+    # the first run is on every path to both uses
+    source = f"#pragma version 8\n{GLOBAL_RUN}\nlog\ntxn ApplicationID\nbz skip\n{GLOBAL_RUN}\nlog\nskip:\n" \
+             f"{GLOBAL_RUN}\nlog\nint 1\n"
+    optimized, count = eliminate(source)
+    assert count == 1 and optimized.count("load 255") == 2
+
+
+def test_writes_in_a_loop_kill_across_it():
+    source = f"""#pragma version 8
+{GLOBAL_RUN}
+log
+int 0
+store 0
+loop:
+load 0
+int 1
++
+dup
+store 0
+{PUT}
+int 3
+<
+bnz loop
+{GLOBAL_RUN}
+log
+int 1
+"""
+    assert eliminate(source) == (source, 0)
+    assert eliminate(source.replace(PUT, "int 4\nstore 1"))[1] == 1
+
+
+def test_dynamic_scratch_is_left_alone():
+    source = SOURCE.format(run=GLOBAL_RUN, between="int 1\nint 4\nstores")
+    assert eliminate(source) == (source, 0)
@@ -0,0 +1,25 @@
+from tools.build import CONTRACTS
+from tools.heatmap import Heatmap, _program_maps, program_map
+from tools.bench import SCENARIOS
+
+
+def test_templated_contract_maps_to_source():
+    # localnet deploys asset_escrow with its template variables substituted
+    heatmap = Heatmap()
+    SCENARIOS["escrow_high_trust"](heatmap)
+    report = heatmap.report()
+    sources = {row["source"] for row in report["asset_escrow.borrow[high_trust]"]["lines"]}
+    assert "contracts/asset_escrow.py" in sources
+    assert "contracts/reputation.py" in sources
+    assert not any(source.endswith(".teal") and source != CONTRACTS["asset_escrow"].approval_path
+                   for source in sources)
+
+
+def test_program_map_requires_same_lines():
+    maps = _program_maps()
+    text, path, _ = maps["asset_escrow.teal"]
+    filled = text.replace("TMPL_TRUST_THRESHOLD", "70")
+    assert program_map(maps, "asset_escrow.teal", filled)[0] == path
+    assert program_map(maps, "asset_escrow.teal", filled + "int 1\n") is None
+    assert program_map(maps, "asset_escrow.teal", text.replace("txn Sender", "txn Receiver", 1)) is None
+    assert program_map(maps, "other.teal", text) is None
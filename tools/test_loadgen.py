@@ -0,0 +1,63 @@
+import glob
+import json
+import os
+
+import pytest
+
+from tools.build import ROOT
+from tools.loadgen import format_report, load_scenario, main, merge, run, run_worker
+
+SCENARIOS = sorted(glob.glob(os.path.join(ROOT, "tools", "scenarios", "*.json")))
+
+
+def _outcomes(result):
+    """A worker's results without the wall-clock measurements."""
+    return ({action: {key: value for key, value in entry.items() if key != "latency_ns"}
+             for action, entry in result["actions"].items()}, result["reasons"], result["events"])
+
+
+@pytest.mark.parametrize("path", SCENARIOS, ids=os.path.basename)
+def test_scenarios_build_valid_groups(path):
+    scenario = dict(load_scenario(path), rounds=4)
+    report = run(scenario, only=0)
+    # every group either commits or loses a race against another group of its round
+    assert report["rejected"] == 0, report["reasons"]
+    assert report["committed"] > 0
+    assert report["offered"] == report["committed"] + report["conflicts"]
+
+
+def test_a_worker_replays_exactly():
+    scenario = dict(load_scenario(os.path.join(ROOT, "tools", "scenarios", "marketplace_rush.json")), rounds=5)
+    first = run_worker(scenario, 1, trace=True)
+    assert _outcomes(run_worker(scenario, 1, trace=True)) == _outcomes(first)
+    assert first["events"] and all(event["worker"] == 1 for event in first["events"])
+    assert _outcomes(run_worker(scenario, 0, trace=True)) != _outcomes(first)
+    # the merged report of a multi-process run holds the same worker's events
+    report = run(scenario, workers=2, trace=True)
+    assert [event for event in report["events"] if event["worker"] == 1] == first["events"]
+    assert report["offered"] == sum(entry["offered"] for entry in report["actions"].values())
+
+
+def test_merge_adds_up_workers():
+    def result(worker, committed, conflicts, reason_round):
+        return {"worker": worker, "elapsed": 1.0, "events": [],
+                "actions": {"a.b": {"offered": committed + conflicts, "committed": committed,
+                                    "conflicts": conflicts, "rejected": 0, "latency_ns": [1000, 3000]}},
+                "reasons": {"conflict a.b: line 7": {"count": conflicts, "first": [worker, reason_round, 0]}}}
+
+    scenario = {"seed": 1, "rounds": 10, "round_seconds": 2}
+    report = merge(scenario, [result(1, 4, 2, 0), result(0, 6, 1, 3)])
+    assert (report["offered"], report["committed"], report["conflicts"]) == (13, 10, 3)
+    assert report["actions"]["a.b"]["conflict_rate"] == round(3 / 13, 4)
+    assert report["ledger_tps"] == 0.25                  # 10 committed / 2 ledgers / 20 s
+    assert report["reasons"]["conflict a.b: line 7"] == {"count": 3, "first": [0, 3, 0]}    # the lowest worker
+    assert "--seed 1 --worker 0 --rounds 4" in format_report(report)
+
+
+def test_load_scenario_checks_the_mix(tmp_path):
+    path = tmp_path / "bad.json"
+    path.write_text(json.dumps({"mix": {"marketplace_contract.steal": 1}}))
+    with pytest.raises(ValueError, match="unknown action"):
+        load_scenario(str(path))
+    with pytest.raises(SystemExit):
+        main([str(path)])
@@ -0,0 +1,130 @@
+import pytest
+
+from contracts.asset_escrow import LOAN_PERIOD
+from tools.assemble import method_selector
+from tools.avm import MIN_TXN_FEE, Ledger, OptIn, Rejected, app_call, method_call, payment
+from tools.feed import avm_record, encode_address
+from tools.loan_index import LoanIndex, decode_loan
+from tools.loan_sweep import avm_groups as sweep_groups, overdue
+from tools.localnet import deploy
+
+COLLATERAL = 2_000_000
+
+
+class World:
+    """An escrow app on a ledger, recording every submitted group as an indexer feed."""
+
+    def __init__(self):
+        self.ledger = Ledger()
+        self.lender = self.ledger.new_account(10**12)
+        apps = deploy(self.ledger, self.lender, ["trust_score", "asset_escrow"])
+        self.app, self.trust = apps["asset_escrow"], apps["trust_score"]
+        self.feed = []
+        self.round = 0
+
+    def submit(self, group):
+        result = self.ledger.submit(group)
+        self.round += 1
+        round = self.round
+        self.feed += [avm_record(txn, round, i, self.ledger.timestamp, group=str(round))
+                      for i, txn in enumerate(group)]
+        return result
+
+    def borrow(self, item):
+        borrower = self.ledger.new_account(10**9)
+        self.submit([
+            payment(borrower, self.ledger.app_address(self.app), COLLATERAL),
+            method_call(borrower, self.app, "borrow(string)void", item, applications=[self.trust],
+                        boxes=[borrower + item.encode()]),
+        ])
+        return borrower
+
+    def confirm_return(self, borrower, item):
+        self.submit([method_call(self.lender, self.app, "confirm_return(address,string)void", borrower, item,
+                                 accounts=[borrower], applications=[self.trust], boxes=[borrower + item.encode()],
+                                 fee=2 * MIN_TXN_FEE)])
+
+    def index(self):
+        return LoanIndex(":memory:", self.app, encode_address(self.lender))
+
+
+def test_follows_borrow_return_and_sweep():
+    world = World()
+    due = world.borrow("item-" + "x" * 27)              # the longest item ID
+    returned = world.borrow("item-1")
+    world.confirm_return(returned, "item-1")
+    world.ledger.advance(LOAN_PERIOD)
+    fresh = world.borrow("item-2")                      # not yet due
+    index = world.index()
+    assert index.apply_feed(world.feed) == 4            # 3 borrows and 1 return
+
+    (group,) = sweep_groups(world.lender, world.app, overdue(index, world.ledger.timestamp))
+    world.submit(group)
+    assert index.apply_feed(world.feed) == 1            # the sweep, which logged the loan it closed
+    assert index.get(encode_address(due), b"item-" + b"x" * 27) is None
+    assert [(loan.borrower, loan.item_id) for loan in index.loans()] == [(encode_address(fresh), b"item-2")]
+    assert index.loans(lender=encode_address(world.lender)) == index.loans()
+
+
+def test_overlapping_and_refetched_feeds():
+    world = World()
+    first = world.borrow("item-1")
+    second = world.borrow("item-2")
+    world.confirm_return(first, "item-1")
+    index = world.index()
+    assert index.apply_feed(world.feed[:2]) == 1
+    # a re-fetch from an earlier round overlaps what was applied; nothing is applied twice
+    assert index.apply_feed(world.feed) == 2
+    assert index.apply_feed(world.feed) == 0
+    assert index.position == (3, 0)
+    assert [loan.borrower for loan in index.loans()] == [encode_address(second)]
+
+
+def test_box_snapshot_then_feed():
+    world = World()
+    first = world.borrow("item-1")
+    snapshot = sorted(world.ledger.apps[world.app].boxes.items())
+    world.borrow("item-2")
+    world.confirm_return(first, "item-1")
+    index = world.index()
+    index.load_boxes(snapshot, 1)
+    assert decode_loan(*snapshot[0]).borrower == encode_address(first)
+    assert index.apply_feed(world.feed) == 2            # the borrow in round 1 is already in the snapshot
+    assert [loan.item_id for loan in index.loans()] == [b"item-2"]
+
+
+def test_legacy_names_keep_local_state_loans():
+    # old clients borrow by name with no box references and close with "return"
+    world = World()
+    ledger, app = world.ledger, world.app
+    borrower = ledger.new_account(10**9)
+    world.submit([app_call(borrower, app, on_complete=OptIn)])
+    world.submit([
+        payment(borrower, ledger.app_address(app), COLLATERAL),
+        app_call(borrower, app, b"borrow", b"item-1", applications=[world.trust]),
+    ])
+    assert ledger.local_state(borrower, app)[b"item_id"] == b"item-1"
+    assert not ledger.apps[app].boxes
+    with pytest.raises(Rejected):
+        ledger.submit([app_call(borrower, app, b"borrow", b"item-2", applications=[world.trust])])
+
+    before = ledger.balance(borrower)
+    world.submit([app_call(world.lender, app, b"return", borrower, accounts=[borrower],
+                           applications=[world.trust], fee=2 * MIN_TXN_FEE)])
+    assert ledger.balance(borrower) == before + COLLATERAL
+    assert ledger.local_state(borrower, app)[b"item_id"] == b"none"
+    assert world.index().apply_feed(world.feed) == 0    # local-state loans are not indexed
+
+
+def test_confirm_return_checks_the_borrower_address():
+    # a 31-byte "address" whose last byte moves into the item ID names the same box
+    world = World()
+    borrower = world.borrow("item-1")
+    shifted = borrower[31:] + b"item-1"
+    with pytest.raises(Rejected, match="assert"):
+        world.ledger.submit([app_call(
+            world.lender, world.app, method_selector("confirm_return(address,string)void"), borrower[:31],
+            len(shifted).to_bytes(2, "big") + shifted, accounts=[borrower], applications=[world.trust],
+            boxes=[borrower + b"item-1"], fee=2 * MIN_TXN_FEE,
+        )])
+    world.confirm_return(borrower, "item-1")
@@ -0,0 +1,85 @@
+import pytest
+
+from contracts.asset_escrow import LOAN_PERIOD
+from tools.avm import MAX_GROUP_SIZE, Ledger, OptIn, app_call, encode_address, method_call, payment
+from tools.loan_index import Loan, LoanIndex
+from tools.loan_sweep import MAX_LOANS, MIN_TXN_FEE, avm_groups, fee, overdue, pack, plan, split, unpack
+from tools.localnet import deploy
+
+COLLATERAL = 2_000_000
+
+
+def test_pack_round_trips():
+    items = [b"a", b"", b"x" * 32, b"item-4"]
+    assert unpack(pack(items)) == items
+    assert pack([]) == b"\x00\x00"
+
+
+@pytest.mark.parametrize("percent, released", [(0, 0), (50, 1_000_001), (100, 2_000_003)])
+def test_split_and_fee(percent, released):
+    assert split(2_000_003, percent) == (released, 2_000_003 - released)
+    loans = [Loan(bytes(32), b"i", 2_000_003, 0)] * 3
+    payments = (3 if percent else 0) + (percent < 100)
+    assert fee(loans, release_percent=percent) == (1 + payments) * MIN_TXN_FEE
+
+
+def test_plan_fills_calls_and_groups():
+    loans = [Loan(bytes([i]) * 32, b"item", COLLATERAL, 0) for i in range(70)]
+    groups = plan(loans)
+    calls = [call for group in groups for call in group]
+    assert [len(accounts) for accounts, _, _ in calls] == [MAX_LOANS] * 17 + [2]
+    assert all(len(group) <= MAX_GROUP_SIZE for group in groups)
+    assert [a for accounts, _, _ in calls for a in accounts] == [loan.borrower for loan in loans]
+
+
+def test_sweeps_overdue_loans_on_chain():
+    ledger = Ledger()
+    lender = ledger.new_account(10**12)
+    apps = deploy(ledger, lender, ["trust_score", "asset_escrow"],
+                  templates={"asset_escrow": {"OVERDUE_RELEASE_PERCENT": 50}})
+    app, trust = apps["asset_escrow"], apps["trust_score"]
+    loans = []
+    for _ in range(70):
+        borrower = ledger.new_account(10**9)
+        ledger.submit([
+            payment(borrower, ledger.app_address(app), COLLATERAL),
+            method_call(borrower, app, "borrow(string)void", "item", applications=[trust], boxes=[borrower + b"item"]),
+        ])
+        loans.append(Loan(borrower, b"item", COLLATERAL, ledger.timestamp))
+    ledger.advance(LOAN_PERIOD)
+    before = ledger.balance(loans[0].borrower)
+    for group in avm_groups(lender, app, loans, release_percent=50):
+        assert len(group) <= MAX_GROUP_SIZE
+        ledger.submit(group)
+    assert not ledger.apps[app].boxes
+    assert ledger.balance(loans[0].borrower) == before + COLLATERAL // 2
+
+
+def test_sweep_skips_loans_without_collateral():
+    ledger = Ledger()
+    lender = ledger.new_account(10**12)
+    apps = deploy(ledger, lender, ["trust_score", "asset_escrow"])
+    app, trust = apps["asset_escrow"], apps["trust_score"]
+    trusted, other = ledger.new_account(10**9), ledger.new_account(10**9)
+    ledger.submit([app_call(trusted, trust, on_complete=OptIn)])
+    ledger.submit([method_call(lender, trust, "add_trust(address,uint64)void", trusted, 60, accounts=[trusted])])
+    ledger.submit([method_call(trusted, app, "borrow(string)void", "item", applications=[trust],
+                               boxes=[trusted + b"item"])])
+    ledger.submit([
+        payment(other, ledger.app_address(app), COLLATERAL),
+        method_call(other, app, "borrow(string)void", "item", applications=[trust], boxes=[other + b"item"]),
+    ])
+    ledger.advance(LOAN_PERIOD)
+    index = LoanIndex(":memory:", app, encode_address(lender))
+    index.load_boxes(sorted(ledger.apps[app].boxes.items()), 1)
+    assert [loan.borrower for loan in overdue(index, ledger.timestamp)] == [encode_address(other)]
+
+    # swept anyway (e.g. from a hand-built list), the trusted loan stays open
+    loans = [Loan(trusted, b"item", 0, 0), Loan(other, b"item", COLLATERAL, 0)]
+    for group in avm_groups(lender, app, loans):
+        ledger.submit(group)
+    assert list(ledger.apps[app].boxes) == [trusted + b"item"]
+    ledger.submit([method_call(lender, app, "confirm_return(address,string)void", trusted, "item",
+                               accounts=[trusted], applications=[trust], boxes=[trusted + b"item"],
+                               fee=2 * MIN_TXN_FEE)])
+    assert not ledger.apps[app].boxes
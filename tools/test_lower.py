@@ -0,0 +1,121 @@
+import pytest
+
+from tools.assemble import method_selector
+from tools.avm import DeleteApplication, Ledger, NoOp, OptIn, Rejected, UpdateApplication, app_call
+from tools.cfg import CFG
+from tools.lower import lower_dispatch
+from tools.teal import parse
+
+SOURCE = """#pragma version 8
+txn ApplicationID
+bz created
+txn OnCompletion
+int NoOp
+==
+bnz noop
+txn OnCompletion
+int OptIn
+==
+bnz opted_in
+txn OnCompletion
+int DeleteApplication
+==
+bnz deleted
+err
+noop:
+txna ApplicationArgs 0
+method "a()void"
+==
+txna ApplicationArgs 0
+byte "a"
+==
+||
+bnz arm_a
+txna ApplicationArgs 0
+method "b()void"
+==
+bnz arm_b
+txna ApplicationArgs 0
+method "a()void"
+==
+bnz arm_shadowed
+err
+arm_a:
+byte "a"
+b done
+arm_b:
+byte "b"
+b done
+arm_shadowed:
+byte "shadowed"
+b done
+opted_in:
+byte "opted in"
+b done
+deleted:
+byte "deleted"
+done:
+log
+created:
+int 1
+"""
+
+
+def _outcome(ledger, creator, app, args, on_complete):
+    try:
+        return ledger.simulate([app_call(creator, app, *args, on_complete=on_complete)]).logs
+    except Rejected:
+        return "rejected"
+
+
+def test_chains_become_match_and_switch():
+    lowered = lower_dispatch(SOURCE)
+    lines = lowered.splitlines()
+    assert "switch noop opted_in dispatch_default_0 dispatch_default_0 dispatch_default_0 deleted" in lines
+    # selectors first, legacy names after, and the repeated selector dropped
+    assert lines[lines.index("match arm_a arm_b") + 1:lines.index("match arm_a arm_b") + 5] == [
+        'byte "a"', "txna ApplicationArgs 0", "match arm_a", "err",
+    ]
+    assert "arm_shadowed" not in " ".join(line for line in lines if line.startswith("match"))
+    assert "==" not in lowered
+
+
+@pytest.mark.parametrize("args, on_complete", [
+    ((method_selector("a()void"),), NoOp),
+    ((b"a",), NoOp),
+    ((method_selector("b()void"),), NoOp),
+    ((b"b",), NoOp),
+    ((), OptIn),
+    ((), DeleteApplication),
+    ((), UpdateApplication),
+])
+def test_lowered_program_behaves_the_same(args, on_complete):
+    ledger = Ledger()
+    creator = ledger.new_account(10**9)
+    original = ledger.deploy(creator, SOURCE)
+    lowered = ledger.deploy(creator, lower_dispatch(SOURCE))
+    expected = _outcome(ledger, creator, original, args, on_complete)
+    assert _outcome(ledger, creator, lowered, args, on_complete) == expected
+
+
+def test_lowered_branches_fall_through():
+    program = parse(lower_dispatch(SOURCE))
+    cfg = CFG(program)
+
+    def block_ending(line):
+        return next(b for b in cfg.blocks if str(program.instrs[b.end - 1]) == line)
+
+    selectors = block_ending("match arm_a arm_b")
+    legacy = block_ending("match arm_a")        # reached only when no selector matched
+    arm_a, arm_b = cfg.block_for_label("arm_a"), cfg.block_for_label("arm_b")
+    assert selectors.succs == [arm_a, arm_b, legacy]
+    assert legacy.succs == [arm_a, cfg.block_at[legacy.end]]
+    assert str(program.instrs[legacy.end]) == "err"
+    on_completion = block_ending("switch noop opted_in dispatch_default_0 dispatch_default_0 dispatch_default_0 deleted")
+    assert cfg.block_at[on_completion.end] in on_completion.succs
+    assert legacy in cfg.reachable(cfg.entry)
+
+
+def test_older_versions_are_unchanged():
+    source = SOURCE.replace("#pragma version 8", "#pragma version 6")
+    assert lower_dispatch(source) == source
@@ -0,0 +1,159 @@
+import pytest
+
+from tools.avm import Ledger, Rejected, address, MIN_TXN_FEE, asset_transfer, method_call
+from tools.localnet import deploy
+from tools.market_batch import PAIRS_PER_GROUP, box_name, cart_groups, listing_groups
+
+PRICE = 1_000_000
+
+
+class Market:
+    """A marketplace app on a ledger with helpers to mint, list and buy."""
+
+    def __init__(self):
+        self.ledger = Ledger()
+        creator = self.ledger.new_account(10**12)
+        self.app = deploy(self.ledger, creator, ["marketplace_contract"], funding=10**8)["marketplace_contract"]
+        self.app_address = self.ledger.app_address(self.app)
+
+    def account(self, *assets):
+        account = self.ledger.new_account(10**9)
+        for asset in assets:
+            self.ledger.opt_in_asset(account, asset)
+        return account
+
+    def assets(self, owner, count, total=1):
+        assets = [self.ledger.create_asset(owner, total) for _ in range(count)]
+        for asset in assets:
+            self.ledger.opt_in_asset(self.app_address, asset)
+        return assets
+
+    def list(self, seller, *items):
+        for group in listing_groups(seller, self.app, items, self.app_address):
+            self.ledger.submit(group)
+
+    def buy(self, buyer, *items, **options):
+        for group in cart_groups(buyer, self.app, items, **options):
+            self.ledger.submit(group)
+
+    def boxes(self):
+        return dict(self.ledger.apps[self.app].boxes)
+
+
+def test_a_drop_and_a_cart_fit_one_group_each():
+    market = Market()
+    seller = market.account()
+    assets = market.assets(seller, PAIRS_PER_GROUP)
+    buyer = market.account(*assets)
+    [drop] = listing_groups(seller, market.app, [(asset, PRICE) for asset in assets], market.app_address)
+    assert len(drop) == 2 * PAIRS_PER_GROUP
+    market.ledger.submit(drop)
+    assert sorted(market.boxes()) == sorted(box_name(asset, seller) for asset in assets)
+
+    before = market.ledger.balance(seller)
+    [cart] = cart_groups(buyer, market.app, [(asset, seller, PRICE) for asset in assets])
+    market.ledger.submit(cart)
+    assert market.ledger.balance(seller) - before == PAIRS_PER_GROUP * PRICE
+    assert all(market.ledger.asset_balance(buyer, asset) == 1 for asset in assets)
+    assert market.boxes() == {}
+
+
+def test_a_cart_goes_through_whole_or_not_at_all():
+    market = Market()
+    seller = market.account()
+    assets = market.assets(seller, 3)
+    buyer = market.account(*assets)
+    market.list(seller, *[(asset, PRICE) for asset in assets])
+    listed = market.boxes()
+    before = market.ledger.balance(buyer)
+    # the last item is underpaid, so the first two do not sell either
+    [cart] = cart_groups(buyer, market.app, [(asset, seller, PRICE) for asset in assets[:2]]
+                         + [(assets[2], seller, PRICE - 1)])
+    with pytest.raises(Rejected, match="txn 5, .*assert failed"):
+        market.ledger.submit(cart)
+    assert market.boxes() == listed
+    assert market.ledger.balance(buyer) == before
+    assert all(market.ledger.asset_balance(buyer, asset) == 0 for asset in assets)
+
+
+def test_each_call_checks_the_transaction_before_it():
+    market = Market()
+    seller = market.account()
+    assets = market.assets(seller, 2)
+    buyer = market.account(*assets)
+    [drop] = listing_groups(seller, market.app, [(asset, PRICE) for asset in assets], market.app_address)
+    with pytest.raises(Rejected, match="txn 2, "):
+        market.ledger.submit([drop[0], drop[2], drop[1], drop[3]])   # both transfers, then both calls
+    assert market.boxes() == {}
+    market.ledger.submit(drop)
+
+    [cart] = cart_groups(buyer, market.app, [(asset, seller, PRICE) for asset in assets])
+    with pytest.raises(Rejected, match="txn 3, "):
+        market.ledger.submit([cart[0], cart[2], cart[1], cart[3]])   # both payments, then both calls
+    market.ledger.submit(cart)
+    assert market.boxes() == {}
+
+
+def test_opt_in_carts_take_five_items_a_group():
+    market = Market()
+    seller = market.account()
+    assets = market.assets(seller, 7)
+    buyer = market.account()                                    # not opted in to any of them
+    market.list(seller, *[(asset, PRICE) for asset in assets])
+    groups = cart_groups(buyer, market.app, [(asset, seller, PRICE) for asset in assets], opt_in=True)
+    assert [len(group) for group in groups] == [15, 6]
+    for group in groups:
+        market.ledger.submit(group)
+    assert all(market.ledger.asset_balance(buyer, asset) == 1 for asset in assets)
+    assert market.boxes() == {}
+
+
+def test_partial_fills_drain_a_fungible_listing():
+    market = Market()
+    seller = market.account()
+    [token] = market.assets(seller, 1, total=500)
+    buyer = market.account(token)
+    market.list(seller, (token, PRICE, 500))
+    name = box_name(token, seller)
+    assert int.from_bytes(market.boxes()[name][40:48], "big") == 500
+
+    market.buy(buyer, (token, seller, PRICE, 20))
+    assert int.from_bytes(market.boxes()[name][40:48], "big") == 480
+    assert market.ledger.asset_balance(buyer, token) == 20
+    for quantity, price in [(481, PRICE), (0, PRICE), (1, PRICE - 1)]:     # too many, none, underpaid
+        with pytest.raises(Rejected, match="assert failed"):
+            market.buy(buyer, (token, seller, price, quantity))
+    market.buy(buyer, (token, seller, PRICE, 480))
+    assert market.ledger.asset_balance(buyer, token) == 500
+    assert market.boxes() == {}
+
+
+def test_delist_returns_the_unsold_units():
+    market = Market()
+    first = market.account()
+    [token] = market.assets(first, 1, total=10)
+    second, buyer = market.account(token), market.account(token)
+    market.ledger.submit([asset_transfer(first, second, token, 4)])
+    market.list(first, (token, PRICE, 6))
+    market.list(second, (token, 2 * PRICE, 4))
+    market.buy(buyer, (token, first, PRICE, 2))
+    market.ledger.submit([method_call(first, market.app, "delist(uint64)void", token,
+                                      boxes=[(0, box_name(token, first))], assets=[token], fee=2 * MIN_TXN_FEE)])
+    assert market.ledger.asset_balance(first, token) == 4
+    # the other seller's listing of the same asset is untouched
+    assert list(market.boxes()) == [box_name(token, second)]
+
+
+def test_buys_from_a_legacy_listing_reference_its_old_name():
+    market = Market()
+    seller = market.account()
+    [item] = market.assets(seller, 1)
+    buyer = market.account(item)
+    market.ledger.submit([asset_transfer(seller, market.app_address, item, 1)])
+    legacy = item.to_bytes(8, "big")
+    market.ledger.apps[market.app].boxes[legacy] = address(seller) + PRICE.to_bytes(8, "big")
+    with pytest.raises(Rejected, match="invalid Box reference"):
+        market.buy(buyer, (item, seller, PRICE))
+    market.buy(buyer, (item, seller, PRICE), legacy=True)
+    assert market.ledger.asset_balance(buyer, item) == 1
+    assert market.boxes() == {}
@@ -0,0 +1,128 @@
+import sqlite3
+
+from tools.avm import Ledger, asset_transfer
+from tools.feed import avm_record, encode_address
+from tools.localnet import deploy
+from tools.market_batch import box_name, cart_groups, listing_groups
+from tools.market_index import MarketIndex, decode_box
+
+PRICE = 1_000_000
+
+
+class World:
+    """A marketplace app on a ledger, recording every submitted group as an indexer feed."""
+
+    def __init__(self):
+        self.ledger = Ledger()
+        creator = self.ledger.new_account(10**12)
+        self.app = deploy(self.ledger, creator, ["marketplace_contract"])["marketplace_contract"]
+        self.app_address = self.ledger.app_address(self.app)
+        self.feed = []
+        self.round = 0
+
+    def submit(self, group):
+        result = self.ledger.submit(group)
+        self.round += 1
+        round = self.round
+        self.feed += [avm_record(txn, round, i, self.ledger.timestamp, group=str(round))
+                      for i, txn in enumerate(group)]
+        return result
+
+    def account(self, *assets):
+        account = self.ledger.new_account(10**9)
+        for asset in assets:
+            self.ledger.opt_in_asset(account, asset)
+        return account
+
+    def asset(self, owner, total):
+        asset = self.ledger.create_asset(owner, total)
+        self.ledger.opt_in_asset(self.app_address, asset)
+        return asset
+
+    def list(self, seller, *items):
+        for group in listing_groups(seller, self.app, items, self.app_address):
+            self.submit(group)
+
+    def buy(self, buyer, *items):
+        for group in cart_groups(buyer, self.app, items):
+            self.submit(group)
+
+    def index(self):
+        return MarketIndex(":memory:", self.app)
+
+
+def test_two_sellers_of_one_asset():
+    world = World()
+    first = world.account()
+    edition = world.asset(first, 10)
+    second, buyer = world.account(edition), world.account(edition)
+    world.ledger.submit([asset_transfer(first, second, edition, 4)])
+    world.list(first, (edition, PRICE, 6))
+    world.list(second, (edition, 2 * PRICE, 4))
+    world.buy(buyer, (edition, second, 2 * PRICE, 3))     # the buy logs the seller it paid
+    index = world.index()
+    assert index.apply_feed(world.feed) == 3
+    assert index.count() == 2
+    assert index.get(edition, encode_address(first)).quantity == 6
+    assert index.get(edition, encode_address(second)).quantity == 1
+
+    world.buy(buyer, (edition, second, 2 * PRICE, 1))
+    assert index.apply_feed(world.feed) == 1
+    assert index.get(edition, encode_address(second)) is None
+    assert [listing.seller for listing in index.listings().items] == [encode_address(first)]
+
+
+def test_overlapping_feeds_and_pages():
+    world = World()
+    seller, buyer = world.account(), world.account()
+    assets = [world.asset(seller, 1) for _ in range(5)]
+    for asset in assets:
+        world.ledger.opt_in_asset(buyer, asset)
+    world.list(seller, *[(asset, PRICE * (i + 1)) for i, asset in enumerate(assets)])
+    world.buy(buyer, (assets[0], seller, PRICE))
+    index = world.index()
+    assert index.apply_feed(world.feed[:4]) == 2
+    # a re-fetch from an earlier round overlaps what was applied; nothing is applied twice
+    assert index.apply_feed(world.feed) == 4
+    assert index.apply_feed(world.feed) == 0
+    assert index.count() == 4
+
+    first = index.listings(order="price", limit=3)
+    assert [listing.price for listing in first.items] == [2 * PRICE, 3 * PRICE, 4 * PRICE]
+    rest = index.listings(order="price", limit=3, cursor=first.cursor)
+    assert [listing.price for listing in rest.items] == [5 * PRICE] and rest.cursor is None
+    assert [listing.asset_id for listing in index.listings(max_price=3 * PRICE).items] == assets[2:0:-1]
+
+
+def test_box_snapshot_then_feed():
+    world = World()
+    seller, buyer = world.account(), world.account()
+    assets = [world.asset(seller, 1) for _ in range(2)]
+    world.ledger.opt_in_asset(buyer, assets[0])
+    world.list(seller, (assets[0], PRICE))
+    snapshot = sorted(world.ledger.apps[world.app].boxes.items())
+    assert [name for name, _ in snapshot] == [box_name(assets[0], seller)]
+    assert decode_box(*snapshot[0]) == (assets[0], encode_address(seller), PRICE, 1)
+    world.list(seller, (assets[1], PRICE))
+    world.buy(buyer, (assets[0], seller, PRICE))
+    index = world.index()
+    index.load_boxes(snapshot, 1)
+    assert index.apply_feed(world.feed) == 2            # the list in round 1 is already in the snapshot
+    assert [listing.asset_id for listing in index.listings().items] == [assets[1]]
+
+
+def test_migrates_an_index_keyed_by_asset(tmp_path):
+    path = str(tmp_path / "market.sqlite")
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE listings (app_id INTEGER NOT NULL, asset_id INTEGER NOT NULL, seller TEXT NOT NULL,
+                               price INTEGER NOT NULL, round INTEGER NOT NULL, intra INTEGER NOT NULL,
+                               time INTEGER NOT NULL, txid TEXT, PRIMARY KEY (app_id, asset_id));
+        INSERT INTO listings VALUES (1, 7, 'SELLER', 5, 3, 0, 0, NULL);
+    """)
+    db.commit()
+    db.close()
+    index = MarketIndex(path, 1)
+    assert (index.get(7, "SELLER").price, index.get(7).quantity) == (5, 1)
+    index._put(7, "OTHER", 6, 1, (4, 0), 0, None)       # a second seller of the same asset
+    assert index.count() == 2
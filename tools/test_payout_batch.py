@@ -0,0 +1,47 @@
+import pytest
+
+from contracts.civic_rewards import MAX_BATCH_TOTAL
+from tools.avm import MIN_TXN_FEE, Ledger, Rejected
+from tools.localnet import deploy
+from tools.payout_batch import MAX_ACCOUNTS, MAX_GROUP_SIZE, avm_groups, fee, pack, plan, unpack
+
+ALGO = 1_000_000
+
+
+def test_pack_round_trips():
+    assert unpack(pack([0, 1, 2**64 - 1])) == [0, 1, 2**64 - 1]
+    with pytest.raises(ValueError):
+        pack([2**64])
+    with pytest.raises(ValueError):
+        unpack(pack([1, 2])[:-1])
+
+
+def test_plan_splits_by_accounts_and_total():
+    payouts = {bytes([i + 1]) * 32: ALGO for i in range(70)}
+    payouts[bytes(32)] = 0                              # dropped
+    groups = plan(payouts)
+    calls = [call for group in groups for call in group]
+    assert [len(group) for group in groups] == [MAX_GROUP_SIZE, 2]
+    assert [len(accounts) for accounts, _ in calls] == [MAX_ACCOUNTS] * 17 + [2]
+    assert fee(calls[0][0]) == 5 * MIN_TXN_FEE
+
+    big = {bytes([1]) * 32: 60 * ALGO, bytes([2]) * 32: 50 * ALGO, bytes([3]) * 32: 50 * ALGO}
+    ((first, second),) = plan(big)
+    assert (unpack(first[1]), unpack(second[1])) == ([60 * ALGO], [50 * ALGO, 50 * ALGO])
+    with pytest.raises(ValueError):
+        plan({bytes(32): MAX_BATCH_TOTAL + 1})
+
+
+def test_payouts_on_chain():
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    app = deploy(ledger, admin, ["civic_rewards"])["civic_rewards"]
+    ledger.fund(ledger.app_address(app), 1000 * ALGO)
+    receivers = [ledger.new_account(ALGO) for _ in range(10)]
+    payouts = {r: (i + 1) * 1000 for i, r in enumerate(receivers)}
+    for group in avm_groups(admin, app, payouts):
+        ledger.submit(group)
+    assert [ledger.balance(r) - ALGO for r in receivers] == list(payouts.values())
+    (group,) = avm_groups(receivers[0], app, {receivers[1]: 1000})
+    with pytest.raises(Rejected):
+        ledger.submit(group)                            # only the creator pays out
@@ -0,0 +1,79 @@
+import pytest
+from algosdk import abi, encoding
+
+from contracts.asset_escrow import GET_LOANS
+from contracts.commute_checkin import GET_TRIPS
+from contracts.reputation import GET_RECORDS
+from tools.avm import Ledger, Rejected, method_call, payment
+from tools.localnet import deploy
+from tools.query import (EXTRA_OPCODE_BUDGET, LOANS_PER_CALL, MAX_APP_ARGS_BYTES, RECORDS_PER_CALL, TRIPS_PER_CALL,
+                         LedgerSimulator, LoanStatus, loan_pages, loans, trust_records)
+
+COLLATERAL = 2_000_000
+
+
+def _decode(page):
+    return (abi.ABIType.from_string("address[]").decode(page[0]),
+            abi.ABIType.from_string("string[]").decode(page[1]))
+
+
+@pytest.mark.parametrize("item_size, sizes", [
+    (0, [8, 8, 3]),                     # a box reference a loan
+    (32, [8, 8, 8]),
+    (250, [7, 7, 2]),                   # selector, two array lengths and 36 bytes a loan: 8 + 286n <= 2048
+])
+def test_loan_pages_fit_the_app_args(item_size, sizes):
+    pairs = [(bytes([i % 256]) * 32, "x" * item_size) for i in range(sum(sizes))]
+    pages = loan_pages(pairs)
+    assert [len(_decode(page)[0]) for page in pages] == sizes
+    assert all(len(_decode(page)[0]) <= LOANS_PER_CALL for page in pages)
+    assert all(4 + sum(len(arg) for arg in page) <= MAX_APP_ARGS_BYTES for page in pages)
+    borrowers = [b for page in pages for b in _decode(page)[0]]
+    assert len(borrowers) == len(pairs)
+
+
+def test_loan_pages_accept_bytes_and_base32():
+    borrower = bytes(range(32))
+    (page,) = loan_pages([(borrower, b"item"), (encoding.encode_address(borrower), "item")])
+    assert _decode(page) == ([encoding.encode_address(borrower)] * 2, ["item", "item"])
+
+
+def test_loans_on_chain():
+    ledger = Ledger()
+    lender = ledger.new_account(10**12)
+    apps = deploy(ledger, lender, ["trust_score", "asset_escrow"])
+    app, trust = apps["asset_escrow"], apps["trust_score"]
+    borrowers = []
+    for _ in range(3):
+        borrower = ledger.new_account(10**9)
+        ledger.submit([
+            payment(borrower, ledger.app_address(app), COLLATERAL),
+            method_call(borrower, app, "borrow(string)void", "item", applications=[trust], boxes=[borrower + b"item"]),
+        ])
+        borrowers.append(borrower)
+    pairs = [(b, "item") for b in borrowers] + [(borrowers[0], "other")]
+    result = loans(LedgerSimulator(ledger, lender), app, pairs)
+    assert list(result) == pairs
+    assert result[pairs[0]] == LoanStatus(COLLATERAL, ledger.timestamp)
+    assert result[pairs[-1]] == LoanStatus(0, 0)          # not open
+
+
+def test_a_full_page_fits_the_reference_limits():
+    ledger = Ledger()
+    creator = ledger.new_account(10**12)
+    apps = deploy(ledger, creator, ["trust_score", "commute_checkin", "asset_escrow"])
+    users = [ledger.new_account(10**6) for _ in range(LOANS_PER_CALL + 1)]
+    pages = [
+        ("trust_score", GET_RECORDS, RECORDS_PER_CALL, lambda n: [users[:n]]),
+        ("commute_checkin", GET_TRIPS, TRIPS_PER_CALL, lambda n: [users[:n]]),
+        ("asset_escrow", GET_LOANS, LOANS_PER_CALL, lambda n: [users[:n], ["item"] * n]),
+    ]
+    for name, signature, per_call, args in pages:
+        full = method_call(creator, apps[name], signature, *args(per_call))
+        ledger.simulate([full], allow_unnamed_resources=True, extra_opcode_budget=EXTRA_OPCODE_BUDGET)
+        over = method_call(creator, apps[name], signature, *args(per_call + 1))
+        with pytest.raises(Rejected, match="exceeds the transaction's references"):
+            ledger.simulate([over], allow_unnamed_resources=True, extra_opcode_budget=EXTRA_OPCODE_BUDGET)
+
+    result = trust_records(LedgerSimulator(ledger, creator), apps["trust_score"], users)
+    assert list(result) == users and set(result.values()) == {(0, 0, 0, 0)}
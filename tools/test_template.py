@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from tools.assemble import assemble, uvarint
+from tools.avm import Ledger, app_call
+from tools.build import CONTRACTS, ROOT
+from tools.template import Template, load, substitute
+
+SOURCE = """#pragma version 8
+int TMPL_AMOUNT
+itob
+log
+byte TMPL_NOTE
+log
+int TMPL_AMOUNT
+int 1
+|
+pop
+txn ApplicationID
+bz done
+byte TMPL_NOTE
+pop
+done:
+int 1
+"""
+
+
+def test_uvarint():
+    assert uvarint(0) == b"\x00"
+    assert uvarint(127) == b"\x7f"
+    assert uvarint(128) == b"\x80\x01"
+    assert uvarint(300) == b"\xac\x02"
+    assert len(uvarint(2**64 - 1)) == 10
+
+
+@pytest.mark.parametrize("amount, note_size", [(0, 0), (127, 1), (128, 127), (300, 128), (2**64 - 1, 300)])
+def test_patch_splices_multibyte_values(amount, note_size):
+    # a value wider than its one-byte placeholder shifts everything after it,
+    # including the branch, which must still land on its label
+    note = b"x" * note_size
+    template = Template.from_assembled(assemble(SOURCE), {"AMOUNT": 1, "NOTE": b""})
+    patched = template.patch(AMOUNT=amount, NOTE=note)
+    assert patched == assemble(SOURCE, {"AMOUNT": amount, "NOTE": note}).bytecode
+
+    ledger = Ledger()
+    creator = ledger.new_account(10**9)
+    app = ledger.deploy(creator, patched)
+    assert ledger.submit([app_call(creator, app)]).logs == [amount.to_bytes(8, "big"), note]
+
+
+def test_values_and_substitute():
+    template = Template.from_assembled(assemble(SOURCE), {"AMOUNT": 1})
+    with pytest.raises(ValueError, match="TMPL_NOTE"):
+        template.values()
+    with pytest.raises(ValueError, match="unknown"):
+        template.values({"NOTE": b"", "OTHER": 1})
+    assert template.values({"NOTE": "hi"}) == {"AMOUNT": 1, "NOTE": b"hi"}
+    assert substitute("int TMPL_AMOUNT\nbyte TMPL_NOTE\n", {"AMOUNT": 5, "NOTE": b"\x01"}) == "int 5\nbyte 0x01\n"
+
+
+def test_contract_template_matches_assembly():
+    template = load("asset_escrow")
+    with open(os.path.join(ROOT, CONTRACTS["asset_escrow"].approval_path)) as f:
+        text = f.read()
+    values = template.values({"TRUST_THRESHOLD": 70, "MIN_COLLATERAL": 2_000_000})
+    assert template.patch(values) == assemble(text, values).bytecode
+    assert Template.from_json(template.to_json()) == template
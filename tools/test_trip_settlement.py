@@ -0,0 +1,50 @@
+from contracts.commute_checkin import HEAD_KEY, TAIL_KEY, queue_slot
+from tools.avm import Ledger, OptIn, app_call, method_call, payment
+from tools.localnet import deploy
+from tools.trip_settlement import MAX_GROUP_SIZE, MAX_RIDERS, MIN_TXN_FEE, avm_groups, fee, plan
+
+FARE = 2_000_000
+
+
+def test_plan_splits_riders():
+    driver, riders = "D", [f"R{i}" for i in range(12)]
+    (group,) = plan(driver, riders)
+    assert [accounts for accounts, _ in group] == [riders[0:4], riders[4:8], riders[8:12]]
+    assert {call_fee for _, call_fee in group} == {fee(MAX_RIDERS)} == {7 * MIN_TXN_FEE}
+    (group,) = plan(driver, riders, operator=True)      # the driver takes one account slot
+    assert [accounts for accounts, _ in group] == [[driver] + riders[i:i + 3] for i in range(0, 12, 3)]
+    groups = plan(driver, [f"R{i}" for i in range(70)])
+    assert [len(group) for group in groups] == [MAX_GROUP_SIZE, 2]
+
+
+def test_settles_pooled_riders_on_chain():
+    ledger = Ledger()
+    operator = ledger.new_account(10**12)
+    apps = deploy(ledger, operator, ["trust_score", "commute_checkin"])
+    app, trust = apps["commute_checkin"], apps["trust_score"]
+
+    def page(key):
+        return queue_slot(ledger.global_state(app).get(key.encode(), 0))[0]
+
+    def join(role):
+        account = ledger.new_account(10**9)
+        ledger.submit([app_call(account, app, on_complete=OptIn)])
+        ledger.submit([app_call(account, trust, on_complete=OptIn)])
+        if role == "rider":
+            ledger.submit([method_call(account, app, "register_rider()void")])
+        return account
+
+    driver = join("driver")
+    riders = [join("rider") for _ in range(6)]
+    for rider in riders[:5]:
+        ledger.submit([method_call(driver, app, "register_driver()void", boxes=[page(TAIL_KEY)])])
+        ledger.submit([
+            payment(rider, ledger.app_address(app), FARE),
+            method_call(rider, app, "start_trip(pay)void", accounts=[driver], boxes=[page(HEAD_KEY)]),
+        ])
+    before = ledger.balance(driver)
+    # the sixth rider never started a trip, so the contract skips them
+    for group in avm_groups(operator, app, driver, riders, trust):
+        ledger.submit(group)
+    assert ledger.balance(driver) == before + 5 * FARE
+    assert [ledger.local_state(rider, app).get(b"trip_active") for rider in riders] == [0] * 6
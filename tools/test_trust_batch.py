@@ -0,0 +1,75 @@
+import pytest
+
+from contracts.reputation import ADD_TRUST, TRUST_CAP
+from tools.avm import Ledger, OptIn, app_call, method_call
+from tools.localnet import deploy
+from tools.query import LedgerSimulator, trust_records
+from tools.trust_batch import DELTA_MAX, DELTA_MIN, avm_groups, pack, unpack
+
+MAX_UINT = 2**64 - 1
+
+
+class Trust:
+    """A trust app, local-state or box-backed, with scores set through its single-field methods."""
+
+    def __init__(self, name):
+        self.ledger = Ledger()
+        self.admin = self.ledger.new_account(10**12)
+        self.app = deploy(self.ledger, self.admin, [name])[name]
+        self.boxes = name == "trust_score_box"
+
+    def user(self, trust=0, fitness=0, eco=0):
+        user = self.ledger.new_account(10**9)
+        if not self.boxes:
+            self.ledger.submit([app_call(user, self.app, on_complete=OptIn)])
+        for method, amount in ((ADD_TRUST, trust), ("add_fitness(address,uint64)void", fitness),
+                               ("add_eco(address,uint64)void", eco)):
+            if amount:
+                self.ledger.submit([method_call(self.admin, self.app, method, user, amount, accounts=[user],
+                                                boxes=[user] if self.boxes else [])])
+        return user
+
+    def batch(self, updates):
+        for group in avm_groups(self.admin, self.app, updates, boxes=self.boxes):
+            self.ledger.submit(group)
+
+    def records(self, users):
+        rows = trust_records(LedgerSimulator(self.ledger, self.admin), self.app, users)
+        return [row[:3] for row in rows.values()]
+
+
+def test_pack_round_trips_int16_deltas():
+    deltas = [(DELTA_MAX, DELTA_MIN, 0), (-1, 1, 7)]
+    assert unpack(pack(deltas)) == deltas
+    with pytest.raises(ValueError, match="int16"):
+        pack([(DELTA_MAX + 1, 0, 0)])
+
+
+@pytest.mark.parametrize("name", ["trust_score", "trust_score_box"])
+def test_batch_update_clamps_at_both_ends(name):
+    trust = Trust(name)
+    near_max = trust.user(trust=90, fitness=MAX_UINT - 10, eco=MAX_UINT)
+    near_zero = trust.user(trust=5, fitness=3, eco=1)
+    at_cap = trust.user(trust=TRUST_CAP, fitness=MAX_UINT - 1)
+    plain = trust.user(trust=40, fitness=40, eco=40)
+    trust.batch({
+        near_max: (30, DELTA_MAX, 1),               # past TRUST_CAP and past 2**64 - 1: clamped, no overflow
+        near_zero: (DELTA_MIN, -4, DELTA_MIN),      # below zero: floored
+        at_cap: (DELTA_MAX, 1, 0),
+        plain: (-10, 10, -40),
+    })
+    assert trust.records([near_max, near_zero, at_cap, plain]) == [
+        (TRUST_CAP, MAX_UINT, MAX_UINT),
+        (0, 0, 0),
+        (TRUST_CAP, MAX_UINT, 0),
+        (30, 50, 0),
+    ]
+
+
+@pytest.mark.parametrize("name", ["trust_score", "trust_score_box"])
+def test_add_trust_caps_huge_amounts(name):
+    trust = Trust(name)
+    user = trust.user(trust=60)
+    trust.ledger.submit([method_call(trust.admin, trust.app, ADD_TRUST, user, MAX_UINT, accounts=[user],
+                                     boxes=[user] if trust.boxes else [])])
+    assert trust.records([user]) == [(TRUST_CAP, 0, 0)]
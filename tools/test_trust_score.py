@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from contracts.reputation import ADD_TRUST, EXPONENTIAL_DECAY, GET_RECORD, LINEAR_DECAY, UPDATED_KEY, decayed_trust_value
+from contracts.trust_score import LEGACY_LOCAL_UINTS
+from tools.avm import Ledger, OptIn, Rejected, app_call, method_call
+from tools.build import CONTRACTS, ROOT
+from tools.localnet import deploy
+from tools.trust_batch import avm_groups
+
+HALF_LIFE = 30 * 24 * 60 * 60
+MIGRATE = "migrate(address)void"
+
+
+def _record(ledger, sender, app, user, boxes=False):
+    result = ledger.simulate([method_call(sender, app, GET_RECORD, user, accounts=[user],
+                                          boxes=[user] if boxes else [])])
+    value = result.return_value
+    return tuple(int.from_bytes(value[i:i + 8], "big") for i in range(0, 32, 8))
+
+
+def _local_trust_app(ledger, admin, args=(), local_schema=None):
+    """A local-state trust app at an ID of the ledger's choosing (localnet pins trust_score's)."""
+    contract = CONTRACTS["trust_score"]
+    return ledger.deploy(admin, os.path.join(ROOT, contract.approval_path), global_schema=contract.global_schema,
+                         local_schema=local_schema or contract.local_schema, args=args)
+
+
+def _score(ledger, admin, app, user, trust, fitness, eco):
+    for method, amount in ((ADD_TRUST, trust), ("add_fitness(address,uint64)void", fitness),
+                           ("add_eco(address,uint64)void", eco)):
+        ledger.submit([method_call(admin, app, method, user, amount, accounts=[user])])
+
+
+def test_migrate_reads_the_templated_trust_app():
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    legacy = _local_trust_app(ledger, admin, [EXPONENTIAL_DECAY, HALF_LIFE])
+    box_app = deploy(ledger, admin, ["trust_score_box"],
+                     templates={"trust_score_box": {"TRUST_APP_ID": legacy}})["trust_score_box"]
+    user, other = ledger.new_account(10**9), ledger.new_account(10**9)
+    ledger.submit([app_call(user, legacy, on_complete=OptIn)])
+    _score(ledger, admin, legacy, user, 80, 7, 3)
+    written = ledger.timestamp
+    ledger.advance(HALF_LIFE + HALF_LIFE // 2)
+
+    def migrate(sender):
+        ledger.submit([method_call(sender, box_app, MIGRATE, user, accounts=[user], applications=[legacy],
+                                   boxes=[user])])
+
+    with pytest.raises(Rejected, match="assert"):
+        migrate(other)                          # only the admin or the user
+    migrate(user)
+    trust = decayed_trust_value(80, written, ledger.timestamp, EXPONENTIAL_DECAY, HALF_LIFE)
+    assert trust == 30
+    assert _record(ledger, admin, box_app, user, boxes=True) == (trust, 7, 3, ledger.timestamp)
+    with pytest.raises(Rejected, match="assert"):
+        migrate(admin)                          # the record exists
+
+
+def test_migrate_defaults_to_the_testnet_trust_app():
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    apps = deploy(ledger, admin, ["trust_score", "trust_score_box"])
+    legacy, box_app = apps["trust_score"], apps["trust_score_box"]
+    user = ledger.new_account(10**9)
+    ledger.submit([app_call(user, legacy, on_complete=OptIn)])
+    _score(ledger, admin, legacy, user, 40, 2, 1)
+    other = _local_trust_app(ledger, admin)
+    with pytest.raises(Rejected, match=f"unavailable App {legacy}"):
+        ledger.submit([method_call(user, box_app, MIGRATE, user, accounts=[user], applications=[other],
+                                   boxes=[user])])
+    ledger.submit([method_call(user, box_app, MIGRATE, user, accounts=[user], applications=[legacy], boxes=[user])])
+    assert _record(ledger, admin, box_app, user, boxes=True)[:3] == (40, 2, 1)
+
+
+def test_box_and_local_records_agree():
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    apps = deploy(ledger, admin, ["trust_score", "trust_score_box"])
+    user = ledger.new_account(10**9)
+    ledger.submit([app_call(user, apps["trust_score"], on_complete=OptIn)])
+    for name, boxes in (("trust_score", False), ("trust_score_box", True)):
+        app = apps[name]
+        for method, amount in ((ADD_TRUST, 70), ("slash_trust(address,uint64)void", 25),
+                               ("add_fitness(address,uint64)void", 9), ("add_eco(address,uint64)void", 4)):
+            ledger.submit([method_call(admin, app, method, user, amount, accounts=[user],
+                                       boxes=[user] if boxes else [])])
+    local = _record(ledger, admin, apps["trust_score"], user)
+    assert local == _record(ledger, admin, apps["trust_score_box"], user, boxes=True)
+    assert local == (45, 9, 4, ledger.timestamp)
+
+
+@pytest.mark.parametrize("curve", [LINEAR_DECAY, EXPONENTIAL_DECAY])
+def test_decay_matches_decayed_trust_value(curve):
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    apps = deploy(ledger, admin, ["trust_score", "trust_score_box"],
+                  args={"trust_score": [curve, HALF_LIFE], "trust_score_box": [curve, HALF_LIFE]})
+    user, other = ledger.new_account(10**9), ledger.new_account(10**9)
+
+    def write(account, amount):
+        for app in apps.values():
+            ledger.submit([method_call(admin, app, ADD_TRUST, account, amount, accounts=[account], boxes=[account])])
+
+    def records(account):
+        return [_record(ledger, admin, apps["trust_score"], account),
+                _record(ledger, admin, apps["trust_score_box"], account, boxes=True)]
+
+    for account in (user, other):
+        ledger.submit([app_call(account, apps["trust_score"], on_complete=OptIn)])
+        write(account, 99)
+    written = ledger.timestamp
+    # reads decay without writing, so every offset is measured from the same write
+    for offset in (1, HALF_LIFE // 3, HALF_LIFE - 1, HALF_LIFE, HALF_LIFE + 1, 2 * HALF_LIFE - 1, 2 * HALF_LIFE,
+                   3 * HALF_LIFE + 7, 63 * HALF_LIFE, 64 * HALF_LIFE):
+        ledger.advance(written + offset - ledger.timestamp)
+        trust = decayed_trust_value(99, written, ledger.timestamp, curve, HALF_LIFE)
+        assert [record[0] for record in records(user)] == [trust, trust], offset
+        if offset == HALF_LIFE // 3:
+            # a write stores the decayed score plus the delta, as of now
+            write(other, 5)
+            assert records(other) == [(trust + 5, 0, 0, ledger.timestamp)] * 2
+    assert trust == 0
+
+
+def test_runs_on_the_testnet_apps_local_schema():
+    # an update in place keeps the 3 local ints the TestNet app was created with
+    ledger = Ledger()
+    admin = ledger.new_account(10**12)
+    app = _local_trust_app(ledger, admin, local_schema=(LEGACY_LOCAL_UINTS, 0))
+    user = ledger.new_account(10**9)
+    ledger.submit([app_call(user, app, on_complete=OptIn)])
+    _score(ledger, admin, app, user, 70, 9, 4)
+    ledger.submit([method_call(admin, app, "slash_trust(address,uint64)void", user, 25, accounts=[user])])
+    for group in avm_groups(admin, app, {user: (-5, 1, 0)}):
+        ledger.submit(group)
+    assert UPDATED_KEY.encode() not in ledger.local_state(user, app)
+    ledger.advance(HALF_LIFE)
+    assert _record(ledger, admin, app, user) == (40, 10, 4, 0)
@@ -0,0 +1,82 @@
+"""
+Pack a driver's finished trips into commute_checkin settle_trips calls.
+
+    from tools.trip_settlement import avm_groups, plan
+
+    for group in plan(driver, riders):              # the driver settles
+        for accounts, fee in group:
+            ...                                     # one settle_trips(address)void call
+    plan(driver, riders, operator=True)             # the app creator settles
+
+Each call pays the driver every listed rider's collateral in one inner
+payment and credits trust to each rider and, once, to the driver, so it
+costs a min fee for itself, the payment and each credit. Riders go in as
+foreign accounts: MAX_RIDERS per call when the driver sends it, one fewer
+when the operator does (the driver takes a slot to receive the payment).
+A shuttle with 12 riders thus settles in one group of 3 calls, with 3
+inner payments instead of 12.
+
+Fees assume every account is opted in to trust_score; credits to accounts
+that are not are skipped, and the extra fee is simply spent. Riders whose
+trip was already ended or cancelled are skipped by the contract too, so a
+plan may be built from the backend's list of matched riders.
+"""
+from contracts.commute_checkin import TRUST_APP_ID
+
+SETTLE_TRIPS = "settle_trips(address)void"
+MAX_RIDERS = 4              # foreign accounts per app call
+MAX_GROUP_SIZE = 16
+MIN_TXN_FEE = 1000
+
+
+def fee(riders, min_fee=MIN_TXN_FEE):
+    """Outer fee for one call: itself, the payment and up to len(riders) + 1 trust credits."""
+    return (3 + riders) * min_fee
+
+
+def plan(driver, riders, operator=False, min_fee=MIN_TXN_FEE):
+    """Split riders into groups of (accounts, fee) calls."""
+    riders = list(riders)
+    per_call = MAX_RIDERS - 1 if operator else MAX_RIDERS
+    calls = []
+    for i in range(0, len(riders), per_call):
+        chunk = riders[i:i + per_call]
+        calls.append(([driver] + chunk if operator else chunk, fee(len(chunk), min_fee)))
+    return [calls[i:i + MAX_GROUP_SIZE] for i in range(0, len(calls), MAX_GROUP_SIZE)]
+
+
+def avm_groups(sender, app_id, driver, riders, trust_app_id=TRUST_APP_ID):
+    """Transaction groups for tools/avm.Ledger.submit; `sender` is the driver or the app creator."""
+    from .avm import method_call
+
+    return [
+        [
+            method_call(sender, app_id, SETTLE_TRIPS, driver, accounts=accounts,
+                        applications=[trust_app_id], fee=call_fee)
+            for accounts, call_fee in group
+        ]
+        for group in plan(driver, riders, operator=sender != driver)
+    ]
+
+
+def algosdk_groups(sender, app_id, driver, riders, params, trust_app_id=TRUST_APP_ID):
+    """Unsigned, grouped algosdk transactions; `params` is algod's suggested params."""
+    import copy
+
+    from algosdk import encoding, transaction
+
+    from .assemble import method_selector
+
+    selector = method_selector(SETTLE_TRIPS)
+    out = []
+    for group in plan(driver, riders, sender != driver, params.min_fee or MIN_TXN_FEE):
+        txns = []
+        for accounts, call_fee in group:
+            sp = copy.copy(params)
+            sp.flat_fee, sp.fee = True, call_fee
+            txns.append(transaction.ApplicationNoOpTxn(
+                sender, sp, app_id, app_args=[selector, encoding.decode_address(driver)],
+                accounts=accounts, foreign_apps=[trust_app_id],
+            ))
+        out.append(transaction.assign_group_id(txns))
+    return out
@@ -0,0 +1,124 @@
+"""
+Pack trust/fitness/eco adjustments into batch_update calls on trust_score.
+
+    from tools.trust_batch import plan
+
+    groups = plan({alice: (5, 20, 0), bob: (-10, 0, 3)})
+    for group in groups:             # each fits one atomic group with its padding
+        for accounts, records in group:
+            ...                      # one batch_update(byte[])void call
+
+Each call adjusts up to MAX_ACCOUNTS addresses, passed as foreign accounts;
+its argument is the ARC-4 byte[] of one 6-byte record per account holding
+three big-endian int16 deltas (trust, fitness, eco). A nightly run over N
+users therefore needs about N / 4 app calls, in place of up to 3 * N
+single-metric calls.
+
+`avm_groups` and `algosdk_groups` turn a plan into transactions for the
+local AVM (tools/avm.py) or for algod. Pass boxes=True for trust_score_box,
+which needs a box reference per account (4 accounts + 4 boxes = the 8
+references one call may carry), and decay=True for a trust app created
+with a decay curve. Four accounts can cost more than one call's 700
+opcodes (trust_score.batch_cost), so groups are packed by budget: each
+takes as many accounts as fit in 16 transactions together with the
+opup()void calls that pad its pooled budget (tools/budget.py): 64
+accounts in local state, 61 with boxes, 51 and 46 with decay. The
+builders append the padding from the static cost, or from a simulate run
+when given a ledger or algod client.
+"""
+import struct
+
+from contracts.reputation import BOX, LOCAL
+from contracts.trust_score import batch_cost
+
+BATCH_UPDATE = "batch_update(byte[])void"
+MAX_ACCOUNTS = 4            # foreign accounts per app call
+DELTA_MIN, DELTA_MAX = -(2**15), 2**15 - 1
+
+
+def pack(deltas):
+    """ARC-4 byte[] for a list of (trust, fitness, eco) deltas."""
+    body = b""
+    for record in deltas:
+        if len(record) != 3:
+            raise ValueError(f"expected (trust, fitness, eco), got {record!r}")
+        for delta in record:
+            if not DELTA_MIN <= delta <= DELTA_MAX:
+                raise ValueError(f"delta {delta} does not fit in an int16")
+        body += struct.pack(">hhh", *record)
+    return struct.pack(">H", len(body)) + body
+
+
+def unpack(data):
+    """Inverse of pack()."""
+    (length,) = struct.unpack_from(">H", data)
+    if length != len(data) - 2 or length % 6:
+        raise ValueError("malformed batch records")
+    return [struct.unpack_from(">hhh", data, 2 + i) for i in range(0, length, 6)]
+
+
+def _call_cost(boxes, decay):
+    storage = BOX if boxes else LOCAL
+    return lambda accounts: batch_cost(len(accounts), storage, decay)
+
+
+def plan(updates, boxes=False, decay=False):
+    """Split {address: (trust, fitness, eco)} into groups of (accounts, packed records) calls.
+
+    Addresses whose three deltas are all zero are dropped.
+    """
+    from .budget import pack as pack_groups
+
+    items = [(addr, tuple(d)) for addr, d in updates.items() if any(d)]
+    return [
+        [([addr for addr, _ in call], pack([d for _, d in call])) for call in calls]
+        for calls, _ in pack_groups(items, _call_cost(boxes, decay), MAX_ACCOUNTS)
+    ]
+
+
+def _group_cost(group, boxes, decay):
+    cost = _call_cost(boxes, decay)
+    return sum(cost(accounts) for accounts, _ in group)
+
+
+def avm_groups(sender, app_id, updates, boxes=False, decay=False, ledger=None):
+    """Transaction groups for tools/avm.Ledger.submit, padded by static cost or measured on `ledger`."""
+    from .assemble import method_selector
+    from .avm import address, app_call
+    from .budget import pad
+
+    selector = method_selector(BATCH_UPDATE)
+    return [
+        pad([
+            app_call(sender, app_id, selector, records, accounts=accounts,
+                     boxes=[(0, address(a)) for a in accounts] if boxes else [])
+            for accounts, records in group
+        ], app_id, cost=_group_cost(group, boxes, decay), ledger=ledger)
+        for group in plan(updates, boxes, decay)
+    ]
+
+
+def algosdk_groups(sender, app_id, updates, params, boxes=False, decay=False, client=None):
+    """Unsigned, grouped algosdk transactions; `params` is algod's suggested params.
+
+    Padded by static cost, or measured with `client`'s simulate endpoint.
+    """
+    from algosdk import encoding, transaction
+
+    from .assemble import method_selector
+    from .budget import pad_algosdk
+
+    selector = method_selector(BATCH_UPDATE)
+    out = []
+    for group in plan(updates, boxes, decay):
+        txns = []
+        for accounts, records in group:
+            names = [encoding.decode_address(a) if isinstance(a, str) else a for a in accounts]
+            txns.append(transaction.ApplicationNoOpTxn(
+                sender, params, app_id, app_args=[selector, records],
+                accounts=[encoding.encode_address(n) for n in names],
+                boxes=[(0, n) for n in names] if boxes else None,
+            ))
+        txns = pad_algosdk(txns, app_id, params, cost=_group_cost(group, boxes, decay), client=client)
+        out.append(transaction.assign_group_id(txns))
+    return out